@@ -0,0 +1,88 @@
+# benchmarks/bench_conditions.py
+"""
+条件表达式求值基准
+对比旧的「文本替换 + eval()」路径与编译后的表达式求值吞吐量
+
+用法:
+    python benchmarks/bench_conditions.py [--iterations 200000]
+"""
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app.workflow.expressions import ExpressionScope, compile_expression  # noqa: E402
+
+NODE_RESULTS: Dict[str, Any] = {"llm_1": "billing", "score_node": 0.82}
+INPUTS: Dict[str, Any] = {"user_type": "admin", "count": 7, "tag": "b"}
+VARIABLES: Dict[str, Any] = {"limit": 10}
+
+# 新旧两种写法都能求值的条件
+CONDITIONS = [
+    "'{{user_type}}' == 'admin'",
+    "{{score_node}} > 0.5 and {{count}} < {{limit}}",
+    "'{{tag}}' in ['a', 'b', 'c']",
+    "not ('{{llm_1}}' == 'refund' or {{count}} >= 100)",
+]
+
+
+def legacy_evaluate(condition: str) -> bool:
+    """旧实现：每次求值都做正则替换并 eval()"""
+    def replace_var(match):
+        var_name = match.group(1)
+        if var_name in NODE_RESULTS:
+            return str(NODE_RESULTS[var_name])
+        if var_name in INPUTS:
+            return str(INPUTS[var_name])
+        if var_name in VARIABLES:
+            return str(VARIABLES[var_name])
+        return match.group(0)
+
+    resolved = re.sub(r'\{\{([^}]+)\}\}', replace_var, condition)
+    return bool(eval(resolved, {"__builtins__": {}}))
+
+
+def compiled_evaluator() -> Callable[[str], bool]:
+    """新实现：表达式预编译，求值时只构造变量绑定"""
+    compiled = {condition: compile_expression(condition) for condition in CONDITIONS}
+
+    def evaluate(condition: str) -> bool:
+        scope = ExpressionScope(NODE_RESULTS, INPUTS, VARIABLES)
+        return compiled[condition].test(scope)
+
+    return evaluate
+
+
+def run(name: str, evaluate: Callable[[str], bool], iterations: int) -> float:
+    """执行基准并返回每秒求值次数"""
+    for condition in CONDITIONS:
+        evaluate(condition)
+    start = time.perf_counter()
+    for i in range(iterations):
+        evaluate(CONDITIONS[i % len(CONDITIONS)])
+    elapsed = time.perf_counter() - start
+    throughput = iterations / elapsed
+    print(f"{name:<10} {iterations} 次求值 {elapsed:.3f}s  {throughput:,.0f} 次/秒")
+    return throughput
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="条件表达式求值基准")
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    compiled = compiled_evaluator()
+    for condition in CONDITIONS:
+        assert legacy_evaluate(condition) == compiled(condition), condition
+
+    legacy = run("eval", legacy_evaluate, args.iterations)
+    fast = run("compiled", compiled, args.iterations)
+    print(f"加速比: {fast / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/bench_history_archive.py
+"""
+历史归档基准
+在临时目录中生成旧会话文件，测量：
+- 归档前后的磁盘占用与压缩方式（zstd / lzma）
+- 归档耗时
+- 归档前后扫描历史目录（os.walk + stat）的耗时
+- 读取会话的延迟：会话文件 vs 归档（同一块命中缓存 / 未命中）
+
+用法:
+    python benchmarks/bench_history_archive.py [--sessions 5000] [--messages 20] [--reads 500]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from typing import Dict, List, Any
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+WORDS = ["合同", "审查", "知识库", "工作流", "向量", "检索", "模型", "部署", "docker", "python", "latency", "cache"]
+
+
+def dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def walk_ms(path: Path) -> float:
+    start = time.perf_counter()
+    for root, _, files in os.walk(path):
+        for name in files:
+            os.stat(os.path.join(root, name))
+    return (time.perf_counter() - start) * 1000
+
+
+def read_ms(func, sessions: List[str]) -> List[float]:
+    samples = []
+    for session in sessions:
+        start = time.perf_counter()
+        func(session)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="历史归档基准")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=20, help="每个会话的消息数")
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_history_archive_")
+    # 应用的数据目录相对于当前目录，切换到临时目录后再导入
+    os.chdir(workdir)
+    os.environ.setdefault("HISTORY_SEARCH_ENABLED", "false")
+    from app.config import HISTORY_DIR, HISTORY_ARCHIVE_DIR  # noqa: E402
+    from app.core.history import save_history, load_history_file  # noqa: E402
+    from app.core.history_archive import history_archive, CODEC  # noqa: E402
+
+    rng = random.Random(0)
+    old = time.time() - 400 * 86400
+    sessions: List[str] = []
+    for index in range(args.sessions):
+        session = f"2024-{1 + index % 12:02d}-{1 + index % 28:02d}/chat_{index}.json"
+        messages = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))}
+            for i in range(args.messages)
+        ]
+        file_path = save_history(messages, session)
+        os.utime(file_path, (old, old))
+        sessions.append(session)
+
+    report: Dict[str, Any] = {"sessions": args.sessions, "codec": CODEC}
+    sample = rng.sample(sessions, min(args.reads, len(sessions)))
+    report["history_bytes_before"] = dir_bytes(HISTORY_DIR)
+    report["walk_ms_before"] = round(walk_ms(HISTORY_DIR), 1)
+    report["file_read_ms_p50"] = round(statistics.median(read_ms(load_history_file, sample)), 3)
+
+    start = time.perf_counter()
+    result = history_archive.archive(1)
+    report["archive_seconds"] = round(time.perf_counter() - start, 2)
+    report["archived_sessions"] = result["archived_sessions"]
+    report["history_bytes_after"] = dir_bytes(HISTORY_DIR)
+    report["archive_bytes"] = dir_bytes(HISTORY_ARCHIVE_DIR)
+    report["walk_ms_after"] = round(walk_ms(HISTORY_DIR), 1)
+
+    # 随机读取基本不命中块缓存；按会话顺序读取时相邻会话位于同一块
+    cold = read_ms(load_history_file, sample)
+    warm = read_ms(load_history_file, sorted(sessions)[:len(sample)])
+    report["archive_read_ms_p50"] = round(statistics.median(cold), 3)
+    report["archive_read_ms_p95"] = round(sorted(cold)[int(len(cold) * 0.95)], 3)
+    report["archive_sequential_read_ms_p50"] = round(statistics.median(warm), 3)
+
+    if args.json:
+        import json
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    before, after = report["history_bytes_before"], report["history_bytes_after"] + report["archive_bytes"]
+    print(f"{args.sessions} 个会话 x {args.messages} 条消息，压缩方式 {CODEC}")
+    print(f"磁盘占用      {before / 1e6:.1f} MB → {after / 1e6:.1f} MB（{before / max(after, 1):.1f}x）")
+    print(f"归档耗时      {report['archive_seconds']}s，归档 {report['archived_sessions']} 个会话")
+    print(f"扫描历史目录  {report['walk_ms_before']}ms → {report['walk_ms_after']}ms")
+    print(f"读取会话文件  p50 {report['file_read_ms_p50']}ms")
+    print(f"读取归档会话  随机 p50 {report['archive_read_ms_p50']}ms p95 {report['archive_read_ms_p95']}ms，"
+          f"顺序 p50 {report['archive_sequential_read_ms_p50']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/bench_history_search.py
+"""
+历史全文检索基准
+在临时目录中生成会话文件，测量：
+- 建立索引的吞吐量（rebuild）与索引大小
+- 保存会话时排队的开销（save_history 中的 submit）与后台批量写入耗时
+- 各类查询的延迟，并与逐个读取会话文件做子串匹配的方式对比
+
+用法:
+    python benchmarks/bench_history_search.py [--messages 100000] [--per-session 20] [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from typing import Dict, List, Any, Callable
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+CJK_WORDS = [
+    "合同", "审查", "知识库", "工作流", "向量", "检索", "模型", "部署", "服务器", "缓存",
+    "数据库", "索引", "性能", "延迟", "吞吐", "并发", "日志", "配置", "代理", "图片",
+    "生成", "翻译", "总结", "会议", "纪要", "报销", "发票", "客户", "订单", "退款"
+]
+LATIN_WORDS = [
+    "python", "docker", "api", "token", "latency", "cache", "vector", "prompt", "stream", "model",
+    "gpt", "embedding", "sqlite", "index", "query", "batch", "retry", "timeout", "proxy", "json"
+]
+# 只出现在少数消息中的词
+RARE_TERMS = ["量子纠缠", "kubernetes"]
+
+QUERIES = ["量子纠缠", "kubernetes", "合同审查", "知识库 缓存", "latency", "退", "gpt 模型"]
+
+
+def make_text(rng: random.Random, index: int) -> str:
+    words = [rng.choice(CJK_WORDS) if rng.random() < 0.6 else rng.choice(LATIN_WORDS) for _ in range(rng.randint(20, 80))]
+    if index % 997 == 0:
+        words.insert(rng.randint(0, len(words)), RARE_TERMS[(index // 997) % len(RARE_TERMS)])
+    return "".join(w if w in CJK_WORDS else f" {w} " for w in words)
+
+
+def generate(history_dir: Path, messages: int, per_session: int) -> List[Path]:
+    """生成会话文件，返回文件路径"""
+    rng = random.Random(0)
+    paths = []
+    for session_index in range(0, messages, per_session):
+        day = f"2024-{1 + (session_index // per_session) % 12:02d}-{1 + (session_index // per_session) % 28:02d}"
+        file_path = history_dir / day / f"chat_{session_index}.json"
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        msgs = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": make_text(rng, session_index + i), "id": f"{session_index}-{i}"}
+            for i in range(min(per_session, messages - session_index))
+        ]
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump({"messages": msgs, "kb_id": "kb1" if session_index % 3 == 0 else None}, f, ensure_ascii=False)
+        paths.append(file_path)
+    return paths
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def timed(func: Callable[[], Any], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def linear_scan(paths: List[Path], query: str) -> int:
+    """旧方式：逐个读取会话文件做子串匹配"""
+    terms = [t.lower() for t in query.split()]
+    hits = 0
+    for file_path in paths:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for msg in data["messages"]:
+            text = msg["content"].lower()
+            if all(t in text for t in terms):
+                hits += 1
+    return hits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="历史全文检索基准")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--per-session", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_history_search_")
+    # 应用的数据目录相对于当前目录，切换到临时目录后再导入
+    os.chdir(workdir)
+    from app.core.history import save_history  # noqa: E402
+    from app.core.history_search import history_search  # noqa: E402
+    from app.config import HISTORY_DIR, HISTORY_SEARCH_PATH  # noqa: E402
+
+    if history_search is None:
+        print("历史检索未启用（HISTORY_SEARCH_ENABLED=false 或 SQLite 不支持 FTS5）")
+        return
+
+    report: Dict[str, Any] = {"messages": args.messages, "per_session": args.per_session}
+
+    start = time.perf_counter()
+    paths = generate(HISTORY_DIR, args.messages, args.per_session)
+    report["generate_seconds"] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    history_search.rebuild()
+    elapsed = time.perf_counter() - start
+    report["rebuild_seconds"] = round(elapsed, 2)
+    report["rebuild_messages_per_second"] = round(args.messages / elapsed)
+    report["index_bytes"] = sum(
+        p.stat().st_size for p in HISTORY_SEARCH_PATH.parent.glob(HISTORY_SEARCH_PATH.name + "*")
+    )
+
+    # 保存会话的开销：每次保存追加一轮对话，索引更新只排队
+    session = paths[0].relative_to(HISTORY_DIR).as_posix()
+    with open(paths[0], "r", encoding="utf-8") as f:
+        messages = json.load(f)["messages"]
+    rng = random.Random(1)
+    submit_ms = []
+    for turn in range(50):
+        messages = messages + [{"role": "user", "content": make_text(rng, turn)}]
+        start = time.perf_counter()
+        history_search.submit(HISTORY_DIR / session, messages, None)
+        submit_ms.append((time.perf_counter() - start) * 1000)
+        save_history(messages, session)
+    start = time.perf_counter()
+    history_search.flush()
+    report["submit_ms_p50"] = round(statistics.median(submit_ms), 3)
+    report["submit_ms_p95"] = round(percentile(submit_ms, 0.95), 3)
+    report["flush_after_50_saves_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    report["queries"] = {}
+    for query in QUERIES:
+        result = history_search.search(query, limit=20)
+        samples = timed(lambda: history_search.search(query, limit=20), args.repeat)
+        report["queries"][query] = {
+            "hits": result["total"],
+            "p50_ms": round(statistics.median(samples), 2),
+            "p95_ms": round(percentile(samples, 0.95), 2)
+        }
+    samples = timed(lambda: history_search.search("合同", limit=20, by_session=True), args.repeat)
+    report["by_session_p50_ms"] = round(statistics.median(samples), 2)
+
+    start = time.perf_counter()
+    scan_hits = linear_scan(paths, RARE_TERMS[0])
+    report["linear_scan_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    report["linear_scan_hits"] = scan_hits
+    history_search.close()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{args.messages} 条消息 / {len(paths)} 个会话")
+    print(f"建立索引      {report['rebuild_seconds']}s  {report['rebuild_messages_per_second']:,} 条/秒  索引大小 {report['index_bytes'] / 1e6:.1f} MB")
+    print(f"保存时排队    p50 {report['submit_ms_p50']}ms  p95 {report['submit_ms_p95']}ms  50 次保存合并写入 {report['flush_after_50_saves_ms']}ms")
+    for query, row in report["queries"].items():
+        print(f"查询 {query:<12} 命中 {row['hits']:>6}  p50 {row['p50_ms']:>7}ms  p95 {row['p95_ms']:>7}ms")
+    print(f"按会话分组    p50 {report['by_session_p50_ms']}ms")
+    print(f"逐个读取文件  {report['linear_scan_ms']}ms（命中 {report['linear_scan_hits']}，索引命中 {report['queries'][RARE_TERMS[0]]['hits']}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/bench_metrics.py
+"""
+指标与追踪的开销基准
+测量热路径上每次记录的耗时：
+- counter.inc / histogram.observe（带标签）
+- with histogram.time()：不启用追踪 / 启用追踪并导出到本地文件
+- 多线程并发 observe 时的吞吐
+- GET /metrics 渲染的耗时
+并按一次流式聊天约 15 次记录估算每个请求增加的耗时
+
+用法:
+    python benchmarks/bench_metrics.py [--iterations 200000] [--threads 4] [--json]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+# 一次流式聊天的记录次数：请求、首块、适配、图片编码、向量化、检索、上游调用与首块、保存历史等
+RECORDS_PER_REQUEST = 15
+
+
+def ns_per_op(func: Callable[[], Any], iterations: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="指标与追踪的开销基准")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_metrics_")
+    os.chdir(workdir)
+    trace_path = Path(workdir) / "spans.jsonl"
+    os.environ["TRACE_EXPORT_PATH"] = str(trace_path)
+    from app.core.metrics import registry, Counter, Histogram  # noqa: E402
+    from app.core.tracing import tracer  # noqa: E402
+
+    counter = Counter("bench_total", "bench", ("model", "outcome"))
+    histogram = Histogram("bench_seconds", "bench", ("upstream", "model"))
+    n = args.iterations
+    report: Dict[str, Any] = {"iterations": n}
+
+    report["baseline_ns"] = round(ns_per_op(lambda: None, n), 1)
+    report["counter_inc_ns"] = round(ns_per_op(lambda: counter.inc("gpt-4o", "success"), n), 1)
+    report["histogram_observe_ns"] = round(ns_per_op(lambda: histogram.observe(0.123, "openai", "gpt-4o"), n), 1)
+
+    def timed() -> None:
+        with histogram.time("openai", "gpt-4o", span="bench"):
+            pass
+
+    # 不启用追踪
+    exporter = tracer.exporter
+    tracer.exporter = None
+    report["timer_ns"] = round(ns_per_op(timed, n), 1)
+    report["span_disabled_ns"] = round(ns_per_op(lambda: tracer.span("bench").end(), n), 1)
+
+    # 启用追踪，span 由后台线程写入文件
+    tracer.exporter = exporter
+    spans = min(n, 50000)
+    report["timer_with_span_ns"] = round(ns_per_op(timed, spans), 1)
+    tracer.close()
+    report["trace_file_bytes"] = trace_path.stat().st_size if trace_path.exists() else 0
+    report["spans_exported"] = exporter.exported if exporter else 0
+    tracer.exporter = None
+
+    # 多线程并发记录
+    per_thread = n // args.threads
+
+    def worker() -> None:
+        for _ in range(per_thread):
+            histogram.observe(0.05, "openai", "gpt-4o")
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    report["threads"] = args.threads
+    report["concurrent_observe_per_sec"] = round(per_thread * args.threads / elapsed)
+
+    # 渲染：每个直方图 50 组标签
+    for metric in registry._metrics:
+        if isinstance(metric, Histogram):
+            for index in range(50 // max(len(metric.labelnames), 1)):
+                metric.observe(0.01, *(f"v{index}" for _ in metric.labelnames))
+    start = time.perf_counter()
+    text = registry.render()
+    report["render_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    report["render_bytes"] = len(text)
+
+    report["per_request_us"] = round(RECORDS_PER_REQUEST * report["timer_ns"] / 1000, 2)
+    report["per_request_with_trace_us"] = round(RECORDS_PER_REQUEST * report["timer_with_span_ns"] / 1000, 2)
+
+    if args.json:
+        import json
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{n} 次迭代（空循环 {report['baseline_ns']}ns/次）")
+    print(f"counter.inc            {report['counter_inc_ns']:>8} ns")
+    print(f"histogram.observe      {report['histogram_observe_ns']:>8} ns")
+    print(f"histogram.time()       {report['timer_ns']:>8} ns（不启用追踪）")
+    print(f"tracer.span() 空操作   {report['span_disabled_ns']:>8} ns")
+    print(f"histogram.time(span=)  {report['timer_with_span_ns']:>8} ns（启用追踪，导出 {report['spans_exported']} 个 span，"
+          f"{report['trace_file_bytes'] / 1e6:.1f} MB）")
+    print(f"{args.threads} 线程并发 observe  {report['concurrent_observe_per_sec']:,} 次/秒")
+    print(f"渲染 /metrics          {report['render_ms']} ms，{report['render_bytes'] / 1e3:.0f} KB")
+    print(f"每个聊天请求约 {RECORDS_PER_REQUEST} 次记录：{report['per_request_us']} µs，"
+          f"启用追踪 {report['per_request_with_trace_us']} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+# benchmarks/bench_suite.py
+"""
+端到端基准套件
+在临时目录中启动本地 OpenAI 兼容桩服务器（benchmarks/fake_openai.py）和应用（uvicorn main:app），
+以指定并发驱动以下场景：
+- chat_stream: POST /api/chat 流式，记录首块延迟与总耗时
+- chat: POST /api/chat 非流式
+- upload: POST /api/files/upload 上传文本文件（分块、向量化写入知识库）
+- rag: 绑定知识库的非流式聊天（知识库检索 + 上游）
+- workflow: 执行 start → llm → end 的工作流
+每个场景报告吞吐、延迟 p50 / p95 / p99、首块延迟、服务端 Server-Timing 各阶段的中位数与应用进程的内存（RSS），
+以及应用进程与所有子进程（工作进程、向量服务、代码沙箱）的 RSS 之和，
+结果写入 JSON 文件；指定 --compare 时与之前的结果比较，超过 --max-regression 的退化以非零状态退出
+--workers N 以生产模式（python main.py --workers N）启动应用，用于比较 1 个与 N 个工作进程的吞吐与内存
+
+用法:
+    python benchmarks/bench_suite.py [--scenarios chat_stream,chat,upload,rag,workflow] [--requests 100]
+                                     [--concurrency 8] [--latency 0.2] [--token-rate 50] [--tokens 100]
+                                     [--image-every 0] [--image-size 512] [--env KEY=VALUE ...] [--workers N]
+                                     [--output results.json] [--compare baseline.json] [--max-regression 0.2] [--json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / "src"
+RESULTS_DIR = BENCH_DIR / "results"
+
+SCENARIOS = ("chat_stream", "chat", "upload", "rag", "workflow")
+WORDS = ["合同", "审查", "知识库", "工作流", "向量", "检索", "模型", "部署", "docker", "python", "latency", "cache"]
+
+# 比较时的指标：(路径, 越大越好)
+COMPARE_METRICS: Tuple[Tuple[str, bool], ...] = (
+    ("throughput_rps", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+    ("ttft_ms.p50", False),
+    ("ttft_ms.p95", False),
+    ("rss_peak_mb", False),
+    ("rss_tree_peak_mb", False),
+)
+
+
+# =============================================================================
+# 进程与统计
+# =============================================================================
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """进程的常驻内存（MB），读取 /proc，不可用时尝试 psutil"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 1024 / 1024
+    except Exception:
+        return None
+
+
+def process_tree(pid: int) -> List[int]:
+    """进程及其所有子孙进程的 PID（读取 /proc，不可用时只返回该进程）"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return [pid]
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # 进程名可能含空格与括号，从最后一个右括号之后解析
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def tree_rss_mb(pid: int) -> Optional[float]:
+    """进程树的常驻内存之和（MB）；进程间共享的页会重复计算"""
+    values = [value for value in map(rss_mb, process_tree(pid)) if value is not None]
+    return sum(values) if values else None
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {
+        "p50": round(statistics.median(ordered), 2),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "mean": round(statistics.fmean(ordered), 2),
+        "max": round(ordered[-1], 2)
+    }
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """解析 Server-Timing 响应头"""
+    result: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    result[name] = float(value)
+                except ValueError:
+                    pass
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def wait_ready(url: str, proc: subprocess.Popen, timeout: float) -> float:
+    """等待服务可以响应，返回等待的秒数"""
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"进程已退出（{proc.returncode}）: {url}")
+            try:
+                if (await client.get(url)).status_code < 400:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"等待 {url} 超时")
+
+
+# =============================================================================
+# 场景
+# =============================================================================
+
+class Sample:
+    __slots__ = ("latency_ms", "ttft_ms", "timings", "error")
+
+    def __init__(self) -> None:
+        self.latency_ms: float = 0.0
+        self.ttft_ms: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[str] = None
+
+
+class Suite:
+    def __init__(self, args: argparse.Namespace, app_url: str, fake_url: str) -> None:
+        self.args = args
+        self.app_url = app_url
+        self.fake_url = fake_url
+        self.kb_id: Optional[str] = None
+        self.workflow_id: Optional[str] = None
+
+    def text(self, index: int, words: int) -> str:
+        return " ".join(WORDS[(index * 7 + i * 13) % len(WORDS)] for i in range(words))
+
+    def chat_body(self, index: int, stream: bool, scenario: str) -> Dict[str, Any]:
+        return {
+            "api_url": self.fake_url,
+            "api_key": "bench",
+            "model": "fake-model",
+            "messages": [{"role": "user", "content": f"问题 {index}: {self.text(index, 20)}"}],
+            "session_file": f"bench_{scenario}_{index}.json",
+            "stream": stream,
+            "cache": "off"
+        }
+
+    async def chat_stream(self, client: httpx.AsyncClient, index: int, sample: Sample) -> None:
+        start = time.perf_counter()
+        async with client.stream("POST", "/api/chat", json=self.chat_body(index, True, "chat_stream")) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if "error" in event:
+                    sample.error = event["error"]
+                elif event.get("done"):
+                    sample.timings = event.get("timings") or {}
+                elif sample.ttft_ms is None and event.get("content"):
+                    sample.ttft_ms = (time.perf_counter() - start) * 1000
+
+    async def chat(self, client: httpx.AsyncClient, index: int, sample: Sample) -> None:
+        response = await client.post("/api/chat", json=self.chat_body(index, False, "chat"))
+        response.raise_for_status()
+        sample.timings = parse_server_timing(response.headers.get("server-timing"))
+
+    async def upload(self, client: httpx.AsyncClient, index: int, sample: Sample) -> None:
+        content = self.text(index, self.args.upload_words).encode("utf-8")
+        files = {"file": (f"bench_upload_{index}.txt", content, "text/plain")}
+        response = await client.post("/api/files/upload", files=files)
+        response.raise_for_status()
+
+    async def setup_rag(self, client: httpx.AsyncClient) -> None:
+        names = []
+        for index in range(self.args.rag_docs):
+            name = f"bench_rag_{index}.txt"
+            files = {"file": (name, self.text(index, self.args.upload_words).encode("utf-8"), "text/plain")}
+            (await client.post("/api/files/upload", files=files)).raise_for_status()
+            names.append(name)
+        response = await client.post("/api/kb/create", json={"name": "bench", "description": "bench", "files": names})
+        response.raise_for_status()
+        self.kb_id = response.json()["id"]
+
+    async def rag(self, client: httpx.AsyncClient, index: int, sample: Sample) -> None:
+        body = self.chat_body(index, False, "rag")
+        body["kb_id"] = self.kb_id
+        response = await client.post("/api/chat", json=body)
+        response.raise_for_status()
+        sample.timings = parse_server_timing(response.headers.get("server-timing"))
+
+    async def setup_workflow(self, client: httpx.AsyncClient) -> None:
+        nodes = [
+            {"node_id": "start", "node_type": "start", "position": {"x": 0, "y": 0}, "data": {}},
+            {"node_id": "llm", "node_type": "llm", "position": {"x": 200, "y": 0}, "data": {
+                "api_url": self.fake_url, "api_key": "bench", "model": "fake-model",
+                "user_message": "{{question}}", "temperature": 0.7
+            }},
+            {"node_id": "end", "node_type": "end", "position": {"x": 400, "y": 0}, "data": {}}
+        ]
+        edges = [
+            {"id": "e1", "source": "start", "target": "llm"},
+            {"id": "e2", "source": "llm", "target": "end"}
+        ]
+        response = await client.post("/api/workflows/create", params={"name": "bench"}, json={"nodes": nodes, "edges": edges})
+        response.raise_for_status()
+        self.workflow_id = response.json()["workflow"]["workflow_id"]
+
+    async def workflow(self, client: httpx.AsyncClient, index: int, sample: Sample) -> None:
+        response = await client.post(
+            f"/api/workflows/{self.workflow_id}/execute",
+            json={"workflow_id": self.workflow_id, "inputs": {"question": f"问题 {index}"}}
+        )
+        response.raise_for_status()
+        result = response.json()
+        if result.get("status") != "completed":
+            sample.error = result.get("error") or result.get("status")
+        sample.timings = result.get("node_timings") or {}
+
+    async def run_scenario(self, name: str, app_pid: int) -> Dict[str, Any]:
+        """以指定并发执行一个场景"""
+        args = self.args
+        func: Callable[[httpx.AsyncClient, int, Sample], Awaitable[None]] = getattr(self, name)
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=self.app_url, timeout=args.timeout, limits=limits) as client:
+            setup = getattr(self, f"setup_{name}", None)
+            if setup is not None:
+                await setup(client)
+
+            samples: List[Sample] = []
+            counter = iter(range(args.warmup + args.requests))
+            rss_samples: List[float] = []
+            tree_samples: List[float] = []
+
+            async def worker() -> None:
+                for index in counter:
+                    sample = Sample()
+                    start = time.perf_counter()
+                    try:
+                        await func(client, index, sample)
+                    except Exception as e:
+                        sample.error = f"{type(e).__name__}: {e}"
+                    sample.latency_ms = (time.perf_counter() - start) * 1000
+                    if index >= args.warmup:
+                        samples.append(sample)
+
+            async def sample_memory() -> None:
+                while True:
+                    value = rss_mb(app_pid)
+                    if value is not None:
+                        rss_samples.append(value)
+                    value = tree_rss_mb(app_pid)
+                    if value is not None:
+                        tree_samples.append(value)
+                    await asyncio.sleep(0.2)
+
+            monitor = asyncio.create_task(sample_memory())
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+            monitor.cancel()
+
+        ok = [sample for sample in samples if sample.error is None]
+        errors = [sample.error for sample in samples if sample.error is not None]
+        phases: Dict[str, List[float]] = {}
+        for sample in ok:
+            for phase, ms in sample.timings.items():
+                phases.setdefault(phase, []).append(ms)
+        result: Dict[str, Any] = {
+            "requests": len(samples),
+            "errors": len(errors),
+            "seconds": round(elapsed, 2),
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": percentiles([sample.latency_ms for sample in ok]),
+            "ttft_ms": percentiles([sample.ttft_ms for sample in ok if sample.ttft_ms is not None]),
+            "server_timing_p50_ms": {phase: round(statistics.median(values), 2) for phase, values in phases.items()},
+            "rss_peak_mb": round(max(rss_samples), 1) if rss_samples else None,
+            "rss_end_mb": round(rss_samples[-1], 1) if rss_samples else None,
+            "rss_tree_peak_mb": round(max(tree_samples), 1) if tree_samples else None
+        }
+        if errors:
+            result["first_error"] = errors[0][:300]
+        return result
+
+
+# =============================================================================
+# 比较
+# =============================================================================
+
+def _lookup(data: Dict[str, Any], path: str) -> Optional[float]:
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data if isinstance(data, (int, float)) else None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> Tuple[List[str], List[str]]:
+    """逐场景比较指标，返回 (所有变化的描述, 超过阈值的退化)"""
+    lines: List[str] = []
+    regressions: List[str] = []
+    for scenario, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base or "error" in result or "error" in base:
+            continue
+        for path, higher_is_better in COMPARE_METRICS:
+            new, old = _lookup(result, path), _lookup(base, path)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            line = f"{scenario:12} {path:16} {old:>10} → {new:<10} {change:+.1%}"
+            lines.append(line)
+            if worse > max_regression:
+                regressions.append(line)
+    return lines, regressions
+
+
+# =============================================================================
+# 入口
+# =============================================================================
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="bench_suite_"))
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}/v1"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    fake_cmd = [
+        sys.executable, str(BENCH_DIR / "fake_openai.py"), "--port", str(fake_port),
+        "--latency", str(args.latency), "--token-rate", str(args.token_rate), "--tokens", str(args.tokens),
+        "--image-every", str(args.image_every), "--image-size", str(args.image_size)
+    ]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_DIR), os.environ.get("PYTHONPATH")]))}
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    if args.workers:
+        # 生产模式，N > 1 时 main.py 在空闲端口上启动向量服务
+        env.setdefault("VECTOR_SERVICE_PORT", str(free_port()))
+        app_cmd = [sys.executable, str(SRC_DIR / "main.py"), "--port", str(app_port), "--workers", str(args.workers)]
+    else:
+        app_cmd = [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+            "--log-level", "warning", "--no-access-log"
+        ]
+    log = open(workdir / "app.log", "wb")
+    fake = subprocess.Popen(fake_cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    app = subprocess.Popen(app_cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workdir": str(workdir),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "json")}
+        },
+        "scenarios": {}
+    }
+    try:
+        await wait_ready(f"{fake_url}/models", fake, 30)
+        # 开始监听的耗时，以及向量化模型预热完成（GET /ready 返回 200）的耗时
+        report["meta"]["app_startup_seconds"] = round(await wait_ready(f"{app_url}/health", app, args.startup_timeout), 2)
+        report["meta"]["app_ready_seconds"] = round(
+            report["meta"]["app_startup_seconds"] + await wait_ready(f"{app_url}/ready", app, args.startup_timeout), 2
+        )
+        report["meta"]["rss_idle_mb"] = rss_mb(app.pid)
+        report["meta"]["rss_tree_idle_mb"] = tree_rss_mb(app.pid)
+        suite = Suite(args, app_url, fake_url)
+        for name in args.scenarios:
+            if not args.json:
+                print(f"运行 {name} ...", file=sys.stderr)
+            try:
+                report["scenarios"][name] = await suite.run_scenario(name, app.pid)
+            except Exception as e:
+                report["scenarios"][name] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        for proc in (app, fake):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        log.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="端到端基准套件")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=5, help="每个场景不计入结果的预热请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时（秒）")
+    parser.add_argument("--startup-timeout", type=float, default=180.0, help="等待应用启动的超时（秒）")
+    parser.add_argument("--latency", type=float, default=0.2, help="桩服务器的首块延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="桩服务器每秒输出的 token 数，0 表示不限速")
+    parser.add_argument("--tokens", type=int, default=100, help="桩服务器每个回复的 token 数")
+    parser.add_argument("--image-every", type=int, default=0, help="每 N 个回复附带一张图片")
+    parser.add_argument("--image-size", type=int, default=512, help="图片边长（像素）")
+    parser.add_argument("--upload-words", type=int, default=2000, help="上传文件的词数")
+    parser.add_argument("--rag-docs", type=int, default=5, help="rag 场景的知识库文件数")
+    parser.add_argument("--workers", type=int, default=0, help="以 python main.py --workers N 启动应用，0 表示单进程 uvicorn main:app")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="传给应用进程的环境变量")
+    parser.add_argument("--output", help=f"结果文件，默认写入 {RESULTS_DIR.name}/bench_<时间>.json")
+    parser.add_argument("--compare", help="与之前的结果文件比较")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的最大退化比例")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    regressions: List[str] = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.max_regression)
+        report["comparison"] = {"baseline": args.compare, "changes": lines, "regressions": regressions}
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        meta = report["meta"]
+        print(f"提交 {meta['commit']}，应用启动 {meta.get('app_startup_seconds')}s（就绪 {meta.get('app_ready_seconds')}s），空闲内存 {meta.get('rss_idle_mb') or 0:.0f} MB"
+              f"（含子进程 {meta.get('rss_tree_idle_mb') or 0:.0f} MB），工作进程 {args.workers or 1}，"
+              f"并发 {args.concurrency}，每场景 {args.requests} 个请求")
+        for name, result in report["scenarios"].items():
+            if "error" in result:
+                print(f"{name:12} 失败: {result['error']}")
+                continue
+            latency, ttft = result["latency_ms"], result["ttft_ms"]
+            line = f"{name:12} {result['throughput_rps']:>7} req/s  "
+            if latency:
+                line += f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+            line += f"错误 {result['errors']}  RSS 峰值 {result['rss_peak_mb']} MB（含子进程 {result.get('rss_tree_peak_mb')} MB）"
+            if ttft:
+                line += f"  首块 p50 {ttft['p50']}ms p95 {ttft['p95']}ms"
+            print(line)
+            if result["server_timing_p50_ms"]:
+                print(" " * 13 + "服务端 p50: " + ", ".join(f"{k} {v}ms" for k, v in result["server_timing_p50_ms"].items()))
+            if result.get("first_error"):
+                print(" " * 13 + f"首个错误: {result['first_error']}")
+        if args.compare:
+            print(f"\n与 {args.compare} 比较（退化阈值 {args.max_regression:.0%}）:")
+            for line in report["comparison"]["changes"]:
+                print(("! " if line in regressions else "  ") + line)
+        print(f"\n结果已写入 {output}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
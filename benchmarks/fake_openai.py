@@ -0,0 +1,161 @@
+# benchmarks/fake_openai.py
+"""
+本地的 OpenAI 兼容桩服务器，供基准测试代替真实上游
+- POST /v1/chat/completions：流式（SSE）与非流式，首块延迟、输出速率与回复长度可配置
+- 每 N 个回复附带一张 base64 图片（模拟绘图模型），图片由随机像素生成，不易被压缩
+- GET /v1/models：模型列表
+- GET /stats：收到的请求数与正在处理的请求数
+不校验 api_key，回复内容与请求无关
+
+用法:
+    python benchmarks/fake_openai.py [--port 18080] [--latency 0.2] [--token-rate 50] [--tokens 100]
+                                     [--image-every 0] [--image-size 512] [--error-rate 0]
+"""
+import io
+import json
+import time
+import random
+import base64
+import asyncio
+import argparse
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = ["合同", "审查", "知识库", "工作流", "向量", "检索", "模型", "部署", "latency", "cache", "token", "stream"]
+
+
+@dataclass
+class FakeConfig:
+    # 首块（非流式为整个回复开始生成前）的延迟（秒）
+    latency: float = 0.2
+    # 每秒输出的 token 数，0 表示不限速
+    token_rate: float = 50.0
+    # 每个回复的 token 数
+    tokens: int = 100
+    # 每 N 个回复附带一张图片，0 表示不附带
+    image_every: int = 0
+    # 图片边长（像素）
+    image_size: int = 512
+    # 返回 500 的比例（0~1）
+    error_rate: float = 0.0
+
+
+def _image_markdown(size: int) -> str:
+    """随机像素的 PNG，以 markdown data URI 的形式返回"""
+    from PIL import Image
+    img = Image.frombytes("RGB", (size, size), random.randbytes(size * size * 3))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return f"\n![image](data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()})\n"
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="fake-openai")
+    state = {"requests": 0, "inflight": 0}
+    image = _image_markdown(config.image_size) if config.image_every > 0 else ""
+
+    def reply_tokens(index: int) -> List[str]:
+        rng = random.Random(index)
+        tokens = [rng.choice(WORDS) + " " for _ in range(config.tokens)]
+        if image and index % config.image_every == 0:
+            tokens.append(image)
+        return tokens
+
+    async def emit(tokens: List[str]) -> AsyncIterator[str]:
+        """按 token_rate 产出 token，速率较高时每次休眠产出多个以减少调度开销"""
+        if config.token_rate <= 0:
+            yield "".join(tokens)
+            return
+        per_sleep = max(1, int(config.token_rate / 200))
+        interval = per_sleep / config.token_rate
+        for start in range(0, len(tokens), per_sleep):
+            await asyncio.sleep(interval)
+            yield "".join(tokens[start:start + per_sleep])
+
+    @app.get("/v1/models")
+    async def models() -> Dict[str, Any]:
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "bench"}]}
+
+    @app.get("/stats")
+    async def stats() -> Dict[str, Any]:
+        return state
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request) -> Any:
+        body = await request.json()
+        state["requests"] += 1
+        index = state["requests"]
+        model = body.get("model", "fake-model")
+        created = int(time.time())
+        if config.error_rate > 0 and random.random() < config.error_rate:
+            return JSONResponse({"error": {"message": "fake upstream error", "type": "server_error"}}, status_code=500)
+
+        tokens = reply_tokens(index)
+        state["inflight"] += 1
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(config.latency)
+                async for _ in emit(tokens):
+                    pass
+            finally:
+                state["inflight"] -= 1
+            return {
+                "id": f"chatcmpl-{index}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            }
+
+        async def sse() -> AsyncIterator[str]:
+            try:
+                await asyncio.sleep(config.latency)
+                async for text in emit(tokens):
+                    chunk = {
+                        "id": f"chatcmpl-{index}",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                final = {
+                    "id": f"chatcmpl-{index}",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                state["inflight"] -= 1
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI 兼容桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.2, help="首块延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="每秒输出的 token 数，0 表示不限速")
+    parser.add_argument("--tokens", type=int, default=100, help="每个回复的 token 数")
+    parser.add_argument("--image-every", type=int, default=0, help="每 N 个回复附带一张图片")
+    parser.add_argument("--image-size", type=int, default=512, help="图片边长（像素）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeConfig(args.latency, args.token_rate, args.tokens, args.image_every, args.image_size, args.error_rate)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,118 @@
 """
 高级 System Prompt 构建器
 支持：动态时间、角色设定、上下文注入、输出约束、思维链引导
+
+两种布局（PROMPT_LAYOUT）：
+- legacy: 时间和知识库上下文位于提示词中部
+- cache_friendly: 静态部分（角色、知识库说明、约束、输出格式）在前且同一智能体逐字节相同，
+  易变部分（时间、检索上下文）在后，可通过 build_messages() 拆成单独的消息
+
+compile() 将静态部分预先拼接为 CompiledPrompt，每次请求只需填充时间与检索上下文
 """
 import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.config import PROMPT_LAYOUT
+
+PROMPT_LAYOUTS = ("legacy", "cache_friendly")
+
+DEFAULT_CONSTRAINTS = [
+    "Use Markdown for formatting.",
+    "Be concise and professional.",
+    "Do not hallucinate."
+]
+
+NO_CONTEXT_TEXT = "No relevant context found in the database for this query."
+
+
+def _current_time() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+
+
+class CompiledPrompt:
+    """
+    预编译的系统提示词
+    静态部分在编译时拼接一次，render() 只填充时间与检索上下文
+    """
+
+    def __init__(
+        self,
+        layout: str,
+        role_definition: str,
+        constraints: List[str],
+        output_format: str,
+        knowledge_base_name: Optional[str]
+    ) -> None:
+        self.layout: str = layout
+        self.knowledge_base_name: Optional[str] = knowledge_base_name
+
+        role_section = f"### Role Definition\n{role_definition}"
+        tail_sections = ["### Constraints\n" + "\n".join([f"- {c}" for c in DEFAULT_CONSTRAINTS + constraints])]
+        if output_format:
+            tail_sections.append(f"### Output Format\n{output_format}")
+
+        # legacy: 角色 | 时间 | 知识库上下文 | 约束与输出格式
+        self._legacy_head: str = role_section
+        self._legacy_tail: str = "\n\n".join(tail_sections)
+
+        # cache_friendly: 角色、知识库说明、约束与输出格式 | 时间、知识库上下文
+        static_sections = [role_section]
+        if knowledge_base_name:
+            static_sections.append(
+                f"### Knowledge Base ({knowledge_base_name})\n"
+                "You have access to local documents, provided in the Knowledge Base Context section "
+                "together with each question. Use this information to answer the user's question. "
+                "If the answer is not in the context, strictly state that you don't know."
+            )
+        self.static_content: str = "\n\n".join(static_sections + tail_sections)
+
+    def _legacy_content(self, context: str) -> str:
+        prompt_parts: List[str] = [self._legacy_head, f"### Current Environment\nTime: {_current_time()}"]
+
+        # 如果是知识库模式，强化上下文指令
+        if self.knowledge_base_name:
+            prompt_parts.append(f"### Knowledge Base Context ({self.knowledge_base_name})")
+            if context:
+                prompt_parts.append(
+                    "You have access to the following local documents. "
+                    "Use this information to answer the user's question. "
+                    "If the answer is not in the context, strictly state that you don't know.\n"
+                    f"```text\n{context}\n```"
+                )
+            else:
+                prompt_parts.append(NO_CONTEXT_TEXT)
+
+        prompt_parts.append(self._legacy_tail)
+        return "\n\n".join(prompt_parts)
+
+    def volatile_content(self, context: str = "") -> str:
+        """cache_friendly 布局的易变部分：时间与检索上下文"""
+        volatile_parts: List[str] = [f"### Current Environment\nTime: {_current_time()}"]
+        if self.knowledge_base_name:
+            context_text = f"```text\n{context}\n```" if context else NO_CONTEXT_TEXT
+            volatile_parts.append(f"### Knowledge Base Context ({self.knowledge_base_name})\n{context_text}")
+        return "\n\n".join(volatile_parts)
+
+    def render_single(self, context: str = "") -> Dict[str, str]:
+        """生成单条 system message"""
+        if self.layout == "cache_friendly":
+            content = f"{self.static_content}\n\n{self.volatile_content(context)}"
+        else:
+            content = self._legacy_content(context)
+        return {"role": "system", "content": content}
+
+    def render(self, context: str = "") -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+        """
+        生成 (系统消息, 易变上下文消息)
+        cache_friendly 布局下易变部分单独成为一条消息，由调用方放在最新的用户消息之前；
+        legacy 布局下第二项为 None
+        """
+        if self.layout != "cache_friendly":
+            return self.render_single(context), None
+        return (
+            {"role": "system", "content": self.static_content},
+            {"role": "system", "content": self.volatile_content(context)}
+        )
 
 
 class SystemPromptBuilder:
@@ -13,8 +122,9 @@ class SystemPromptBuilder:
     使用流式 API 构建复杂的系统提示词
     """
 
-    def __init__(self, model_name: str = "default") -> None:
+    def __init__(self, model_name: str = "default", layout: Optional[str] = None) -> None:
         self.model_name: str = model_name
+        self.layout: str = layout or PROMPT_LAYOUT
         self.role_definition: str = "你是一个智能、乐于助人的AI助手。"
         self.context_data: str = ""
         self.constraints: List[str] = []
@@ -47,55 +157,85 @@ class SystemPromptBuilder:
         self.output_format = style
         return self
 
-    def build(self) -> Dict[str, str]:
-        """生成最终发送给 API 的 system message 对象"""
-
-        # 1. 基础信息构建
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    def compile(self) -> CompiledPrompt:
+        """预编译静态部分（不包含已注入的上下文）"""
+        return CompiledPrompt(
+            layout=self.layout,
+            role_definition=self.role_definition,
+            constraints=list(self.constraints),
+            output_format=self.output_format,
+            knowledge_base_name=self.knowledge_base_name
+        )
 
-        # 2. 组装 Prompt
-        prompt_parts: List[str] = [
-            f"### Role Definition\n{self.role_definition}",
-            f"### Current Environment\nTime: {current_time}",
-        ]
+    def build_split(self) -> Tuple[str, str]:
+        """
+        按 cache_friendly 布局生成 (静态部分, 易变部分)
+        静态部分只取决于角色、知识库名称、约束和输出格式
+        """
+        compiled = self.compile()
+        return compiled.static_content, compiled.volatile_content(self.context_data)
 
-        # 3. 如果是知识库模式，强化上下文指令
-        if self.knowledge_base_name:
-            prompt_parts.append(f"### Knowledge Base Context ({self.knowledge_base_name})")
-            if self.context_data:
-                prompt_parts.append(
-                    "You have access to the following local documents. "
-                    "Use this information to answer the user's question. "
-                    "If the answer is not in the context, strictly state that you don't know.\n"
-                    f"```text\n{self.context_data}\n```"
-                )
-            else:
-                prompt_parts.append("No relevant context found in the database for this query.")
-
-        # 4. 添加约束
-        default_constraints = [
-            "Use Markdown for formatting.",
-            "Be concise and professional.",
-            "Do not hallucinate."
-        ]
-        all_constraints = default_constraints + self.constraints
-        prompt_parts.append(
-            "### Constraints\n" + "\n".join([f"- {c}" for c in all_constraints])
-        )
+    def build(self) -> Dict[str, str]:
+        """生成最终发送给 API 的 system message 对象"""
+        return self.compile().render_single(self.context_data)
 
-        # 5. 输出格式
-        if self.output_format:
-            prompt_parts.append(f"### Output Format\n{self.output_format}")
+    def build_messages(self) -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+        """
+        生成 (系统消息, 易变上下文消息)
+        cache_friendly 布局下易变部分单独成为一条消息，由调用方放在最新的用户消息之前；
+        legacy 布局下第二项为 None
+        """
+        return self.compile().render(self.context_data)
 
-        final_content = "\n\n".join(prompt_parts)
 
-        return {"role": "system", "content": final_content}
+def attach_volatile_context(messages: List[Dict[str, Any]], volatile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """把易变上下文消息插入到最后一条用户消息之前，保持之前的消息前缀不变"""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].get("role") == "user":
+            return messages[:index] + [volatile] + messages[index:]
+    return messages + [volatile]
 
 
 # =============================================================================
 # 工厂函数
 # =============================================================================
 
+def _rag_prompt_builder(
+    kb_name: str,
+    context: str = "",
+    role: Optional[str] = None,
+    constraints: Optional[List[str]] = None,
+    output_format: Optional[str] = None
+) -> SystemPromptBuilder:
+    builder = SystemPromptBuilder()
+
+    if role:
+        builder.set_role(role)
+    else:
+        builder.set_role(f"你是 '{kb_name}' 的专属知识库助手。")
+
+    builder = (
+        builder
+        .bind_knowledge_base(kb_name)
+        .inject_context(context)
+        .add_constraint("优先基于提供的 [Context] 回答问题。")
+        .add_constraint("如果 [Context] 中没有答案，请明确告知用户。")
+    )
+    for constraint in constraints or []:
+        builder.add_constraint(constraint)
+    if output_format:
+        builder.set_output_style(output_format)
+    return builder
+
+
+def _chat_prompt_builder() -> SystemPromptBuilder:
+    return (
+        SystemPromptBuilder()
+        .set_role("你是一个智能体，你必须完全按照用户的指令进行回答。")
+        .add_constraint("回答要富有逻辑性。")
+    )
+
+
 def create_rag_system_prompt(
     kb_name: str,
     context: str,
@@ -112,21 +252,36 @@ def create_rag_system_prompt(
     Returns:
         系统消息字典
     """
-    builder = SystemPromptBuilder()
+    return _rag_prompt_builder(kb_name, context, role).build()
 
-    if role:
-        builder.set_role(role)
-    else:
-        builder.set_role(f"你是 '{kb_name}' 的专属知识库助手。")
 
-    return (
-        builder
-        .bind_knowledge_base(kb_name)
-        .inject_context(context)
-        .add_constraint("优先基于提供的 [Context] 回答问题。")
-        .add_constraint("如果 [Context] 中没有答案，请明确告知用户。")
-        .build()
-    )
+def create_rag_system_messages(
+    kb_name: str,
+    context: str,
+    role: Optional[str] = None
+) -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+    """
+    按当前布局创建 RAG 模式的 (系统消息, 易变上下文消息)，参数同 create_rag_system_prompt
+    """
+    return _rag_prompt_builder(kb_name, context, role).build_messages()
+
+
+def compile_rag_prompt(
+    kb_name: str,
+    role: Optional[str] = None,
+    constraints: Optional[List[str]] = None,
+    output_format: Optional[str] = None
+) -> CompiledPrompt:
+    """
+    预编译 RAG 模式的系统提示，检索上下文在 render() 时填入
+
+    Args:
+        kb_name: 知识库名称
+        role: 可选的角色定义
+        constraints: 追加的约束
+        output_format: 输出格式要求
+    """
+    return _rag_prompt_builder(kb_name, role=role, constraints=constraints, output_format=output_format).compile()
 
 
 def create_chat_system_prompt() -> Dict[str, str]:
@@ -136,9 +291,14 @@ def create_chat_system_prompt() -> Dict[str, str]:
     Returns:
         系统消息字典
     """
-    return (
-        SystemPromptBuilder()
-        .set_role("你是一个智能体，你必须完全按照用户的指令进行回答。")
-        .add_constraint("回答要富有逻辑性。")
-        .build()
-    )
\ No newline at end of file
+    return _chat_prompt_builder().build()
+
+
+def create_chat_system_messages() -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+    """按当前布局创建普通聊天模式的 (系统消息, 易变上下文消息)"""
+    return _chat_prompt_builder().build_messages()
+
+
+def compile_chat_prompt() -> CompiledPrompt:
+    """预编译普通聊天模式的系统提示"""
+    return _chat_prompt_builder().compile()
@@ -4,54 +4,84 @@
 负责加载环境变量、定义基础路径和默认配置
 """
 import os
+import time
 import socket
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
 
+# 代理探测结果的缓存文件：有效期内（NETWORK_PROBE_TTL 秒）--reload 重启或再次启动时不再探测
+NETWORK_PROBE_CACHE: Path = Path(".network_probe")
+
+
+def _probe_proxy(host: str, port: int) -> bool:
+    """代理端口是否可以连接，结果在有效期内复用缓存"""
+    ttl = float(os.getenv("NETWORK_PROBE_TTL", "600"))
+    try:
+        if ttl > 0 and time.time() - NETWORK_PROBE_CACHE.stat().st_mtime < ttl:
+            return NETWORK_PROBE_CACHE.read_text().strip() == "1"
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            available = True
+    except OSError:
+        available = False
+    try:
+        NETWORK_PROBE_CACHE.write_text("1" if available else "0")
+    except OSError:
+        pass
+    return available
+
+
 def setup_network() -> None:
     """
     智能网络配置：检测代理可用性
     - 如果代理可用（端口7890），设置代理直接访问 Hugging Face
     - 如果代理不可用，使用国内镜像
+    - 已设置 HF_ENDPOINT 或 HTTPS_PROXY（含 .env）时不探测；NETWORK_PROBE=false 时不探测，直接使用镜像
     """
+    if os.getenv("HF_ENDPOINT") or os.getenv("HTTPS_PROXY"):
+        return
     proxy_host: str = "127.0.0.1"
     proxy_port: int = 7890
 
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(1)
-        result = sock.connect_ex((proxy_host, proxy_port))
-        sock.close()
-
-        if result == 0:
-            proxy_url = f"http://{proxy_host}:{proxy_port}"
-            os.environ["HTTP_PROXY"] = proxy_url
-            os.environ["HTTPS_PROXY"] = proxy_url
-            logger.info(f"🌐 检测到代理 ({proxy_url})，使用代理访问 Hugging Face")
-        else:
-            raise ConnectionError("Proxy not available")
-    except Exception:
+    probe = os.getenv("NETWORK_PROBE", "true").lower() in ("1", "true", "yes")
+    if probe and _probe_proxy(proxy_host, proxy_port):
+        proxy_url = f"http://{proxy_host}:{proxy_port}"
+        os.environ["HTTP_PROXY"] = proxy_url
+        os.environ["HTTPS_PROXY"] = proxy_url
+        logger.info(f"🌐 检测到代理 ({proxy_url})，使用代理访问 Hugging Face")
+    else:
         os.environ["HF_ENDPOINT"] = "https://hf-mirror.com"
         logger.info("🪞 未检测到代理，使用 Hugging Face 镜像 (hf-mirror.com)")
 
 
+load_dotenv()
+
 # 在加载其他模块前执行网络配置
 setup_network()
 
-load_dotenv()
-
 # =============================================================================
 # 基础路径配置
 # =============================================================================
 BASE_DIR: Path = Path(".")
 STATIC_DIR: Path = BASE_DIR / "static"
 HISTORY_DIR: Path = BASE_DIR / "history"
+# 历史会话索引（标题、消息数、kb_id、修改时间、大小）
+HISTORY_CATALOG_PATH: Path = HISTORY_DIR / "catalog.db"
+# 历史全文检索索引（SQLite FTS5），保存会话后由后台线程批量更新
+HISTORY_SEARCH_ENABLED: bool = os.getenv("HISTORY_SEARCH_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_SEARCH_PATH: Path = HISTORY_DIR / "search.db"
+# 批量写入间隔（秒）与触发立即写入的排队会话数
+HISTORY_SEARCH_FLUSH_INTERVAL: float = float(os.getenv("HISTORY_SEARCH_FLUSH_INTERVAL", "1.0"))
+HISTORY_SEARCH_BATCH_SIZE: int = int(os.getenv("HISTORY_SEARCH_BATCH_SIZE", "200"))
 UPLOAD_DIR: Path = BASE_DIR / "data_uploads"
 KB_META_FILE: Path = BASE_DIR / "kb_metadata.json"
 CHROMA_PATH: str = "chroma_db"
@@ -65,4 +95,201 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 # =============================================================================
 DEFAULT_API_URL: str = os.getenv("PROXY_BASE_URL", "https://api.openai.com/v1")
 DEFAULT_API_KEY: str = os.getenv("PROXY_API_KEY", "")
-DEFAULT_MODEL: str = os.getenv("TARGET_MODEL", "gpt-3.5-turbo")
\ No newline at end of file
+DEFAULT_MODEL: str = os.getenv("TARGET_MODEL", "gpt-3.5-turbo")
+
+# =============================================================================
+# 工作流 HTTP 节点配置
+# =============================================================================
+HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_MAX_RESPONSE_BYTES: int = int(os.getenv("HTTP_MAX_RESPONSE_BYTES", str(50 * 1024 * 1024)))
+HTTP_SPOOL_THRESHOLD_BYTES: int = int(os.getenv("HTTP_SPOOL_THRESHOLD_BYTES", str(1024 * 1024)))
+
+# =============================================================================
+# 工作流代码节点沙箱配置
+# =============================================================================
+CODE_SANDBOX_WORKERS: int = int(os.getenv("CODE_SANDBOX_WORKERS", str(min(4, os.cpu_count() or 1))))
+CODE_SANDBOX_MEMORY_MB: int = int(os.getenv("CODE_SANDBOX_MEMORY_MB", "512"))
+
+# =============================================================================
+# 工作流执行日志配置
+# =============================================================================
+WORKFLOW_JOURNAL_ENABLED: bool = os.getenv("WORKFLOW_JOURNAL_ENABLED", "true").lower() in ("1", "true", "yes")
+WORKFLOW_JOURNAL_MAX_AGE_DAYS: int = int(os.getenv("WORKFLOW_JOURNAL_MAX_AGE_DAYS", "7"))
+WORKFLOW_JOURNAL_MAX_RUNS: int = int(os.getenv("WORKFLOW_JOURNAL_MAX_RUNS", "10000"))
+
+# =============================================================================
+# LLM 响应缓存配置
+# =============================================================================
+# 默认缓存策略: off（仅请求显式开启时缓存）/ auto（temperature 为 0 的非绘图请求）/ force
+LLM_CACHE_MODE: str = os.getenv("LLM_CACHE_MODE", "off").lower()
+LLM_CACHE_DIR: Path = BASE_DIR / "llm_cache"
+LLM_CACHE_MEMORY_BYTES: int = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_DISK_BYTES: int = int(os.getenv("LLM_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# 相同的上游请求并发时合并为一次调用
+LLM_COALESCE_ENABLED: bool = os.getenv("LLM_COALESCE_ENABLED", "true").lower() in ("1", "true", "yes")
+# 模型名包含这些关键字时视为绘图模型，不参与自动缓存
+LLM_CACHE_IMAGE_MODEL_KEYWORDS: List[str] = [
+    keyword.strip().lower()
+    for keyword in os.getenv(
+        "LLM_CACHE_IMAGE_MODEL_KEYWORDS",
+        "image,dall-e,imagen,flux,midjourney,stable-diffusion,sdxl"
+    ).split(",")
+    if keyword.strip()
+]
+
+# =============================================================================
+# 上游流量调控配置（可通过 PROXY_RATE_LIMIT_{name} / PROXY_MAX_CONCURRENCY_{name} 按预设覆盖）
+# =============================================================================
+# 每个上游每秒最大请求数，0 表示不限速
+UPSTREAM_RATE_LIMIT: float = float(os.getenv("UPSTREAM_RATE_LIMIT", "0"))
+UPSTREAM_BURST: int = int(os.getenv("UPSTREAM_BURST", "10"))
+UPSTREAM_INITIAL_CONCURRENCY: int = int(os.getenv("UPSTREAM_INITIAL_CONCURRENCY", "4"))
+UPSTREAM_MAX_CONCURRENCY: int = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))
+# 排队等待上限（秒）
+UPSTREAM_QUEUE_TIMEOUT: float = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "120"))
+UPSTREAM_BACKOFF_BASE: float = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX: float = float(os.getenv("UPSTREAM_BACKOFF_MAX", "30"))
+
+# =============================================================================
+# 上游组配置（.env 中 PROXY_GROUP_{name}=presetA,presetB 定义一组提供相同模型的预设）
+# =============================================================================
+# 负载均衡策略: least_outstanding（最少未完成请求）/ ewma（延迟指数加权平均 × 未完成请求数）
+UPSTREAM_BALANCE_STRATEGY: str = os.getenv("UPSTREAM_BALANCE_STRATEGY", "least_outstanding").lower()
+UPSTREAM_EWMA_ALPHA: float = float(os.getenv("UPSTREAM_EWMA_ALPHA", "0.3"))
+# 连续失败达到该次数后熔断，冷却后放行一次试探请求
+UPSTREAM_BREAKER_FAILURES: int = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_COOLDOWN: float = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+# 健康检查间隔（秒），0 表示关闭
+UPSTREAM_HEALTH_INTERVAL: float = float(os.getenv("UPSTREAM_HEALTH_INTERVAL", "30"))
+UPSTREAM_HEALTH_TIMEOUT: float = float(os.getenv("UPSTREAM_HEALTH_TIMEOUT", "5"))
+# 流式请求首个块超过该时间（秒）未到达时向组内另一成员发送对冲请求，0 表示关闭
+UPSTREAM_HEDGE_TTFT: float = float(os.getenv("UPSTREAM_HEDGE_TTFT", "10"))
+UPSTREAM_MAX_HEDGES: int = int(os.getenv("UPSTREAM_MAX_HEDGES", "1"))
+
+# =============================================================================
+# 聊天上下文窗口配置
+# =============================================================================
+# 上下文策略: off / trim（丢弃最早的轮次）/ summarize（以滚动摘要替代最早的轮次）
+CONTEXT_MODE: str = os.getenv("CONTEXT_MODE", "trim").lower()
+# 提示词 token 上限，0 表示只受模型上下文窗口限制
+CONTEXT_MAX_PROMPT_TOKENS: int = int(os.getenv("CONTEXT_MAX_PROMPT_TOKENS", "0"))
+# 为模型回复预留的 token 数
+CONTEXT_RESPONSE_RESERVE: int = int(os.getenv("CONTEXT_RESPONSE_RESERVE", "4096"))
+CONTEXT_DEFAULT_WINDOW: int = int(os.getenv("CONTEXT_DEFAULT_WINDOW", "32768"))
+# 模型上下文窗口: 模型名关键字=token 数，按最长匹配的关键字生效
+CONTEXT_MODEL_WINDOWS: Dict[str, int] = {
+    keyword.strip().lower(): int(tokens)
+    for keyword, _, tokens in (
+        item.partition("=")
+        for item in os.getenv(
+            "CONTEXT_MODEL_WINDOWS",
+            "gpt-3.5=16385,gpt-4=8192,gpt-4-turbo=128000,gpt-4o=128000,gpt-4.1=1000000,o1=200000,o3=200000,"
+            "claude=200000,gemini=1000000,deepseek=64000,qwen=32768,glm=128000,moonshot=128000"
+        ).split(",")
+    )
+    if keyword.strip() and tokens.strip().isdigit()
+}
+# 超出预算时裁剪到预算的该比例，使裁剪边界在之后若干轮内保持不变（摘要不必每轮重算，前缀也更稳定）
+CONTEXT_TRIM_TARGET: float = float(os.getenv("CONTEXT_TRIM_TARGET", "0.75"))
+# 生成摘要使用的模型，为空时使用当前对话的模型
+CONTEXT_SUMMARY_MODEL: str = os.getenv("CONTEXT_SUMMARY_MODEL", "")
+CONTEXT_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "800"))
+CONTEXT_CACHE_DIR: Path = BASE_DIR / "context_cache"
+# 将被裁剪的轮次写入 chat_memory 向量集合，并按当前问题检索相关的早期对话
+CONTEXT_MEMORY_ENABLED: bool = os.getenv("CONTEXT_MEMORY_ENABLED", "false").lower() in ("1", "true", "yes")
+CONTEXT_MEMORY_RESULTS: int = int(os.getenv("CONTEXT_MEMORY_RESULTS", "3"))
+
+# =============================================================================
+# 系统提示词布局
+# =============================================================================
+# legacy: 时间与知识库上下文位于系统提示词中部
+# cache_friendly: 系统提示词只包含角色、约束等静态内容（同一智能体逐字节相同），
+# 时间与知识库上下文作为单独的消息放在最新的用户消息之前，便于上游缓存提示词前缀
+PROMPT_LAYOUT: str = os.getenv("PROMPT_LAYOUT", "legacy").lower()
+# 前缀复用统计中每个上游 / 模型保留的前缀哈希数量
+PROMPT_PREFIX_TRACK_SIZE: int = int(os.getenv("PROMPT_PREFIX_TRACK_SIZE", "4096"))
+
+# =============================================================================
+# 会话存储
+# =============================================================================
+# 内存中缓存的会话文件数量（含消息 ID 索引）
+SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", "64"))
+
+# =============================================================================
+# 跨会话记忆
+# =============================================================================
+# 保存会话后在后台把每轮问答向量化写入 session_history 集合，聊天时检索其他会话中相关的问答
+SESSION_MEMORY_ENABLED: bool = os.getenv("SESSION_MEMORY_ENABLED", "false").lower() in ("1", "true", "yes")
+SESSION_MEMORY_RESULTS: int = int(os.getenv("SESSION_MEMORY_RESULTS", "3"))
+# 检索的时间预算（秒），超时则本轮不附加历史会话
+SESSION_MEMORY_TIMEOUT: float = float(os.getenv("SESSION_MEMORY_TIMEOUT", "0.3"))
+# 向量距离上限（越小越相似），超过的结果丢弃
+SESSION_MEMORY_MAX_DISTANCE: float = float(os.getenv("SESSION_MEMORY_MAX_DISTANCE", "1.0"))
+# all: 检索所有会话；kb: 只检索关联同一知识库的会话
+SESSION_MEMORY_SCOPE: str = os.getenv("SESSION_MEMORY_SCOPE", "all").lower()
+# 每轮问答写入的最大字符数
+SESSION_MEMORY_MAX_CHARS: int = int(os.getenv("SESSION_MEMORY_MAX_CHARS", "1000"))
+# 后台批量写入间隔（秒）
+SESSION_MEMORY_FLUSH_INTERVAL: float = float(os.getenv("SESSION_MEMORY_FLUSH_INTERVAL", "2.0"))
+
+# =============================================================================
+# 归档
+# =============================================================================
+# 超过 HISTORY_ARCHIVE_AFTER_DAYS 天的会话压缩写入归档段文件（安装 zstandard 时使用 zstd，否则使用 lzma），
+# 原文件删除后仍可通过 load_history_file 读取；0 表示不归档
+HISTORY_ARCHIVE_DIR: Path = BASE_DIR / "history_archive"
+HISTORY_ARCHIVE_AFTER_DAYS: int = int(os.getenv("HISTORY_ARCHIVE_AFTER_DAYS", "30"))
+# 压缩块的未压缩大小（字节），读取一个归档会话只需解压所在的块
+HISTORY_ARCHIVE_BLOCK_SIZE: int = int(os.getenv("HISTORY_ARCHIVE_BLOCK_SIZE", str(1024 * 1024)))
+# 单个段文件的最大大小（字节），超过后新建段文件
+HISTORY_ARCHIVE_SEGMENT_SIZE: int = int(os.getenv("HISTORY_ARCHIVE_SEGMENT_SIZE", str(64 * 1024 * 1024)))
+# 超过 IMAGE_ARCHIVE_AFTER_DAYS 天的生成图片转码为 webp / avif，旧文件名映射到新文件；0 表示不转码
+IMAGE_ARCHIVE_AFTER_DAYS: int = int(os.getenv("IMAGE_ARCHIVE_AFTER_DAYS", "30"))
+IMAGE_ARCHIVE_FORMAT: str = os.getenv("IMAGE_ARCHIVE_FORMAT", "webp").lower()
+IMAGE_ARCHIVE_QUALITY: int = int(os.getenv("IMAGE_ARCHIVE_QUALITY", "80"))
+IMAGE_ARCHIVE_MAP_PATH: Path = HISTORY_ARCHIVE_DIR / "image_map.json"
+# 定期执行归档的间隔（小时），0 表示只通过接口手动执行
+ARCHIVE_INTERVAL_HOURS: float = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+
+# =============================================================================
+# 指标与追踪
+# =============================================================================
+# 是否提供 GET /metrics（Prometheus 文本格式）；指标本身始终在进程内记录
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# span 导出文件（每行一个 OTLP/JSON 对象），为空时不记录 span
+TRACE_EXPORT_PATH: str = os.getenv("TRACE_EXPORT_PATH", "")
+# 根 span 的采样率（0~1），子 span 跟随父 span
+TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+# 导出文件超过该大小（字节）时轮转为 .1
+TRACE_EXPORT_MAX_BYTES: int = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+# 最近慢请求的记录数量（环形缓冲）与记录阈值（毫秒），通过 GET /api/settings/slow-requests 查询
+SLOW_REQUEST_LOG_SIZE: int = int(os.getenv("SLOW_REQUEST_LOG_SIZE", "100"))
+SLOW_REQUEST_THRESHOLD_MS: float = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+
+# =============================================================================
+# 启动
+# =============================================================================
+# 服务开始监听后在后台线程中预加载较慢的模块（openai、Pillow、PyPDF2、chromadb 客户端），
+# 关闭时这些模块在首次使用时才加载
+STARTUP_PRELOAD: bool = os.getenv("STARTUP_PRELOAD", "true").lower() in ("1", "true", "yes")
+# 启动后在后台线程中预热向量化：加载模型、计算一批示例文本并打开知识库集合，完成前 GET /ready 返回 503；
+# 使用向量服务（VECTOR_SERVICE_URL）时由向量服务加载模型，各工作进程的预热等待向量服务就绪
+EMBEDDING_WARMUP: bool = os.getenv("EMBEDDING_WARMUP", "true").lower() in ("1", "true", "yes")
+# 预热期间需要向量化的请求（知识库检索、文件上传）最多等待的秒数，超时返回 503 与 Retry-After；0 表示不等待
+EMBEDDING_WARMUP_WAIT: float = float(os.getenv("EMBEDDING_WARMUP_WAIT", "30"))
+# 预热失败后按指数退避重试（2 秒起，每次翻倍），两次重试之间的最大间隔（秒）
+EMBEDDING_WARMUP_RETRY_MAX: float = float(os.getenv("EMBEDDING_WARMUP_RETRY_MAX", "60"))
+
+# =============================================================================
+# 多进程部署
+# =============================================================================
+# 向量服务地址（如 http://127.0.0.1:9100）。设置后向量化与 Chroma 读写都转发到该服务，
+# 多个工作进程共用一份向量化模型与一个 Chroma 客户端；为空时在本进程内加载。
+# main.py --workers N（N > 1）未设置该变量时自动启动向量服务并设置
+VECTOR_SERVICE_URL: str = os.getenv("VECTOR_SERVICE_URL", "").rstrip("/")
+# 自动启动的向量服务监听的端口（仅监听 127.0.0.1）
+VECTOR_SERVICE_PORT: int = int(os.getenv("VECTOR_SERVICE_PORT", "9100"))
+# 向量服务请求超时（秒），需覆盖向量服务启动时加载模型的时间
+VECTOR_SERVICE_TIMEOUT: float = float(os.getenv("VECTOR_SERVICE_TIMEOUT", "120"))
@@ -0,0 +1,75 @@
+# app/core/agent_prompts.py
+"""
+智能体提示词注册表
+每个知识库智能体的系统提示词静态部分只编译一次，请求时只填充时间与检索上下文。
+知识库更新或删除时（kb_manager 变更通知）使对应的编译结果失效
+"""
+import logging
+from typing import Dict, Any, Optional
+
+from advanced_system import CompiledPrompt, compile_rag_prompt, compile_chat_prompt
+from app.core.kb_manager import kb_manager
+
+logger = logging.getLogger(__name__)
+
+# 未定义智能体模板时的默认角色
+DEFAULT_ROLE_TEMPLATE = "你是 {name}，{description}"
+
+
+def render_role(template: str, kb_info: Dict[str, Any]) -> str:
+    """填充角色模板中的 {name} 与 {description}，其余花括号原样保留"""
+    return (
+        template
+        .replace("{name}", kb_info.get("name", ""))
+        .replace("{description}", kb_info.get("description", ""))
+    )
+
+
+class AgentPromptRegistry:
+    """按知识库 ID 缓存编译后的系统提示词"""
+
+    def __init__(self) -> None:
+        self._compiled: Dict[str, CompiledPrompt] = {}
+        self._default: Optional[CompiledPrompt] = None
+        kb_manager.on_change(self.invalidate)
+
+    def _compile(self, kb_info: Dict[str, Any]) -> CompiledPrompt:
+        agent = kb_info.get("agent") or {}
+        return compile_rag_prompt(
+            kb_name=kb_info["name"],
+            role=render_role(agent.get("role") or DEFAULT_ROLE_TEMPLATE, kb_info),
+            constraints=agent.get("constraints") or [],
+            output_format=agent.get("output_format")
+        )
+
+    def for_kb(self, kb_id: str, kb_info: Dict[str, Any]) -> CompiledPrompt:
+        """
+        获取知识库智能体的编译结果，不存在时编译并缓存
+
+        Args:
+            kb_id: 知识库ID
+            kb_info: kb_manager.get_kb() 返回的知识库信息
+        """
+        compiled = self._compiled.get(kb_id)
+        if compiled is None:
+            compiled = self._compile(kb_info)
+            self._compiled[kb_id] = compiled
+            logger.debug(f"编译智能体提示词: {kb_info['name']} ({kb_id})")
+        return compiled
+
+    def default(self) -> CompiledPrompt:
+        """普通聊天模式的编译结果"""
+        if self._default is None:
+            self._default = compile_chat_prompt()
+        return self._default
+
+    def invalidate(self, kb_id: Optional[str] = None) -> None:
+        """使指定知识库（None 表示全部）的编译结果失效"""
+        if kb_id is None:
+            self._compiled.clear()
+        else:
+            self._compiled.pop(kb_id, None)
+
+
+# 模块级单例
+agent_prompts: AgentPromptRegistry = AgentPromptRegistry()
@@ -7,13 +7,15 @@ import base64
 import json
 import logging
 import re
+import time
 import uuid
 from typing import List, Dict, Any, Optional, Union, Tuple
 from pathlib import Path
 from io import BytesIO
-from PIL import Image
 
 from app.config import STATIC_DIR
+from app.core.image_archive import image_archive
+from app.core.metrics import image_encode_seconds
 
 logger = logging.getLogger(__name__)
 
@@ -336,11 +338,15 @@ class MultimodalAdapter:
             path_or_url: 图片路径
             compress: 是否压缩图片 (Resize to max 1024px, JPEG quality 80)
         """
+        started = time.perf_counter()
         try:
             # 移除 URL 前缀，获取相对路径
             if "/static/" in path_or_url:
                 rel_path = path_or_url.split("/static/")[1]
                 full_path = STATIC_DIR / rel_path
+                # 已转码的生成图片
+                if not full_path.exists() and rel_path.startswith("generated_images/"):
+                    full_path = image_archive.resolve_path(rel_path.split("/", 1)[1])
             else:
                 return None 
 
@@ -348,7 +354,8 @@ class MultimodalAdapter:
                 logger.warning(f"图片文件不存在: {full_path}")
                 return None
 
-            # 使用 PIL 处理图片
+            # 使用 PIL 处理图片（首次使用时导入）
+            from PIL import Image
             with Image.open(full_path) as img:
                 # 转换为 RGB (防止 RGBA 转 JPEG 报错)
                 if img.mode in ('RGBA', 'P'):
@@ -366,9 +373,11 @@ class MultimodalAdapter:
                 data = buffer.getvalue()
                 
                 b64_data = base64.b64encode(data).decode('utf-8')
+                image_encode_seconds.observe(time.perf_counter() - started, "success")
                 return f"data:image/jpeg;base64,{b64_data}"
             
         except Exception as e:
+            image_encode_seconds.observe(time.perf_counter() - started, "error")
             logger.error(f"转换图片为 Base64 失败: {e}")
             return None
             
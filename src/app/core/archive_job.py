@@ -0,0 +1,99 @@
+# app/core/archive_job.py
+"""
+归档任务
+每 ARCHIVE_INTERVAL_HOURS 小时（或通过接口手动）执行一次：
+- 超过 HISTORY_ARCHIVE_AFTER_DAYS 天的会话压缩写入归档段文件
+- 超过 IMAGE_ARCHIVE_AFTER_DAYS 天的生成图片转码
+同一时间只执行一个任务（文件锁，多进程部署时各进程之间也互斥，其他进程的定期执行返回 busy）
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from app.config import (
+    ARCHIVE_INTERVAL_HOURS,
+    HISTORY_ARCHIVE_AFTER_DAYS,
+    HISTORY_ARCHIVE_DIR,
+    IMAGE_ARCHIVE_AFTER_DAYS
+)
+from app.core.file_lock import file_lock
+from app.core.history_archive import history_archive
+from app.core.image_archive import image_archive
+
+logger = logging.getLogger(__name__)
+
+# 启动后首次执行前等待的秒数，避开启动时的负载
+INITIAL_DELAY = 300
+
+
+class ArchiveJob:
+    """定期执行会话归档与图片转码"""
+
+    def __init__(self, interval_hours: float = ARCHIVE_INTERVAL_HOURS) -> None:
+        self.interval_hours: float = interval_hours
+        self._lock = file_lock(HISTORY_ARCHIVE_DIR / "archive_job")
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    def run_once(
+        self,
+        history_days: Optional[int] = None,
+        image_days: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        执行一次归档（阻塞，在线程中调用）
+
+        Args:
+            history_days: 归档超过该天数的会话，为空时使用 HISTORY_ARCHIVE_AFTER_DAYS，0 表示跳过
+            image_days: 转码超过该天数的图片，为空时使用 IMAGE_ARCHIVE_AFTER_DAYS，0 表示跳过
+
+        Returns:
+            {"history": ..., "images": ...}；已有任务在执行时返回 {"status": "busy"}
+        """
+        history_days = HISTORY_ARCHIVE_AFTER_DAYS if history_days is None else history_days
+        image_days = IMAGE_ARCHIVE_AFTER_DAYS if image_days is None else image_days
+        if not self._lock.acquire(blocking=False):
+            return {"status": "busy"}
+        try:
+            result: Dict[str, Any] = {"status": "success", "history": None, "images": None}
+            if history_days > 0:
+                history_archive.sync_catalog()
+                result["history"] = history_archive.archive(history_days)
+            if image_days > 0:
+                result["images"] = image_archive.transcode(image_days)
+            self.last_result = result
+            return result
+        finally:
+            self._lock.release()
+
+    async def _loop(self) -> None:
+        await asyncio.sleep(INITIAL_DELAY)
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.warning(f"归档任务失败: {e}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self) -> None:
+        """启动定期归档"""
+        if self.interval_hours <= 0 or self._task is not None:
+            return
+        if HISTORY_ARCHIVE_AFTER_DAYS <= 0 and IMAGE_ARCHIVE_AFTER_DAYS <= 0:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止定期归档（正在执行的一次在线程中完成）"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+# 模块级单例
+archive_job: ArchiveJob = ArchiveJob()
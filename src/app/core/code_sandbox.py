@@ -0,0 +1,176 @@
+# app/core/code_sandbox.py
+"""
+代码节点沙箱
+维护一组常驻的 worker 子进程执行工作流代码节点：
+- worker 预先启动并复用，调用时没有解释器启动开销
+- 每次执行都有墙钟超时（超时即终止并重建 worker）和 CPU 时间限制（RLIMIT_CPU）
+- worker 启动时通过 RLIMIT_AS 限制内存
+- 上下文与结果以长度前缀的 JSON 帧在进程间传递
+"""
+import os
+import sys
+import math
+import signal
+import asyncio
+import logging
+import subprocess
+from typing import Dict, List, Any, Optional
+
+from app.config import CODE_SANDBOX_WORKERS, CODE_SANDBOX_MEMORY_MB
+from app.core import sandbox_worker
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT: str = os.path.abspath(sandbox_worker.__file__)
+
+# 未指定或无效时使用的超时（秒）
+DEFAULT_TIMEOUT: float = 30
+
+
+class CodeExecutionError(Exception):
+    """代码节点执行失败（用户代码异常、超时或超出资源限制）"""
+
+
+def normalize_timeout(value: Any) -> float:
+    """节点配置中的超时：为空、非数字或不大于 0 时使用默认值"""
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_TIMEOUT
+    if not math.isfinite(timeout) or timeout <= 0:
+        return DEFAULT_TIMEOUT
+    return timeout
+
+
+class _Worker:
+    """单个 worker 子进程的句柄"""
+
+    def __init__(self, memory_limit_mb: int) -> None:
+        self.process: subprocess.Popen = subprocess.Popen(
+            [sys.executable, "-I", WORKER_SCRIPT, str(memory_limit_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+
+    def alive(self) -> bool:
+        """进程是否仍在运行"""
+        return self.process.poll() is None
+
+    def call(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """发送任务并阻塞等待结果"""
+        sandbox_worker.write_frame(self.process.stdin, job)
+        return sandbox_worker.read_frame(self.process.stdout)
+
+    def kill(self) -> None:
+        """终止进程"""
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+    def describe_exit(self) -> str:
+        """描述进程退出原因"""
+        code = self.process.poll()
+        if code is None:
+            return "worker 无响应"
+        if code < 0:
+            if -code == getattr(signal, "SIGXCPU", None):
+                return "代码节点超出 CPU 时间限制"
+            if -code == getattr(signal, "SIGKILL", None):
+                return "worker 被强制终止"
+        return f"worker 异常退出 (exit code {code})"
+
+
+class CodeSandboxPool:
+    """
+    代码节点 worker 进程池
+    并发度等于 worker 数量，可同时利用多个 CPU 核心
+    """
+
+    def __init__(self, size: int, memory_limit_mb: int) -> None:
+        self.size: int = max(1, size)
+        self.memory_limit_mb: int = memory_limit_mb
+        self._idle: List[_Worker] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._started: bool = False
+
+    def start(self) -> None:
+        """预先启动全部 worker"""
+        if self._started:
+            return
+        self._started = True
+        while len(self._idle) < self.size:
+            self._idle.append(_Worker(self.memory_limit_mb))
+        logger.info(f"代码沙箱已启动 {self.size} 个 worker 进程")
+
+    def shutdown(self) -> None:
+        """终止全部空闲 worker"""
+        for worker in self._idle:
+            worker.kill()
+        self._idle.clear()
+        self._started = False
+
+    def _acquire_worker(self) -> _Worker:
+        """取出一个存活的空闲 worker，必要时新建"""
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.alive():
+                return worker
+            worker.kill()
+        return _Worker(self.memory_limit_mb)
+
+    def _replace(self, worker: _Worker) -> None:
+        """终止失效的 worker 并补充一个新的，保持进程池预热"""
+        worker.kill()
+        self._idle.append(_Worker(self.memory_limit_mb))
+
+    async def run(
+        self,
+        code: str,
+        context: Dict[str, Any],
+        results: Dict[str, Any],
+        inputs: Dict[str, Any],
+        timeout: float = DEFAULT_TIMEOUT
+    ) -> Any:
+        """
+        在 worker 中执行代码
+
+        Args:
+            code: Python 代码，结果通过变量 output 返回
+            context: 执行上下文
+            results: 已完成节点的结果
+            inputs: 工作流输入
+            timeout: 墙钟超时（秒），同时作为 CPU 时间限制，无效值按 normalize_timeout() 处理
+
+        Returns:
+            代码中 output 变量的值
+        """
+        timeout = normalize_timeout(timeout)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+            self.start()
+
+        async with self._semaphore:
+            worker = self._acquire_worker()
+            job = {"code": code, "context": context, "results": results, "inputs": inputs, "timeout": timeout}
+            try:
+                response = await asyncio.wait_for(asyncio.to_thread(worker.call, job), timeout=timeout)
+            except asyncio.TimeoutError:
+                self._replace(worker)
+                raise CodeExecutionError(f"代码节点执行超时 ({timeout}s)")
+            except (EOFError, OSError):
+                self._replace(worker)
+                raise CodeExecutionError(worker.describe_exit())
+            except BaseException:
+                # 被取消（客户端断开、并行节点失败）时 worker 可能仍在执行，不能放回空闲队列
+                self._replace(worker)
+                raise
+
+            self._idle.append(worker)
+
+        if not response.get("ok"):
+            raise CodeExecutionError(response.get("error", "未知错误"))
+        return response.get("output")
+
+
+# 模块级单例
+code_sandbox_pool: CodeSandboxPool = CodeSandboxPool(CODE_SANDBOX_WORKERS, CODE_SANDBOX_MEMORY_MB)
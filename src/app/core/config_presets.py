@@ -0,0 +1,149 @@
+# app/core/config_presets.py
+"""
+API 配置预设注册表
+.env 中的 PROXY_BASE_URL_{name} / PROXY_API_KEY_{name} 构成一个名为 name 的预设，
+PROXY_GROUP_{name}=presetA,presetB 将多个提供相同模型的预设组成上游组。
+文件只在修改时间变化或通过 save() 写入后重新解析，聊天、设置和工作流共用同一份索引。
+"""
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import dotenv_values, set_key
+
+from app.core.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+ENV_PATH: Path = Path(".env")
+
+BASE_URL_PREFIX = "PROXY_BASE_URL_"
+API_KEY_PREFIX = "PROXY_API_KEY_"
+# 可选的按预设流量调控参数
+RATE_LIMIT_PREFIX = "PROXY_RATE_LIMIT_"
+MAX_CONCURRENCY_PREFIX = "PROXY_MAX_CONCURRENCY_"
+# 上游组：逗号分隔的预设名称
+GROUP_PREFIX = "PROXY_GROUP_"
+PRESET_PREFIXES = (BASE_URL_PREFIX, API_KEY_PREFIX, RATE_LIMIT_PREFIX, MAX_CONCURRENCY_PREFIX, GROUP_PREFIX)
+
+
+class ConfigPresetRegistry:
+    """
+    配置预设注册表
+    进程环境变量中的预设作为基础，.env 文件中的值优先（与 load_dotenv(override=True) 语义一致）
+    """
+
+    def __init__(self, env_path: Path = ENV_PATH) -> None:
+        self.env_path: Path = env_path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._loaded: bool = False
+        self._presets: Dict[str, Dict[str, str]] = {}
+        self._groups: Dict[str, List[str]] = {}
+        # 启动时的进程环境变量快照
+        self._base_env: Dict[str, str] = {
+            key: value for key, value in os.environ.items()
+            if key.startswith(PRESET_PREFIXES)
+        }
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return self.env_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _refresh(self) -> None:
+        """文件修改时间变化时重新解析"""
+        mtime = self._file_mtime()
+        if self._loaded and mtime == self._mtime:
+            return
+        with self._lock:
+            if self._loaded and mtime == self._mtime:
+                return
+            values = dict(self._base_env)
+            if mtime is not None:
+                values.update({k: v for k, v in dotenv_values(self.env_path).items() if v is not None})
+
+            presets: Dict[str, Dict[str, str]] = {}
+            for key, base_url in values.items():
+                if key.startswith(BASE_URL_PREFIX) and base_url:
+                    name = key[len(BASE_URL_PREFIX):]
+                    presets[name] = {
+                        "name": name,
+                        "base_url": base_url,
+                        "api_key": values.get(f"{API_KEY_PREFIX}{name}", "")
+                    }
+                    for field, prefix in (("rate_limit", RATE_LIMIT_PREFIX), ("max_concurrency", MAX_CONCURRENCY_PREFIX)):
+                        if values.get(f"{prefix}{name}"):
+                            presets[name][field] = values[f"{prefix}{name}"]
+
+            groups: Dict[str, List[str]] = {}
+            for key, members in values.items():
+                if key.startswith(GROUP_PREFIX) and members:
+                    name = key[len(GROUP_PREFIX):]
+                    listed = [m.strip() for m in members.split(",") if m.strip()]
+                    groups[name] = [m for m in listed if m in presets]
+                    missing = [m for m in listed if m not in presets]
+                    if missing:
+                        logger.warning(f"上游组 {name} 引用了不存在的预设: {', '.join(missing)}")
+            self._presets = presets
+            self._groups = {name: members for name, members in groups.items() if members}
+            self._mtime = mtime
+            self._loaded = True
+            logger.info(f"已加载 {len(presets)} 个 API 配置预设，{len(self._groups)} 个上游组")
+
+    def invalidate(self) -> None:
+        """强制下次访问时重新解析"""
+        self._loaded = False
+
+    def get(self, name: str) -> Optional[Dict[str, str]]:
+        """按名称获取预设，不存在时返回 None"""
+        self._refresh()
+        return self._presets.get(name)
+
+    def find_by_url(self, base_url: str) -> Optional[Dict[str, str]]:
+        """按 base_url 查找预设（忽略末尾的 /），多个预设共用地址时返回名称最小的"""
+        self._refresh()
+        base_url = base_url.rstrip("/")
+        for name in sorted(self._presets):
+            if self._presets[name]["base_url"].rstrip("/") == base_url:
+                return self._presets[name]
+        return None
+
+    def group(self, name: str) -> Optional[List[Dict[str, str]]]:
+        """按名称获取上游组的成员预设，不存在时返回 None"""
+        self._refresh()
+        members = self._groups.get(name)
+        if members is None:
+            return None
+        return [self._presets[member] for member in members]
+
+    def groups(self) -> Dict[str, List[str]]:
+        """所有上游组及其成员名称"""
+        self._refresh()
+        return {name: list(self._groups[name]) for name in sorted(self._groups)}
+
+    def names(self) -> List[str]:
+        """所有预设名称（已排序）"""
+        self._refresh()
+        return sorted(self._presets)
+
+    def list(self) -> List[Dict[str, str]]:
+        """所有预设（按名称排序）"""
+        self._refresh()
+        return [self._presets[name] for name in sorted(self._presets)]
+
+    def save(self, name: str, base_url: str, api_key: str) -> None:
+        """写入或更新预设到 .env（多进程部署时各进程共享同一文件，写入期间持有文件锁）"""
+        with file_lock(self.env_path):
+            if not self.env_path.exists():
+                self.env_path.touch()
+            set_key(self.env_path, f"{BASE_URL_PREFIX}{name}", base_url)
+            set_key(self.env_path, f"{API_KEY_PREFIX}{name}", api_key)
+        self.invalidate()
+
+
+# 模块级单例
+config_presets: ConfigPresetRegistry = ConfigPresetRegistry()
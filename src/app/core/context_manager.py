@@ -0,0 +1,463 @@
+# app/core/context_manager.py
+"""
+聊天上下文窗口管理
+发送给上游之前按模型的 token 预算裁剪消息：
+- token 计数：安装了 tiktoken 时使用对应模型的分词器，否则按字符估算；每条消息的计数按内容缓存
+- trim：超出预算时从最早的轮次开始移出，一次裁剪到预算的 CONTEXT_TRIM_TARGET，
+  裁剪边界按会话记录，在之后若干轮内保持不变
+- summarize：移出的轮次以滚动摘要的形式附加到系统提示词之后，摘要按会话缓存，只对新移出的轮次增量更新
+- 可选将移出的轮次写入 chat_memory 向量集合，并按当前问题检索相关的片段
+"""
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from app.config import (
+    CONTEXT_MODE,
+    CONTEXT_MAX_PROMPT_TOKENS,
+    CONTEXT_RESPONSE_RESERVE,
+    CONTEXT_DEFAULT_WINDOW,
+    CONTEXT_MODEL_WINDOWS,
+    CONTEXT_TRIM_TARGET,
+    CONTEXT_SUMMARY_MODEL,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_CACHE_DIR,
+    CONTEXT_MEMORY_ENABLED,
+    CONTEXT_MEMORY_RESULTS,
+    PROMPT_LAYOUT
+)
+from app.core.file_lock import atomic_write_json
+from app.core.llm_gateway import llm_gateway
+from app.core.rag_engine import add_chat_memory, aquery_chat_memory
+from app.core.singleflight import SingleFlight
+from app.core.upstream_governor import PRIORITY_INTERACTIVE
+from advanced_system import attach_volatile_context
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，未安装时按字符估算
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_MODES = ("off", "trim", "summarize")
+
+# 每张图片按高清图的典型消耗估算
+IMAGE_TOKENS = 765
+# 每条消息的角色与分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 至少为历史消息保留的预算
+MIN_PROMPT_BUDGET = 1024
+
+TOKEN_CACHE_SIZE = 16384
+STATE_CACHE_SIZE = 256
+
+ROLE_LABELS = {"user": "用户", "assistant": "助手", "system": "系统"}
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责压缩对话历史。请把已有摘要和新增对话合并成一份简洁的摘要，"
+    "保留事实、结论、用户的偏好与要求、尚未解决的问题，以及后续对话可能引用的具体细节"
+    "（名称、数字、代码标识符等）。不要评论，不要编造，使用对话所用的语言。"
+)
+
+# 中日韩字符大致每个字符一个 token，其余文本约四个字符一个 token
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+@lru_cache(maxsize=64)
+def _encoding(model: str) -> Optional[Any]:
+    """模型对应的分词器，tiktoken 不可用或无法加载时返回 None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception as e:
+        logger.debug(f"加载 {model} 分词器失败: {e}")
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.debug(f"加载 cl100k_base 分词器失败: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符估算 token 数"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """消息的文本部分，图片以占位符表示"""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for item in content:
+            if item.get("type") == "text":
+                parts.append(item.get("text") or "")
+            elif item.get("type") == "image_url":
+                parts.append("[图片]")
+        return " ".join(parts)
+    return ""
+
+
+def _message_digest(message: Dict[str, Any]) -> bytes:
+    payload = json.dumps([message.get("role"), message.get("content")], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+def _prefix_digest(digests: List[bytes]) -> str:
+    return hashlib.blake2b(b"".join(digests), digest_size=16).hexdigest()
+
+
+class TokenCounter:
+    """按模型分词器计数，结果按 (分词器, 内容摘要) 缓存"""
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE) -> None:
+        self.max_entries: int = max_entries
+        self._cache: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+
+    def count_text(self, text: str, model: str) -> int:
+        if not text:
+            return 0
+        encoding = _encoding(model)
+        name = encoding.name if encoding is not None else "estimate"
+        key = (name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        tokens = len(encoding.encode(text, disallowed_special=())) if encoding is not None else estimate_tokens(text)
+        self._cache[key] = tokens
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Dict[str, Any], model: str) -> int:
+        content = message.get("content")
+        tokens = MESSAGE_OVERHEAD_TOKENS
+        if isinstance(content, str):
+            tokens += self.count_text(content, model)
+        elif isinstance(content, list):
+            for item in content:
+                if item.get("type") == "text":
+                    tokens += self.count_text(item.get("text") or "", model)
+                elif item.get("type") == "image_url":
+                    tokens += IMAGE_TOKENS
+        return tokens
+
+
+def context_window(model: str) -> int:
+    """模型的上下文窗口，按最长匹配的关键字查找"""
+    name = (model or "").lower()
+    matches = [keyword for keyword in CONTEXT_MODEL_WINDOWS if keyword in name]
+    if not matches:
+        return CONTEXT_DEFAULT_WINDOW
+    return CONTEXT_MODEL_WINDOWS[max(matches, key=len)]
+
+
+def prompt_budget(model: str) -> int:
+    """提示词的 token 预算"""
+    budget = context_window(model) - CONTEXT_RESPONSE_RESERVE
+    if CONTEXT_MAX_PROMPT_TOKENS > 0:
+        budget = min(budget, CONTEXT_MAX_PROMPT_TOKENS)
+    return max(budget, MIN_PROMPT_BUDGET)
+
+
+class ContextManager:
+    """
+    上下文窗口管理器
+    会话状态记录已移出的消息数、这些消息的摘要哈希和滚动摘要，
+    历史被编辑或删除导致前缀不一致时重新计算
+    """
+
+    def __init__(self, cache_dir: Path = CONTEXT_CACHE_DIR) -> None:
+        self.cache_dir: Path = cache_dir
+        self.counter: TokenCounter = TokenCounter()
+        self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._summaries: SingleFlight = SingleFlight("context-summary")
+        self._background: Set["asyncio.Task[None]"] = set()
+
+    # =========================================================================
+    # 会话状态
+    # =========================================================================
+
+    def _state_path(self, session: str) -> Path:
+        name = hashlib.sha1(session.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{name}.json"
+
+    def _load_state(self, session: str) -> Optional[Dict[str, Any]]:
+        state = self._states.get(session)
+        if state is not None:
+            self._states.move_to_end(session)
+            return state
+        try:
+            with open(self._state_path(session), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember_state(session, state)
+        return state
+
+    def _remember_state(self, session: str, state: Dict[str, Any]) -> None:
+        self._states[session] = state
+        self._states.move_to_end(session)
+        while len(self._states) > STATE_CACHE_SIZE:
+            self._states.popitem(last=False)
+
+    def _save_state(self, session: str, state: Dict[str, Any]) -> None:
+        """原子写入会话状态"""
+        self._remember_state(session, state)
+        path = self._state_path(session)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(path, state, indent=None)
+        except OSError as e:
+            logger.warning(f"保存上下文状态失败: {e}")
+
+    # =========================================================================
+    # 裁剪
+    # =========================================================================
+
+    async def fit(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        upstream: Dict[str, Any],
+        session: Optional[str] = None,
+        query: str = "",
+        mode: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        按 token 预算裁剪消息列表
+
+        Args:
+            messages: 第一条可以是系统提示词的消息列表
+            model: 模型名称，决定分词器和预算
+            upstream: 上游调用参数（base_url、api_key、group、priority），生成摘要时使用
+            session: 会话标识（历史文件路径），为空时不缓存裁剪边界与摘要
+            query: 当前问题，用于检索聊天记忆
+            mode: off / trim / summarize，为空时使用 CONTEXT_MODE
+
+        Returns:
+            裁剪后的消息列表
+        """
+        mode = mode or CONTEXT_MODE
+        if mode not in CONTEXT_MODES:
+            logger.warning(f"未知的上下文策略 {mode}，使用 trim")
+            mode = "trim"
+        if mode == "off":
+            return messages
+
+        system = messages[:1] if messages and messages[0].get("role") == "system" else []
+        history = messages[len(system):]
+        if len(history) < 2:
+            return messages
+
+        budget = prompt_budget(model)
+        costs = [self.counter.count_message(m, model) for m in history]
+        system_cost = sum(self.counter.count_message(m, model) for m in system)
+        digests = [_message_digest(m) for m in history]
+
+        # 之前的裁剪边界仍然有效时沿用
+        state = self._load_state(session) if session else None
+        covered = 0
+        if state is not None:
+            previous = state.get("covered", 0)
+            if 0 < previous < len(history) and state.get("digest") == _prefix_digest(digests[:previous]):
+                covered = previous
+            else:
+                state = None
+
+        summary_reserve = CONTEXT_SUMMARY_MAX_TOKENS if mode == "summarize" else 0
+
+        def fits(start: int, limit: int) -> bool:
+            reserve = summary_reserve if start > 0 else 0
+            return system_cost + reserve + sum(costs[start:]) <= limit
+
+        if covered == 0 and fits(0, budget):
+            return messages
+
+        start = covered
+        if not fits(start, budget):
+            target = int(budget * CONTEXT_TRIM_TARGET)
+            while start < len(history) - 1 and not fits(start, target):
+                start += 1
+            # 保留的部分不以助手消息开头
+            while start < len(history) - 1 and history[start].get("role") != "user":
+                start += 1
+
+        summary = ""
+        if mode == "summarize":
+            base, summary = (covered, state.get("summary", "")) if state and state.get("summary") else (0, "")
+            if start > base:
+                summary = await self._summarize(session, summary, history[base:start], digests[:start], model, upstream)
+
+        if session and (state is None or start != covered or summary != state.get("summary", "")):
+            self._save_state(session, {"covered": start, "digest": _prefix_digest(digests[:start]), "summary": summary})
+
+        recalled: List[str] = []
+        if CONTEXT_MEMORY_ENABLED and session:
+            offload_from = covered if state is not None else 0
+            if start > offload_from:
+                self._offload(session, history[offload_from:start], digests[offload_from:start])
+            if query:
+                recalled = await self._recall(session, query)
+
+        kept_tokens = system_cost + sum(costs[start:])
+        logger.info(
+            f"上下文裁剪 ({mode}): 移出 {start}/{len(history)} 条消息，"
+            f"{system_cost + sum(costs)} → {kept_tokens} tokens（预算 {budget}）"
+        )
+        return self._assemble(system, history[start:], summary, recalled)
+
+    @staticmethod
+    def _assemble(
+        system: List[Dict[str, Any]],
+        kept: List[Dict[str, Any]],
+        summary: str,
+        recalled: List[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        把摘要和检索到的早期对话附加到系统提示词末尾
+        cache_friendly 布局下随问题变化的检索结果放在最新的用户消息之前，不破坏提示词前缀
+        """
+        extra = []
+        if summary:
+            extra.append(f"【早期对话摘要】\n{summary}")
+        if recalled:
+            recalled_note = "【相关的早期对话】\n" + "\n---\n".join(recalled)
+            if PROMPT_LAYOUT == "cache_friendly":
+                kept = attach_volatile_context(kept, {"role": "system", "content": recalled_note})
+            else:
+                extra.append(recalled_note)
+        if not extra:
+            return system + kept
+
+        note = "\n\n".join(extra)
+        if system and isinstance(system[0].get("content"), str):
+            system_msg = dict(system[0])
+            system_msg["content"] = f"{system_msg['content']}\n\n{note}"
+            return [system_msg] + kept
+        return system + [{"role": "system", "content": note}] + kept
+
+    # =========================================================================
+    # 摘要
+    # =========================================================================
+
+    @staticmethod
+    def _transcript(messages: List[Dict[str, Any]]) -> str:
+        lines = []
+        for message in messages:
+            label = ROLE_LABELS.get(message.get("role"), message.get("role") or "")
+            lines.append(f"{label}: {message_text(message)}")
+        return "\n".join(lines)
+
+    async def _summarize(
+        self,
+        session: Optional[str],
+        summary: str,
+        dropped: List[Dict[str, Any]],
+        digests: List[bytes],
+        model: str,
+        upstream: Dict[str, Any]
+    ) -> str:
+        """将新移出的消息合并进滚动摘要，失败时保留原摘要；同一会话的并发请求只生成一次"""
+        summary_model = CONTEXT_SUMMARY_MODEL or model
+
+        async def run() -> str:
+            # 移出的内容过长时分段滚动合并，避免摘要请求本身超出上下文
+            chunk_limit = max((context_window(summary_model) - CONTEXT_RESPONSE_RESERVE) // 2, MIN_PROMPT_BUDGET)
+            result = summary
+            chunk: List[Dict[str, Any]] = []
+            chunk_tokens = 0
+            for message in dropped + [None]:
+                cost = self.counter.count_message(message, summary_model) if message is not None else 0
+                if chunk and (message is None or chunk_tokens + cost > chunk_limit):
+                    result = await self._summarize_chunk(result, chunk, summary_model, upstream)
+                    chunk, chunk_tokens = [], 0
+                if message is not None:
+                    chunk.append(message)
+                    chunk_tokens += cost
+            return result
+
+        try:
+            if session is None:
+                return await run()
+            return await self._summaries.do((session, _prefix_digest(digests)), run)
+        except Exception as e:
+            logger.warning(f"生成对话摘要失败，仅裁剪上下文: {e}")
+            return summary
+
+    async def _summarize_chunk(
+        self,
+        summary: str,
+        messages: List[Dict[str, Any]],
+        model: str,
+        upstream: Dict[str, Any]
+    ) -> str:
+        prompt = f"已有摘要：\n{summary or '（无）'}\n\n新增对话：\n{self._transcript(messages)}"
+        content = await llm_gateway.complete(
+            base_url=upstream.get("base_url", ""),
+            api_key=upstream.get("api_key", ""),
+            group=upstream.get("group"),
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            params={"temperature": 0, "max_tokens": CONTEXT_SUMMARY_MAX_TOKENS},
+            cache="auto",
+            timeout=120.0,
+            priority=upstream.get("priority", PRIORITY_INTERACTIVE)
+        )
+        if not content:
+            raise ValueError("摘要为空")
+        return content.strip()
+
+    # =========================================================================
+    # 聊天记忆
+    # =========================================================================
+
+    def _offload(self, session: str, messages: List[Dict[str, Any]], digests: List[bytes]) -> None:
+        """在后台把移出的消息写入聊天记忆"""
+        items = []
+        for message, digest in zip(messages, digests):
+            text = message_text(message).strip()
+            if text:
+                label = ROLE_LABELS.get(message.get("role"), message.get("role") or "")
+                items.append({"id": f"{session}:{message.get('id') or digest.hex()}", "text": f"{label}: {text}"})
+        if not items:
+            return
+
+        async def write() -> None:
+            try:
+                await add_chat_memory(session, items)
+            except Exception as e:
+                logger.warning(f"写入聊天记忆失败: {e}")
+
+        task = asyncio.get_running_loop().create_task(write())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _recall(self, session: str, query: str) -> List[str]:
+        try:
+            return await aquery_chat_memory(session, query, CONTEXT_MEMORY_RESULTS)
+        except Exception as e:
+            logger.warning(f"检索聊天记忆失败: {e}")
+            return []
+
+
+# 模块级单例
+context_manager: ContextManager = ContextManager()
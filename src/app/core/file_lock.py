@@ -0,0 +1,103 @@
+# app/core/file_lock.py
+"""
+跨进程文件锁与原子写入
+多进程部署（main.py --workers N）时各进程共享同一组 JSON 元数据文件：
+- file_lock(path)：对 <path>.lock 加排他锁（fcntl.flock），同时串行化进程内的线程，同一线程可重入；
+  读-改-写（例如创建知识库）整个过程持有锁，避免两个进程同时写入时丢失更新
+- atomic_write_json(path, data)：先写同目录下唯一命名的临时文件再 os.replace，
+  读取方不会看到写了一半的文件，多个进程同时写入也不会共用同一个临时文件
+- acquire(blocking=False) 可用于选出执行定期任务的进程（持有锁直到进程退出）
+不支持 fcntl 的平台（Windows）只在进程内加锁
+"""
+import os
+import json
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    """基于锁文件的排他锁（跨进程 + 跨线程，同一线程可重入）"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path: Path = Path(path)
+        self._lock = threading.RLock()
+        self._fd: Optional[int] = None
+        self._depth = 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """获取锁；blocking 为 False 且锁被其他进程或线程持有时返回 False"""
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                self._lock.release()
+                raise
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    self._lock.release()
+                    if blocking:
+                        raise
+                    return False
+            self._fd = fd
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.release()
+
+
+_locks: Dict[str, FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+def file_lock(path: Union[str, Path]) -> FileLock:
+    """保护 path 的锁（锁文件为 <path>.lock），同一路径在进程内共享同一个实例"""
+    lock_path = Path(str(path) + ".lock")
+    key = os.path.abspath(lock_path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = FileLock(lock_path)
+        return lock
+
+
+def atomic_write_json(path: Union[str, Path], data: Any, indent: Optional[int] = 2) -> None:
+    """原子写入 JSON 文件"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -2,12 +2,14 @@
 """
 文件元数据管理器
 负责管理上传文件的分组等元信息
+修改在跨进程文件锁内完成，多进程部署时不会丢失其他进程的更新
 """
 import json
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Set
 
 from app.config import BASE_DIR
+from app.core.file_lock import file_lock, atomic_write_json
 
 FILE_META_PATH: Path = BASE_DIR / "file_metadata.json"
 
@@ -19,8 +21,10 @@ class FileManager:
 
     def __init__(self) -> None:
         self.path: Path = FILE_META_PATH
-        if not self.path.exists():
-            self._save({})
+        self._lock = file_lock(self.path)
+        with self._lock:
+            if not self.path.exists():
+                self._save({})
 
     def _load(self) -> Dict[str, Any]:
         """加载元数据文件"""
@@ -28,17 +32,17 @@ class FileManager:
             return json.load(f)
 
     def _save(self, data: Dict[str, Any]) -> None:
-        """保存元数据文件"""
-        with open(self.path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """原子写入元数据文件（调用方持有 self._lock）"""
+        atomic_write_json(self.path, data)
 
     def set_group(self, filename: str, group: str) -> None:
         """设置文件的分组"""
-        data = self._load()
-        if filename not in data:
-            data[filename] = {}
-        data[filename]["group"] = group
-        self._save(data)
+        with self._lock:
+            data = self._load()
+            if filename not in data:
+                data[filename] = {}
+            data[filename]["group"] = group
+            self._save(data)
 
     def get_group(self, filename: str) -> str:
         """获取文件的分组，默认为 '未分组'"""
@@ -56,18 +60,20 @@ class FileManager:
 
     def delete_meta(self, filename: str) -> None:
         """删除文件的元数据"""
-        data = self._load()
-        if filename in data:
-            del data[filename]
-            self._save(data)
+        with self._lock:
+            data = self._load()
+            if filename in data:
+                del data[filename]
+                self._save(data)
 
     def rename_meta(self, old_name: str, new_name: str) -> None:
         """重命名文件时同步更新元数据"""
-        data = self._load()
-        if old_name in data:
-            data[new_name] = data[old_name]
-            del data[old_name]
-            self._save(data)
+        with self._lock:
+            data = self._load()
+            if old_name in data:
+                data[new_name] = data[old_name]
+                del data[old_name]
+                self._save(data)
 
 
 # 模块级单例实例
@@ -3,88 +3,100 @@
 聊天历史管理模块
 负责保存、加载和列出历史会话记录
 """
-import json
+import logging
 import datetime
-import os
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
 from app.config import HISTORY_DIR
+from app.core.ids import new_message_id
+from app.core.file_lock import atomic_write_json
+from app.core.history_catalog import history_catalog
+from app.core.history_archive import history_archive
+from app.core.image_archive import image_archive
+from app.core.history_search import history_search
+from app.core.session_memory import session_memory
+from app.core.metrics import history_save_seconds
 
+logger = logging.getLogger(__name__)
 
-def save_history(messages: List[Dict[str, Any]], filename: str, kb_id: Optional[str] = None) -> None:
+
+def history_path(filename: str) -> Path:
     """
-    保存聊天历史到按日期组织的目录中
+    会话文件的完整路径
 
     Args:
-        messages: 消息列表
-        filename: 文件名或完整路径（如 "chat_123.json" 或 "2025-12-27/chat_123.json"）
-        kb_id: 关联的知识库ID
+        filename: 文件名或完整路径（如 "chat_123.json" 或 "2025-12-27/chat_123.json"），
+                  只有文件名时放在当天的日期目录下
     """
     # 验证文件名不为空
     if not filename or not filename.strip():
         raise ValueError("文件名不能为空")
-    
-    # 如果 filename 包含日期目录，直接使用；否则创建新的日期目录
+
+    # 如果 filename 包含日期目录，直接使用；否则使用当天的日期目录
     if '/' in filename:
-        file_path = HISTORY_DIR / filename
-        # 确保目录存在
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-    else:
-        now = datetime.datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        save_dir = HISTORY_DIR / date_str
-        save_dir.mkdir(parents=True, exist_ok=True)
+        return HISTORY_DIR / filename
+
+    date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+    if not filename.endswith('.json'):
+        filename += '.json'
+    return HISTORY_DIR / date_str / filename
+
+
+def save_history(messages: List[Dict[str, Any]], filename: str, kb_id: Optional[str] = None) -> Path:
+    """
+    保存聊天历史到按日期组织的目录中
 
-        if not filename.endswith('.json'):
-            filename += '.json'
+    Args:
+        messages: 消息列表
+        filename: 文件名或完整路径（如 "chat_123.json" 或 "2025-12-27/chat_123.json"）
+        kb_id: 关联的知识库ID
 
-        file_path = save_dir / filename
+    Returns:
+        写入的文件路径
+    """
+    file_path = history_path(filename)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
 
     # 确保每条消息都有 ID
     for msg in messages:
         if 'id' not in msg or not msg['id']:
-            msg['id'] = str(int(datetime.datetime.now().timestamp() * 1000)) + ''.join(__import__('random').choices('abcdefghijklmnopqrstuvwxyz0123456789', k=9))
-    
+            msg['id'] = new_message_id()
+
     # 保存为包含 messages 和 kb_id 的字典格式
     data = {
         "messages": messages,
         "kb_id": kb_id
     }
-    
-    logger = __import__('logging').getLogger(__name__)
+
     logger.debug(f"保存历史记录 - 文件: {filename}, 消息数量: {len(messages)}")
-    logger.debug(f"保存的消息ID: {[msg.get('id') for msg in messages]}")
-    
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+
+    with history_save_seconds.time(span="history.save", messages=len(messages)):
+        # 先写临时文件再替换，避免并发读取到写了一半的文件（临时文件名唯一，多个进程可同时保存）
+        atomic_write_json(file_path, data)
+        history_catalog.record(file_path, messages, kb_id)
+    if history_search is not None:
+        history_search.submit(file_path, messages, kb_id)
+    if session_memory is not None:
+        session_memory.submit(file_path, messages, kb_id)
+    return file_path
 
 
 def get_all_history() -> Dict[str, List[str]]:
     """
     获取所有历史记录，按日期分组
+    由历史索引提供，只重新扫描有变化的日期目录
 
     Returns:
         日期 -> 文件名列表 的字典，按日期降序排列
     """
-    if not HISTORY_DIR.exists():
-        return {}
-
-    result: Dict[str, List[str]] = {}
-    for date_dir in sorted(HISTORY_DIR.iterdir(), reverse=True):
-        if date_dir.is_dir():
-            files = [
-                f.name
-                for f in sorted(date_dir.glob("*.json"), key=os.path.getmtime, reverse=True)
-            ]
-            if files:
-                result[date_dir.name] = files
-    return result
+    return history_catalog.grouped()
 
 
 def load_history_file(filepath_str: str) -> Optional[Dict[str, Any]]:
     """
     加载指定的历史文件
+    文件已归档时从归档读取；已转码的生成图片链接替换为新文件
 
     Args:
         filepath_str: 相对于 HISTORY_DIR 的文件路径
@@ -92,19 +104,8 @@ def load_history_file(filepath_str: str) -> Optional[Dict[str, Any]]:
     Returns:
         包含 messages 和 kb_id 的字典，如果文件不存在则返回 None
     """
-    file_path = HISTORY_DIR / filepath_str
-    if not file_path.exists():
+    data = history_archive.read_session(filepath_str)
+    if data is None:
         return None
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    # 兼容旧格式：如果直接是消息列表，则包装成新格式
-    if isinstance(data, list):
-        return {"messages": data, "kb_id": None}
-    
-    # 新格式：包含 messages 和 kb_id
-    if isinstance(data, dict) and "messages" in data:
-        return data
-    
-    return None
\ No newline at end of file
+    image_archive.rewrite_messages(data["messages"])
+    return data
\ No newline at end of file
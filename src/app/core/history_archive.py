@@ -0,0 +1,382 @@
+# app/core/history_archive.py
+"""
+历史会话归档
+超过 HISTORY_ARCHIVE_AFTER_DAYS 天的会话文件压缩写入归档段文件后删除原文件：
+- 会话以紧凑 JSON 拼接成约 HISTORY_ARCHIVE_BLOCK_SIZE 的块，每块单独压缩后追加到段文件，
+  安装了 zstandard 时使用 zstd，否则使用标准库 lzma（段文件记录各自的压缩方式）
+- 索引（归档目录下的 index.db）记录每个会话所在的段、块和块内偏移，读取时只解压一个块
+- 历史索引中的会话标记为已归档，列表、分页、检索不受影响；read_session 先读原文件，再读归档
+再次保存已归档的会话时写入新的会话文件，之后以该文件为准
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import datetime
+import threading
+import lzma
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import (
+    HISTORY_DIR,
+    HISTORY_ARCHIVE_DIR,
+    HISTORY_ARCHIVE_BLOCK_SIZE,
+    HISTORY_ARCHIVE_SEGMENT_SIZE
+)
+from app.core.history_catalog import history_catalog, session_title
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时使用 lzma
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC: str = "zstd" if zstandard is not None else "xz"
+_SUFFIXES = {"zstd": ".zst", "xz": ".xz"}
+
+# 缓存最近解压的块数
+BLOCK_CACHE_SIZE = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archived (
+    path TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    block_offset INTEGER NOT NULL,
+    block_length INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    title TEXT,
+    message_count INTEGER NOT NULL,
+    kb_id TEXT,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    archived_at REAL NOT NULL
+);
+"""
+
+
+def compress(data: bytes, codec: str = CODEC) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return lzma.compress(data, preset=6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 归档需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return lzma.decompress(data)
+
+
+def parse_session(data: Any) -> Optional[Dict[str, Any]]:
+    """会话文件内容转为 {"messages", "kb_id"}，兼容旧格式（直接是消息列表）"""
+    if isinstance(data, list):
+        return {"messages": data, "kb_id": None}
+    if isinstance(data, dict) and isinstance(data.get("messages"), list):
+        return data
+    return None
+
+
+class HistoryArchive:
+    """归档段文件与索引"""
+
+    def __init__(self, archive_dir: Path, history_dir: Path, block_size: int, segment_size: int) -> None:
+        self.archive_dir: Path = archive_dir
+        self.history_dir: Path = history_dir
+        self.block_size: int = block_size
+        self.segment_size: int = segment_size
+        self._lock = threading.RLock()
+        self._blocks: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        """首次使用时创建归档目录和索引"""
+        if self._conn is None:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.archive_dir / "index.db"), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _has_index(self) -> bool:
+        return self._conn is not None or (self.archive_dir / "index.db").exists()
+
+    # =========================================================================
+    # 读取
+    # =========================================================================
+
+    def _read_block(self, segment: str, codec: str, offset: int, length: int) -> bytes:
+        key = (segment, offset)
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+            return block
+        with open(self.archive_dir / segment, "rb") as f:
+            f.seek(offset)
+            block = decompress(f.read(length), codec)
+        self._blocks[key] = block
+        while len(self._blocks) > BLOCK_CACHE_SIZE:
+            self._blocks.popitem(last=False)
+        return block
+
+    def load(self, session: str) -> Optional[Dict[str, Any]]:
+        """读取已归档的会话，不存在时返回 None"""
+        if not self._has_index():
+            return None
+        with self._lock:
+            row = self._db().execute(
+                "SELECT a.segment, s.codec, a.block_offset, a.block_length, a.offset, a.length "
+                "FROM archived a JOIN segments s ON s.name = a.segment WHERE a.path = ?",
+                (session,)
+            ).fetchone()
+            if row is None:
+                return None
+            segment, codec, block_offset, block_length, offset, length = row
+            block = self._read_block(segment, codec, block_offset, block_length)
+        return parse_session(json.loads(block[offset:offset + length].decode("utf-8")))
+
+    def contains(self, session: str) -> bool:
+        """会话是否已归档"""
+        if not self._has_index():
+            return False
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM archived WHERE path = ?", (session,)).fetchone() is not None
+
+    def read_session(self, session: str) -> Optional[Dict[str, Any]]:
+        """
+        读取会话：会话文件存在时读取文件，否则读取归档
+
+        Args:
+            session: 相对于 HISTORY_DIR 的路径（如 "2025-01-17/chat_123.json"）
+
+        Returns:
+            {"messages": [...], "kb_id": ...}，会话不存在时返回 None
+        """
+        file_path = self.history_dir / session
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                return parse_session(json.load(f))
+        except FileNotFoundError:
+            pass
+        return self.load(session)
+
+    # =========================================================================
+    # 删除与重命名
+    # =========================================================================
+
+    def remove(self, session: str) -> bool:
+        """从归档索引中删除会话（段文件中的数据成为无效数据），返回是否存在"""
+        if not self._has_index():
+            return False
+        with self._lock:
+            return self._db().execute("DELETE FROM archived WHERE path = ?", (session,)).rowcount > 0
+
+    def rename(self, old_session: str, new_session: str) -> bool:
+        """重命名已归档的会话，返回是否存在"""
+        if not self._has_index():
+            return False
+        date, _, name = new_session.rpartition("/")
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM archived WHERE path = ?", (new_session,))
+            return conn.execute(
+                "UPDATE archived SET path = ?, date = ?, name = ? WHERE path = ?", (new_session, date, name, old_session)
+            ).rowcount > 0
+
+    # =========================================================================
+    # 归档
+    # =========================================================================
+
+    def _candidates(self, older_than_days: int) -> List[Tuple[Path, os.stat_result]]:
+        """日期目录早于截止日期且修改时间早于截止时间的会话文件"""
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+        cutoff_date = cutoff.strftime("%Y-%m-%d")
+        cutoff_ts = cutoff.timestamp()
+        files = []
+        if not self.history_dir.exists():
+            return files
+        for date_dir in sorted(self.history_dir.iterdir()):
+            if not date_dir.is_dir() or date_dir.name >= cutoff_date:
+                continue
+            for file_path in sorted(date_dir.glob("*.json")):
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                if stat.st_mtime < cutoff_ts:
+                    files.append((file_path, stat))
+        return files
+
+    def archive(self, older_than_days: int) -> Dict[str, Any]:
+        """
+        归档超过指定天数的会话文件
+
+        Returns:
+            归档的会话数、原文件总大小、写入的压缩数据大小与段文件名
+        """
+        candidates = self._candidates(older_than_days)
+        if not candidates:
+            return {"archived_sessions": 0, "original_bytes": 0, "archived_bytes": 0, "segments": []}
+
+        with self._lock:
+            conn = self._db()
+            segments: List[str] = []
+            segment_path: Optional[Path] = None
+            segment_file = None
+            rows: List[Tuple[Any, ...]] = []
+            stamps: Dict[str, Tuple[Path, int, int]] = {}
+            block = bytearray()
+            pending: List[Tuple[Any, ...]] = []
+            original_bytes = 0
+            now = time.time()
+
+            def open_segment() -> None:
+                nonlocal segment_path, segment_file
+                if segment_file is not None:
+                    segment_file.flush()
+                    os.fsync(segment_file.fileno())
+                    segment_file.close()
+                name = f"segment-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}-{len(segments)}{_SUFFIXES[CODEC]}"
+                segment_path = self.archive_dir / name
+                segment_file = open(segment_path, "ab")
+                segments.append(name)
+
+            def write_block() -> None:
+                if not pending:
+                    return
+                if segment_file is None or segment_file.tell() >= self.segment_size:
+                    open_segment()
+                data = compress(bytes(block))
+                block_offset = segment_file.tell()
+                segment_file.write(data)
+                for entry in pending:
+                    rows.append((entry[0], segments[-1], block_offset, len(data)) + entry[1:])
+                block.clear()
+                pending.clear()
+
+            try:
+                for file_path, stat in candidates:
+                    try:
+                        with open(file_path, "r", encoding="utf-8") as f:
+                            data = parse_session(json.load(f))
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"读取历史文件失败，跳过归档 {file_path}: {e}")
+                        continue
+                    if data is None:
+                        continue
+                    session = file_path.relative_to(self.history_dir).as_posix()
+                    encoded = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    pending.append((
+                        session, len(block), len(encoded), file_path.parent.name, file_path.name,
+                        session_title(data["messages"]), len(data["messages"]), data.get("kb_id"),
+                        stat.st_mtime, stat.st_size, now
+                    ))
+                    block.extend(encoded)
+                    stamps[session] = (file_path, stat.st_mtime_ns, stat.st_size)
+                    original_bytes += stat.st_size
+                    if len(block) >= self.block_size:
+                        write_block()
+                write_block()
+            finally:
+                if segment_file is not None:
+                    segment_file.flush()
+                    os.fsync(segment_file.fileno())
+                    segment_file.close()
+
+            # 段文件落盘后再写索引，写入索引后再删除原文件
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO segments VALUES (?, ?, ?)", [(name, CODEC, now) for name in segments]
+                )
+                conn.executemany("INSERT OR REPLACE INTO archived VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        archived: List[str] = []
+        for session, (file_path, mtime_ns, size) in stamps.items():
+            try:
+                stat = file_path.stat()
+                # 归档期间被修改的文件保留，之后以文件为准
+                if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size):
+                    continue
+                file_path.unlink()
+            except OSError as e:
+                logger.warning(f"删除已归档的历史文件失败 {file_path}: {e}")
+                continue
+            archived.append(session)
+        for date_dir in {self.history_dir / session.rpartition("/")[0] for session in archived}:
+            try:
+                date_dir.rmdir()
+            except OSError:
+                pass
+        # 历史索引中尚未记录的会话（例如在应用之外放入的文件）一并补充
+        listing = {row[0]: row for row in rows}
+        history_catalog.record_archived([
+            dict(zip(("path", "date", "name", "title", "message_count", "kb_id", "mtime", "size"), listing[session][:1] + listing[session][6:13]))
+            for session in archived
+        ])
+        history_catalog.mark_archived(archived)
+
+        archived_bytes = sum((self.archive_dir / name).stat().st_size for name in segments)
+        logger.info(
+            f"归档 {len(archived)} 个会话: {original_bytes / 1e6:.1f} MB → {archived_bytes / 1e6:.1f} MB ({CODEC})"
+        )
+        return {
+            "archived_sessions": len(archived),
+            "original_bytes": original_bytes,
+            "archived_bytes": archived_bytes,
+            "segments": segments
+        }
+
+    def sync_catalog(self) -> int:
+        """把已归档的会话补充到历史索引（例如历史索引重建之后），返回补充的条数"""
+        if not self._has_index():
+            return 0
+        with self._lock:
+            cursor = self._db().execute(
+                "SELECT path, date, name, title, message_count, kb_id, mtime, size FROM archived"
+            )
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        # 再次保存过的会话以文件为准，由历史索引同步
+        return history_catalog.record_archived([row for row in rows if not (self.history_dir / row["path"]).exists()])
+
+    def stats(self) -> Dict[str, Any]:
+        """归档统计"""
+        if not self._has_index():
+            return {"codec": CODEC, "sessions": 0, "original_bytes": 0, "segments": 0, "archived_bytes": 0}
+        with self._lock:
+            sessions, original = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM archived"
+            ).fetchone()
+            names = [row[0] for row in self._db().execute("SELECT name FROM segments").fetchall()]
+        archived_bytes = sum((self.archive_dir / name).stat().st_size for name in names if (self.archive_dir / name).exists())
+        return {
+            "codec": CODEC,
+            "sessions": sessions,
+            "original_bytes": original,
+            "segments": len(names),
+            "archived_bytes": archived_bytes
+        }
+
+
+# 模块级单例
+history_archive: HistoryArchive = HistoryArchive(
+    HISTORY_ARCHIVE_DIR, HISTORY_DIR, HISTORY_ARCHIVE_BLOCK_SIZE, HISTORY_ARCHIVE_SEGMENT_SIZE
+)
@@ -0,0 +1,321 @@
+# app/core/history_catalog.py
+"""
+聊天历史目录索引
+在 SQLite 中记录每个会话文件的标题、消息数、kb_id、修改时间和大小，
+历史列表与分页查询直接读取索引，不再对每个文件 stat / 排序。
+- 保存、重命名、删除会话时同步更新索引
+- 日期目录的修改时间变化（目录中有文件新增、删除或替换）时只重新扫描该目录，
+  以发现在应用之外发生的变化；sync(full=True) 重新检查全部文件
+- 已归档的会话（archived = 1）没有对应的文件，同步时保留
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.config import HISTORY_DIR, HISTORY_CATALOG_PATH
+
+logger = logging.getLogger(__name__)
+
+# 标题取第一条用户消息的前若干个字符
+TITLE_LENGTH = 50
+
+# 分页查询单页最大条数
+MAX_PAGE_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    path TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    title TEXT,
+    message_count INTEGER NOT NULL,
+    kb_id TEXT,
+    mtime REAL NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    archived INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(date, mtime);
+CREATE INDEX IF NOT EXISTS idx_sessions_kb ON sessions(kb_id, date, mtime);
+CREATE TABLE IF NOT EXISTS date_dirs (
+    date TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = "path, date, name, title, message_count, kb_id, mtime, size"
+
+
+def session_title(messages: List[Dict[str, Any]]) -> str:
+    """会话标题：第一条用户消息的文本"""
+    for msg in messages:
+        if msg.get("role") != "user":
+            continue
+        content = msg.get("content")
+        if isinstance(content, list):
+            content = " ".join(item.get("text", "") for item in content if item.get("type") == "text")
+        text = " ".join(str(content or "").split())
+        if text:
+            return text[:TITLE_LENGTH]
+    return ""
+
+
+class HistoryCatalog:
+    """基于 SQLite 的会话文件索引"""
+
+    def __init__(self, db_path: Path, history_dir: Path) -> None:
+        self.db_path: Path = db_path
+        self.history_dir: Path = history_dir
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "archived" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _relative(self, file_path: Path) -> Tuple[str, str, str]:
+        """(相对路径, 日期目录, 文件名)"""
+        relative = file_path.relative_to(self.history_dir)
+        return relative.as_posix(), relative.parent.as_posix(), relative.name
+
+    def _upsert(self, file_path: Path, stat: os.stat_result, messages: List[Dict[str, Any]], kb_id: Optional[str]) -> None:
+        path, date, name = self._relative(file_path)
+        self._execute(
+            f"INSERT OR REPLACE INTO sessions ({_COLUMNS}, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, date, name, session_title(messages), len(messages), kb_id, stat.st_mtime, stat.st_size, stat.st_mtime_ns)
+        )
+
+    def record(self, file_path: Path, messages: List[Dict[str, Any]], kb_id: Optional[str]) -> None:
+        """会话文件保存后更新索引"""
+        try:
+            self._upsert(file_path, file_path.stat(), messages, kb_id)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.warning(f"更新历史索引失败 {file_path}: {e}")
+
+    def remove(self, file_path: Path) -> None:
+        """会话文件删除后更新索引"""
+        try:
+            self._execute("DELETE FROM sessions WHERE path = ?", (self._relative(file_path)[0],))
+        except (ValueError, sqlite3.Error) as e:
+            logger.warning(f"更新历史索引失败 {file_path}: {e}")
+
+    def rename(self, old_path: Path, new_path: Path) -> None:
+        """会话文件（或已归档的会话）重命名后更新索引"""
+        try:
+            path, date, name = self._relative(new_path)
+            old = self._relative(old_path)[0]
+            if not new_path.exists():
+                self._execute("UPDATE sessions SET path = ?, date = ?, name = ? WHERE path = ?", (path, date, name, old))
+                return
+            stat = new_path.stat()
+            self._execute(
+                "UPDATE sessions SET path = ?, date = ?, name = ?, mtime = ?, mtime_ns = ?, size = ? WHERE path = ?",
+                (path, date, name, stat.st_mtime, stat.st_mtime_ns, stat.st_size, old)
+            )
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.warning(f"更新历史索引失败 {new_path}: {e}")
+
+    def mark_archived(self, paths: List[str]) -> None:
+        """会话归档（原文件删除）后保留在索引中"""
+        with self._lock:
+            self._conn.executemany("UPDATE sessions SET archived = 1 WHERE path = ?", [(path,) for path in paths])
+
+    def record_archived(self, rows: List[Dict[str, Any]]) -> int:
+        """补充索引中缺少的已归档会话（例如索引文件被删除后），返回补充的条数"""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO sessions ({_COLUMNS}, mtime_ns, archived) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 1)",
+                [tuple(row[column] for column in _COLUMNS.split(", ")) for row in rows]
+            )
+            return self._conn.total_changes - before
+
+    # =========================================================================
+    # 与目录同步
+    # =========================================================================
+
+    def _scan_date_dir(self, date_dir: Path, full: bool) -> int:
+        """重新扫描一个日期目录，只读取修改时间或大小变化的文件，返回读取的文件数"""
+        date = date_dir.name
+        known = {
+            name: (mtime_ns, size)
+            for name, mtime_ns, size in self._execute(
+                "SELECT name, mtime_ns, size FROM sessions WHERE date = ? AND archived = 0", (date,)
+            ).fetchall()
+        }
+        loaded = 0
+        present = set()
+        for file_path in date_dir.glob("*.json"):
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            present.add(file_path.name)
+            if not full and known.get(file_path.name) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取历史文件失败 {file_path}: {e}")
+                continue
+            if isinstance(data, list):
+                data = {"messages": data, "kb_id": None}
+            if not isinstance(data, dict) or not isinstance(data.get("messages"), list):
+                continue
+            self._upsert(file_path, stat, data["messages"], data.get("kb_id"))
+            loaded += 1
+
+        for name in known.keys() - present:
+            self._execute("DELETE FROM sessions WHERE path = ?", (f"{date}/{name}",))
+        return loaded
+
+    def sync(self, full: bool = False) -> Dict[str, int]:
+        """
+        将索引与历史目录同步
+
+        Args:
+            full: 为 False 时只扫描修改时间变化的日期目录；为 True 时检查所有文件
+
+        Returns:
+            扫描的目录数与读取的文件数
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                scanned, loaded = self._sync_locked(full)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if loaded:
+            logger.info(f"历史索引同步: 扫描 {scanned} 个目录，读取 {loaded} 个文件")
+        return {"scanned_dirs": scanned, "loaded_files": loaded}
+
+    def _sync_locked(self, full: bool) -> Tuple[int, int]:
+        """在事务中执行同步，返回 (扫描的目录数, 读取的文件数)"""
+        scanned = loaded = 0
+        known_dirs = dict(self._execute("SELECT date, mtime_ns FROM date_dirs").fetchall())
+        present = set()
+        if self.history_dir.exists():
+            for date_dir in self.history_dir.iterdir():
+                try:
+                    if not date_dir.is_dir():
+                        continue
+                    mtime_ns = date_dir.stat().st_mtime_ns
+                except OSError:
+                    continue
+                present.add(date_dir.name)
+                if not full and known_dirs.get(date_dir.name) == mtime_ns:
+                    continue
+                loaded += self._scan_date_dir(date_dir, full)
+                scanned += 1
+                self._execute("INSERT OR REPLACE INTO date_dirs VALUES (?, ?)", (date_dir.name, mtime_ns))
+
+        # 已不存在的日期目录（包括只通过 record() 写入、尚未扫描过的目录）
+        known_dates = set(known_dirs)
+        known_dates.update(row[0] for row in self._execute("SELECT DISTINCT date FROM sessions").fetchall())
+        for date in known_dates - present:
+            self._execute("DELETE FROM sessions WHERE date = ? AND archived = 0", (date,))
+            self._execute("DELETE FROM date_dirs WHERE date = ?", (date,))
+        return scanned, loaded
+
+    # =========================================================================
+    # 查询
+    # =========================================================================
+
+    def grouped(self) -> Dict[str, List[str]]:
+        """日期 -> 文件名列表，按日期和修改时间降序（与 get_all_history 的格式相同）"""
+        self.sync()
+        result: Dict[str, List[str]] = {}
+        for date, name in self._execute("SELECT date, name FROM sessions ORDER BY date DESC, mtime DESC").fetchall():
+            result.setdefault(date, []).append(name)
+        return result
+
+    def paths(self) -> List[str]:
+        """所有会话文件的相对路径"""
+        self.sync()
+        return [row[0] for row in self._execute("SELECT path FROM sessions").fetchall()]
+
+    def page(
+        self,
+        offset: int = 0,
+        limit: int = 50,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        kb_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        分页列出会话，按日期和修改时间降序
+
+        Args:
+            offset: 跳过的条数
+            limit: 返回的最大条数（不超过 MAX_PAGE_SIZE）
+            start_date: 起始日期（含），格式 YYYY-MM-DD
+            end_date: 结束日期（含），格式 YYYY-MM-DD
+            kb_id: 只列出关联该知识库的会话
+
+        Returns:
+            {"total": 总条数, "offset", "limit", "items": [...]}
+        """
+        self.sync()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        where, params = self._filters(start_date, end_date, kb_id)
+        total = self._execute(f"SELECT COUNT(*) FROM sessions{where}", params).fetchone()[0]
+        rows = self._execute(
+            f"SELECT {_COLUMNS}, archived FROM sessions{where} ORDER BY date DESC, mtime DESC LIMIT ? OFFSET ?",
+            params + (limit, offset)
+        ).fetchall()
+        columns = _COLUMNS.split(", ") + ["archived"]
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "items": [{**dict(zip(columns, row)), "archived": bool(row[-1])} for row in rows]
+        }
+
+    def dates(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按日期统计会话数，日期降序"""
+        self.sync()
+        where, params = self._filters(start_date, end_date, None)
+        rows = self._execute(
+            f"SELECT date, COUNT(*) FROM sessions{where} GROUP BY date ORDER BY date DESC", params
+        ).fetchall()
+        return [{"date": date, "count": count} for date, count in rows]
+
+    @staticmethod
+    def _filters(start_date: Optional[str], end_date: Optional[str], kb_id: Optional[str]) -> Tuple[str, tuple]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        if kb_id:
+            clauses.append("kb_id = ?")
+            params.append(kb_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        sessions, size, archived = self._execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(archived), 0) FROM sessions"
+        ).fetchone()
+        return {"sessions": sessions, "archived": archived, "total_bytes": size, "db_path": str(self.db_path)}
+
+
+# 模块级单例
+history_catalog: HistoryCatalog = HistoryCatalog(HISTORY_CATALOG_PATH, HISTORY_DIR)
@@ -0,0 +1,461 @@
+# app/core/history_search.py
+"""
+聊天历史全文检索
+基于 SQLite FTS5 的倒排索引，索引内容为预先切分好的词项：
+- 拉丁字母与数字按单词切分（小写）
+- 中日韩文字按二元组（bigram）切分，并在每段末尾附加最后一个字，
+  使单字与跨段的查询也能命中
+查询按同样的规则切分并作为短语匹配，相当于子串匹配，结果按 BM25 排序。
+
+索引更新是异步、批量的：save_history 只把会话放入队列，后台线程按 HISTORY_SEARCH_FLUSH_INTERVAL
+合并同一会话的多次保存后在一个事务中写入。每条消息保存内容摘要，只重新索引新增或修改的消息。
+"""
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import (
+    HISTORY_DIR,
+    HISTORY_SEARCH_ENABLED,
+    HISTORY_SEARCH_PATH,
+    HISTORY_SEARCH_FLUSH_INTERVAL,
+    HISTORY_SEARCH_BATCH_SIZE
+)
+from app.core.history_catalog import history_catalog
+from app.core.history_archive import history_archive
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字（假名、CJK 统一表意文字及扩展 A、兼容表意文字、谚文音节）
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+# 摘要截取的上下文长度（匹配位置前后各若干字符）
+SNIPPET_RADIUS = 40
+
+# 单次查询最大返回条数
+MAX_RESULTS = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    path TEXT PRIMARY KEY,
+    kb_id TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    role TEXT,
+    position INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_key ON messages(session, message_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(tokens, tokenize = 'unicode61 remove_diacritics 0');
+"""
+
+
+def _runs(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _is_cjk(run: str) -> bool:
+    return bool(_CJK_RE.match(run))
+
+
+def tokenize(text: str) -> List[str]:
+    """将文档切分为索引词项"""
+    tokens: List[str] = []
+    for run in _runs(text):
+        if not _is_cjk(run) or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+    return tokens
+
+
+def query_tokens(term: str) -> Tuple[List[str], bool]:
+    """
+    将一个查询词切分为短语词项
+
+    Returns:
+        (词项列表, 最后一个词项是否按前缀匹配)
+        查询词以单个中日韩文字结尾时，文档中该字可能是一个二元组的首字，因此按前缀匹配
+    """
+    runs = _runs(term)
+    tokens: List[str] = []
+    prefix = False
+    for index, run in enumerate(runs):
+        last = index == len(runs) - 1
+        if not _is_cjk(run):
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+            prefix = last
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            # 查询词中间的中日韩文字段在文档中同样以单字结尾
+            if not last:
+                tokens.append(run[-1])
+    return tokens, prefix
+
+
+def build_match(query: str) -> Optional[str]:
+    """将用户查询转换为 FTS5 MATCH 表达式，空格分隔的多个词之间为 AND"""
+    phrases: List[str] = []
+    for term in query.split():
+        tokens, prefix = query_tokens(term)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"' + ("*" if prefix else ""))
+    return " AND ".join(phrases) if phrases else None
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """消息的文本内容（多模态消息只取文本部分）"""
+    content = message.get("content")
+    if isinstance(content, list):
+        return "\n".join(item.get("text", "") for item in content if isinstance(item, dict) and item.get("type") == "text")
+    return content if isinstance(content, str) else ""
+
+
+def make_snippet(text: str, terms: List[str]) -> str:
+    """截取第一个命中词附近的文本"""
+    lowered = text.lower()
+    positions = [pos for pos in (lowered.find(term.lower()) for term in terms) if pos >= 0]
+    start = min(positions) if positions else 0
+    begin = max(0, start - SNIPPET_RADIUS)
+    end = min(len(text), start + SNIPPET_RADIUS * 2)
+    snippet = " ".join(text[begin:end].split())
+    return ("…" if begin > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class HistorySearchIndex:
+    """会话消息的全文索引"""
+
+    def __init__(self, db_path: Path, history_dir: Path, flush_interval: float, batch_size: int) -> None:
+        self.db_path: Path = db_path
+        self.history_dir: Path = history_dir
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+        self._lock = threading.RLock()
+        self._cond = threading.Condition()
+        # 待处理的操作: ("index", path, messages, kb_id) / ("remove", path) / ("rename", old, new)
+        self._pending: Deque[Tuple[Any, ...]] = deque()
+        self._worker: Optional[threading.Thread] = None
+        self._closed: bool = False
+        self.indexed_messages: int = 0
+        self.batches: int = 0
+        self.last_flush_seconds: float = 0.0
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _session_key(self, file_path: Path) -> str:
+        return file_path.relative_to(self.history_dir).as_posix()
+
+    # =========================================================================
+    # 更新队列
+    # =========================================================================
+
+    def _enqueue(self, operation: Tuple[Any, ...]) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append(operation)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="history-search", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+    def submit(self, file_path: Path, messages: List[Dict[str, Any]], kb_id: Optional[str]) -> None:
+        """会话保存后排队等待索引（只复制消息的 ID、角色和文本，不阻塞调用方）"""
+        try:
+            session = self._session_key(file_path)
+        except ValueError:
+            return
+        snapshot = [
+            (str(msg.get("id") or f"#{position}"), msg.get("role"), message_text(msg))
+            for position, msg in enumerate(messages)
+        ]
+        self._enqueue(("index", session, snapshot, kb_id))
+
+    def remove(self, file_path: Path) -> None:
+        """会话删除后排队移除索引"""
+        try:
+            self._enqueue(("remove", self._session_key(file_path)))
+        except ValueError:
+            pass
+
+    def rename(self, old_path: Path, new_path: Path) -> None:
+        """会话重命名后排队更新索引"""
+        try:
+            self._enqueue(("rename", self._session_key(old_path), self._session_key(new_path)))
+        except ValueError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            # 等待一个刷新周期，合并这段时间内的多次保存
+            deadline = time.monotonic() + self.flush_interval
+            with self._cond:
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"历史检索索引更新失败: {e}")
+
+    def flush(self) -> int:
+        """立即处理队列中的全部操作，返回处理的操作数"""
+        with self._cond:
+            batch = list(self._pending)
+            self._pending.clear()
+        if not batch:
+            return 0
+
+        # 同一会话连续的多次保存只索引最后一次；删除和重命名之前的保存仍按顺序处理
+        latest: Dict[str, int] = {}
+        keep = set()
+        for index, operation in enumerate(batch):
+            if operation[0] == "index":
+                if operation[1] in latest:
+                    keep.discard(latest[operation[1]])
+                latest[operation[1]] = index
+                keep.add(index)
+            else:
+                for session in operation[1:]:
+                    latest.pop(session, None)
+
+        started = time.perf_counter()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for index, operation in enumerate(batch):
+                    kind = operation[0]
+                    if kind == "index":
+                        if index in keep:
+                            self._index_session(*operation[1:])
+                    elif kind == "remove":
+                        self._remove_session(operation[1])
+                    elif kind == "rename":
+                        self._rename_session(operation[1], operation[2])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.batches += 1
+        self.last_flush_seconds = time.perf_counter() - started
+        return len(batch)
+
+    def close(self) -> None:
+        """处理完队列中的剩余操作并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout=30)
+        self.flush()
+
+    # =========================================================================
+    # 索引写入（在 flush 的事务中调用）
+    # =========================================================================
+
+    def _index_session(self, session: str, snapshot: List[Tuple[str, Optional[str], str]], kb_id: Optional[str]) -> None:
+        conn = self._conn
+        existing = {
+            message_id: (row_id, digest)
+            for row_id, message_id, digest in conn.execute(
+                "SELECT id, message_id, digest FROM messages WHERE session = ?", (session,)
+            )
+        }
+        seen = set()
+        for position, (message_id, role, text) in enumerate(snapshot):
+            if message_id in seen:
+                continue
+            seen.add(message_id)
+            digest = hashlib.blake2b(f"{role}\x00{text}".encode("utf-8"), digest_size=12).hexdigest()
+            current = existing.get(message_id)
+            if current is not None and current[1] == digest:
+                conn.execute("UPDATE messages SET position = ? WHERE id = ?", (position, current[0]))
+                continue
+            if current is not None:
+                conn.execute("DELETE FROM message_fts WHERE rowid = ?", (current[0],))
+                conn.execute("DELETE FROM messages WHERE id = ?", (current[0],))
+            cursor = conn.execute(
+                "INSERT INTO messages (session, message_id, role, position, digest, text) VALUES (?, ?, ?, ?, ?, ?)",
+                (session, message_id, role, position, digest, text)
+            )
+            conn.execute("INSERT INTO message_fts (rowid, tokens) VALUES (?, ?)", (cursor.lastrowid, " ".join(tokenize(text))))
+            self.indexed_messages += 1
+
+        for message_id in existing.keys() - seen:
+            row_id = existing[message_id][0]
+            conn.execute("DELETE FROM message_fts WHERE rowid = ?", (row_id,))
+            conn.execute("DELETE FROM messages WHERE id = ?", (row_id,))
+        conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session, kb_id, time.time()))
+
+    def _remove_session(self, session: str) -> None:
+        conn = self._conn
+        conn.execute("DELETE FROM message_fts WHERE rowid IN (SELECT id FROM messages WHERE session = ?)", (session,))
+        conn.execute("DELETE FROM messages WHERE session = ?", (session,))
+        conn.execute("DELETE FROM sessions WHERE path = ?", (session,))
+
+    def _rename_session(self, old: str, new: str) -> None:
+        conn = self._conn
+        self._remove_session(new)
+        conn.execute("UPDATE messages SET session = ? WHERE session = ?", (new, old))
+        conn.execute("UPDATE sessions SET path = ? WHERE path = ?", (new, old))
+
+    # =========================================================================
+    # 查询
+    # =========================================================================
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        kb_id: Optional[str] = None,
+        by_session: bool = False
+    ) -> Dict[str, Any]:
+        """
+        全文检索
+
+        Args:
+            query: 查询文本，空格分隔的多个词需要同时命中
+            limit: 返回的最大条数（不超过 MAX_RESULTS）
+            offset: 跳过的条数
+            kb_id: 只检索关联该知识库的会话
+            by_session: 为 True 时每个会话只返回得分最高的一条消息
+
+        Returns:
+            {"query", "total", "results": [{"session", "message_id", "role", "position", "score", "snippet"}]}
+        """
+        match = build_match(query)
+        if match is None:
+            return {"query": query, "total": 0, "results": []}
+        limit = max(1, min(limit, MAX_RESULTS))
+        offset = max(0, offset)
+
+        where = "message_fts MATCH ?"
+        params: List[Any] = [match]
+        if kb_id:
+            where += " AND m.session IN (SELECT path FROM sessions WHERE kb_id = ?)"
+            params.append(kb_id)
+        ranked = (
+            "SELECT m.session, m.message_id, m.role, m.position, m.text, bm25(message_fts) AS score "
+            f"FROM message_fts JOIN messages m ON m.id = message_fts.rowid WHERE {where}"
+        )
+        if by_session:
+            sql = (
+                "SELECT session, message_id, role, position, text, score, hits FROM ("
+                f"SELECT *, ROW_NUMBER() OVER (PARTITION BY session ORDER BY score) AS rn, "
+                f"COUNT(*) OVER (PARTITION BY session) AS hits FROM ({ranked})"
+                ") WHERE rn = 1"
+            )
+            count_sql = f"SELECT COUNT(DISTINCT session) FROM ({ranked})"
+        else:
+            sql = f"SELECT *, 1 AS hits FROM ({ranked})"
+            count_sql = f"SELECT COUNT(*) FROM ({ranked})"
+
+        terms = query.split()
+        with self._lock:
+            total = self._conn.execute(count_sql, tuple(params)).fetchone()[0]
+            rows = self._conn.execute(f"{sql} ORDER BY score LIMIT ? OFFSET ?", tuple(params) + (limit, offset)).fetchall()
+        results = []
+        for session, message_id, role, position, text, score, hits in rows:
+            item = {
+                "session": session,
+                "message_id": message_id,
+                "role": role,
+                "position": position,
+                # bm25() 越小越相关，取反后越大越相关
+                "score": round(-score, 4),
+                "snippet": make_snippet(text, terms)
+            }
+            if by_session:
+                item["hits"] = hits
+            results.append(item)
+        return {"query": query, "total": total, "results": results}
+
+    def rebuild(self, full: bool = False) -> Dict[str, int]:
+        """
+        按历史索引补全检索索引（例如启用检索之前已有的会话）
+
+        Args:
+            full: 为 True 时重新读取所有会话；否则只读取尚未索引的会话
+
+        Returns:
+            读取的会话数与移除的会话数
+        """
+        catalog = set(history_catalog.paths())
+        indexed = {row[0] for row in self._execute("SELECT path FROM sessions").fetchall()}
+        for session in indexed - catalog:
+            self._enqueue(("remove", session))
+        loaded = 0
+        for session in sorted(catalog if full else catalog - indexed):
+            # 已归档的会话从归档读取
+            try:
+                data = history_archive.read_session(session)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取历史会话失败 {session}: {e}")
+                continue
+            if data is None:
+                continue
+            self.submit(self.history_dir / session, data["messages"], data.get("kb_id"))
+            loaded += 1
+        self.flush()
+        return {"loaded_sessions": loaded, "removed_sessions": len(indexed - catalog)}
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        sessions = self._execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        messages = self._execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "sessions": sessions,
+            "messages": messages,
+            "pending": pending,
+            "batches": self.batches,
+            "indexed_messages": self.indexed_messages,
+            "last_flush_seconds": round(self.last_flush_seconds, 4)
+        }
+
+
+def _create_index() -> Optional[HistorySearchIndex]:
+    if not HISTORY_SEARCH_ENABLED:
+        return None
+    try:
+        return HistorySearchIndex(HISTORY_SEARCH_PATH, HISTORY_DIR, HISTORY_SEARCH_FLUSH_INTERVAL, HISTORY_SEARCH_BATCH_SIZE)
+    except sqlite3.OperationalError as e:
+        # SQLite 未编译 FTS5 时不提供历史检索
+        logger.warning(f"历史检索不可用: {e}")
+        return None
+
+
+# 模块级单例，关闭或 SQLite 不支持 FTS5 时为 None
+history_search: Optional[HistorySearchIndex] = _create_index()
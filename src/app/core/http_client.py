@@ -0,0 +1,203 @@
+# app/core/http_client.py
+"""
+共享异步 HTTP 客户端
+进程内复用一个 httpx.AsyncClient，按主机维护连接池，
+支持失败重试（指数退避）、响应大小限制以及将大响应体写入临时文件
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import httpx
+
+from app.config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_MAX_RESPONSE_BYTES,
+    HTTP_SPOOL_THRESHOLD_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR: Path = Path(tempfile.gettempdir()) / "nexus_http_spool"
+SPOOL_TTL_SECONDS: int = 24 * 3600
+
+# 幂等方法在收到这些状态码时可以安全重试
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class ResponseTooLargeError(Exception):
+    """响应体超过大小限制"""
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的异步 HTTP 客户端（延迟创建）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            follow_redirects=True
+        )
+        _cleanup_spool_dir()
+    return _client
+
+
+async def close_http_client() -> None:
+    """关闭共享客户端，释放连接池"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _cleanup_spool_dir() -> None:
+    """清理过期的临时响应文件"""
+    if not SPOOL_DIR.exists():
+        return
+    expire_before = time.time() - SPOOL_TTL_SECONDS
+    for path in SPOOL_DIR.iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < expire_before:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _retry_delay(attempt: int, backoff: float, max_delay: float, response: Optional[httpx.Response] = None) -> float:
+    """计算重试等待时间，优先使用服务端的 Retry-After，两者都不超过 max_delay"""
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            # 服务端给出的等待时间也要封顶，否则一个超大的值会让节点或请求几乎无限期挂起
+            return min(float(retry_after), max_delay)
+    return min(backoff * (2 ** attempt) * (1 + random.random()), max_delay)
+
+
+async def _read_body(response: httpx.Response, max_bytes: int, spool_threshold: int) -> Dict[str, Any]:
+    """
+    读取响应体
+    小响应保存在内存中，超过 spool_threshold 后转存到临时文件，超过 max_bytes 则中止
+    """
+    content_length = response.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ResponseTooLargeError(f"响应体大小 {content_length} 超过限制 {max_bytes}")
+
+    buffer = bytearray()
+    spool_file = None
+    size = 0
+    try:
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > max_bytes:
+                raise ResponseTooLargeError(f"响应体超过限制 {max_bytes} 字节")
+            if spool_file is None and size > spool_threshold:
+                SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+                spool_file = tempfile.NamedTemporaryFile(dir=SPOOL_DIR, prefix="resp_", delete=False)
+                spool_file.write(buffer)
+                buffer = bytearray()
+            if spool_file is not None:
+                spool_file.write(chunk)
+            else:
+                buffer.extend(chunk)
+    except BaseException:
+        if spool_file is not None:
+            spool_file.close()
+            os.unlink(spool_file.name)
+        raise
+
+    if spool_file is not None:
+        spool_file.close()
+        logger.info(f"响应体 {size} 字节已写入临时文件: {spool_file.name}")
+        return {"body": None, "body_file": spool_file.name, "body_size": size}
+
+    return {"content": bytes(buffer), "body_size": size}
+
+
+async def request(
+    method: str,
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    json_body: Any = None,
+    timeout: float = 30,
+    retries: int = 2,
+    backoff: float = 0.5,
+    max_delay: float = 30,
+    max_bytes: int = HTTP_MAX_RESPONSE_BYTES,
+    spool_threshold: int = HTTP_SPOOL_THRESHOLD_BYTES
+) -> Dict[str, Any]:
+    """
+    发送 HTTP 请求
+
+    Args:
+        method: 请求方法
+        url: 请求 URL
+        headers: 请求头
+        json_body: JSON 请求体
+        timeout: 超时时间（秒）
+        retries: 最大重试次数
+        backoff: 退避基数（秒）
+        max_delay: 单次重试等待时间上限（秒），同样限制服务端的 Retry-After
+        max_bytes: 响应体大小上限
+        spool_threshold: 超过该大小的响应体写入临时文件
+
+    Returns:
+        包含 status_code, headers, body 的字典；
+        大响应体的 body 为 None，并通过 body_file 返回临时文件路径
+    """
+    method = method.upper()
+    client = get_http_client()
+    attempt = 0
+
+    while True:
+        delay: Optional[float] = None
+        try:
+            async with client.stream(method, url, headers=headers, json=json_body, timeout=timeout) as response:
+                if (
+                    response.status_code in RETRY_STATUS_CODES
+                    and method in IDEMPOTENT_METHODS
+                    and attempt < retries
+                ):
+                    # 先释放连接再等待
+                    delay = _retry_delay(attempt, backoff, max_delay, response)
+                    logger.warning(f"HTTP {response.status_code} {method} {url}，{delay:.1f}s 后重试")
+                else:
+                    return await _build_result(response, max_bytes, spool_threshold)
+        except httpx.TransportError as e:
+            # 连接阶段失败时请求尚未发出，非幂等方法也可以重试
+            can_retry = method in IDEMPOTENT_METHODS or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+            if not can_retry or attempt >= retries:
+                raise
+            delay = _retry_delay(attempt, backoff, max_delay)
+            logger.warning(f"HTTP 请求失败 {method} {url}: {e}，{delay:.1f}s 后重试")
+
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def _build_result(response: httpx.Response, max_bytes: int, spool_threshold: int) -> Dict[str, Any]:
+    """将响应转换为节点结果"""
+    body = await _read_body(response, max_bytes, spool_threshold)
+    result: Dict[str, Any] = {
+        "status_code": response.status_code,
+        "headers": dict(response.headers)
+    }
+    if "content" in body:
+        content = body.pop("content")
+        if response.headers.get("content-type", "").startswith("application/json"):
+            result["body"] = json.loads(content) if content else None
+        else:
+            result["body"] = content.decode(response.encoding or "utf-8", errors="replace")
+    result.update(body)
+    return result
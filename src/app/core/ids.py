@@ -0,0 +1,41 @@
+# app/core/ids.py
+"""
+消息 ID 生成
+ULID 格式：48 位毫秒时间戳 + 80 位随机数，Crockford Base32 编码为 26 个字符。
+按字符串排序即按生成时间排序；同一毫秒内生成的 ID 在随机部分上递增，保证单调
+"""
+import os
+import time
+import threading
+
+# Crockford Base32 字母表（不含 I L O U）
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+_lock = threading.Lock()
+_last_ms: int = -1
+_last_random: int = 0
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(_ALPHABET[remainder])
+    return "".join(reversed(chars))
+
+
+def new_message_id() -> str:
+    """生成按时间排序的唯一消息 ID"""
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ms:
+            # 同一毫秒（或时钟回拨）：沿用上一个时间戳并递增随机部分
+            now_ms = _last_ms
+            _last_random = (_last_random + 1) % (1 << _RANDOM_BITS)
+        else:
+            _last_ms = now_ms
+            _last_random = int.from_bytes(os.urandom(_RANDOM_BITS // 8), "big")
+        return _encode(now_ms, 10) + _encode(_last_random, 16)
+
@@ -0,0 +1,200 @@
+# app/core/image_archive.py
+"""
+生成图片归档
+超过 IMAGE_ARCHIVE_AFTER_DAYS 天的生成图片（png / jpg / bmp）转码为 webp（或 avif）后删除原文件，
+旧文件名 -> 新文件名 记录在映射文件中：
+- resolve / resolve_path 把消息中引用的旧文件名解析为转码后的文件
+- rewrite_messages 在加载历史会话时替换消息中的图片链接，会话文件本身不修改
+转码后的文件不小于原文件时保留原文件，并在映射中记录为指向自身，之后不再尝试
+"""
+import os
+import re
+import json
+import logging
+import datetime
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import (
+    STATIC_DIR,
+    IMAGE_ARCHIVE_FORMAT,
+    IMAGE_ARCHIVE_QUALITY,
+    IMAGE_ARCHIVE_MAP_PATH
+)
+from app.core.file_lock import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+IMAGE_URL_PREFIX = "/static/generated_images/"
+_IMAGE_URL_RE = re.compile(re.escape(IMAGE_URL_PREFIX) + r"([^\s\)\"'<>]+)")
+
+# 转码的原始格式
+SOURCE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def _pil_supports(feature: str) -> bool:
+    """Pillow 是否支持某个格式（只在需要时导入 Pillow）"""
+    from PIL import features
+    return bool(features.check(feature))
+
+
+class ImageArchive:
+    """生成图片转码与引用映射"""
+
+    def __init__(self, image_dir: Path, map_path: Path, image_format: str, quality: int) -> None:
+        self.image_dir: Path = image_dir
+        self.map_path: Path = map_path
+        self.quality: int = quality
+        if image_format == "avif" and not _pil_supports("avif"):
+            logger.warning("当前 Pillow 不支持 AVIF，生成图片归档使用 WebP")
+            image_format = "webp"
+        self.format: str = image_format if image_format in ("webp", "avif") else "webp"
+        self._lock = threading.Lock()
+        self._map: Dict[str, str] = {}
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    def _mapping(self) -> Dict[str, str]:
+        """映射文件的内容，文件未变化时使用缓存"""
+        try:
+            stat = self.map_path.stat()
+        except OSError:
+            return {}
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            try:
+                with open(self.map_path, "r", encoding="utf-8") as f:
+                    self._map = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取图片映射失败: {e}")
+                self._map = {}
+            self._stamp = stamp
+        return self._map
+
+    def _save_mapping(self, mapping: Dict[str, str]) -> None:
+        self.map_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(self.map_path, mapping, indent=None)
+
+    # =========================================================================
+    # 引用解析
+    # =========================================================================
+
+    def resolve(self, name: str) -> str:
+        """旧文件名对应的当前文件名，未转码时原样返回"""
+        return self._mapping().get(name, name)
+
+    def resolve_path(self, name: str) -> Path:
+        """图片文件的当前路径（原文件存在时优先）"""
+        path = self.image_dir / name
+        if path.exists():
+            return path
+        return self.image_dir / self.resolve(name)
+
+    def rewrite(self, text: str) -> str:
+        """把文本中已转码图片的链接替换为新文件"""
+        mapping = self._mapping()
+        if not mapping or IMAGE_URL_PREFIX not in text:
+            return text
+        return _IMAGE_URL_RE.sub(lambda m: IMAGE_URL_PREFIX + mapping.get(m.group(1), m.group(1)), text)
+
+    def rewrite_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """替换消息（含多模态内容中的 image_url）中已转码图片的链接，就地修改并返回"""
+        if not self._mapping():
+            return messages
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                message["content"] = self.rewrite(content)
+            elif isinstance(content, list):
+                for item in content:
+                    if not isinstance(item, dict):
+                        continue
+                    if item.get("type") == "text" and isinstance(item.get("text"), str):
+                        item["text"] = self.rewrite(item["text"])
+                    elif item.get("type") == "image_url" and isinstance(item.get("image_url"), dict):
+                        url = item["image_url"].get("url")
+                        if isinstance(url, str):
+                            item["image_url"]["url"] = self.rewrite(url)
+        return messages
+
+    # =========================================================================
+    # 转码
+    # =========================================================================
+
+    def _transcode(self, path: Path) -> Optional[Path]:
+        """转码一张图片，返回新文件路径；转码后没有变小时返回 None"""
+        target = path.with_suffix(f".{self.format}")
+        if target.exists():
+            target = path.with_name(f"{path.stem}_{path.suffix.lstrip('.')}.{self.format}")
+        tmp_path = target.with_name(target.name + ".tmp")
+        from PIL import Image
+        with Image.open(path) as img:
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+            img.save(tmp_path, format=self.format.upper(), quality=self.quality)
+        if tmp_path.stat().st_size >= path.stat().st_size:
+            tmp_path.unlink()
+            return None
+        os.replace(tmp_path, target)
+        return target
+
+    def transcode(self, older_than_days: int) -> Dict[str, Any]:
+        """
+        转码超过指定天数的生成图片
+
+        Returns:
+            转码的图片数、转码后没有变小而保留的图片数、转码失败的图片数与节省的字节数
+        """
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=older_than_days)).timestamp()
+        failed = saved = 0
+        if not self.image_dir.exists():
+            return {"converted": 0, "kept": 0, "failed": 0, "saved_bytes": 0, "format": self.format}
+
+        with self._lock:
+            mapping = dict(self._mapping())
+            converted: List[Tuple[Path, Path]] = []
+            kept: List[str] = []
+            for path in sorted(self.image_dir.iterdir()):
+                if path.suffix.lower() not in SOURCE_SUFFIXES or path.name in mapping or not path.is_file():
+                    continue
+                try:
+                    if path.stat().st_mtime >= cutoff:
+                        continue
+                    target = self._transcode(path)
+                except Exception as e:
+                    logger.warning(f"图片转码失败 {path.name}: {e}")
+                    failed += 1
+                    continue
+                if target is None:
+                    kept.append(path.name)
+                else:
+                    converted.append((path, target))
+
+            # 先写入映射再删除原文件，避免引用失效
+            if converted or kept:
+                mapping.update((path.name, target.name) for path, target in converted)
+                mapping.update((name, name) for name in kept)
+                self._save_mapping(mapping)
+            for path, target in converted:
+                saved += path.stat().st_size - target.stat().st_size
+                path.unlink()
+
+        if converted:
+            logger.info(f"转码 {len(converted)} 张生成图片为 {self.format}，节省 {saved / 1e6:.1f} MB")
+        return {
+            "converted": len(converted),
+            "kept": len(kept),
+            "failed": failed,
+            "saved_bytes": saved,
+            "format": self.format
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """映射统计"""
+        return {"format": self.format, "mapped": len(self._mapping())}
+
+
+# 模块级单例
+image_archive: ImageArchive = ImageArchive(
+    STATIC_DIR / "generated_images", IMAGE_ARCHIVE_MAP_PATH, IMAGE_ARCHIVE_FORMAT, IMAGE_ARCHIVE_QUALITY
+)
@@ -2,14 +2,28 @@
 """
 知识库管理器
 负责知识库的创建、查询、删除以及文件关联管理
+元数据解析后缓存在内存中，元数据文件的修改时间或大小变化时才重新读取
+修改在跨进程文件锁内完成（读取最新内容 → 修改 → 原子写入），多进程部署时不会丢失其他进程的更新
 """
+import copy
 import json
 import uuid
+import logging
 import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple
 
 from app.config import KB_META_FILE
+from app.core.file_lock import file_lock, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# 元数据文件版本标识 (mtime_ns, size, inode)；原子替换总会产生新的 inode，
+# 其他进程在同一个时间戳粒度内写入大小相同的内容时也能识别
+FileStamp = Tuple[int, int, int]
+
+# 知识库变更监听器，参数为变更的知识库 ID，None 表示全部
+ChangeListener = Callable[[Optional[str]], None]
 
 
 class KBManager:
@@ -19,20 +33,65 @@ class KBManager:
 
     def __init__(self) -> None:
         self.file_path: Path = KB_META_FILE
-        if not self.file_path.exists():
-            self._save({})
+        self._cache: Optional[Dict[str, Any]] = None
+        self._stamp: Optional[FileStamp] = None
+        self._listeners: List[ChangeListener] = []
+        self._lock = file_lock(self.file_path)
+        with self._lock:
+            if not self.file_path.exists():
+                self._save({})
+
+    def _file_stamp(self) -> Optional[FileStamp]:
+        """元数据文件版本标识，文件不存在时返回 None"""
+        try:
+            stat = self.file_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _data(self) -> Dict[str, Any]:
+        """
+        缓存的知识库元数据（只读）
+        文件被外部修改时重新读取，并通知监听器全部失效
+        """
+        stamp = self._file_stamp()
+        if self._cache is None or stamp != self._stamp:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self._cache = json.load(f)
+            reloaded = self._stamp is not None
+            self._stamp = stamp
+            if reloaded:
+                self._notify(None)
+        return self._cache
 
     def _load(self) -> Dict[str, Any]:
-        """加载知识库元数据"""
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        """加载知识库元数据（副本，可修改后传给 _save）"""
+        return copy.deepcopy(self._data())
 
     def _save(self, data: Dict[str, Any]) -> None:
-        """保存知识库元数据"""
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-    def create_kb(self, name: str, description: str, files: List[str]) -> Dict[str, Any]:
+        """原子写入知识库元数据并更新缓存（调用方持有 self._lock）"""
+        atomic_write_json(self.file_path, data)
+        self._cache = data
+        self._stamp = self._file_stamp()
+
+    def on_change(self, listener: ChangeListener) -> None:
+        """注册知识库变更监听器（更新、删除或元数据文件被外部修改时调用）"""
+        self._listeners.append(listener)
+
+    def _notify(self, kb_id: Optional[str]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(kb_id)
+            except Exception as e:
+                logger.warning(f"知识库变更通知失败: {e}")
+
+    def create_kb(
+        self,
+        name: str,
+        description: str,
+        files: List[str],
+        agent: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
         创建新的知识库
 
@@ -40,21 +99,25 @@ class KBManager:
             name: 知识库名称
             description: 知识库描述
             files: 关联的文件列表
+            agent: 智能体提示词模板（可选），包含 role / constraints / output_format
 
         Returns:
             创建的知识库信息
         """
-        data = self._load()
-        kb_id = str(uuid.uuid4())[:8]
-        data[kb_id] = {
-            "id": kb_id,
-            "name": name,
-            "description": description,
-            "files": files,
-            "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-        }
-        self._save(data)
-        return data[kb_id]
+        with self._lock:
+            data = self._load()
+            kb_id = str(uuid.uuid4())[:8]
+            data[kb_id] = {
+                "id": kb_id,
+                "name": name,
+                "description": description,
+                "files": files,
+                "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+            }
+            if agent:
+                data[kb_id]["agent"] = agent
+            self._save(data)
+            return copy.deepcopy(data[kb_id])
 
     def list_kbs(self) -> Dict[str, Any]:
         """列出所有知识库"""
@@ -62,16 +125,26 @@ class KBManager:
 
     def get_kb(self, kb_id: str) -> Optional[Dict[str, Any]]:
         """根据 ID 获取知识库信息"""
-        return self._load().get(kb_id)
+        kb_info = self._data().get(kb_id)
+        return copy.deepcopy(kb_info) if kb_info is not None else None
 
     def delete_kb(self, kb_id: str) -> None:
         """删除指定的知识库"""
-        data = self._load()
-        if kb_id in data:
-            del data[kb_id]
-            self._save(data)
-
-    def update_kb(self, kb_id: str, name: str, description: str, files: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._load()
+            if kb_id in data:
+                del data[kb_id]
+                self._save(data)
+                self._notify(kb_id)
+
+    def update_kb(
+        self,
+        kb_id: str,
+        name: str,
+        description: str,
+        files: Optional[List[str]] = None,
+        agent: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         更新知识库信息
 
@@ -80,19 +153,24 @@ class KBManager:
             name: 新的名称
             description: 新的描述
             files: 新的文件列表（可选）
+            agent: 新的智能体提示词模板（可选）
 
         Returns:
             更新后的知识库信息，如果知识库不存在则返回 None
         """
-        data = self._load()
-        if kb_id not in data:
-            return None
-        data[kb_id]["name"] = name
-        data[kb_id]["description"] = description
-        if files is not None:
-            data[kb_id]["files"] = files
-        self._save(data)
-        return data[kb_id]
+        with self._lock:
+            data = self._load()
+            if kb_id not in data:
+                return None
+            data[kb_id]["name"] = name
+            data[kb_id]["description"] = description
+            if files is not None:
+                data[kb_id]["files"] = files
+            if agent is not None:
+                data[kb_id]["agent"] = agent
+            self._save(data)
+            self._notify(kb_id)
+            return copy.deepcopy(data[kb_id])
 
     def find_kbs_using_file(self, filename: str) -> List[str]:
         """
@@ -113,20 +191,22 @@ class KBManager:
 
     def remove_file_from_all_kbs(self, filename: str) -> None:
         """从所有知识库中移除指定文件"""
-        data = self._load()
-        for kb_id, kb_data in data.items():
-            if filename in kb_data.get("files", []):
-                kb_data["files"].remove(filename)
-        self._save(data)
+        with self._lock:
+            data = self._load()
+            for kb_id, kb_data in data.items():
+                if filename in kb_data.get("files", []):
+                    kb_data["files"].remove(filename)
+            self._save(data)
 
     def rename_file_in_kbs(self, old_name: str, new_name: str) -> None:
         """在所有知识库中重命名文件"""
-        data = self._load()
-        for kb_id, kb_data in data.items():
-            files = kb_data.get("files", [])
-            if old_name in files:
-                kb_data["files"] = [new_name if f == old_name else f for f in files]
-        self._save(data)
+        with self._lock:
+            data = self._load()
+            for kb_id, kb_data in data.items():
+                files = kb_data.get("files", [])
+                if old_name in files:
+                    kb_data["files"] = [new_name if f == old_name else f for f in files]
+            self._save(data)
 
 
 # 模块级单例实例
@@ -0,0 +1,798 @@
+# app/core/llm_gateway.py
+"""
+LLM 上游调用网关
+聊天和工作流的 chat.completions 调用统一经过这里：
+- 按 (base_url, api_key) 复用 AsyncOpenAI 客户端及其连接池
+- 可选的响应缓存：内存 LRU（按字节预算淘汰）+ 磁盘持久层，
+  缓存键为 (base_url, API Key 哈希, model, messages, 采样参数) 的规范化哈希
+- 流式请求命中缓存时按小块回放，调用方看到的仍是增量内容
+- 相同请求并发时只发送一次上游调用（single-flight），流式订阅者共享同一个上游流
+- 每次上游调用经 upstream_governor 排队限流，429 / 过载时按 Retry-After 或指数退避重试
+- 指定上游组时在组内负载均衡，失败时转移到其他成员，流式首块超时时发送对冲请求
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, AsyncIterator, Awaitable, Callable, Set, Tuple
+
+from app.config import (
+    LLM_CACHE_MODE,
+    LLM_CACHE_DIR,
+    LLM_CACHE_MEMORY_BYTES,
+    LLM_CACHE_DISK_BYTES,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_IMAGE_MODEL_KEYWORDS,
+    LLM_COALESCE_ENABLED,
+    UPSTREAM_HEDGE_TTFT,
+    UPSTREAM_MAX_HEDGES
+)
+from app.core.singleflight import SingleFlight, StreamFlight
+from app.core.prompt_stats import prefix_tracker
+from app.core.upstream_governor import (
+    upstream_governor,
+    backoff_delay,
+    UpstreamBusyError,
+    UpstreamPermit,
+    PRIORITY_INTERACTIVE
+)
+from app.core.upstream_pool import upstream_pool, Endpoint, UpstreamUnavailableError
+from app.core.metrics import upstream_requests, upstream_request_seconds, upstream_ttft_seconds
+from app.core.tracing import tracer, KIND_CLIENT
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ("off", "auto", "force")
+
+# 缓存回放时每个增量块的字符数
+REPLAY_CHUNK_CHARS = 16
+# 每写入多少次磁盘缓存触发一次磁盘清理
+_DISK_PRUNE_INTERVAL = 200
+# 最多保留的上游客户端数量
+_MAX_CLIENTS = 32
+
+
+def is_image_model(model: str) -> bool:
+    """根据模型名判断是否为绘图模型"""
+    name = (model or "").lower()
+    return any(keyword in name for keyword in LLM_CACHE_IMAGE_MODEL_KEYWORDS)
+
+
+def should_use_cache(model: str, params: Dict[str, Any], mode: Optional[str] = None) -> bool:
+    """
+    判断请求是否参与缓存
+
+    Args:
+        model: 模型名称
+        params: 采样参数
+        mode: off / auto / force，为空时使用 LLM_CACHE_MODE
+
+    auto 模式下只缓存显式 temperature=0 的非绘图模型请求，force 无条件缓存
+    """
+    mode = (mode or LLM_CACHE_MODE).lower()
+    if mode not in CACHE_MODES:
+        raise ValueError(f"未知的缓存模式: {mode}")
+    if mode == "off":
+        return False
+    if mode == "force":
+        return True
+    if is_image_model(model):
+        return False
+    temperature = params.get("temperature")
+    return temperature is not None and float(temperature) == 0
+
+
+# 部分代理以正文形式返回的限流信息
+RATE_LIMIT_MARKERS = ("RATE LIMIT", "TOO MANY REQUESTS")
+# 只检查较短的回复，避免正常回答中提到这些词时误判
+_RATE_LIMIT_CONTENT_MAX_CHARS = 500
+
+
+def looks_rate_limited(content: str) -> bool:
+    """回复正文是否为上游的限流提示"""
+    if len(content) > _RATE_LIMIT_CONTENT_MAX_CHARS:
+        return False
+    upper = content.upper()
+    return any(marker in upper for marker in RATE_LIMIT_MARKERS)
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """解析 Retry-After / retry-after-ms 响应头"""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def classify_error(error: Exception) -> Tuple[str, Optional[float], bool]:
+    """
+    对上游异常分类
+
+    Returns:
+        (许可结果 throttled / error, Retry-After 秒数, 是否可以重试)
+    """
+    import openai
+    if isinstance(error, openai.APIStatusError):
+        retry_after = _retry_after(error.response.headers)
+        if error.status_code in (429, 503, 529):
+            return "throttled", retry_after, True
+        if error.status_code in (502, 504):
+            return "error", retry_after, True
+        return "error", None, False
+    if isinstance(error, openai.APITimeoutError):
+        return "error", None, False
+    if isinstance(error, openai.APIConnectionError):
+        return "error", None, True
+    return "error", None, False
+
+
+def is_failover_error(error: BaseException) -> bool:
+    """上游自身的故障（换一个成员可能成功），而不是请求本身的问题"""
+    import openai
+    if isinstance(error, (UpstreamBusyError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+async def _next_chunk(iterator: AsyncIterator[str]) -> str:
+    return await iterator.__anext__()
+
+
+def _record_upstream(permit: UpstreamPermit, model: str, stream: str, outcome: str, started: float) -> None:
+    """记录一次上游调用的指标（按预设名称或上游地址、模型区分）"""
+    upstream = permit.limiter.name
+    upstream_requests.inc(upstream, model, stream, outcome)
+    upstream_request_seconds.observe(time.perf_counter() - started, upstream, model, stream)
+
+
+def request_key(
+    base_url: str,
+    model: str,
+    messages: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    api_key: Optional[str] = None
+) -> str:
+    """
+    请求的规范化哈希
+    直连调用传入 api_key，只混入其哈希：不同 Key 的权限、配额与计费相互独立，
+    不能共享缓存或合并到同一个上游请求；上游组调用不传，以组名为作用域在组内共享
+    """
+    credential = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else None
+    canonical = json.dumps(
+        {
+            "base_url": (base_url or "").rstrip("/"),
+            "credential": credential,
+            "model": model,
+            "messages": messages,
+            "params": params
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+    内存层为按字节预算淘汰的 LRU，磁盘层每个条目一个 JSON 文件，按 TTL 和总大小清理
+    """
+
+    def __init__(self, cache_dir: Path, memory_bytes: int, disk_bytes: int, ttl_seconds: int) -> None:
+        self.cache_dir: Path = cache_dir
+        self.memory_bytes: int = memory_bytes
+        self.disk_bytes: int = disk_bytes
+        self.ttl_seconds: int = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._memory_used: int = 0
+        self._writes_since_prune: int = 0
+        self.hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, content: str, created_at: float) -> None:
+        """放入内存层，单条超过预算四分之一的不进内存"""
+        size = len(content.encode("utf-8"))
+        if size > self.memory_bytes // 4:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        self._memory[key] = (content, size, created_at)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, (_, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_used -= evicted_size
+
+    def _read_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return entry["content"], entry["created_at"]
+
+    def _write_disk(self, key: str, model: str, content: str, created_at: float) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"key": key, "model": model, "content": content, "created_at": created_at}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入 LLM 缓存失败: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    async def get(self, key: str) -> Optional[str]:
+        """查找缓存，内存未命中时读取磁盘"""
+        cached = self._memory.get(key)
+        if cached is not None:
+            content, _, created_at = cached
+            if time.time() - created_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return content
+            self.discard(key)
+
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        content, created_at = entry
+        self._remember(key, content, created_at)
+        self.hits += 1
+        self.disk_hits += 1
+        return content
+
+    async def put(self, key: str, model: str, content: str) -> None:
+        """写入两级缓存"""
+        created_at = time.time()
+        self._remember(key, content, created_at)
+        await asyncio.to_thread(self._write_disk, key, model, content, created_at)
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= _DISK_PRUNE_INTERVAL:
+            self._writes_since_prune = 0
+            await asyncio.to_thread(self.prune_disk)
+
+    def discard(self, key: str) -> None:
+        """删除单条缓存"""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def prune_disk(self) -> int:
+        """删除过期条目，总大小超出预算时从最旧的开始删除，返回删除数量"""
+        if not self.cache_dir.exists():
+            return 0
+        now = time.time()
+        files = []
+        removed = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"LLM 缓存清理: 删除 {removed} 个条目")
+        return removed
+
+    def clear(self) -> None:
+        """清空全部缓存"""
+        self._memory.clear()
+        self._memory_used = 0
+        if self.cache_dir.exists():
+            for path in self.cache_dir.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "memory_budget_bytes": self.memory_bytes
+        }
+
+
+class LLMGateway:
+    """
+    LLM 调用网关
+    complete() 返回完整回复，stream() 逐块产出增量内容
+    """
+
+    def __init__(self, cache: ResponseCache) -> None:
+        self.cache: ResponseCache = cache
+        self._clients: "OrderedDict[Tuple[str, str], AsyncOpenAI]" = OrderedDict()
+        self.completions: SingleFlight = SingleFlight("llm")
+        self.streams: StreamFlight = StreamFlight("llm-stream")
+
+    def client(self, base_url: str, api_key: str) -> "AsyncOpenAI":
+        """获取复用的上游客户端（openai SDK 导入较慢，首次使用时导入）"""
+        from openai import AsyncOpenAI
+        client_key = (base_url, api_key)
+        client = self._clients.get(client_key)
+        if client is None:
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+            self._clients[client_key] = client
+            while len(self._clients) > _MAX_CLIENTS:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client_key)
+        return client
+
+    def _configured_client(self, base_url: str, api_key: str, timeout: Optional[float]) -> "AsyncOpenAI":
+        """按单次调用的超时设置派生客户端，共享底层连接池；重试由网关统一处理"""
+        options: Dict[str, Any] = {"max_retries": 0}
+        if timeout is not None:
+            options["timeout"] = timeout
+        return self.client(base_url, api_key).with_options(**options)
+
+    async def close(self) -> None:
+        """关闭全部上游客户端"""
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+    async def _create_completion(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        cache_key: Optional[str],
+        cache_filter: Optional[Callable[[str], bool]],
+        timeout: Optional[float],
+        max_retries: int,
+        priority: int
+    ) -> Optional[str]:
+        """经上游调控发送非流式请求，限流或过载时退避重试，按需写入缓存"""
+        client = self._configured_client(base_url, api_key, timeout)
+        attempt = 0
+        while True:
+            permit = await upstream_governor.acquire(base_url, priority)
+            span = tracer.span("llm.upstream", kind=KIND_CLIENT, upstream=permit.limiter.name, model=model, attempt=attempt)
+            started = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(model=model, messages=messages, **params)
+            except asyncio.CancelledError as e:
+                permit.release("error")
+                _record_upstream(permit, model, "false", "error", started)
+                span.end(e)
+                raise
+            except Exception as e:
+                outcome, retry_after, retryable = classify_error(e)
+                permit.release(outcome, retry_after)
+                _record_upstream(permit, model, "false", outcome, started)
+                span.end(e)
+                if not retryable or attempt >= max_retries:
+                    raise
+                delay = backoff_delay(attempt, retry_after)
+                logger.warning(f"LLM 请求失败 ({model}): {e}，{delay:.1f}s 后重试")
+            else:
+                content = response.choices[0].message.content
+                span.end()
+                if not (content and looks_rate_limited(content)):
+                    permit.release("success")
+                    _record_upstream(permit, model, "false", "success", started)
+                    if cache_key is not None and content and (cache_filter is None or cache_filter(content)):
+                        await self.cache.put(cache_key, model, content)
+                    return content
+                # 部分代理以 200 + 正文的形式返回限流信息
+                permit.release("throttled")
+                _record_upstream(permit, model, "false", "throttled", started)
+                if attempt >= max_retries:
+                    return content
+                delay = backoff_delay(attempt)
+                logger.warning(f"LLM 上游返回限流信息 ({model})，{delay:.1f}s 后重试")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _stream_completion(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        timeout: Optional[float],
+        max_retries: int,
+        priority: int
+    ) -> AsyncIterator[str]:
+        """
+        经上游调控发送流式请求，逐块产出增量内容
+        只在收到第一个块之前重试；许可在整个流期间保持占用
+        """
+        client = self._configured_client(base_url, api_key, timeout)
+        attempt = 0
+        while True:
+            permit = await upstream_governor.acquire(base_url, priority)
+            # 异步生成器可能在其他上下文中关闭，span 不设为当前 span，手动结束
+            span = tracer.span("llm.upstream", kind=KIND_CLIENT, upstream=permit.limiter.name, model=model, attempt=attempt, stream=True)
+            started = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(model=model, messages=messages, stream=True, **params)
+            except asyncio.CancelledError as e:
+                permit.release("error")
+                _record_upstream(permit, model, "true", "error", started)
+                span.end(e)
+                raise
+            except Exception as e:
+                outcome, retry_after, retryable = classify_error(e)
+                permit.release(outcome, retry_after)
+                _record_upstream(permit, model, "true", outcome, started)
+                span.end(e)
+                if not retryable or attempt >= max_retries:
+                    raise
+                delay = backoff_delay(attempt, retry_after)
+                logger.warning(f"LLM 流式请求失败 ({model}): {e}，{delay:.1f}s 后重试")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            outcome = "error"
+            error: Optional[BaseException] = None
+            first = True
+            try:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first:
+                            first = False
+                            ttft = time.perf_counter() - started
+                            upstream_ttft_seconds.observe(ttft, permit.limiter.name, model)
+                            span.set("ttft_ms", round(ttft * 1000, 1))
+                        yield chunk.choices[0].delta.content
+                outcome = "success"
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                permit.release(outcome)
+                _record_upstream(permit, model, "true", outcome, started)
+                span.end(error)
+            return
+
+    async def _pooled_completion(
+        self,
+        group: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        cache_key: Optional[str],
+        cache_filter: Optional[Callable[[str], bool]],
+        timeout: Optional[float],
+        max_retries: int,
+        priority: int
+    ) -> Optional[str]:
+        """在上游组内选择成员发送非流式请求，上游故障时转移到下一个成员"""
+        tried: Set[str] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            endpoint = upstream_pool.choose(group, tried)
+            if endpoint is None:
+                if last_error is not None:
+                    raise last_error
+                raise UpstreamUnavailableError(f"上游组 {group} 没有可用成员")
+            if tried:
+                upstream_pool.failovers += 1
+            tried.add(endpoint.name)
+
+            endpoint.begin()
+            start = time.monotonic()
+            try:
+                content = await self._create_completion(
+                    endpoint.base_url, endpoint.api_key, model, messages, params,
+                    cache_key, cache_filter, timeout, max_retries, priority
+                )
+            except Exception as e:
+                if not is_failover_error(e):
+                    endpoint.abandon()
+                    raise
+                endpoint.failure()
+                last_error = e
+                logger.warning(f"上游组 {group} 成员 {endpoint.name} 失败: {e}")
+                continue
+            except BaseException:
+                endpoint.abandon()
+                raise
+            endpoint.success(time.monotonic() - start)
+            return content
+
+    async def _pooled_stream(
+        self,
+        group: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        timeout: Optional[float],
+        max_retries: int,
+        priority: int
+    ) -> AsyncIterator[str]:
+        """
+        在上游组内选择成员发送流式请求
+        首个块到达前：成员故障时转移到下一个成员；超过 UPSTREAM_HEDGE_TTFT 未收到首块时
+        向另一个成员发送对冲请求，先产出首块的请求胜出，其余请求被取消
+        """
+        attempts: Dict["asyncio.Future[str]", Tuple[Endpoint, AsyncIterator[str], float]] = {}
+        tried: Set[str] = set()
+        last_error: Optional[BaseException] = None
+        hedges = 0
+
+        def launch() -> bool:
+            endpoint = upstream_pool.choose(group, tried)
+            if endpoint is None:
+                return False
+            tried.add(endpoint.name)
+            endpoint.begin()
+            iterator = self._stream_completion(
+                endpoint.base_url, endpoint.api_key, model, messages, params, timeout, max_retries, priority
+            )
+            attempts[asyncio.ensure_future(_next_chunk(iterator))] = (endpoint, iterator, time.monotonic())
+            return True
+
+        async def discard(future: "asyncio.Future[str]", endpoint: Endpoint, iterator: AsyncIterator[str]) -> None:
+            future.cancel()
+            try:
+                await future
+            except BaseException:
+                pass
+            await iterator.aclose()
+            endpoint.abandon()
+
+        winner: Optional[Tuple[Endpoint, AsyncIterator[str], float]] = None
+        first: Optional[str] = None
+        try:
+            if not launch():
+                raise UpstreamUnavailableError(f"上游组 {group} 没有可用成员")
+            while winner is None:
+                if not attempts:
+                    if last_error is not None and launch():
+                        upstream_pool.failovers += 1
+                        continue
+                    raise last_error or UpstreamUnavailableError(f"上游组 {group} 没有可用成员")
+
+                can_hedge = UPSTREAM_HEDGE_TTFT > 0 and hedges < UPSTREAM_MAX_HEDGES
+                done, _ = await asyncio.wait(
+                    attempts, timeout=UPSTREAM_HEDGE_TTFT if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedges += 1
+                    if launch():
+                        upstream_pool.hedged += 1
+                        logger.info(f"上游组 {group} 首块超过 {UPSTREAM_HEDGE_TTFT:.0f}s 未到达，发送对冲请求")
+                    continue
+
+                for future in done:
+                    endpoint, iterator, started = attempts.pop(future)
+                    error = future.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        if winner is None:
+                            winner = (endpoint, iterator, started)
+                            first = future.result() if error is None else None
+                        else:
+                            await discard(future, endpoint, iterator)
+                    elif is_failover_error(error):
+                        endpoint.failure()
+                        last_error = error
+                        logger.warning(f"上游组 {group} 成员 {endpoint.name} 失败: {error}")
+                    else:
+                        endpoint.abandon()
+                        raise error
+        finally:
+            # 胜出者确定或出错后取消其余请求
+            for future, (endpoint, iterator, _) in list(attempts.items()):
+                await discard(future, endpoint, iterator)
+            attempts.clear()
+
+        endpoint, iterator, started = winner
+        ttft = time.monotonic() - started
+        outcome = "abandon"
+        try:
+            if first is not None:
+                yield first
+                async for content in iterator:
+                    yield content
+            outcome = "success"
+        except Exception as e:
+            if is_failover_error(e):
+                outcome = "failure"
+            raise
+        finally:
+            await iterator.aclose()
+            if outcome == "success":
+                endpoint.success(ttft)
+            elif outcome == "failure":
+                endpoint.failure()
+            else:
+                endpoint.abandon()
+
+    async def complete(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        cache: Optional[str] = None,
+        cache_filter: Optional[Callable[[str], bool]] = None,
+        timeout: Optional[float] = None,
+        max_retries: int = 2,
+        priority: int = PRIORITY_INTERACTIVE,
+        group: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        非流式调用
+
+        Args:
+            base_url: 上游地址
+            api_key: API Key
+            model: 模型名称
+            messages: 消息列表
+            params: 其余请求参数（temperature、max_tokens、response_format 等）
+            cache: 缓存模式 off / auto / force，为空时使用全局配置
+            cache_filter: 返回 False 的回复不写入缓存（如上游以正文返回的错误）
+            timeout: 超时时间（秒）
+            max_retries: 限流、过载或连接失败时的最大重试次数
+            priority: 排队优先级，见 upstream_governor.PRIORITY_*
+            group: 上游组名称，指定时忽略 base_url / api_key，在组内选择成员
+
+        Returns:
+            回复内容
+        """
+        params = params or {}
+        # 组内成员提供相同的模型，缓存与合并按组共享
+        scope = f"group:{group}" if group else base_url
+        prefix_tracker.record(scope, model, messages)
+        key = request_key(scope, model, messages, params, api_key=None if group else api_key)
+        cache_key = key if should_use_cache(model, params, cache) else None
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"LLM 缓存命中: {model} ({key[:12]})")
+                return cached
+
+        def call() -> Awaitable[Optional[str]]:
+            if group:
+                return self._pooled_completion(
+                    group, model, messages, params, cache_key, cache_filter, timeout, max_retries, priority
+                )
+            return self._create_completion(
+                base_url, api_key, model, messages, params, cache_key, cache_filter, timeout, max_retries, priority
+            )
+
+        if not LLM_COALESCE_ENABLED:
+            return await call()
+        # 相同请求正在进行时直接共享其结果
+        return await self.completions.do(key, call)
+
+    async def stream(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        cache: Optional[str] = None,
+        cache_filter: Optional[Callable[[str], bool]] = None,
+        timeout: Optional[float] = None,
+        max_retries: int = 2,
+        priority: int = PRIORITY_INTERACTIVE,
+        group: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式调用，逐块产出增量内容，参数同 complete()
+        命中缓存时按小块回放；相同请求正在流式返回时加入同一个上游流；
+        上游流完整结束后才写入缓存
+        """
+        params = params or {}
+        scope = f"group:{group}" if group else base_url
+        prefix_tracker.record(scope, model, messages)
+        key = request_key(scope, model, messages, params, api_key=None if group else api_key)
+        cache_key = key if should_use_cache(model, params, cache) else None
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"LLM 缓存命中（流式回放）: {model} ({key[:12]})")
+                for start in range(0, len(cached), REPLAY_CHUNK_CHARS):
+                    yield cached[start:start + REPLAY_CHUNK_CHARS]
+                    await asyncio.sleep(0)
+                return
+
+        def source() -> AsyncIterator[str]:
+            if group:
+                return self._pooled_stream(group, model, messages, params, timeout, max_retries, priority)
+            return self._stream_completion(base_url, api_key, model, messages, params, timeout, max_retries, priority)
+
+        async def store(parts: List[str]) -> None:
+            full_content = "".join(parts)
+            if cache_key is not None and full_content and (cache_filter is None or cache_filter(full_content)):
+                await self.cache.put(cache_key, model, full_content)
+
+        if not LLM_COALESCE_ENABLED:
+            parts: List[str] = []
+            async for content in source():
+                parts.append(content)
+                yield content
+            await store(parts)
+            return
+
+        async for content in self.streams.subscribe(key, source, store):
+            yield content
+
+    def stats(self) -> Dict[str, Any]:
+        """网关统计：缓存、请求合并与提示词前缀复用"""
+        return {
+            "cache": self.cache.stats(),
+            "prefix": prefix_tracker.stats(),
+            "coalesce": {
+                "enabled": LLM_COALESCE_ENABLED,
+                "completions": self.completions.stats(),
+                "streams": self.streams.stats()
+            }
+        }
+
+
+# 模块级单例
+llm_gateway: LLMGateway = LLMGateway(
+    ResponseCache(LLM_CACHE_DIR, LLM_CACHE_MEMORY_BYTES, LLM_CACHE_DISK_BYTES, LLM_CACHE_TTL_SECONDS)
+)
@@ -0,0 +1,254 @@
+# app/core/metrics.py
+"""
+指标
+进程内的计数器与直方图，由 GET /metrics 以 Prometheus 文本格式（0.0.4）输出：
+- counter.inc(*标签值) / counter.add(数量, *标签值)
+- histogram.observe(秒数, *标签值)
+- with histogram.time(*标签值, span="名称"): 计时并记录直方图，启用追踪时同时记录一个 span
+每次记录只做一次二分查找和加锁的累加，热路径上的开销见 benchmarks/bench_metrics.py
+"""
+import time
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.tracing import tracer, NOOP_SPAN
+
+# 默认的延迟分桶（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 本地操作（图片编码、保存历史、向量化）的分桶
+FAST_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# (指标名, 帮助文本, 类型, [(标签, 值)])
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + 1
+
+    def add(self, amount: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class _Timer:
+    """Histogram.time() 返回的计时器"""
+
+    __slots__ = ("histogram", "labels", "span_name", "attributes", "start", "span")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...], span_name: Optional[str], attributes: Dict[str, Any]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+        self.span_name = span_name
+        self.attributes = attributes
+        self.span: Any = NOOP_SPAN
+
+    def __enter__(self) -> Any:
+        if self.span_name is not None and tracer.enabled:
+            attributes = dict(zip(self.histogram.labelnames, self.labels))
+            attributes.update(self.attributes)
+            self.span = tracer.span(self.span_name, **attributes).__enter__()
+        self.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        self.span.__exit__(exc_type, exc, tb)
+
+
+class Histogram:
+    """累积分桶的直方图"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = labelnames
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数（最后一个为 +Inf）, 总和, 次数]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels: str, span: Optional[str] = None, **attributes: Any) -> _Timer:
+        """
+        计时上下文管理器，退出时记录耗时
+
+        Args:
+            *labels: 标签值
+            span: 启用追踪时记录的 span 名称，标签与 attributes 作为 span 属性
+        """
+        return _Timer(self, labels, span, attributes)
+
+    def snapshot(self, *labels: str) -> Dict[str, Any]:
+        """某组标签的次数与总和"""
+        with self._lock:
+            entry = self._values.get(labels)
+            return {"count": entry[2], "sum": entry[1]} if entry else {"count": 0, "sum": 0.0}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, [list(entry[0]), entry[1], entry[2]]) for labels, entry in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，另外可以注册在输出时采集的回调（把已有的 stats() 转为指标）"""
+
+    def __init__(self, prefix: str) -> None:
+        self.prefix: str = prefix
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(f"{self.prefix}_{name}", documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+        """注册采集回调（可用作装饰器），回调返回 (指标名, 帮助文本, 类型, [(标签, 值)])"""
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                lines.append(f"# 采集失败 {getattr(collect, '__name__', collect)}: {e}")
+                continue
+            for name, documentation, kind, values in samples:
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full_name} {documentation}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                for labels, value in values:
+                    names = tuple(labels)
+                    lines.append(f"{full_name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 模块级单例
+registry: MetricsRegistry = MetricsRegistry("nexus")
+
+# =============================================================================
+# 聊天
+# =============================================================================
+chat_requests = registry.counter("chat_requests_total", "聊天请求数", ("model", "stream", "outcome"))
+chat_request_seconds = registry.histogram(
+    "chat_request_seconds", "聊天请求从收到到响应结束（流式为最后一块）的耗时", ("model", "stream")
+)
+chat_ttft_seconds = registry.histogram("chat_ttft_seconds", "流式聊天从收到请求到第一个内容块的耗时", ("model",))
+prepare_messages_seconds = registry.histogram(
+    "prepare_messages_seconds", "多模态适配（prepare_messages）的耗时", buckets=FAST_BUCKETS
+)
+image_encode_seconds = registry.histogram(
+    "image_encode_seconds", "本地图片压缩并编码为 Base64 的耗时", ("outcome",), buckets=FAST_BUCKETS
+)
+history_save_seconds = registry.histogram("history_save_seconds", "保存会话文件的耗时", buckets=FAST_BUCKETS)
+
+# =============================================================================
+# 上游
+# =============================================================================
+upstream_requests = registry.counter(
+    "upstream_requests_total", "上游 chat.completions 调用次数（每次重试单独计数）", ("upstream", "model", "stream", "outcome")
+)
+upstream_request_seconds = registry.histogram(
+    "upstream_request_seconds", "上游调用的耗时（流式为整个流）", ("upstream", "model", "stream")
+)
+upstream_ttft_seconds = registry.histogram("upstream_ttft_seconds", "上游流式调用到第一个内容块的耗时", ("upstream", "model"))
+
+# =============================================================================
+# RAG
+# =============================================================================
+rag_embed_seconds = registry.histogram("rag_embed_seconds", "查询文本向量化的耗时", buckets=FAST_BUCKETS)
+rag_query_seconds = registry.histogram("rag_query_seconds", "向量检索的耗时（不含向量化）", ("collection",), buckets=FAST_BUCKETS)
+rag_ingest_seconds = registry.histogram("rag_ingest_seconds", "写入向量库（含向量化）的耗时", ("collection",))
+rag_ingest_chunks = registry.counter("rag_ingest_chunks_total", "写入向量库的块数", ("collection",))
+rag_ingest_bytes = registry.counter("rag_ingest_bytes_total", "写入向量库的文本字节数（UTF-8）", ("collection",))
+
+# =============================================================================
+# 工作流
+# =============================================================================
+workflow_node_seconds = registry.histogram("workflow_node_seconds", "工作流节点的执行耗时（含失败）", ("type",))
+workflow_node_errors = registry.counter("workflow_node_errors_total", "执行失败的工作流节点数", ("type",))
+workflow_execution_seconds = registry.histogram("workflow_execution_seconds", "工作流整体的执行耗时", ("status",))
@@ -0,0 +1,91 @@
+# app/core/prompt_stats.py
+"""
+提示词前缀复用统计
+上游的提示词缓存按消息前缀命中。每个请求按消息计算累积哈希（第 i 个哈希覆盖前 i 条消息），
+与同一上游 / 模型之前请求的哈希比较，得到可复用的最长前缀，用于衡量提示词布局对缓存的友好程度
+"""
+import json
+import time
+import hashlib
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Tuple
+
+from app.config import PROMPT_PREFIX_TRACK_SIZE
+
+# 保留的最近请求记录数
+RECENT_RECORDS = 50
+
+
+class PrefixTracker:
+    """按 (上游, 模型) 记录见过的前缀哈希"""
+
+    def __init__(self, max_prefixes: int = PROMPT_PREFIX_TRACK_SIZE) -> None:
+        self.max_prefixes: int = max_prefixes
+        self._seen: Dict[Tuple[str, str], "OrderedDict[str, None]"] = {}
+        self.recent: "deque[Dict[str, Any]]" = deque(maxlen=RECENT_RECORDS)
+        self.requests: int = 0
+        self.prefix_hits: int = 0
+        self.reused_chars: int = 0
+        self.total_chars: int = 0
+
+    def record(self, scope: str, model: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        记录一次请求的前缀哈希
+
+        Returns:
+            本次请求的记录：系统提示词哈希、可复用的消息数与字符数
+        """
+        seen = self._seen.setdefault((scope, model), OrderedDict())
+        hasher = hashlib.blake2b(digest_size=16)
+        hashes: List[str] = []
+        sizes: List[int] = []
+        for message in messages:
+            payload = json.dumps([message.get("role"), message.get("content")], ensure_ascii=False, sort_keys=True)
+            hasher.update(payload.encode("utf-8"))
+            hashes.append(hasher.copy().hexdigest())
+            sizes.append(len(payload))
+
+        reused_messages = 0
+        for index, digest in enumerate(hashes):
+            if digest not in seen:
+                break
+            reused_messages = index + 1
+            seen.move_to_end(digest)
+        for digest in hashes[reused_messages:]:
+            seen[digest] = None
+        while len(seen) > self.max_prefixes:
+            seen.popitem(last=False)
+
+        total = sum(sizes)
+        reused = sum(sizes[:reused_messages])
+        self.requests += 1
+        self.total_chars += total
+        self.reused_chars += reused
+        if reused_messages:
+            self.prefix_hits += 1
+
+        record = {
+            "time": time.time(),
+            "scope": scope,
+            "model": model,
+            "system_hash": hashes[0] if hashes else None,
+            "messages": len(messages),
+            "reused_messages": reused_messages,
+            "reused_chars": reused,
+            "total_chars": total
+        }
+        self.recent.append(record)
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        """前缀复用统计"""
+        return {
+            "requests": self.requests,
+            "prefix_hit_rate": self.prefix_hits / self.requests if self.requests else 0.0,
+            "reused_char_ratio": self.reused_chars / self.total_chars if self.total_chars else 0.0,
+            "recent": list(self.recent)[-10:]
+        }
+
+
+# 模块级单例
+prefix_tracker: PrefixTracker = PrefixTracker()
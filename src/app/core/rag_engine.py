@@ -2,41 +2,293 @@
 """
 RAG 引擎模块
 负责文本向量化存储和检索
+启动时由 embedding_warmup 在后台预热向量化模型，预热完成前需要向量化的请求排队等待（有超时）
+设置 VECTOR_SERVICE_URL 时向量化与集合读写转发到向量服务（app.core.vector_service），本进程不加载模型
 """
+import time
 import uuid
-from typing import List, Optional, Dict, Any
+import asyncio
+import logging
+import threading
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Tuple
 
-import chromadb
-from chromadb.utils import embedding_functions
+from app.config import CHROMA_PATH, EMBEDDING_WARMUP, EMBEDDING_WARMUP_WAIT, EMBEDDING_WARMUP_RETRY_MAX, VECTOR_SERVICE_URL
+from app.core.singleflight import SingleFlight
+from app.core.metrics import rag_embed_seconds, rag_query_seconds, rag_ingest_seconds, rag_ingest_chunks, rag_ingest_bytes
 
-from app.config import CHROMA_PATH
+if TYPE_CHECKING:
+    import chromadb
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+logger = logging.getLogger(__name__)
 
 # =============================================================================
 # RAG 引擎初始化
 # =============================================================================
-_chroma_client: chromadb.PersistentClient = chromadb.PersistentClient(path=CHROMA_PATH)
-_embedding_fn: Optional[embedding_functions.SentenceTransformerEmbeddingFunction] = None
+# 导入 chromadb、打开数据库与加载向量化模型都较慢，首次使用（或启动后的后台预加载）时才执行
+_client_lock = threading.Lock()
+_embedding_lock = threading.Lock()
+_collection_lock = threading.Lock()
+_chroma_client: Optional["chromadb.ClientAPI"] = None
+_embedding_fn: Optional["SentenceTransformerEmbeddingFunction"] = None
+# 向量服务地址，非空时客户端与 embedding function 使用 app.core.vector_service 中的远程实现
+_service_url: str = VECTOR_SERVICE_URL
+
+
+def serve_local() -> None:
+    """向量服务进程调用：忽略 VECTOR_SERVICE_URL，在本进程内加载模型与打开数据库（需在首次使用前调用）"""
+    global _service_url
+    _service_url = ""
+
 
-def _get_embedding_function() -> embedding_functions.SentenceTransformerEmbeddingFunction:
+def _get_client() -> "chromadb.ClientAPI":
+    """延迟创建 Chroma 客户端（使用向量服务时为 VectorServiceClient）"""
+    global _chroma_client
+    if _chroma_client is None:
+        with _client_lock:
+            if _chroma_client is None:
+                if _service_url:
+                    from app.core.vector_service import VectorServiceClient
+                    _chroma_client = VectorServiceClient(_service_url)
+                else:
+                    import chromadb
+                    _chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _chroma_client
+
+
+def _get_embedding_function() -> "SentenceTransformerEmbeddingFunction":
     """延迟加载 embedding function 以避免 uvicorn reload 模式下的多进程问题"""
     global _embedding_fn
     if _embedding_fn is None:
-        _embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        with _embedding_lock:
+            if _embedding_fn is None:
+                if _service_url:
+                    from app.core.vector_service import RemoteEmbeddingFunction
+                    _embedding_fn = RemoteEmbeddingFunction(_get_client())
+                else:
+                    from chromadb.utils import embedding_functions
+                    _embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name="all-MiniLM-L6-v2"
+                    )
+                    _embedding_succeeded()
     return _embedding_fn
 
-_collection: Optional[chromadb.Collection] = None
 
-def _get_collection() -> chromadb.Collection:
+def init_client() -> None:
+    """导入 chromadb 并打开数据库（启动后由后台预加载调用）"""
+    _get_client()
+
+
+_collections: Dict[str, "chromadb.Collection"] = {}
+
+
+def _get_named_collection(name: str) -> "chromadb.Collection":
+    collection = _collections.get(name)
+    if collection is None:
+        with _collection_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = _get_client().get_or_create_collection(
+                    name=name,
+                    embedding_function=_get_embedding_function()
+                )
+                _collections[name] = collection
+    return collection
+
+
+def get_collection(name: str) -> "chromadb.Collection":
+    """按名称获取集合（向量服务按请求中的集合名转发）"""
+    return _get_named_collection(name)
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """计算一批文本的向量（阻塞，首次调用会加载模型）"""
+    embeddings = _get_embedding_function()(texts)
+    _embedding_succeeded()
+    return embeddings
+
+
+def _get_collection() -> "chromadb.Collection":
     """延迟加载 collection 以避免 uvicorn reload 模式下的多进程问题"""
-    global _collection
-    if _collection is None:
-        _collection = _chroma_client.get_or_create_collection(
-            name="root_library",
-            embedding_function=_get_embedding_function()
-        )
-    return _collection
+    return _get_named_collection("root_library")
+
+
+def _get_memory_collection() -> "chromadb.Collection":
+    """聊天记忆集合：从上下文中移出的早期对话，按会话检索"""
+    return _get_named_collection("chat_memory")
+
+
+def _get_history_collection() -> "chromadb.Collection":
+    """历史会话集合：已保存会话中的每轮问答，跨会话检索"""
+    return _get_named_collection("session_history")
+
+
+# =============================================================================
+# 预热
+# =============================================================================
+# 预热时计算的示例文本
+WARMUP_TEXTS: List[str] = ["warm up", "向量化模型预热", "The quick brown fox jumps over the lazy dog."]
+# 等待超时后建议客户端重试的秒数
+WARMUP_RETRY_AFTER = 5
+
+
+class EmbeddingWarmingError(Exception):
+    """向量化模型仍在加载，等待超过 EMBEDDING_WARMUP_WAIT 秒"""
+
+    def __init__(self, retry_after: int = WARMUP_RETRY_AFTER) -> None:
+        super().__init__("向量化模型正在加载，请稍后重试")
+        self.retry_after: int = retry_after
+
+
+def _resolve(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class EmbeddingWarmup:
+    """
+    在后台线程中加载向量化模型、计算一批示例文本并打开知识库集合
+    状态: pending（未开始）→ warming → ready / failed；预热失败时不再拦截请求，由首次使用重新加载，
+    同时在后台按指数退避重试，重试成功或首次使用时加载成功后变为 ready
+    """
+
+    def __init__(self, wait_seconds: float, retry_max: float = EMBEDDING_WARMUP_RETRY_MAX, retry_base: float = 2.0) -> None:
+        self.wait_seconds: float = wait_seconds
+        self.retry_max: float = retry_max
+        self.retry_base: float = retry_base
+        self.state: str = "pending"
+        self.error: Optional[str] = None
+        self.attempts: int = 0
+        self.timings: Dict[str, float] = {}
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._lock = threading.Lock()
+        # 等待预热完成的请求：(事件循环, future)
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+        # mark_ready() 时唤醒等待重试的后台线程
+        self._wake = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> None:
+        """开始预热（重复调用时忽略）"""
+        with self._lock:
+            if self.state != "pending":
+                return
+            self.state = "warming"
+            self._started = time.perf_counter()
+        threading.Thread(target=self._run, name="embedding-warmup", daemon=True).start()
+
+    def _step(self, name: str, func: Any) -> None:
+        started = time.perf_counter()
+        func()
+        self.timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _attempt(self) -> bool:
+        """执行一次预热，返回是否成功"""
+        self.attempts += 1
+        try:
+            self._step("model", _get_embedding_function)
+            self._step("batch", lambda: _get_embedding_function()(WARMUP_TEXTS))
+            self._step("collection", _get_collection)
+        except Exception as e:
+            self.error = str(e)
+            logger.warning(f"向量化模型预热失败（第 {self.attempts} 次），将在后台重试或在首次使用时重新加载: {e}")
+            return False
+        logger.info(f"🔥 向量化模型预热完成，耗时 {time.perf_counter() - self._started:.2f}s")
+        return True
+
+    def _finish(self, state: str) -> None:
+        """更新状态并唤醒等待预热的请求"""
+        with self._lock:
+            if self.state == "ready":
+                return
+            self.state = state
+            if state == "ready":
+                self.error = None
+            self._finished = time.perf_counter()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _run(self) -> None:
+        delay = self.retry_base
+        # 失败后状态为 failed（请求不再等待），后台继续重试直到成功；模型加载慢于向量服务超时等情况不会永久未就绪
+        while not self._attempt():
+            self._finish("failed")
+            if self._wake.wait(delay) or self.ready:
+                return
+            delay = min(delay * 2, self.retry_max)
+        self._finish("ready")
+
+    def mark_ready(self) -> None:
+        """预热失败后首次使用时加载成功：标记为就绪并停止后台重试"""
+        if self.state != "failed":
+            return
+        logger.info("向量化模型已在首次使用时加载成功，标记为就绪")
+        self._finish("ready")
+        self._wake.set()
+
+    async def wait(self) -> None:
+        """
+        预热进行中时等待其完成，最多等待 wait_seconds 秒
+
+        Raises:
+            EmbeddingWarmingError: 等待超时（wait_seconds 为 0 时立即抛出）
+        """
+        if self.state != "warming":
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.state != "warming":
+                return
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, self.wait_seconds)
+        except asyncio.TimeoutError:
+            raise EmbeddingWarmingError() from None
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = None
+        if self._started is not None:
+            elapsed = round((self._finished or time.perf_counter()) - self._started, 2)
+        return {
+            "state": self.state,
+            "error": self.error,
+            "elapsed_seconds": elapsed,
+            "timings_ms": dict(self.timings),
+            "attempts": self.attempts,
+            "waiting": len(self._waiters)
+        }
+
+
+# 模块级单例（EMBEDDING_WARMUP=false 时为 None，模型在首次使用时加载）
+embedding_warmup: Optional[EmbeddingWarmup] = EmbeddingWarmup(EMBEDDING_WARMUP_WAIT) if EMBEDDING_WARMUP else None
+
+
+async def wait_for_embedding() -> None:
+    """预热进行中时等待其完成，超时抛出 EmbeddingWarmingError"""
+    if embedding_warmup is not None:
+        await embedding_warmup.wait()
+
+
+def _embedding_succeeded() -> None:
+    """预热之外的向量化成功（本进程加载了模型，或向量服务返回了结果）"""
+    if embedding_warmup is not None and embedding_warmup.state == "failed":
+        embedding_warmup.mark_ready()
+
+
+def _count_ingest(collection: str, documents: List[str]) -> None:
+    """记录写入向量库的块数与字节数"""
+    rag_ingest_chunks.add(len(documents), collection)
+    rag_ingest_bytes.add(sum(len(doc.encode("utf-8")) for doc in documents), collection)
 
 
 def add_text_to_rag(filename: str, text: str, chunk_size: int = 500) -> int:
@@ -59,10 +311,13 @@ def add_text_to_rag(filename: str, text: str, chunk_size: int = 500) -> int:
     ids = [f"{filename}_{i}_{uuid.uuid4().hex[:4]}" for i in range(len(chunks))]
     metadatas = [{"source": filename} for _ in range(len(chunks))]
 
-    collection.add(documents=chunks, metadatas=metadatas, ids=ids)
+    with rag_ingest_seconds.time("kb", span="rag.ingest", source=filename, chunks=len(chunks)):
+        collection.add(documents=chunks, metadatas=metadatas, ids=ids)
+    _count_ingest("kb", chunks)
     return len(chunks)
 
 
+
 def query_rag_with_filter(
     query: str,
     allowed_files: List[str],
@@ -92,6 +347,62 @@ def query_rag_with_filter(
     return "\n---\n".join(docs) if docs else ""
 
 
+# 相同的并发检索 / 向量化只执行一次
+_query_flight = SingleFlight("rag-query")
+_embed_flight = SingleFlight("embedding")
+
+
+async def embed_query(text: str) -> List[float]:
+    """计算查询文本的向量（并发的相同文本只计算一次）"""
+    await wait_for_embedding()
+
+    async def compute() -> List[float]:
+        # 首次调用会加载模型，放在线程中执行
+        with rag_embed_seconds.time(span="rag.embed"):
+            embeddings = await asyncio.to_thread(lambda: _get_embedding_function()([text]))
+        _embedding_succeeded()
+        return embeddings[0]
+
+    return await _embed_flight.do(text, compute)
+
+
+async def aquery_rag_with_filter(
+    query: str,
+    allowed_files: List[str],
+    n_results: int = 3
+) -> str:
+    """
+    query_rag_with_filter 的异步版本
+    在线程中执行检索，不阻塞事件循环；并发的相同检索合并为一次
+
+    Args:
+        query: 查询文本
+        allowed_files: 允许检索的文件列表
+        n_results: 返回结果数量
+
+    Returns:
+        拼接的检索结果文本
+    """
+    if not allowed_files:
+        return ""
+
+    async def run() -> str:
+        embedding = await embed_query(query)
+        with rag_query_seconds.time("kb", span="rag.query", files=len(allowed_files)):
+            results = await asyncio.to_thread(
+                lambda: _get_collection().query(
+                    query_embeddings=[embedding],
+                    n_results=n_results,
+                    where={"source": {"$in": allowed_files}}
+                )
+            )
+        docs = results['documents'][0]
+        return "\n---\n".join(docs) if docs else ""
+
+    key = (query, tuple(sorted(allowed_files)), n_results)
+    return await _query_flight.do(key, run)
+
+
 def delete_from_rag(filename: str) -> None:
     """从 RAG 中删除指定文件的所有块"""
     collection = _get_collection()
@@ -105,4 +416,102 @@ def rename_in_rag(old_name: str, new_name: str) -> None:
     if existing_records['ids']:
         ids_to_update = existing_records['ids']
         new_metadatas = [{"source": new_name} for _ in ids_to_update]
-        collection.update(ids=ids_to_update, metadatas=new_metadatas)
\ No newline at end of file
+        collection.update(ids=ids_to_update, metadatas=new_metadatas)
+
+# =============================================================================
+# 聊天记忆
+# =============================================================================
+
+async def add_chat_memory(session: str, items: List[Dict[str, str]]) -> None:
+    """
+    写入聊天记忆
+
+    Args:
+        session: 会话标识
+        items: [{"id": 稳定的条目 ID, "text": 文本}]，相同 ID 重复写入时覆盖
+    """
+    if not items:
+        return
+    documents = [item["text"] for item in items]
+    with rag_ingest_seconds.time("chat_memory", span="rag.ingest", chunks=len(items)):
+        await asyncio.to_thread(
+            lambda: _get_memory_collection().upsert(
+                ids=[item["id"] for item in items],
+                documents=documents,
+                metadatas=[{"session": session} for _ in items]
+            )
+        )
+    _count_ingest("chat_memory", documents)
+
+
+async def aquery_chat_memory(session: str, query: str, n_results: int = 3) -> List[str]:
+    """检索会话中与查询相关的早期对话"""
+    embedding = await embed_query(query)
+    with rag_query_seconds.time("chat_memory", span="rag.query"):
+        results = await asyncio.to_thread(
+            lambda: _get_memory_collection().query(
+                query_embeddings=[embedding],
+                n_results=n_results,
+                where={"session": session}
+            )
+        )
+    return results['documents'][0] if results['documents'] else []
+
+
+# =============================================================================
+# 历史会话记忆
+# =============================================================================
+
+def history_memory_entries(session: str) -> Dict[str, Tuple[str, str]]:
+    """会话已写入的问答：问答键 -> (记录 ID, 内容摘要)"""
+    records = _get_history_collection().get(where={"session": session}, include=["metadatas"])
+    return {
+        meta["exchange"]: (record_id, meta.get("digest", ""))
+        for record_id, meta in zip(records["ids"], records["metadatas"])
+    }
+
+
+def upsert_history_memory(ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+    """写入历史问答（在调用线程中计算向量）"""
+    if ids:
+        with rag_ingest_seconds.time("session_history", span="rag.ingest", chunks=len(ids)):
+            _get_history_collection().upsert(ids=ids, documents=documents, metadatas=metadatas)
+        _count_ingest("session_history", documents)
+
+
+def delete_history_memory(session: Optional[str] = None, ids: Optional[List[str]] = None) -> None:
+    """按会话或记录 ID 删除历史问答"""
+    if ids:
+        _get_history_collection().delete(ids=ids)
+    elif session:
+        _get_history_collection().delete(where={"session": session})
+
+
+def rename_history_memory(old_session: str, new_session: str) -> None:
+    """会话文件重命名后更新历史问答的元数据"""
+    collection = _get_history_collection()
+    records = collection.get(where={"session": old_session}, include=["metadatas"])
+    if records["ids"]:
+        metadatas = [{**meta, "session": new_session} for meta in records["metadatas"]]
+        collection.update(ids=records["ids"], metadatas=metadatas)
+
+
+async def aquery_history_memory(
+    query: str,
+    n_results: int = 3,
+    where: Optional[Dict[str, Any]] = None
+) -> List[Tuple[str, Dict[str, Any], float]]:
+    """检索与查询相关的历史问答，返回 [(文本, 元数据, 距离)]"""
+    embedding = await embed_query(query)
+    with rag_query_seconds.time("session_history", span="rag.query"):
+        results = await asyncio.to_thread(
+            lambda: _get_history_collection().query(
+                query_embeddings=[embedding],
+                n_results=n_results,
+                where=where,
+                include=["documents", "metadatas", "distances"]
+            )
+        )
+    if not results["ids"] or not results["ids"][0]:
+        return []
+    return list(zip(results["documents"][0], results["metadatas"][0], results["distances"][0]))
@@ -0,0 +1,149 @@
+# app/core/request_timing.py
+"""
+请求耗时分解
+- RequestTimings 记录一次请求各阶段的耗时（知识库、检索、上下文裁剪、图片压缩、上游、保存等），
+  绑定到当前上下文后，调用链中的 with phase("名称") 即可记录，未绑定时为空操作
+- server_timing() 生成 Server-Timing 响应头
+- slow_requests 保存最近超过 SLOW_REQUEST_THRESHOLD_MS 的请求（环形缓冲），供管理接口按耗时排序查询
+"""
+import re
+import time
+import datetime
+import threading
+import contextvars
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import SLOW_REQUEST_LOG_SIZE, SLOW_REQUEST_THRESHOLD_MS
+
+_TOKEN_RE = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class RequestTimings:
+    """一次请求各阶段的耗时，同名阶段累加"""
+
+    __slots__ = ("started", "phases")
+
+    def __init__(self) -> None:
+        self.started: float = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def mark(self, name: str) -> None:
+        """记录从请求开始到现在的耗时（例如首个内容块），已记录时不覆盖"""
+        if name not in self.phases:
+            self.phases[name] = time.perf_counter() - self.started
+
+    def measure(self, name: str) -> "_Phase":
+        """计时上下文管理器"""
+        return _Phase(self, name)
+
+    def elapsed(self) -> float:
+        """从请求开始到现在的秒数"""
+        return time.perf_counter() - self.started
+
+    def as_dict(self, total: bool = True) -> Dict[str, float]:
+        """各阶段耗时（毫秒）"""
+        result = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        if total:
+            result["total"] = round(self.elapsed() * 1000, 1)
+        return result
+
+
+class _Phase:
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings: Optional[RequestTimings], name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.start)
+
+
+_current: "contextvars.ContextVar[Optional[RequestTimings]]" = contextvars.ContextVar("request_timings", default=None)
+
+
+def bind(timings: RequestTimings) -> contextvars.Token:
+    """把耗时记录绑定到当前上下文，返回 unbind 使用的令牌"""
+    return _current.set(timings)
+
+
+def unbind(token: contextvars.Token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:
+        # 异步生成器在其他上下文中关闭
+        pass
+
+
+def phase(name: str) -> _Phase:
+    """在当前请求的耗时记录中计时一个阶段（没有绑定的记录时只计时不保存）"""
+    return _Phase(_current.get(), name)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing 响应头：name;dur=毫秒, ..."""
+    return ", ".join(f"{_TOKEN_RE.sub('_', name)};dur={ms}" for name, ms in timings.items())
+
+
+class SlowRequestLog:
+    """最近的慢请求（环形缓冲，超出容量时丢弃最早的记录）"""
+
+    def __init__(self, size: int, threshold_ms: float) -> None:
+        self.threshold_ms: float = threshold_ms
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=max(size, 1))
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, kind: str, timings: Dict[str, float], total_ms: float, **info: Any) -> None:
+        """
+        记录一次请求，耗时低于阈值时忽略
+
+        Args:
+            kind: 请求类型（chat / workflow）
+            timings: 各阶段耗时（毫秒）
+            total_ms: 总耗时（毫秒）
+            **info: 模型、会话、工作流 ID 等
+        """
+        if total_ms < self.threshold_ms:
+            return
+        entry = {
+            "kind": kind,
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "total_ms": round(total_ms, 1),
+            "timings": timings,
+            **info
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def slowest(self, limit: int = 20, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按总耗时从高到低排列的记录"""
+        with self._lock:
+            entries = [entry for entry in self._entries if kind is None or entry["kind"] == kind]
+        entries.sort(key=lambda entry: entry["total_ms"], reverse=True)
+        return entries[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "capacity": self._entries.maxlen,
+            "size": len(self._entries),
+            "recorded": self.recorded
+        }
+
+
+# 模块级单例
+slow_requests: SlowRequestLog = SlowRequestLog(SLOW_REQUEST_LOG_SIZE, SLOW_REQUEST_THRESHOLD_MS)
@@ -0,0 +1,109 @@
+# app/core/sandbox_worker.py
+"""
+代码节点沙箱 worker
+以独立脚本方式运行（python -I sandbox_worker.py <内存上限MB>），循环读取任务并执行。
+进程间使用长度前缀的 JSON 帧通信，本模块只能依赖标准库（orjson 可选）
+"""
+import os
+import sys
+import json
+import struct
+from typing import List, Any
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+_HEADER = struct.Struct(">I")
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 JSON 字节，无法序列化的值转为字符串"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """反序列化 JSON 字节"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_frame(stream, payload: Any) -> None:
+    """写入一帧：4 字节长度 + JSON 数据"""
+    data = dumps(payload)
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _read_exact(stream, size: int) -> bytes:
+    """读取指定字节数，对端关闭时抛出 EOFError"""
+    chunks: List[bytes] = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise EOFError("管道已关闭")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(stream) -> Any:
+    """读取一帧"""
+    (size,) = _HEADER.unpack(_read_exact(stream, _HEADER.size))
+    return loads(_read_exact(stream, size))
+
+
+def _worker_main(memory_limit_mb: int) -> None:
+    """worker 主循环：读取任务、执行代码、返回结果"""
+    try:
+        import resource
+    except ImportError:  # Windows 无 resource 模块，仅依赖父进程的墙钟超时
+        resource = None
+
+    if resource is not None and memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    # 用户代码不应写入协议管道
+    sys.stdout = open(os.devnull, "w")
+
+    while True:
+        try:
+            job = read_frame(stdin)
+        except EOFError:
+            return
+
+        if resource is not None:
+            # CPU 时间限制按本次任务的累计值设置，超出后内核发送 SIGXCPU 终止进程
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            soft = used + max(1, int(job.get("timeout") or 30))
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+        exec_globals = {
+            "__builtins__": {},
+            "context": job.get("context", {}),
+            "results": job.get("results", {}),
+            "inputs": job.get("inputs", {})
+        }
+        try:
+            exec(job["code"], exec_globals)
+            response = {"ok": True, "output": exec_globals.get("output")}
+        except MemoryError:
+            response = {"ok": False, "error": "代码节点超出内存限制"}
+        except BaseException as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        write_frame(stdout, response)
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
@@ -0,0 +1,331 @@
+# app/core/session_memory.py
+"""
+跨会话记忆
+保存会话后，把其中的每轮问答（一条用户消息及其后的助手回复）向量化写入 session_history 集合；
+聊天时按当前问题检索其他会话中相关的问答，作为易变上下文插入到最新的用户消息之前。
+- 写入在后台线程中批量进行：save_history 只排队，同一会话的多次保存合并，
+  按内容摘要只向量化新增或修改的问答
+- 检索有严格的时间预算（SESSION_MEMORY_TIMEOUT），超时则本轮跳过，不影响聊天延迟
+与 context_manager 的 chat_memory 不同：后者只检索同一会话中被裁剪掉的早期消息
+"""
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import (
+    HISTORY_DIR,
+    SESSION_MEMORY_ENABLED,
+    SESSION_MEMORY_RESULTS,
+    SESSION_MEMORY_TIMEOUT,
+    SESSION_MEMORY_MAX_DISTANCE,
+    SESSION_MEMORY_SCOPE,
+    SESSION_MEMORY_MAX_CHARS,
+    SESSION_MEMORY_FLUSH_INTERVAL
+)
+from app.core.history_catalog import history_catalog
+from app.core.history_archive import history_archive
+from app.core.rag_engine import (
+    history_memory_entries,
+    upsert_history_memory,
+    delete_history_memory,
+    rename_history_memory,
+    aquery_history_memory
+)
+
+logger = logging.getLogger(__name__)
+
+ROLE_LABELS = {"user": "用户", "assistant": "助手"}
+
+MEMORY_HEADER = "【相关的历史会话】\n以下是用户在其他会话中与当前问题相关的问答，仅供参考："
+
+
+def _text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        content = " ".join(item.get("text", "") for item in content if isinstance(item, dict) and item.get("type") == "text")
+    return " ".join(str(content or "").split())
+
+
+def exchanges(messages: List[Dict[str, Any]], max_chars: int = SESSION_MEMORY_MAX_CHARS) -> List[Tuple[str, str]]:
+    """
+    把消息列表切分为问答
+
+    Returns:
+        [(问答键, 文本)]，问答键为用户消息的 ID（没有 ID 时为位置）
+    """
+    result: List[Tuple[str, str]] = []
+    key: Optional[str] = None
+    lines: List[str] = []
+    for position, message in enumerate(messages):
+        role = message.get("role")
+        if role not in ROLE_LABELS:
+            continue
+        text = _text(message)
+        if role == "user":
+            if key is not None and len(lines) > 1:
+                result.append((key, "\n".join(lines)[:max_chars]))
+            key, lines = (str(message.get("id") or f"#{position}"), [f"用户: {text}"]) if text else (None, [])
+        elif key is not None and text:
+            lines.append(f"助手: {text}")
+    # 只写入已有回复的问答
+    if key is not None and len(lines) > 1:
+        result.append((key, "\n".join(lines)[:max_chars]))
+    return result
+
+
+class SessionMemory:
+    """历史会话问答的后台向量化与检索"""
+
+    def __init__(self, history_dir: Path, flush_interval: float) -> None:
+        self.history_dir: Path = history_dir
+        self.flush_interval: float = flush_interval
+        self._cond = threading.Condition()
+        # 待处理的操作: ("index", session, exchanges, kb_id) / ("remove", session) / ("rename", old, new)
+        self._pending: Deque[Tuple[Any, ...]] = deque()
+        self._worker: Optional[threading.Thread] = None
+        self._closed: bool = False
+        self.embedded: int = 0
+        self.recalls: int = 0
+        self.timeouts: int = 0
+        self.errors: int = 0
+
+    def _session_key(self, file_path: Path) -> str:
+        return file_path.relative_to(self.history_dir).as_posix()
+
+    # =========================================================================
+    # 写入
+    # =========================================================================
+
+    def _enqueue(self, operation: Tuple[Any, ...]) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append(operation)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="session-memory", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+    def submit(self, file_path: Path, messages: List[Dict[str, Any]], kb_id: Optional[str]) -> None:
+        """会话保存后排队等待向量化（只在调用方线程中切分问答，不计算向量）"""
+        try:
+            session = self._session_key(file_path)
+        except ValueError:
+            return
+        self._enqueue(("index", session, exchanges(messages), kb_id))
+
+    def remove(self, file_path: Path) -> None:
+        """会话删除后排队移除"""
+        try:
+            self._enqueue(("remove", self._session_key(file_path)))
+        except ValueError:
+            pass
+
+    def rename(self, old_path: Path, new_path: Path) -> None:
+        """会话重命名后排队更新"""
+        try:
+            self._enqueue(("rename", self._session_key(old_path), self._session_key(new_path)))
+        except ValueError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            # 等待一个刷新周期，合并这段时间内的多次保存
+            deadline = time.monotonic() + self.flush_interval
+            with self._cond:
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"写入历史会话记忆失败: {e}")
+
+    def flush(self) -> int:
+        """立即处理队列中的全部操作，返回处理的操作数"""
+        with self._cond:
+            batch = list(self._pending)
+            self._pending.clear()
+
+        # 同一会话连续的多次保存只处理最后一次；删除和重命名之前的保存仍按顺序处理
+        latest: Dict[str, int] = {}
+        keep = set()
+        for index, operation in enumerate(batch):
+            if operation[0] == "index":
+                if operation[1] in latest:
+                    keep.discard(latest[operation[1]])
+                latest[operation[1]] = index
+                keep.add(index)
+            else:
+                for session in operation[1:]:
+                    latest.pop(session, None)
+
+        for index, operation in enumerate(batch):
+            kind = operation[0]
+            if kind == "index":
+                if index in keep:
+                    self._index_session(*operation[1:])
+            elif kind == "remove":
+                delete_history_memory(session=operation[1])
+            elif kind == "rename":
+                delete_history_memory(session=operation[2])
+                rename_history_memory(operation[1], operation[2])
+        return len(batch)
+
+    def _index_session(self, session: str, items: List[Tuple[str, str]], kb_id: Optional[str]) -> None:
+        existing = history_memory_entries(session)
+        ids: List[str] = []
+        documents: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        seen = set()
+        for key, text in items:
+            if key in seen:
+                continue
+            seen.add(key)
+            digest = hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+            current = existing.get(key)
+            if current is not None and current[1] == digest:
+                continue
+            # 记录 ID 与会话路径无关，重命名后沿用
+            ids.append(current[0] if current is not None else uuid.uuid4().hex)
+            documents.append(text)
+            metadatas.append({
+                "session": session,
+                "exchange": key,
+                "digest": digest,
+                "kb_id": kb_id or "",
+                "date": session.split("/")[0]
+            })
+        upsert_history_memory(ids, documents, metadatas)
+        self.embedded += len(ids)
+
+        removed = [existing[key][0] for key in existing.keys() - seen]
+        if removed:
+            delete_history_memory(ids=removed)
+
+    def rebuild(self) -> int:
+        """把历史索引中的全部会话排队写入（例如启用之前已有的会话），未变化的问答不会重新向量化，返回排队的会话数"""
+        queued = 0
+        for session in history_catalog.paths():
+            # 已归档的会话从归档读取
+            try:
+                data = history_archive.read_session(session)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取历史会话失败 {session}: {e}")
+                continue
+            if data is None:
+                continue
+            self.submit(self.history_dir / session, data["messages"], data.get("kb_id"))
+            queued += 1
+        return queued
+
+    def close(self) -> None:
+        """处理完队列中的剩余操作并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout=30)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"写入历史会话记忆失败: {e}")
+
+    # =========================================================================
+    # 检索
+    # =========================================================================
+
+    @staticmethod
+    def _where(exclude_session: Optional[str], kb_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        clauses: List[Dict[str, Any]] = []
+        if exclude_session:
+            clauses.append({"session": {"$ne": exclude_session}})
+        if SESSION_MEMORY_SCOPE == "kb":
+            clauses.append({"kb_id": kb_id or ""})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    async def recall(
+        self,
+        query: str,
+        exclude_session: Optional[str] = None,
+        kb_id: Optional[str] = None,
+        n_results: int = SESSION_MEMORY_RESULTS,
+        timeout: float = SESSION_MEMORY_TIMEOUT
+    ) -> List[Dict[str, Any]]:
+        """
+        检索其他会话中与问题相关的问答
+
+        Args:
+            query: 当前问题
+            exclude_session: 当前会话文件，不检索
+            kb_id: 当前知识库（SESSION_MEMORY_SCOPE=kb 时只检索关联该知识库的会话）
+            n_results: 最大条数
+            timeout: 时间预算（秒），超时返回空列表
+
+        Returns:
+            [{"session", "text", "distance"}]，按相似度降序
+        """
+        if not query.strip():
+            return []
+        self.recalls += 1
+        try:
+            rows = await asyncio.wait_for(
+                aquery_history_memory(query, n_results, self._where(exclude_session, kb_id)), timeout
+            )
+        except asyncio.TimeoutError:
+            # 向量计算在后台继续完成（首次调用时加载模型），之后的请求不再超时
+            self.timeouts += 1
+            logger.debug(f"检索历史会话超过 {timeout}s，本轮跳过")
+            return []
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"检索历史会话失败: {e}")
+            return []
+        return [
+            {"session": meta.get("session", ""), "text": text, "distance": round(distance, 4)}
+            for text, meta, distance in rows
+            if distance <= SESSION_MEMORY_MAX_DISTANCE
+        ]
+
+    @staticmethod
+    def note(recalled: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """检索结果组成的易变上下文消息，没有结果时返回 None"""
+        if not recalled:
+            return None
+        parts = [f"[{item['session'].split('/')[0]}]\n{item['text']}" for item in recalled]
+        return {"role": "system", "content": MEMORY_HEADER + "\n" + "\n---\n".join(parts)}
+
+    def stats(self) -> Dict[str, Any]:
+        """写入与检索统计"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "embedded": self.embedded,
+            "recalls": self.recalls,
+            "timeouts": self.timeouts,
+            "errors": self.errors
+        }
+
+
+# 模块级单例，未启用时为 None
+session_memory: Optional[SessionMemory] = (
+    SessionMemory(HISTORY_DIR, SESSION_MEMORY_FLUSH_INTERVAL) if SESSION_MEMORY_ENABLED else None
+)
@@ -0,0 +1,225 @@
+# app/core/session_store.py
+"""
+会话存储
+会话文件解析后缓存在内存中（LRU），并维护 消息 ID -> 位置 的索引：
+- 编辑 / 删除消息时按 ID 直接定位，不再逐条扫描
+- 文件的修改时间或大小变化（例如在其他进程中被修改）时重新读取
+- 已归档的会话从归档读取（不缓存），修改后写入新的会话文件
+- 聊天接口的增量模式（delta）从这里读取已保存的历史，客户端只需发送本轮的新消息
+写入仍为整个文件的原子替换，会话文件格式不变
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import HISTORY_DIR, SESSION_CACHE_SIZE
+from app.core.history import history_path, save_history
+from app.core.history_archive import history_archive
+
+logger = logging.getLogger(__name__)
+
+# 会话文件版本标识 (mtime_ns, size)
+FileStamp = Tuple[int, int]
+
+
+def _file_stamp(file_path: Path) -> Optional[FileStamp]:
+    """文件版本标识，文件不存在时返回 None"""
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Session:
+    """一个会话文件的内存副本与消息索引"""
+
+    def __init__(self, path: Path, stamp: Optional[FileStamp], messages: List[Dict[str, Any]], kb_id: Optional[str]) -> None:
+        self.path: Path = path
+        self.stamp: Optional[FileStamp] = stamp
+        self.messages: List[Dict[str, Any]] = messages
+        self.kb_id: Optional[str] = kb_id
+        self.index: Dict[str, int] = {}
+        self.reindex()
+
+    def reindex(self, start: int = 0) -> None:
+        """重建 start 之后消息的索引"""
+        for position in range(start, len(self.messages)):
+            message_id = self.messages[position].get("id")
+            if message_id:
+                self.index[message_id] = position
+
+    def locate(self, message_id: str, role: Optional[str] = None) -> Optional[int]:
+        """按 ID（和角色）查找消息位置"""
+        position = self.index.get(message_id)
+        if position is None:
+            return None
+        if role is not None and self.messages[position].get("role") != role:
+            return None
+        return position
+
+
+class SessionStore:
+    """会话文件缓存与按消息 ID 的读写"""
+
+    def __init__(self, capacity: int = SESSION_CACHE_SIZE) -> None:
+        self.capacity: int = capacity
+        self._sessions: "OrderedDict[Path, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits: int = 0
+        self.loads: int = 0
+
+    def _remember(self, session: Session) -> None:
+        self._sessions[session.path] = session
+        self._sessions.move_to_end(session.path)
+        while len(self._sessions) > self.capacity:
+            self._sessions.popitem(last=False)
+
+    def _get(self, session_file: str) -> Optional[Session]:
+        path = history_path(session_file)
+        stamp = _file_stamp(path)
+        session = self._sessions.get(path)
+        if stamp is None:
+            self._sessions.pop(path, None)
+            archived = history_archive.load(path.relative_to(HISTORY_DIR).as_posix())
+            if archived is None:
+                return None
+            self.loads += 1
+            return Session(path, None, archived["messages"], archived.get("kb_id"))
+        if session is not None and session.stamp == stamp:
+            self._sessions.move_to_end(path)
+            self.hits += 1
+            return session
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取会话文件失败 {session_file}: {e}")
+            self._sessions.pop(path, None)
+            return None
+        # 兼容旧格式：直接是消息列表
+        if isinstance(data, list):
+            data = {"messages": data, "kb_id": None}
+        if not isinstance(data, dict) or not isinstance(data.get("messages"), list):
+            return None
+
+        self.loads += 1
+        session = Session(path, stamp, data["messages"], data.get("kb_id"))
+        self._remember(session)
+        return session
+
+    def _persist(self, session_file: str, session: Session) -> None:
+        """写回会话文件，失败时丢弃内存副本，下次从文件重新读取"""
+        try:
+            save_history(session.messages, session_file, session.kb_id)
+        except Exception:
+            self._sessions.pop(session.path, None)
+            raise
+        session.stamp = _file_stamp(session.path)
+
+    def load(self, session_file: str) -> Optional[Dict[str, Any]]:
+        """
+        读取会话
+
+        Returns:
+            {"messages": [...], "kb_id": ...}，消息列表为副本；会话不存在时返回 None
+        """
+        with self._lock:
+            session = self._get(session_file)
+            if session is None:
+                return None
+            return {"messages": [dict(m) for m in session.messages], "kb_id": session.kb_id}
+
+    def exists(self, session_file: str) -> bool:
+        """会话是否存在且可读取"""
+        with self._lock:
+            return self._get(session_file) is not None
+
+    def save(self, session_file: str, messages: List[Dict[str, Any]], kb_id: Optional[str] = None) -> None:
+        """保存完整的消息列表（替换已有内容），缺少 ID 的消息自动分配 ID"""
+        with self._lock:
+            session = Session(history_path(session_file), None, [dict(m) for m in messages], kb_id)
+            self._persist(session_file, session)
+            session.reindex()
+            self._remember(session)
+
+    def append(self, session_file: str, messages: List[Dict[str, Any]], kb_id: Optional[str] = None) -> None:
+        """在会话末尾追加消息，会话不存在时新建"""
+        with self._lock:
+            session = self._get(session_file)
+            if session is None:
+                self.save(session_file, messages, kb_id)
+                return
+            start = len(session.messages)
+            session.messages.extend(dict(m) for m in messages)
+            session.kb_id = kb_id
+            self._persist(session_file, session)
+            session.reindex(start)
+
+    def update_message(
+        self,
+        session_file: str,
+        message_id: str,
+        role: str,
+        patch: Callable[[Dict[str, Any]], None]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        按 ID 就地修改一条消息并保存
+
+        Args:
+            session_file: 会话文件
+            message_id: 消息ID
+            role: 消息角色，必须与 ID 对应的消息一致
+            patch: 就地修改消息字典的函数
+
+        Returns:
+            修改后的消息副本，会话或消息不存在时返回 None
+        """
+        with self._lock:
+            session = self._get(session_file)
+            if session is None:
+                return None
+            position = session.locate(message_id, role)
+            if position is None:
+                return None
+            patch(session.messages[position])
+            self._persist(session_file, session)
+            return dict(session.messages[position])
+
+    def delete_message(self, session_file: str, message_id: str, role: str) -> Optional[Dict[str, Any]]:
+        """
+        按 ID 删除一条消息并保存
+
+        Returns:
+            被删除的消息，会话或消息不存在时返回 None
+        """
+        with self._lock:
+            session = self._get(session_file)
+            if session is None:
+                return None
+            position = session.locate(message_id, role)
+            if position is None:
+                return None
+            deleted = session.messages.pop(position)
+            del session.index[message_id]
+            self._persist(session_file, session)
+            # 之后的消息位置前移一位
+            session.reindex(position)
+            return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        return {
+            "cached_sessions": len(self._sessions),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "loads": self.loads
+        }
+
+
+# 模块级单例
+session_store: SessionStore = SessionStore()
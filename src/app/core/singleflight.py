@@ -0,0 +1,173 @@
+# app/core/singleflight.py
+"""
+请求合并（single-flight）
+相同键的并发调用只执行一次，其余调用者等待并共享同一结果：
+- SingleFlight: 协程调用，所有等待者拿到同一个返回值或异常
+- StreamFlight: 流式调用，一个上游流向多个订阅者分发，后加入的订阅者先收到已产出的部分
+"""
+import asyncio
+import logging
+from typing import Dict, List, Any, Optional, Callable, Awaitable, AsyncIterator, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+def _consume_exception(future: "asyncio.Future[Any]") -> None:
+    """标记异常已读取，避免所有等待者都被取消时产生 'exception was never retrieved' 警告"""
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """
+    协程调用合并
+    上游调用在独立任务中执行，单个等待者被取消不会影响其他等待者
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.calls: int = 0
+        self.coalesced: int = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn()，相同 key 的调用正在进行时直接等待其结果"""
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+
+            def release(done: "asyncio.Future[Any]") -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+                _consume_exception(done)
+
+            future.add_done_callback(release)
+        else:
+            self.coalesced += 1
+            logger.debug(f"[{self.name}] 合并重复请求")
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+class _Broadcast:
+    """一次上游流的共享状态"""
+
+    def __init__(self) -> None:
+        self.chunks: List[Any] = []
+        self.done: bool = False
+        self.error: Optional[BaseException] = None
+        self.subscribers: int = 0
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed: asyncio.Event = asyncio.Event()
+
+    def publish(self, chunk: Any) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        # 唤醒当前等待者，后续等待使用新的 Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class StreamFlight:
+    """
+    流式调用合并
+    第一个订阅者启动上游任务，之后的订阅者从头回放已产出的块并继续接收新块；
+    所有订阅者都离开后取消上游任务
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self._inflight: Dict[Hashable, _Broadcast] = {}
+        self.calls: int = 0
+        self.coalesced: int = 0
+
+    async def _produce(
+        self,
+        key: Hashable,
+        broadcast: _Broadcast,
+        source: Callable[[], AsyncIterator[Any]],
+        on_complete: Optional[Callable[[List[Any]], Awaitable[None]]]
+    ) -> None:
+        try:
+            async for chunk in source():
+                broadcast.publish(chunk)
+        except asyncio.CancelledError:
+            broadcast.finish(ConnectionAbortedError("上游流已取消"))
+            raise
+        except Exception as e:
+            broadcast.finish(e)
+            return
+        finally:
+            if self._inflight.get(key) is broadcast:
+                del self._inflight[key]
+
+        broadcast.finish()
+        if on_complete is not None:
+            try:
+                await on_complete(broadcast.chunks)
+            except Exception as e:
+                logger.warning(f"[{self.name}] 流结束回调失败: {e}")
+
+    async def subscribe(
+        self,
+        key: Hashable,
+        source: Callable[[], AsyncIterator[Any]],
+        on_complete: Optional[Callable[[List[Any]], Awaitable[None]]] = None
+    ) -> AsyncIterator[Any]:
+        """
+        订阅 key 对应的流，不存在时以 source() 启动上游
+
+        Args:
+            key: 合并键
+            source: 返回上游异步迭代器的函数
+            on_complete: 上游流正常结束后以全部块调用（只调用一次）
+        """
+        broadcast = self._inflight.get(key)
+        if broadcast is None:
+            self.calls += 1
+            broadcast = _Broadcast()
+            self._inflight[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, source, on_complete))
+        else:
+            self.coalesced += 1
+            logger.debug(f"[{self.name}] 合并重复流式请求，已产出 {len(broadcast.chunks)} 块")
+
+        broadcast.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(broadcast.chunks):
+                    yield broadcast.chunks[index]
+                    index += 1
+                elif broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                else:
+                    await broadcast.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # 没有订阅者了，停止上游并让后续请求重新发起
+                if self._inflight.get(key) is broadcast:
+                    del self._inflight[key]
+                broadcast.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
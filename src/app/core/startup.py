@@ -0,0 +1,149 @@
+# app/core/startup.py
+"""
+启动加速
+- preloader: 服务开始监听后在后台线程中依次加载较慢的模块（openai、Pillow、PyPDF2、chromadb 客户端），
+  首个用到它们的请求不必等待；单个模块加载失败只记录日志，首次使用时会再次尝试
+- profile_imports(): 在子进程中以 python -X importtime 导入 main，汇总各模块与各顶层包的导入耗时，
+  供 python main.py --profile-startup 使用
+"""
+import sys
+import time
+import logging
+import importlib
+import threading
+import subprocess
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import STARTUP_PRELOAD
+
+logger = logging.getLogger(__name__)
+
+
+def _import(name: str) -> Callable[[], Any]:
+    return lambda: importlib.import_module(name)
+
+
+def _open_chroma() -> None:
+    from app.core.rag_engine import init_client
+    init_client()
+
+
+# 预加载步骤：(名称, 加载函数)，按顺序执行
+PRELOAD_STEPS: List[Tuple[str, Callable[[], Any]]] = [
+    ("openai", _import("openai")),
+    ("PIL", _import("PIL.Image")),
+    ("PyPDF2", _import("PyPDF2")),
+    ("chromadb", _open_chroma),
+]
+
+
+class Preloader:
+    """在后台线程中执行预加载步骤"""
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]]) -> None:
+        self.steps = steps
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="startup-preload", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        for name, step in self.steps:
+            step_started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.errors[name] = str(e)
+                logger.warning(f"预加载 {name} 失败: {e}")
+            self.timings[name] = round((time.perf_counter() - step_started) * 1000, 1)
+        self.done.set()
+        detail = ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.timings.items())
+        logger.info(f"⚡ 后台预加载完成，耗时 {time.perf_counter() - started:.2f}s（{detail}）")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"done": self.done.is_set(), "timings_ms": dict(self.timings), "errors": dict(self.errors)}
+
+
+def profile_imports(module: str = "main", top: int = 20) -> Dict[str, Any]:
+    """
+    在子进程中导入模块，解析 -X importtime 的输出
+
+    Args:
+        module: 导入的模块
+        top: 每个列表保留的条目数
+
+    Returns:
+        total_ms（各模块自身耗时之和）、wall_ms（子进程总耗时，含解释器启动）、
+        packages（按顶层包汇总的自身耗时）、modules（自身耗时最高的模块）、
+        app_modules（本项目模块的累计耗时，含其导入的第三方库）
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+
+    rows: List[Tuple[str, int, int]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+
+    packages: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+
+    def ms(us: int) -> float:
+        return round(us / 1000, 1)
+
+    by_self = sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+    own = [row for row in rows if row[0] == module or row[0].startswith("app.")]
+    by_cumulative = sorted(own, key=lambda row: row[2], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": ms(sum(row[1] for row in rows)),
+        "wall_ms": round(wall_ms, 1),
+        "packages": [
+            {"name": name, "self_ms": ms(us)}
+            for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+        "modules": [{"name": name, "self_ms": ms(s), "cumulative_ms": ms(c)} for name, s, c in by_self],
+        "app_modules": [{"name": name, "self_ms": ms(s), "cumulative_ms": ms(c)} for name, s, c in by_cumulative]
+    }
+
+
+def format_profile(report: Dict[str, Any]) -> str:
+    """profile_imports() 结果的文本报告"""
+    lines = [
+        f"导入 {report['module']}: {report['total_ms']:.0f} ms（子进程总耗时 {report['wall_ms']:.0f} ms，含解释器启动）",
+        "",
+        "按顶层包（自身耗时）:"
+    ]
+    lines += [f"  {item['self_ms']:>9.1f} ms  {item['name']}" for item in report["packages"]]
+    lines += ["", "本项目模块（累计耗时）:"]
+    lines += [f"  {item['cumulative_ms']:>9.1f} ms  {item['name']}" for item in report["app_modules"]]
+    lines += ["", "最慢的模块（自身耗时 / 累计耗时）:"]
+    lines += [
+        f"  {item['self_ms']:>9.1f} ms  {item['cumulative_ms']:>9.1f} ms  {item['name']}"
+        for item in report["modules"]
+    ]
+    return "\n".join(lines)
+
+
+# 模块级单例（STARTUP_PRELOAD=false 时为 None）
+preloader: Optional[Preloader] = Preloader(PRELOAD_STEPS) if STARTUP_PRELOAD else None
@@ -0,0 +1,325 @@
+# app/core/tracing.py
+"""
+追踪
+- tracer.span(name, **attributes) 记录一段操作的起止时间，嵌套的 span 通过 contextvars 关联父子关系
+  （asyncio 任务与 asyncio.to_thread 会复制上下文，跨任务 / 线程同样有效）
+- 设置 TRACE_EXPORT_PATH 后，结束的 span 由后台线程批量写入本地文件，每行一个 OTLP/JSON 的
+  {"resourceSpans": [...]} 对象，与 OpenTelemetry Collector 的 file exporter 格式相同，
+  可用 otlpjsonfile receiver 导入 Jaeger / Tempo 等
+- 未设置时 span 为空操作，不生成 ID、不读取时钟
+- 按 TRACE_SAMPLE_RATE 对根 span 采样，子 span 跟随父 span
+"""
+import os
+import json
+import random
+import logging
+import threading
+import time
+import contextvars
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import TRACE_EXPORT_PATH, TRACE_SAMPLE_RATE, TRACE_EXPORT_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "nexus-ai"
+
+# OTLP 的 SpanKind 与 StatusCode
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# 后台线程写入的间隔（秒）与单批最多的 span 数
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 512
+# 导出队列的上限，写入跟不上时丢弃最早的 span
+MAX_PENDING = 10000
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    """OTLP/JSON 的属性格式"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """
+    一段被追踪的操作
+    作为上下文管理器使用时成为当前 span，退出时结束；
+    也可以调用 end() 手动结束（例如跨越 yield 的异步生成器）
+    """
+
+    __slots__ = ("tracer", "name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "_token")
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: str,
+        kind: int,
+        attributes: Dict[str, Any]
+    ) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def sampled(self) -> bool:
+        return True
+
+    def set(self, key: str, value: Any) -> None:
+        """设置属性"""
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """结束 span 并交给导出器（重复调用无效）"""
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer._finish(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> None:
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # 异步生成器在其他上下文中关闭
+                pass
+            self._token = None
+        self.end(exc)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON 的 span 格式"""
+        span: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """未启用导出或未被采样时的 span"""
+
+    __slots__ = ()
+
+    sampled = False
+    trace_id = ""
+    span_id = ""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> None:
+        pass
+
+
+class _UnsampledSpan(_NoopSpan):
+    """未被采样的根 span，作为当前 span 使子 span 同样不被采样"""
+
+    __slots__ = ("_token",)
+
+    def __init__(self) -> None:
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> "_UnsampledSpan":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> None:
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                pass
+            self._token = None
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: "contextvars.ContextVar[Optional[Any]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanExporter:
+    """后台线程把结束的 span 批量追加到本地 JSONL 文件，超过 max_bytes 时轮转为 .1"""
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path: Path = path
+        self.max_bytes: int = max_bytes
+        self._pending: Deque[Span] = deque(maxlen=MAX_PENDING)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.exported = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span) -> None:
+        """排队导出（不阻塞调用方）"""
+        with self._cond:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(span)
+            if len(self._pending) >= FLUSH_BATCH:
+                self._cond.notify()
+
+    def _take(self) -> List[Span]:
+        with self._cond:
+            if not self._pending and not self._closed:
+                self._cond.wait(FLUSH_INTERVAL)
+            batch = list(self._pending)
+            self._pending.clear()
+            return batch
+
+    def _write(self, batch: List[Span]) -> None:
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "app"},
+                    "spans": [span.to_otlp() for span in batch]
+                }]
+            }]
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.path.stat().st_size + len(line) > self.max_bytes:
+                os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+        except OSError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+        self.exported += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take()
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.warning(f"写入追踪文件失败: {e}")
+            elif self._closed:
+                return
+
+    def close(self) -> None:
+        """写入排队中的 span 并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": str(self.path), "pending": len(self._pending), "exported": self.exported, "dropped": self.dropped}
+
+
+class Tracer:
+    """创建 span；没有导出器时全部为空操作"""
+
+    def __init__(self, exporter: Optional[SpanExporter], sample_rate: float) -> None:
+        self.exporter: Optional[SpanExporter] = exporter
+        self.sample_rate: float = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def span(self, name: str, parent: Optional[Any] = None, kind: int = KIND_INTERNAL, **attributes: Any) -> Any:
+        """
+        创建 span（用 with 激活为当前 span，或稍后调用 end()）
+
+        Args:
+            name: 操作名称
+            parent: 父 span，为空时使用当前 span；没有当前 span 时作为根 span 并按采样率采样
+            kind: OTLP SpanKind
+            **attributes: 属性
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        if parent is None or parent is NOOP_SPAN:
+            parent = _current_span.get()
+        if parent is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return _UnsampledSpan()
+            return Span(self, name, f"{random.getrandbits(128):032x}", "", kind, attributes)
+        if not parent.sampled:
+            return _UnsampledSpan()
+        return Span(self, name, parent.trace_id, parent.span_id, kind, attributes)
+
+    def activate(self, span: Any) -> Optional[contextvars.Token]:
+        """把 span 设为当前 span 但不结束它（用于跨越多个阶段的 span），返回 deactivate 使用的令牌"""
+        if self.exporter is None or span is NOOP_SPAN:
+            return None
+        return _current_span.set(span)
+
+    def deactivate(self, token: Optional[contextvars.Token]) -> None:
+        """恢复 activate 之前的当前 span"""
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass
+
+    def current(self) -> Any:
+        """当前 span（没有时为空操作 span）"""
+        return _current_span.get() or NOOP_SPAN
+
+    def _finish(self, span: Span) -> None:
+        if self.exporter is not None:
+            self.exporter.submit(span)
+
+    def close(self) -> None:
+        if self.exporter is not None:
+            self.exporter.close()
+
+    def stats(self) -> Dict[str, Any]:
+        if self.exporter is None:
+            return {"enabled": False}
+        return {"enabled": True, "sample_rate": self.sample_rate, **self.exporter.stats()}
+
+
+# 模块级单例
+tracer: Tracer = Tracer(
+    SpanExporter(Path(TRACE_EXPORT_PATH), TRACE_EXPORT_MAX_BYTES) if TRACE_EXPORT_PATH else None,
+    TRACE_SAMPLE_RATE
+)
@@ -0,0 +1,260 @@
+# app/core/upstream_governor.py
+"""
+上游流量调控
+每个上游（API 预设 / base_url）一个调控器，所有 LLM 调用在发送前获取许可：
+- 令牌桶限制请求速率
+- AIMD 并发上限：成功时缓慢增加，收到 429 / 过载时减半
+- 收到 Retry-After 时在该时间内暂停派发
+- 等待队列按优先级派发：交互式聊天 > 工作流 > 批量执行
+"""
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.config import (
+    UPSTREAM_RATE_LIMIT,
+    UPSTREAM_BURST,
+    UPSTREAM_INITIAL_CONCURRENCY,
+    UPSTREAM_MAX_CONCURRENCY,
+    UPSTREAM_QUEUE_TIMEOUT,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX
+)
+from app.core.config_presets import config_presets
+
+logger = logging.getLogger(__name__)
+
+# 优先级，数值越小越先派发
+PRIORITY_INTERACTIVE = 0
+PRIORITY_WORKFLOW = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_WORKFLOW: "workflow",
+    PRIORITY_BATCH: "batch"
+}
+
+# 等待时间统计保留的样本数
+_WAIT_SAMPLES = 1024
+
+
+class UpstreamBusyError(Exception):
+    """排队等待超时"""
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """重试等待时间：优先使用 Retry-After，否则指数退避加随机抖动"""
+    if retry_after is not None and retry_after >= 0:
+        return min(retry_after, UPSTREAM_BACKOFF_MAX)
+    delay = min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+
+class UpstreamPermit:
+    """一次上游调用的许可，调用结束后必须通过 release() 归还并报告结果"""
+
+    __slots__ = ("limiter", "released")
+
+    def __init__(self, limiter: "UpstreamLimiter") -> None:
+        self.limiter = limiter
+        self.released: bool = False
+
+    def release(self, outcome: str = "success", retry_after: Optional[float] = None) -> None:
+        """
+        归还许可
+
+        Args:
+            outcome: success / throttled（429、过载）/ error（其他失败，不调整并发上限）
+            retry_after: 上游要求的等待秒数
+        """
+        if self.released:
+            return
+        self.released = True
+        self.limiter._release(outcome, retry_after)
+
+    async def __aenter__(self) -> "UpstreamPermit":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        # 未显式报告结果时：正常结束视为成功，异常视为一般错误
+        self.release("success" if exc_type is None else "error")
+
+
+class UpstreamLimiter:
+    """单个上游的令牌桶 + AIMD 并发调控器"""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        initial_concurrency: int,
+        max_concurrency: int
+    ) -> None:
+        self.name: str = name
+        self.rate: float = rate
+        self.capacity: float = float(max(1, burst))
+        self.tokens: float = self.capacity
+        self.updated: float = time.monotonic()
+        self.max_concurrency: int = max(1, max_concurrency)
+        self.limit: float = float(min(max(1, initial_concurrency), self.max_concurrency))
+        self.inflight: int = 0
+        self.blocked_until: float = 0.0
+        self._waiters: List[Tuple[int, int, "asyncio.Future[UpstreamPermit]"]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 统计
+        self.acquired: int = 0
+        self.throttled: int = 0
+        self.errors: int = 0
+        self.timeouts: int = 0
+        self._waits: "deque[float]" = deque(maxlen=_WAIT_SAMPLES)
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _dispatch(self) -> None:
+        """按优先级唤醒满足条件的等待者，条件不满足时安排定时重试"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            if self.inflight >= int(self.limit):
+                return  # 等待 release 触发
+            if now < self.blocked_until:
+                self._schedule(self.blocked_until - now)
+                return
+            if self.rate > 0 and self.tokens < 1:
+                self._schedule((1 - self.tokens) / self.rate)
+                return
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            if self.rate > 0:
+                self.tokens -= 1
+            self.inflight += 1
+            future.set_result(UpstreamPermit(self))
+
+    def _schedule(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(max(delay, 0.001), self._dispatch)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> UpstreamPermit:
+        """
+        排队获取许可
+
+        Raises:
+            UpstreamBusyError: 等待超过 timeout 秒
+        """
+        start = time.monotonic()
+        future: "asyncio.Future[UpstreamPermit]" = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            permit = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # 超时或取消的同时 _dispatch 可能已经分配了许可，要归还，否则并发名额永久泄漏
+            if future.done() and not future.cancelled():
+                future.result().release("error")
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise UpstreamBusyError(f"上游 {self.name} 繁忙，排队超过 {timeout:.0f}s")
+            raise
+        self.acquired += 1
+        self._waits.append(time.monotonic() - start)
+        return permit
+
+    def _release(self, outcome: str, retry_after: Optional[float]) -> None:
+        self.inflight -= 1
+        if outcome == "success":
+            # 加性增长：大约每个并发窗口 +1
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        elif outcome == "throttled":
+            self.throttled += 1
+            self.limit = max(1.0, self.limit / 2)
+            pause = retry_after if retry_after is not None else backoff_delay(0)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            logger.warning(f"上游 {self.name} 限流，并发上限降为 {int(self.limit)}，暂停 {pause:.1f}s")
+        else:
+            self.errors += 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        """队列与等待时间统计"""
+        depth: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        waits = sorted(self._waits)
+        return {
+            "name": self.name,
+            "inflight": self.inflight,
+            "concurrency_limit": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "rate_limit": self.rate,
+            "tokens": round(self.tokens, 2),
+            "paused_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "queue_depth": sum(depth.values()),
+            "queue_depth_by_priority": depth,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "queue_timeouts": self.timeouts,
+            "wait_seconds": {
+                "avg": sum(waits) / len(waits) if waits else 0.0,
+                "p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                "max": waits[-1] if waits else 0.0
+            }
+        }
+
+
+class UpstreamGovernor:
+    """按上游划分的调控器集合"""
+
+    def __init__(self) -> None:
+        self._limiters: Dict[str, UpstreamLimiter] = {}
+
+    def limiter(self, base_url: str) -> UpstreamLimiter:
+        """获取上游对应的调控器，预设可通过 PROXY_RATE_LIMIT_{name} / PROXY_MAX_CONCURRENCY_{name} 覆盖默认值"""
+        key = (base_url or "").rstrip("/")
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            preset = config_presets.find_by_url(key)
+            rate = UPSTREAM_RATE_LIMIT
+            max_concurrency = UPSTREAM_MAX_CONCURRENCY
+            if preset is not None:
+                rate = float(preset.get("rate_limit") or rate)
+                max_concurrency = int(preset.get("max_concurrency") or max_concurrency)
+            limiter = UpstreamLimiter(
+                name=preset["name"] if preset else key,
+                rate=rate,
+                burst=UPSTREAM_BURST,
+                initial_concurrency=UPSTREAM_INITIAL_CONCURRENCY,
+                max_concurrency=max_concurrency
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    async def acquire(self, base_url: str, priority: int = PRIORITY_INTERACTIVE) -> UpstreamPermit:
+        """排队获取上游许可"""
+        return await self.limiter(base_url).acquire(priority, timeout=UPSTREAM_QUEUE_TIMEOUT)
+
+    def stats(self) -> Dict[str, Any]:
+        """全部上游的统计"""
+        return {key: limiter.stats() for key, limiter in self._limiters.items()}
+
+
+# 模块级单例
+upstream_governor: UpstreamGovernor = UpstreamGovernor()
@@ -0,0 +1,244 @@
+# app/core/upstream_pool.py
+"""
+上游组
+一个上游组由多个提供相同模型的预设组成（.env 中 PROXY_GROUP_{name}=presetA,presetB），
+LLM 调用在组内选择成员：
+- 负载均衡：最少未完成请求，或延迟 EWMA × 未完成请求数
+- 熔断：连续失败达到阈值后暂停使用该成员，冷却后放行一次试探请求
+- 健康检查：后台定期请求成员的 /models，检查失败的成员只在组内没有其他可用成员时使用
+成员状态按预设名称共享，同一预设属于多个组时使用同一份统计
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, List, Any, Optional, Set
+
+import httpx
+
+from app.config import (
+    UPSTREAM_BALANCE_STRATEGY,
+    UPSTREAM_EWMA_ALPHA,
+    UPSTREAM_BREAKER_FAILURES,
+    UPSTREAM_BREAKER_COOLDOWN,
+    UPSTREAM_HEALTH_INTERVAL,
+    UPSTREAM_HEALTH_TIMEOUT
+)
+from app.core.config_presets import config_presets
+from app.core.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+BALANCE_STRATEGIES = ("least_outstanding", "ewma")
+
+
+class UpstreamUnavailableError(Exception):
+    """上游组中没有可用成员"""
+
+
+class Endpoint:
+    """上游组成员的负载与熔断状态"""
+
+    def __init__(self, name: str, base_url: str, api_key: str) -> None:
+        self.name: str = name
+        self.base_url: str = base_url
+        self.api_key: str = api_key
+        self.outstanding: int = 0
+        self.ewma: Optional[float] = None
+        # 熔断状态: closed / open / half_open
+        self.state: str = "closed"
+        self.consecutive_failures: int = 0
+        self.opened_at: float = 0.0
+        self.trial_inflight: bool = False
+        self.healthy: bool = True
+        self.last_probe: Optional[float] = None
+        # 统计
+        self.requests: int = 0
+        self.successes: int = 0
+        self.failures: int = 0
+
+    def available(self, now: float) -> bool:
+        """熔断器是否允许发送请求（不考虑健康检查结果）"""
+        if self.state == "open":
+            if now - self.opened_at < UPSTREAM_BREAKER_COOLDOWN:
+                return False
+            self.state = "half_open"
+            logger.info(f"上游 {self.name} 熔断冷却结束，放行试探请求")
+        if self.state == "half_open":
+            return not self.trial_inflight
+        return True
+
+    def score(self, strategy: str) -> float:
+        """负载评分，越小越优先"""
+        if strategy == "ewma":
+            # 尚无延迟样本的成员优先获得流量
+            return (self.ewma or 0.0) * (self.outstanding + 1)
+        return float(self.outstanding)
+
+    def begin(self) -> None:
+        """开始一次请求"""
+        self.outstanding += 1
+        self.requests += 1
+        if self.state == "half_open":
+            self.trial_inflight = True
+
+    def success(self, latency: Optional[float] = None) -> None:
+        """请求成功，latency 为首块时间（流式）或总耗时"""
+        self.outstanding -= 1
+        self.successes += 1
+        if latency is not None:
+            self.ewma = latency if self.ewma is None else (
+                UPSTREAM_EWMA_ALPHA * latency + (1 - UPSTREAM_EWMA_ALPHA) * self.ewma
+            )
+        self.consecutive_failures = 0
+        self.trial_inflight = False
+        if self.state != "closed":
+            logger.info(f"上游 {self.name} 恢复，关闭熔断")
+        self.state = "closed"
+
+    def failure(self) -> None:
+        """请求因上游原因失败（超时、连接失败、5xx、重试后仍被限流）"""
+        self.outstanding -= 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.trial_inflight = False
+        if self.state == "half_open" or self.consecutive_failures >= UPSTREAM_BREAKER_FAILURES:
+            if self.state != "open":
+                logger.warning(f"上游 {self.name} 连续失败 {self.consecutive_failures} 次，熔断 {UPSTREAM_BREAKER_COOLDOWN:.0f}s")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def abandon(self) -> None:
+        """请求被取消或因请求本身的问题失败，不影响熔断状态"""
+        self.outstanding -= 1
+        self.trial_inflight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.ewma, 3) if self.ewma is not None else None,
+            "breaker": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures
+        }
+
+
+class UpstreamPool:
+    """上游组成员选择与健康检查"""
+
+    def __init__(self, strategy: str = UPSTREAM_BALANCE_STRATEGY) -> None:
+        if strategy not in BALANCE_STRATEGIES:
+            logger.warning(f"未知的负载均衡策略 {strategy}，使用 least_outstanding")
+            strategy = "least_outstanding"
+        self.strategy: str = strategy
+        self._endpoints: Dict[str, Endpoint] = {}
+        self._health_task: Optional["asyncio.Task[None]"] = None
+        self.hedged: int = 0
+        self.failovers: int = 0
+
+    def members(self, group: str) -> List[Endpoint]:
+        """组成员，预设的地址或 Key 变化时同步更新"""
+        presets = config_presets.group(group)
+        if presets is None:
+            raise UpstreamUnavailableError(f"上游组 {group} 不存在")
+        members = []
+        for preset in presets:
+            endpoint = self._endpoints.get(preset["name"])
+            if endpoint is None:
+                endpoint = Endpoint(preset["name"], preset["base_url"], preset["api_key"])
+                self._endpoints[preset["name"]] = endpoint
+            else:
+                endpoint.base_url = preset["base_url"]
+                endpoint.api_key = preset["api_key"]
+            members.append(endpoint)
+        return members
+
+    def choose(self, group: str, exclude: Set[str]) -> Optional[Endpoint]:
+        """
+        选择负载最低的可用成员
+
+        Args:
+            group: 上游组名称
+            exclude: 本次请求已尝试过的成员名称
+
+        Returns:
+            选中的成员，组内没有可用成员时返回 None
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.members(group) if e.name not in exclude and e.available(now)]
+        # 健康检查失败的成员只作为最后的选择
+        healthy = [e for e in candidates if e.healthy]
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: e.score(self.strategy))
+
+    async def probe(self, endpoint: Endpoint) -> None:
+        """请求成员的 /models，响应状态低于 500 视为健康"""
+        url = f"{endpoint.base_url.rstrip('/')}/models"
+        try:
+            response = await get_http_client().get(
+                url,
+                headers={"Authorization": f"Bearer {endpoint.api_key}"},
+                timeout=UPSTREAM_HEALTH_TIMEOUT
+            )
+            healthy = response.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != endpoint.healthy:
+            logger.info(f"上游 {endpoint.name} 健康检查: {'正常' if healthy else '失败'}")
+        endpoint.healthy = healthy
+        endpoint.last_probe = time.time()
+
+    async def check_all(self) -> None:
+        """检查所有组的全部成员"""
+        endpoints: Dict[str, Endpoint] = {}
+        for group in config_presets.groups():
+            for endpoint in self.members(group):
+                endpoints[endpoint.name] = endpoint
+        await asyncio.gather(*(self.probe(e) for e in endpoints.values()))
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.warning(f"上游健康检查失败: {e}")
+            await asyncio.sleep(UPSTREAM_HEALTH_INTERVAL)
+
+    def start(self) -> None:
+        """启动后台健康检查"""
+        if UPSTREAM_HEALTH_INTERVAL <= 0 or self._health_task is not None:
+            return
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        """停止后台健康检查"""
+        if self._health_task is None:
+            return
+        self._health_task.cancel()
+        try:
+            await self._health_task
+        except asyncio.CancelledError:
+            pass
+        self._health_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """各组成员状态"""
+        return {
+            "strategy": self.strategy,
+            "hedged": self.hedged,
+            "failovers": self.failovers,
+            "groups": {
+                group: [endpoint.stats() for endpoint in self.members(group)]
+                for group in config_presets.groups()
+            }
+        }
+
+
+# 模块级单例
+upstream_pool: UpstreamPool = UpstreamPool()
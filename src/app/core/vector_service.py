@@ -0,0 +1,229 @@
+# app/core/vector_service.py
+"""
+向量服务
+多进程部署时由一个独立进程加载向量化模型并打开 Chroma 数据库，各工作进程通过 HTTP 调用：
+- 每个工作进程不再各自加载一份向量化模型（sentence-transformers + torch，常驻内存数百 MB）
+- Chroma PersistentClient 只在这一个进程中打开，所有写入由它串行提交（单写入者）
+- 工作进程设置 VECTOR_SERVICE_URL 后，rag_engine 使用这里的 RemoteCollection / RemoteEmbeddingFunction，
+  它们实现了 chromadb.Collection 与 embedding function 中用到的方法，rag_engine 的调用方不需要修改
+
+服务端接口（只监听本机地址）:
+- GET /health、GET /ready（向量化模型预热完成后返回 200）
+- POST /embed {"texts": [...]} -> {"result": [[...], ...]}
+- POST /collections/{name}/{op}，op 为 COLLECTION_OPS 之一，请求体为该方法的关键字参数 -> {"result": ...}
+
+用法:
+    python -m app.core.vector_service --port 9100
+    （python main.py --workers N 在 N > 1 时自动启动）
+"""
+import os
+import sys
+import time
+import logging
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.config import VECTOR_SERVICE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# 转发到向量服务的集合方法
+COLLECTION_OPS = ("add", "upsert", "query", "get", "delete", "update", "count")
+
+
+class VectorServiceError(Exception):
+    """向量服务返回错误"""
+
+
+def _json_safe(value: Any) -> Any:
+    """把 numpy 数组等转换为可 JSON 序列化的值"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+# =============================================================================
+# 客户端（工作进程）
+# =============================================================================
+
+class VectorServiceClient:
+    """向量服务客户端，提供与 chromadb 客户端同名的 get_or_create_collection（线程安全）"""
+
+    def __init__(self, base_url: str, timeout: float = VECTOR_SERVICE_TIMEOUT) -> None:
+        self.base_url: str = base_url
+        # 本机服务，不使用环境变量中的代理
+        self._client = httpx.Client(base_url=base_url, timeout=timeout, trust_env=False)
+
+    def call(self, path: str, payload: Dict[str, Any]) -> Any:
+        response = self._client.post(path, json=_json_safe(payload))
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            raise VectorServiceError(f"向量服务 {path} 返回 {response.status_code}: {detail}")
+        return response.json()["result"]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.call("/embed", {"texts": list(texts)})
+
+    def get_or_create_collection(self, name: str, embedding_function: Any = None) -> "RemoteCollection":
+        """集合在向量服务中按需创建，向量化也由向量服务完成，embedding_function 被忽略"""
+        return RemoteCollection(self, name)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class RemoteCollection:
+    """转发到向量服务的集合，方法与 chromadb.Collection 一致（只支持关键字参数）"""
+
+    def __init__(self, client: VectorServiceClient, name: str) -> None:
+        self.name: str = name
+        self._client = client
+
+    def _call(self, op: str, kwargs: Dict[str, Any]) -> Any:
+        return self._client.call(f"/collections/{self.name}/{op}", kwargs)
+
+    def add(self, **kwargs: Any) -> None:
+        self._call("add", kwargs)
+
+    def upsert(self, **kwargs: Any) -> None:
+        self._call("upsert", kwargs)
+
+    def update(self, **kwargs: Any) -> None:
+        self._call("update", kwargs)
+
+    def delete(self, **kwargs: Any) -> None:
+        self._call("delete", kwargs)
+
+    def query(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._call("query", kwargs)
+
+    def get(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._call("get", kwargs)
+
+    def count(self) -> int:
+        return self._call("count", {})
+
+
+class RemoteEmbeddingFunction:
+    """由向量服务计算向量的 embedding function"""
+
+    def __init__(self, client: VectorServiceClient) -> None:
+        self._client = client
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self._client.embed(input)
+
+
+# =============================================================================
+# 服务端
+# =============================================================================
+
+def create_app() -> Any:
+    """向量服务的 FastAPI 应用（在本进程内加载模型与打开数据库）"""
+    from contextlib import asynccontextmanager
+
+    from fastapi import Body, FastAPI, HTTPException, Response
+
+    from app.core import rag_engine
+
+    # 即使环境中设置了 VECTOR_SERVICE_URL（例如写在 .env 中供工作进程使用），也不能转发给自己
+    rag_engine.serve_local()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if rag_engine.embedding_warmup is not None:
+            rag_engine.embedding_warmup.start()
+        yield
+
+    app = FastAPI(title="Nexus Vector Service", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health() -> Dict[str, Any]:
+        return {"status": "ok", "pid": os.getpid()}
+
+    @app.get("/ready")
+    async def ready(response: Response) -> Dict[str, Any]:
+        warmup = rag_engine.embedding_warmup
+        is_ready = warmup is None or warmup.ready
+        if not is_ready:
+            response.status_code = 503
+            response.headers["Retry-After"] = str(rag_engine.WARMUP_RETRY_AFTER)
+        return {
+            "status": "ready" if is_ready else warmup.state,
+            "pid": os.getpid(),
+            "embedding": warmup.stats() if warmup is not None else None
+        }
+
+    # 同步接口在线程池中执行，模型加载完成前的请求阻塞等待（由客户端超时兜底）
+    @app.post("/embed")
+    def embed(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+        return {"result": _json_safe(rag_engine.embed_texts(payload.get("texts", [])))}
+
+    @app.post("/collections/{name}/{op}")
+    def collection_op(name: str, op: str, payload: Dict[str, Any] = Body(default={})) -> Dict[str, Any]:
+        if op not in COLLECTION_OPS:
+            raise HTTPException(status_code=404, detail=f"不支持的集合操作: {op}")
+        try:
+            result = getattr(rag_engine.get_collection(name), op)(**payload)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"result": _json_safe(result)}
+
+    return app
+
+
+def spawn(port: int, host: str = "127.0.0.1", ready_timeout: float = 30) -> "subprocess.Popen[bytes]":
+    """
+    启动向量服务子进程并等待其开始监听（模型在服务内后台加载，不等待加载完成）
+
+    Raises:
+        RuntimeError: 子进程退出或超时仍未开始监听
+    """
+    # 与工作进程使用相同的工作目录（CHROMA_PATH 等为相对路径），从任意目录启动时也能导入 app
+    src_dir = str(Path(__file__).resolve().parents[2])
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")]))}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.core.vector_service", "--host", host, "--port", str(port)], env=env
+    )
+    url = f"http://{host}:{port}/health"
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"向量服务启动失败，退出码 {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1, trust_env=False).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"向量服务 {ready_timeout:.0f}s 内未开始监听")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    import uvicorn
+    from app.config import VECTOR_SERVICE_PORT
+
+    parser = argparse.ArgumentParser(description="Nexus 向量服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=VECTOR_SERVICE_PORT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.info(f"向量服务启动: http://{args.host}:{args.port} (PID {os.getpid()})")
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,25 +3,35 @@
 聊天相关 API 路由
 """
 import logging
-from typing import Dict, Any, List, Optional, Union, AsyncGenerator
+from typing import Dict, Any, List, Optional, Tuple, Union, AsyncGenerator
 import re
 import json
 import base64
 import uuid
-import time
-import random
+import asyncio
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from fastapi.responses import StreamingResponse
-from openai import OpenAI
 
 from app.schemas import ChatRequest, ModelListRequest
-from app.core.rag_engine import query_rag_with_filter
+from app.core.rag_engine import aquery_rag_with_filter, EmbeddingWarmingError
 from app.core.kb_manager import kb_manager
-from app.core.history import save_history, load_history_file
+from app.core.session_store import session_store
+from app.core.ids import new_message_id
 from app.core.api_adapter import MultimodalAdapter
-from app.config import DEFAULT_API_URL, DEFAULT_API_KEY, DEFAULT_MODEL, STATIC_DIR, HISTORY_DIR
-from advanced_system import create_rag_system_prompt, create_chat_system_prompt
+from app.core.config_presets import config_presets
+from app.core.llm_gateway import llm_gateway
+from app.core.context_manager import context_manager
+from app.core.agent_prompts import agent_prompts
+from app.core.session_memory import session_memory
+from app.core.image_archive import image_archive
+from app.core.upstream_governor import PRIORITY_INTERACTIVE
+from app.core.metrics import chat_requests, chat_request_seconds, chat_ttft_seconds, prepare_messages_seconds
+from app.core.tracing import tracer, KIND_SERVER
+from app.core import request_timing
+from app.core.request_timing import RequestTimings, phase, server_timing, slow_requests
+from app.config import DEFAULT_API_URL, DEFAULT_API_KEY, DEFAULT_MODEL
+from advanced_system import attach_volatile_context
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
@@ -41,6 +51,15 @@ async def get_config() -> Dict[str, str]:
     }
 
 
+# 上游以正文形式返回错误时常见的关键字
+ERROR_KEYWORDS = ['BAKA', 'ERROR', 'RATE LIMIT', 'TOO MANY REQUESTS']
+
+
+def _is_error_content(content: str) -> bool:
+    """回复内容是否为上游返回的错误信息"""
+    return any(keyword in content.upper() for keyword in ERROR_KEYWORDS)
+
+
 def _extract_last_user_query(messages: List[Dict[str, Any]]) -> str:
     """
     从消息列表中提取最后一条用户消息的文本内容
@@ -58,245 +77,255 @@ def _extract_last_user_query(messages: List[Dict[str, Any]]) -> str:
     return ''
 
 
-def _prepare_messages_with_system_prompt(
+async def _prepare_messages_with_system_prompt(
         messages: List[Dict[str, Any]],
         kb_id: Optional[str],
         user_query: str
-) -> List[Dict[str, Any]]:
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
     """
     根据是否有知识库绑定，准备包含系统提示的消息列表
+
+    Returns:
+        (消息列表, 易变上下文消息)；cache_friendly 布局下时间与检索上下文不放在系统提示词中，
+        由调用方在上下文裁剪之后插入到最新的用户消息之前
     """
     current_messages = list(messages)
+    volatile_msg = None
 
     if kb_id and user_query:
-        kb_info = kb_manager.get_kb(kb_id)
+        with phase("kb"):
+            kb_info = kb_manager.get_kb(kb_id)
         if kb_info:
             logger.info(f"🤖 激活 Agent: {kb_info['name']}")
-            context = query_rag_with_filter(user_query, kb_info['files'])
-            system_msg = create_rag_system_prompt(
-                kb_name=kb_info['name'],
-                context=context,
-                role=f"你是 {kb_info['name']}，{kb_info['description']}"
-            )
+            with phase("rag"):
+                context = await aquery_rag_with_filter(user_query, kb_info['files'])
+            system_msg, volatile_msg = agent_prompts.for_kb(kb_id, kb_info).render(context)
             if current_messages and current_messages[0]['role'] == 'system':
                 current_messages[0] = system_msg
             else:
                 current_messages.insert(0, system_msg)
     else:
         if not current_messages or current_messages[0]['role'] != 'system':
-            current_messages.insert(0, create_chat_system_prompt())
-
-    return current_messages
-
-
-def save_history(messages: List[Dict[str, Any]], filename: str, kb_id: Optional[str] = None) -> None:
-    """
-    保存聊天历史到按日期组织的目录中
-
-    Args:
-        messages: 消息列表
-        filename: 文件名或完整路径（如 "chat_123.json" 或 "2025-12-27/chat_123.json"）
-        kb_id: 关联的知识库ID
-    """
-    from app.core.history import save_history as core_save_history
-    
-    # 将 kb_id 作为元数据保存到历史记录中
-    history_data = {
-        "messages": messages,
-        "kb_id": kb_id
-    }
-    
-    # 验证文件名不为空
-    if not filename or not filename.strip():
-        raise ValueError("文件名不能为空")
-    
-    # 如果 filename 包含日期目录，直接使用；否则创建新的日期目录
-    if '/' in filename:
-        file_path = HISTORY_DIR / filename
-        # 确保目录存在
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-    else:
-        import datetime
-        now = datetime.datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        save_dir = HISTORY_DIR / date_str
-        save_dir.mkdir(parents=True, exist_ok=True)
-
-        if not filename.endswith('.json'):
-            filename += '.json'
-
-        file_path = save_dir / filename
-
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(history_data, f, ensure_ascii=False, indent=2)
-
-
-def load_history_file(filepath_str: str) -> Optional[Dict[str, Any]]:
-    """
-    加载指定的历史文件
-
-    Args:
-        filepath_str: 相对于 HISTORY_DIR 的文件路径
-
-    Returns:
-        包含 messages 和 kb_id 的字典，如果文件不存在则返回 None
-    """
-    file_path = HISTORY_DIR / filepath_str
-    if not file_path.exists():
-        return None
-
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    # 兼容旧格式：如果直接是消息列表，则包装成新格式
-    if isinstance(data, list):
-        return {"messages": data, "kb_id": None}
-    
-    # 新格式：包含 messages 和 kb_id
-    if isinstance(data, dict) and "messages" in data:
-        return data
-    
-    return None
+            system_msg, volatile_msg = agent_prompts.default().render()
+            current_messages.insert(0, system_msg)
 
+    return current_messages, volatile_msg
 
 
 @router.post("/chat")
-async def chat_endpoint(request: ChatRequest):
-    """处理聊天请求"""
-    logger.info(f"收到聊天请求 - Model: {request.model}, API URL: {request.api_url}, Stream: {request.stream}, Drawing Workspace: {request.drawing_workspace_mode}")
-    logger.debug(f"请求消息数量: {len(request.messages)}")
+async def chat_endpoint(request: ChatRequest, response: Response):
+    """处理聊天请求，各阶段耗时通过 Server-Timing 响应头返回（流式请求另在最后一个事件的 timings 字段中返回）"""
+    timings = RequestTimings()
+    stream_label = "true" if request.stream else "false"
+    api_url, api_key = request.api_url, request.api_key
+    # config_id 可以是单个预设，也可以是上游组（组内负载均衡与故障转移）
+    group: Optional[str] = None
+    if request.config_id:
+        preset = config_presets.get(request.config_id)
+        if preset is not None:
+            api_url, api_key = preset["base_url"], preset["api_key"]
+        elif config_presets.group(request.config_id) is not None:
+            group = request.config_id
+        else:
+            raise HTTPException(status_code=404, detail=f"配置预设不存在: {request.config_id}")
+
+    logger.info(f"收到聊天请求 - Model: {request.model}, API URL: {api_url or f'上游组 {group}'}, Stream: {request.stream}, Drawing Workspace: {request.drawing_workspace_mode}")
+    logger.debug(f"请求消息数量: {len(request.messages)}, 增量模式: {request.delta}")
     logger.debug(f"请求消息ID: {[msg.get('id') for msg in request.messages]}")
     logger.debug(f"KB ID: {request.kb_id}")
     
+    span = tracer.span("chat.request", kind=KIND_SERVER, model=request.model, stream=request.stream, session=request.session_file)
+    token = tracer.activate(span)
+    timing_token = request_timing.bind(timings)
     try:
-        logger.info("初始化 OpenAI 客户端")
-        
-        client = OpenAI(
-            base_url=request.api_url, 
-            api_key=request.api_key,
-            max_retries=0,
-            timeout=300.0  # 设置5分钟超时，适合长图片生成
-        )
-        
-        user_query = _extract_last_user_query(request.messages)
+        # 增量模式下客户端只发送本轮的新消息，之前的历史从会话存储读取
+        history = request.messages
+        if request.delta and request.session_file:
+            with phase("history"):
+                stored = await asyncio.to_thread(session_store.load, request.session_file)
+            # 会话不存在（未保存或已被清理）时不能只用本轮消息继续，否则会以残缺的上下文覆盖会话
+            if stored is None:
+                raise HTTPException(status_code=409, detail="会话不存在或已失效，请关闭增量模式并发送完整的 messages")
+            history = stored["messages"] + request.messages
+
+        # 上游调用参数，经由 LLM 网关发送（复用连接池，可选响应缓存）
+        params: Dict[str, Any] = {}
+        if request.temperature is not None:
+            params["temperature"] = request.temperature
+        cache_mode = request.cache
+        if request.drawing_workspace_mode and cache_mode != "force":
+            cache_mode = "off"
+        upstream = {
+            "base_url": api_url,
+            "api_key": api_key,
+            "model": request.model,
+            "params": params,
+            "cache": cache_mode,
+            "cache_filter": lambda content: not _is_error_content(content),
+            "timeout": 300.0,  # 设置5分钟超时，适合长图片生成
+            "max_retries": 2,  # 只在限流、过载或连接失败时重试，超时不重试
+            "priority": PRIORITY_INTERACTIVE,
+            "group": group
+        }
+        
+        user_query = _extract_last_user_query(history)
         logger.debug(f"提取的用户查询: {user_query}")
 
+        # 检索历史会话与准备系统提示词、裁剪上下文并行进行，超过时间预算时跳过
+        memory_task = None
+        if session_memory is not None and request.memory and user_query:
+            memory_task = asyncio.create_task(
+                session_memory.recall(user_query, exclude_session=request.session_file, kb_id=request.kb_id)
+            )
+
         # 1. 先处理系统提示词
-        current_messages = _prepare_messages_with_system_prompt(
-            request.messages,
+        current_messages, volatile_msg = await _prepare_messages_with_system_prompt(
+            history,
             request.kb_id,
             user_query
         )
         
-        # 2. 再进行多模态上下文增强
-        context_aware_messages = adapter.prepare_messages(current_messages, request.drawing_workspace_mode)
+        # 2. 按模型的 token 预算裁剪上下文
+        with phase("context"):
+            current_messages = await context_manager.fit(
+                current_messages,
+                model=request.model,
+                upstream=upstream,
+                session=request.session_file,
+                query=user_query,
+                mode=request.context_mode
+            )
+        if volatile_msg is not None:
+            current_messages = attach_volatile_context(current_messages, volatile_msg)
+        if memory_task is not None:
+            with phase("memory"):
+                memory_msg = session_memory.note(await memory_task)
+            if memory_msg is not None:
+                current_messages = attach_volatile_context(current_messages, memory_msg)
+
+        # 3. 再进行多模态上下文增强
+        with prepare_messages_seconds.time(span="chat.prepare_messages"), phase("prepare"):
+            context_aware_messages = adapter.prepare_messages(current_messages, request.drawing_workspace_mode)
         logger.debug(f"准备发送的消息数量: {len(context_aware_messages)}")
 
         logger.info(f"调用模型 API - {request.model}, Stream: {request.stream}")
         
         if request.stream:
+            # 请求 span 在流结束时由生成器结束；响应头只包含开始输出之前的阶段
             return StreamingResponse(
-                _stream_chat_response(client, request.model, context_aware_messages, request.messages, request.session_file, request.kb_id, request.drawing_workspace_mode),
-                media_type="text/event-stream"
+                _stream_chat_response(upstream, context_aware_messages, history, request.session_file, request.kb_id, request.drawing_workspace_mode, timings, span),
+                media_type="text/event-stream",
+                headers={"Server-Timing": server_timing(timings.as_dict(total=False))}
             )
         else:
-            return await _non_stream_chat_response(client, request.model, context_aware_messages, request.messages, request.session_file, request.kb_id, request.drawing_workspace_mode)
+            result = await _non_stream_chat_response(upstream, context_aware_messages, history, request.session_file, request.kb_id, request.drawing_workspace_mode)
+            span.end()
+            chat_requests.inc(request.model, stream_label, "success")
+            chat_request_seconds.observe(timings.elapsed(), request.model, stream_label)
+            response.headers["Server-Timing"] = server_timing(_finish_timings(timings, request.model, request.session_file, False, "success"))
+            return result
             
     except Exception as e:
+        chat_requests.inc(request.model, stream_label, "error")
+        chat_request_seconds.observe(timings.elapsed(), request.model, stream_label)
+        _finish_timings(timings, request.model, request.session_file, request.stream, "error")
+        span.end(e)
+        if isinstance(e, (EmbeddingWarmingError, HTTPException)):
+            raise
         logger.error(f"聊天请求处理失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        request_timing.unbind(timing_token)
+        tracer.deactivate(token)
+
 
+def _finish_timings(timings: RequestTimings, model: str, session_file: Optional[str], stream: bool, outcome: str) -> Dict[str, float]:
+    """结束一次聊天请求的耗时记录，慢请求写入慢请求记录，返回各阶段耗时（毫秒）"""
+    result = timings.as_dict()
+    slow_requests.record("chat", result, result["total"], model=model, session=session_file, stream=stream, outcome=outcome)
+    return result
 
-async def _stream_chat_response(client, model: str, messages: List[Dict[str, Any]], original_messages: List[Dict[str, Any]], session_file: str, kb_id: Optional[str] = None, drawing_workspace_mode: bool = False):
+
+async def _stream_chat_response(upstream: Dict[str, Any], messages: List[Dict[str, Any]], original_messages: List[Dict[str, Any]], session_file: str, kb_id: Optional[str] = None, drawing_workspace_mode: bool = False, timings: Optional[RequestTimings] = None, span: Any = None):
     """流式响应生成器"""
     full_content = ""
+    timings = timings or RequestTimings()
+    model = upstream["model"]
+    outcome = "error"
+    error: Optional[BaseException] = None
+    token = tracer.activate(span) if span is not None else None
+    timing_token = request_timing.bind(timings)
     
     try:
-        stream = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            stream=True
-        )
-        
-        for chunk in stream:
-            if chunk.choices and len(chunk.choices) > 0:
-                delta = chunk.choices[0].delta
-                if hasattr(delta, 'content') and delta.content:
-                    content = delta.content
-                    full_content += content
-                    yield f"data: {json.dumps({'content': content}, ensure_ascii=False)}\n\n"
+        with phase("upstream"):
+            async for content in llm_gateway.stream(messages=messages, **upstream):
+                if not full_content:
+                    timings.mark("ttft")
+                    chat_ttft_seconds.observe(timings.elapsed(), model)
+                full_content += content
+                yield f"data: {json.dumps({'content': content}, ensure_ascii=False)}\n\n"
         
         logger.info(f"流式响应完成，总内容长度: {len(full_content)}")
         logger.debug(f"流式响应原始内容: {full_content[:500]}...")
         
-        processed_content = adapter.process_response(full_content)
+        with phase("process"):
+            processed_content = adapter.process_response(full_content)
         
         logger.debug(f"处理后内容长度: {len(processed_content)}")
         logger.debug(f"处理后内容预览: {processed_content[:500]}...")
         
-        assistant_id = str(int(time.time() * 1000)) + ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=9))
+        assistant_id = new_message_id()
         
         logger.debug(f"原始消息数量: {len(original_messages)}")
         logger.debug(f"原始消息ID: {[msg.get('id') for msg in original_messages]}")
         
         if not drawing_workspace_mode:
             new_history = original_messages + [{"role": "assistant", "content": processed_content, "id": assistant_id}]
-            save_history(new_history, session_file, kb_id)
+            with phase("save"):
+                await asyncio.to_thread(session_store.save, session_file, new_history, kb_id)
             logger.info(f"历史记录已保存到: {session_file}")
         else:
             logger.info("绘图工作区模式：不保存历史记录")
         
-        yield f"data: {json.dumps({'done': True, 'content': processed_content, 'id': assistant_id}, ensure_ascii=False)}\n\n"
+        outcome = "success"
+        breakdown = _finish_timings(timings, model, session_file, True, outcome)
+        yield f"data: {json.dumps({'done': True, 'content': processed_content, 'id': assistant_id, 'timings': breakdown}, ensure_ascii=False)}\n\n"
         
     except Exception as e:
+        error = e
         logger.error(f"流式响应处理失败: {e}", exc_info=True)
-        yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
-
-
-async def _non_stream_chat_response(client, model: str, messages: List[Dict[str, Any]], original_messages: List[Dict[str, Any]], session_file: str, kb_id: Optional[str] = None, drawing_workspace_mode: bool = False) -> Dict[str, str]:
+        breakdown = _finish_timings(timings, model, session_file, True, outcome)
+        yield f"data: {json.dumps({'error': str(e), 'timings': breakdown}, ensure_ascii=False)}\n\n"
+    finally:
+        chat_requests.inc(model, "true", outcome)
+        chat_request_seconds.observe(timings.elapsed(), model, "true")
+        request_timing.unbind(timing_token)
+        tracer.deactivate(token)
+        if span is not None:
+            span.end(error)
+
+
+async def _non_stream_chat_response(upstream: Dict[str, Any], messages: List[Dict[str, Any]], original_messages: List[Dict[str, Any]], session_file: str, kb_id: Optional[str] = None, drawing_workspace_mode: bool = False) -> Dict[str, str]:
     """非流式响应处理"""
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages
-        )
-        
-        logger.info(f"收到 API 响应")
-        logger.debug(f"响应对象类型: {type(response)}")
-        logger.debug(f"响应 choices 数量: {len(response.choices) if hasattr(response, 'choices') else 'N/A'}")
-        
-        if hasattr(response, 'choices') and len(response.choices) > 0:
-            logger.debug(f"第一个 choice 类型: {type(response.choices[0])}")
-            if hasattr(response.choices[0], 'message'):
-                logger.debug(f"message 类型: {type(response.choices[0].message)}")
-                if hasattr(response.choices[0].message, 'content'):
-                    final_content = response.choices[0].message.content
-                    logger.info(f"响应内容长度: {len(final_content) if final_content else 0}")
-                    logger.debug(f"响应内容预览: {final_content[:200] if final_content else 'None'}...")
-                else:
-                    logger.error("message 对象没有 content 属性")
-                    raise HTTPException(status_code=500, detail="API 响应格式错误: message 缺少 content 属性")
-            else:
-                logger.error("choice 对象没有 message 属性")
-                raise HTTPException(status_code=500, detail="API 响应格式错误: choice 缺少 message 属性")
-        else:
-            logger.error("响应对象缺少 choices 属性或 choices 为空")
-            raise HTTPException(status_code=500, detail="API 响应格式错误: 缺少 choices")
+        with phase("upstream"):
+            final_content = await llm_gateway.complete(messages=messages, **upstream)
         
         logger.info(f"原始响应内容: {final_content[:500] if final_content else 'None'}...")
         
-        error_keywords = ['BAKA', 'ERROR', 'RATE LIMIT', 'TOO MANY REQUESTS']
-        if final_content and any(keyword in final_content.upper() for keyword in error_keywords):
+        if final_content and _is_error_content(final_content):
             logger.warning(f"检测到 API 错误响应: {final_content}")
             raise HTTPException(status_code=500, detail=f"API 返回错误: {final_content}")
 
-        final_content = adapter.process_response(final_content)
+        with phase("process"):
+            final_content = adapter.process_response(final_content)
 
-        assistant_id = str(int(time.time() * 1000)) + ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=9))
+        assistant_id = new_message_id()
         
         if not drawing_workspace_mode:
             new_history = original_messages + [{"role": "assistant", "content": final_content, "id": assistant_id}]
-            save_history(new_history, session_file, kb_id)
+            with phase("save"):
+                await asyncio.to_thread(session_store.save, session_file, new_history, kb_id)
             logger.info(f"历史记录已保存到: {session_file}")
         else:
             logger.info("绘图工作区模式：不保存历史记录")
@@ -315,6 +344,7 @@ async def list_models(data: ModelListRequest) -> Dict[str, Any]:
     logger.info(f"获取模型列表请求 - API URL: {data.api_url}, API Key: {data.api_key[:10]}...")
     
     try:
+        from openai import OpenAI
         client = OpenAI(
             base_url=data.api_url, 
             api_key=data.api_key,
@@ -342,6 +372,28 @@ async def list_models(data: ModelListRequest) -> Dict[str, Any]:
             return {"error": f"未知错误: {error_msg}", "models": []}
 
 
+def _replace_text_content(msg: Dict[str, Any], content: str) -> None:
+    """替换消息的文本内容"""
+    # 如果原内容是多模态格式（数组），保持多模态格式
+    if isinstance(msg.get('content'), list):
+        # 保留图片等媒体，只更新文本部分
+        new_content = []
+        text_updated = False
+        for item in msg['content']:
+            if item.get('type') == 'text' and not text_updated:
+                new_content.append({'type': 'text', 'text': content})
+                text_updated = True
+            else:
+                new_content.append(item)
+        # 如果没有找到文本项，添加一个
+        if not text_updated:
+            new_content.append({'type': 'text', 'text': content})
+        msg['content'] = new_content
+    else:
+        # 简单文本格式
+        msg['content'] = content
+
+
 @router.post("/edit_message")
 async def edit_message(request: Dict[str, Any]) -> Dict[str, Any]:
     """编辑消息内容"""
@@ -355,50 +407,23 @@ async def edit_message(request: Dict[str, Any]) -> Dict[str, Any]:
         
         logger.info(f"编辑消息 - ID: {message_id}, Role: {role}")
         
-        # 读取当前会话历史
         session_file = request.get('session_file')
         if not session_file:
             raise HTTPException(status_code=400, detail="缺少 session_file 参数")
         
-        # 使用 HISTORY_DIR 而不是 STATIC_DIR / "chat_history"
-        history_data = load_history_file(session_file)
-        if history_data is None:
-            raise HTTPException(status_code=404, detail="会话文件不存在")
-        
-        messages = history_data.get('messages', [])
-        kb_id = history_data.get('kb_id')
-        
-        # 查找并更新消息
-        message_found = False
-        for msg in messages:
-            if msg.get('id') == message_id and msg.get('role') == role:
-                message_found = True
-                # 如果原内容是多模态格式（数组），保持多模态格式
-                if isinstance(msg.get('content'), list):
-                    # 保留图片等媒体，只更新文本部分
-                    new_content = []
-                    text_updated = False
-                    for item in msg['content']:
-                        if item.get('type') == 'text' and not text_updated:
-                            new_content.append({'type': 'text', 'text': content})
-                            text_updated = True
-                        else:
-                            new_content.append(item)
-                    # 如果没有找到文本项，添加一个
-                    if not text_updated:
-                        new_content.append({'type': 'text', 'text': content})
-                    msg['content'] = new_content
-                else:
-                    # 简单文本格式
-                    msg['content'] = content
-                logger.info(f"已更新 {role} 消息内容")
-                break
-        
-        if not message_found:
+        # 会话存储按消息 ID 索引定位，修改后写回会话文件
+        updated = await asyncio.to_thread(
+            session_store.update_message,
+            session_file,
+            message_id,
+            role,
+            lambda msg: _replace_text_content(msg, content)
+        )
+        if updated is None:
+            if not await asyncio.to_thread(session_store.exists, session_file):
+                raise HTTPException(status_code=404, detail="会话文件不存在")
             raise HTTPException(status_code=404, detail="未找到要编辑的消息")
-        
-        # 保存更新后的历史记录
-        save_history(messages, session_file, kb_id)
+        logger.info(f"已更新 {role} 消息内容")
         
         return {"success": True, "message": "消息编辑成功"}
         
@@ -421,41 +446,22 @@ async def delete_message(request: Dict[str, Any]) -> Dict[str, Any]:
         
         logger.info(f"删除消息 - ID: {message_id}, Role: {role}")
         
-        # 读取当前会话历史
         session_file = request.get('session_file')
         if not session_file:
             raise HTTPException(status_code=400, detail="缺少 session_file 参数")
         
         logger.info(f"会话文件路径: {session_file}")
         
-        # 使用 HISTORY_DIR 而不是 STATIC_DIR / "chat_history"
-        history_data = load_history_file(session_file)
-        if history_data is None:
-            logger.error(f"会话文件不存在: {HISTORY_DIR / session_file}")
-            raise HTTPException(status_code=404, detail="会话文件不存在")
-        
-        messages = history_data.get('messages', [])
-        kb_id = history_data.get('kb_id')
-        
-        logger.info(f"当前消息数量: {len(messages)}, kb_id: {kb_id}")
-        
-        # 查找并删除消息
-        message_found = False
-        new_messages = []
-        deleted_content = None
-        
-        for msg in messages:
-            if msg.get('id') == message_id and msg.get('role') == role:
-                message_found = True
-                deleted_content = msg.get('content', '')
-                logger.info(f"已删除 {role} 消息")
-                continue
-            new_messages.append(msg)
-        
-        if not message_found:
+        # 会话存储按消息 ID 索引定位，删除后写回会话文件
+        deleted = await asyncio.to_thread(session_store.delete_message, session_file, message_id, role)
+        if deleted is None:
+            if not await asyncio.to_thread(session_store.exists, session_file):
+                logger.error(f"会话文件不存在: {session_file}")
+                raise HTTPException(status_code=404, detail="会话文件不存在")
             logger.error(f"未找到要删除的消息 - ID: {message_id}, Role: {role}")
-            logger.error(f"当前所有消息ID: {[msg.get('id') for msg in messages]}")
             raise HTTPException(status_code=404, detail="未找到要删除的消息")
+        logger.info(f"已删除 {role} 消息")
+        deleted_content = deleted.get('content', '')
         
         # 如果删除的内容包含图片URL，尝试删除本地图片文件
         if deleted_content:
@@ -471,7 +477,7 @@ async def delete_message(request: Dict[str, Any]) -> Dict[str, Any]:
             image_matches = re.findall(image_pattern, content_to_check)
             
             for image_filename in image_matches:
-                image_path = STATIC_DIR / "generated_images" / image_filename
+                image_path = image_archive.resolve_path(image_filename)
                 if image_path.exists():
                     try:
                         image_path.unlink()
@@ -479,9 +485,6 @@ async def delete_message(request: Dict[str, Any]) -> Dict[str, Any]:
                     except Exception as img_err:
                         logger.warning(f"删除图片文件失败: {img_err}")
         
-        # 保存更新后的历史记录
-        save_history(new_messages, session_file, kb_id)
-        
         return {"success": True, "message": "消息删除成功"}
         
     except HTTPException:
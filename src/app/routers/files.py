@@ -8,12 +8,11 @@ import datetime
 import logging
 from typing import Dict, Any, List
 
-import PyPDF2
 from fastapi import APIRouter, UploadFile, File, HTTPException
 
 from app.config import UPLOAD_DIR
 from app.schemas import FileActionRequest, SetGroupRequest
-from app.core.rag_engine import add_text_to_rag, delete_from_rag, rename_in_rag
+from app.core.rag_engine import add_text_to_rag, delete_from_rag, rename_in_rag, wait_for_embedding, EmbeddingWarmingError
 from app.core.kb_manager import kb_manager
 from app.core.file_manager import file_manager
 
@@ -34,6 +33,7 @@ def _extract_text_from_file(filename: str, content: bytes) -> str:
         提取的文本内容
     """
     if filename.lower().endswith(".pdf"):
+        import PyPDF2
         text_content = ""
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
         for page in pdf_reader.pages:
@@ -71,8 +71,9 @@ async def set_file_group(req: SetGroupRequest) -> Dict[str, str]:
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)) -> Dict[str, Any]:
-    """上传文件并添加到 RAG"""
+    """上传文件并添加到 RAG（向量化模型预热中时等待，超时返回 503）"""
     try:
+        await wait_for_embedding()
         filename = file.filename
         file_location = UPLOAD_DIR / filename
         content = await file.read()
@@ -84,6 +85,8 @@ async def upload_file(file: UploadFile = File(...)) -> Dict[str, Any]:
         count = add_text_to_rag(filename, text_content)
 
         return {"status": "success", "filename": filename, "chunks": count}
+    except EmbeddingWarmingError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
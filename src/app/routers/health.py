@@ -0,0 +1,40 @@
+# app/routers/health.py
+"""
+健康检查 API 路由
+- GET /health：存活检查，进程能处理请求即返回 200
+- GET /ready：就绪检查，向量化模型预热完成（或未启用预热）时返回 200，预热中或失败时返回 503（失败后后台重试，成功后恢复）
+多进程部署时两个接口都只反映处理该请求的工作进程；使用向量服务时，工作进程的预热在向量服务加载完模型后完成
+"""
+import os
+from typing import Any, Dict
+
+from fastapi import APIRouter, Response
+
+from app.core.rag_engine import embedding_warmup, WARMUP_RETRY_AFTER
+from app.config import VECTOR_SERVICE_URL
+from app.core.startup import preloader
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/health")
+async def health() -> Dict[str, Any]:
+    """存活检查"""
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@router.get("/ready")
+async def ready(response: Response) -> Dict[str, Any]:
+    """就绪检查，附带预热与后台预加载的进度"""
+    embedding = embedding_warmup.stats() if embedding_warmup is not None else None
+    is_ready = embedding_warmup is None or embedding_warmup.ready
+    if not is_ready:
+        response.status_code = 503
+        response.headers["Retry-After"] = str(WARMUP_RETRY_AFTER)
+    return {
+        "status": "ready" if is_ready else embedding["state"],
+        "pid": os.getpid(),
+        "embedding": embedding,
+        "vector_service": VECTOR_SERVICE_URL or None,
+        "preload": preloader.stats() if preloader is not None else None
+    }
@@ -3,14 +3,21 @@
 聊天历史相关 API 路由
 """
 import os
+import asyncio
 from pathlib import Path
 from typing import Dict, List, Any, Tuple, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
 from app.config import HISTORY_DIR
 from app.schemas import HistoryActionRequest, LoadHistoryRequest
 from app.core.history import get_all_history, load_history_file
+from app.core.history_catalog import history_catalog
+from app.core.history_archive import history_archive
+from app.core.image_archive import image_archive
+from app.core.archive_job import archive_job
+from app.core.history_search import history_search
+from app.core.session_memory import session_memory
 
 router = APIRouter(prefix="/api/history", tags=["history"])
 
@@ -34,18 +41,99 @@ def _parse_history_path(filename: str) -> Tuple[Optional[str], str]:
 @router.get("/list")
 async def list_history() -> Dict[str, List[str]]:
     """列出所有历史记录"""
-    return get_all_history()
+    return await asyncio.to_thread(get_all_history)
+
+
+@router.get("/sessions")
+async def list_sessions(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    kb_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """分页列出会话（按日期和修改时间降序），可按日期范围和知识库过滤"""
+    return await asyncio.to_thread(history_catalog.page, offset, limit, start_date, end_date, kb_id)
+
+
+@router.get("/dates")
+async def list_dates(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """按日期统计会话数"""
+    return {"dates": await asyncio.to_thread(history_catalog.dates, start_date, end_date)}
+
+
+@router.post("/reindex")
+async def reindex_history() -> Dict[str, Any]:
+    """重新检查所有历史文件并更新索引"""
+    result = await asyncio.to_thread(history_catalog.sync, True)
+    # 历史索引重建后补充已归档的会话
+    result["archived_sessions"] = await asyncio.to_thread(history_archive.sync_catalog)
+    return {"status": "success", **result}
 
 
 @router.post("/load")
 async def load_history(req: LoadHistoryRequest) -> Dict[str, Any]:
     """加载指定的历史记录，返回包含messages和kb_id的字典"""
-    data = load_history_file(req.filepath)
+    data = await asyncio.to_thread(load_history_file, req.filepath)
     if data is None:
         raise HTTPException(status_code=404, detail="Not Found")
     return data
 
 
+@router.get("/search")
+async def search_history(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    kb_id: Optional[str] = None,
+    by_session: bool = False
+) -> Dict[str, Any]:
+    """全文检索历史消息，按相关度排序并返回摘要"""
+    if history_search is None:
+        raise HTTPException(status_code=503, detail="历史检索未启用")
+    return await asyncio.to_thread(history_search.search, q, limit, offset, kb_id, by_session)
+
+
+@router.post("/search/reindex")
+async def reindex_search(full: bool = False) -> Dict[str, Any]:
+    """补全历史检索索引，full 为 true 时重新索引全部会话"""
+    if history_search is None:
+        raise HTTPException(status_code=503, detail="历史检索未启用")
+    result = await asyncio.to_thread(history_search.rebuild, full)
+    return {"status": "success", **result}
+
+
+@router.post("/memory/reindex")
+async def reindex_memory() -> Dict[str, Any]:
+    """把全部会话排队写入跨会话记忆，未变化的问答不会重新向量化"""
+    if session_memory is None:
+        raise HTTPException(status_code=503, detail="跨会话记忆未启用")
+    queued = await asyncio.to_thread(session_memory.rebuild)
+    return {"status": "success", "queued_sessions": queued}
+
+
+@router.post("/archive")
+async def run_archive(
+    history_days: Optional[int] = Query(None, ge=0),
+    image_days: Optional[int] = Query(None, ge=0)
+) -> Dict[str, Any]:
+    """立即归档旧会话并转码旧的生成图片，天数为空时使用配置，0 表示跳过"""
+    result = await asyncio.to_thread(archive_job.run_once, history_days, image_days)
+    if result.get("status") == "busy":
+        raise HTTPException(status_code=409, detail="归档任务正在执行")
+    return result
+
+
+@router.get("/archive/stats")
+async def archive_stats() -> Dict[str, Any]:
+    """归档统计"""
+    return {
+        "history": await asyncio.to_thread(history_archive.stats),
+        "images": image_archive.stats(),
+        "last_run": archive_job.last_result
+    }
+
+
 @router.post("/delete")
 async def delete_history(req: HistoryActionRequest) -> Dict[str, str]:
     """删除历史记录"""
@@ -56,13 +144,21 @@ async def delete_history(req: HistoryActionRequest) -> Dict[str, str]:
         else:
             target_path = HISTORY_DIR / req.filename
 
-        if not target_path.exists():
+        session = target_path.relative_to(HISTORY_DIR).as_posix()
+        # 已归档的会话只有归档索引中的记录
+        archived = history_archive.remove(session)
+        if target_path.exists():
+            os.remove(target_path)
+        elif not archived:
             raise HTTPException(status_code=404, detail="File not found")
-
-        os.remove(target_path)
+        history_catalog.remove(target_path)
+        if history_search is not None:
+            history_search.remove(target_path)
+        if session_memory is not None:
+            session_memory.remove(target_path)
 
         # 清理空目录
-        if target_path.parent != HISTORY_DIR and not any(target_path.parent.iterdir()):
+        if target_path.parent != HISTORY_DIR and target_path.parent.exists() and not any(target_path.parent.iterdir()):
             os.rmdir(target_path.parent)
 
         return {"status": "success"}
@@ -87,12 +183,23 @@ async def rename_history(req: HistoryActionRequest) -> Dict[str, str]:
         old_path = HISTORY_DIR / date_dir / old_name
         new_path = HISTORY_DIR / date_dir / new_name
 
-        if not old_path.exists():
+        old_session = f"{date_dir}/{old_name}"
+        new_session = f"{date_dir}/{new_name}"
+        old_archived = history_archive.contains(old_session)
+        if not old_path.exists() and not old_archived:
             raise HTTPException(status_code=404, detail="File not found")
-        if new_path.exists():
+        if new_path.exists() or history_archive.contains(new_session):
             raise HTTPException(status_code=400, detail="Name exists")
 
-        os.rename(old_path, new_path)
+        if old_path.exists():
+            os.rename(old_path, new_path)
+        if old_archived:
+            history_archive.rename(old_session, new_session)
+        history_catalog.rename(old_path, new_path)
+        if history_search is not None:
+            history_search.rename(old_path, new_path)
+        if session_memory is not None:
+            session_memory.rename(old_path, new_path)
         return {"status": "success"}
     except HTTPException:
         raise
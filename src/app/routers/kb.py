@@ -15,7 +15,8 @@ router = APIRouter(prefix="/api/kb", tags=["kb"])
 @router.post("/create")
 async def create_kb(req: CreateKBRequest) -> Dict[str, Any]:
     """创建新知识库"""
-    return kb_manager.create_kb(req.name, req.description, req.files)
+    agent = req.agent.dict() if req.agent else None
+    return kb_manager.create_kb(req.name, req.description, req.files, agent)
 
 
 @router.get("/list")
@@ -35,7 +36,8 @@ async def delete_kb(req: DeleteKBRequest) -> Dict[str, str]:
 @router.post("/update")
 async def update_kb(req: UpdateKBRequest) -> Dict[str, Any]:
     """更新知识库"""
-    result = kb_manager.update_kb(req.kb_id, req.name, req.description, req.files)
+    agent = req.agent.dict() if req.agent else None
+    result = kb_manager.update_kb(req.kb_id, req.name, req.description, req.files, agent)
     if result is None:
         return {"status": "error", "message": "知识库不存在"}
     return {"status": "success", "kb": result}
\ No newline at end of file
@@ -0,0 +1,67 @@
+# app/routers/metrics.py
+"""
+指标 API 路由
+GET /metrics 以 Prometheus 文本格式输出进程内的指标，
+另外把网关缓存、上游调控、会话存储与追踪导出的统计转为指标
+"""
+from typing import Iterable
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import registry, Sample
+from app.core.tracing import tracer
+from app.core.llm_gateway import llm_gateway
+from app.core.upstream_governor import upstream_governor
+from app.core.session_store import session_store
+
+router = APIRouter(tags=["metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@registry.collector
+def _gateway_samples() -> Iterable[Sample]:
+    cache = llm_gateway.cache.stats()
+    yield "llm_cache_hits_total", "响应缓存命中数（含磁盘）", "counter", [({}, cache["hits"])]
+    yield "llm_cache_misses_total", "响应缓存未命中数", "counter", [({}, cache["misses"])]
+    yield "llm_cache_memory_bytes", "响应缓存内存占用（字节）", "gauge", [({}, cache["memory_bytes"])]
+
+
+@registry.collector
+def _upstream_samples() -> Iterable[Sample]:
+    limiters = upstream_governor.stats().values()
+    yield "upstream_inflight", "正在进行的上游调用数", "gauge", [
+        ({"upstream": s["name"]}, s["inflight"]) for s in limiters
+    ]
+    yield "upstream_queue_depth", "等待上游许可的调用数", "gauge", [
+        ({"upstream": s["name"]}, s["queue_depth"]) for s in limiters
+    ]
+    yield "upstream_concurrency_limit", "上游当前的并发上限", "gauge", [
+        ({"upstream": s["name"]}, s["concurrency_limit"]) for s in limiters
+    ]
+    yield "upstream_throttled_total", "上游限流次数", "counter", [
+        ({"upstream": s["name"]}, s["throttled"]) for s in limiters
+    ]
+
+
+@registry.collector
+def _session_samples() -> Iterable[Sample]:
+    stats = session_store.stats()
+    yield "session_cache_sessions", "内存中缓存的会话数", "gauge", [({}, stats["cached_sessions"])]
+    yield "session_cache_hits_total", "会话缓存命中数", "counter", [({}, stats["hits"])]
+    yield "session_loads_total", "从磁盘加载会话的次数", "counter", [({}, stats["loads"])]
+
+
+@registry.collector
+def _trace_samples() -> Iterable[Sample]:
+    stats = tracer.stats()
+    if stats["enabled"]:
+        yield "trace_spans_exported_total", "已写入导出文件的 span 数", "counter", [({}, stats["exported"])]
+        yield "trace_spans_dropped_total", "丢弃的 span 数", "counter", [({}, stats["dropped"])]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus 文本格式的指标"""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -10,6 +10,8 @@ from typing import Any, Dict, List
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.core.file_lock import file_lock, atomic_write_json
+
 router = APIRouter(prefix="/api/prompts", tags=["prompts"])
 
 STORAGE_DIR = Path("storage")
@@ -46,9 +48,9 @@ def _load_prompts() -> List[Dict[str, Any]]:
 
 
 def _save_prompts(prompts: List[Dict[str, Any]]) -> None:
-    """Save prompts to storage file."""
+    """Save prompts to storage file (atomic; callers hold the file lock)."""
     _ensure_storage()
-    PROMPTS_FILE.write_text(json.dumps(prompts, ensure_ascii=False, indent=2), encoding="utf-8")
+    atomic_write_json(PROMPTS_FILE, prompts)
 
 
 @router.get("", response_model=List[PromptResponse])
@@ -60,26 +62,28 @@ async def get_prompts() -> List[Dict[str, Any]]:
 @router.post("", response_model=PromptResponse)
 async def create_prompt(prompt: PromptCreate) -> Dict[str, Any]:
     """Create a new prompt."""
-    prompts = _load_prompts()
-    new_prompt = {
-        "id": str(uuid.uuid4()),
-        "name": prompt.name,
-        "content": prompt.content
-    }
-    prompts.append(new_prompt)
-    _save_prompts(prompts)
-    return new_prompt
+    with file_lock(PROMPTS_FILE):
+        prompts = _load_prompts()
+        new_prompt = {
+            "id": str(uuid.uuid4()),
+            "name": prompt.name,
+            "content": prompt.content
+        }
+        prompts.append(new_prompt)
+        _save_prompts(prompts)
+        return new_prompt
 
 
 @router.delete("/{prompt_id}")
 async def delete_prompt(prompt_id: str) -> Dict[str, str]:
     """Delete a prompt by ID."""
-    prompts = _load_prompts()
-    original_count = len(prompts)
-    prompts = [p for p in prompts if p.get("id") != prompt_id]
+    with file_lock(PROMPTS_FILE):
+        prompts = _load_prompts()
+        original_count = len(prompts)
+        prompts = [p for p in prompts if p.get("id") != prompt_id]
     
-    if len(prompts) == original_count:
-        raise HTTPException(status_code=404, detail="Prompt not found")
+        if len(prompts) == original_count:
+            raise HTTPException(status_code=404, detail="Prompt not found")
     
-    _save_prompts(prompts)
-    return {"message": "Prompt deleted successfully"}
+        _save_prompts(prompts)
+        return {"message": "Prompt deleted successfully"}
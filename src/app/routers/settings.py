@@ -3,17 +3,18 @@
 设置管理 API 路由
 负责读取和更新 .env 文件中的动态配置
 """
-import os
 from typing import Dict, List, Optional
-from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from dotenv import set_key, load_dotenv
 
-router = APIRouter(prefix="/api/settings", tags=["settings"])
+from app.core.config_presets import config_presets
+from app.core.llm_gateway import llm_gateway
+from app.core.upstream_governor import upstream_governor
+from app.core.upstream_pool import upstream_pool
+from app.core.request_timing import slow_requests
 
-ENV_PATH = Path(".env")
+router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 class ConfigItem(BaseModel):
     name: str
@@ -26,30 +27,16 @@ class ConfigResponse(BaseModel):
 @router.get("/configs", response_model=ConfigResponse)
 async def list_configs():
     """列出所有保存的 API 配置名称"""
-    load_dotenv(override=True) # 重新加载以确保获取最新值
-    configs = []
-    for key in os.environ:
-        if key.startswith("PROXY_BASE_URL_"):
-            config_name = key.replace("PROXY_BASE_URL_", "")
-            # 确保对应的 API KEY 也存在 (可选检查)
-            configs.append(config_name)
-    return {"configs": sorted(configs)}
+    return {"configs": config_presets.names()}
 
 @router.get("/config/{name}")
 async def get_config(name: str):
     """获取指定配置的详细信息"""
-    load_dotenv(override=True)
-    base_url = os.getenv(f"PROXY_BASE_URL_{name}")
-    api_key = os.getenv(f"PROXY_API_KEY_{name}")
-    
-    if not base_url:
+    preset = config_presets.get(name)
+    if preset is None:
         raise HTTPException(status_code=404, detail="Config not found")
-        
-    return {
-        "name": name,
-        "base_url": base_url,
-        "api_key": api_key
-    }
+
+    return preset
 
 @router.post("/configs")
 async def save_config(config: ConfigItem):
@@ -59,21 +46,47 @@ async def save_config(config: ConfigItem):
         suffix = config.name.strip()
         if not suffix:
             raise HTTPException(status_code=400, detail="Config name cannot be empty")
-            
-        base_url_key = f"PROXY_BASE_URL_{suffix}"
-        api_key_key = f"PROXY_API_KEY_{suffix}"
-        
-        # 如果 .env 不存在，创建一个
-        if not ENV_PATH.exists():
-            ENV_PATH.touch()
-            
-        # 使用 dotenv set_key 写入文件
-        set_key(ENV_PATH, base_url_key, config.base_url)
-        set_key(ENV_PATH, api_key_key, config.api_key)
-        
-        # 重新加载环境变量
-        load_dotenv(override=True)
-        
+
+        # 写入 .env，注册表随之失效并在下次访问时重新加载
+        config_presets.save(suffix, config.base_url, config.api_key)
+
         return {"status": "success", "message": f"Config '{suffix}' saved"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats():
+    """获取 LLM 响应缓存与请求合并统计"""
+    return llm_gateway.stats()
+
+@router.delete("/llm-cache")
+async def clear_llm_cache():
+    """清空 LLM 响应缓存"""
+    llm_gateway.cache.clear()
+    return {"status": "success", "message": "LLM cache cleared"}
+
+@router.get("/upstream")
+async def get_upstream_stats():
+    """获取各上游的排队深度、并发上限与等待时间统计"""
+    return upstream_governor.stats()
+
+@router.get("/upstream-groups")
+async def get_upstream_groups():
+    """获取上游组成员的负载、延迟、熔断与健康检查状态"""
+    return upstream_pool.stats()
+
+@router.get("/slow-requests")
+async def get_slow_requests(
+    limit: int = Query(20, ge=1, le=1000),
+    kind: Optional[str] = Query(None, description="chat / workflow")
+):
+    """获取最近的慢请求（按总耗时从高到低）及各阶段耗时"""
+    return {"stats": slow_requests.stats(), "requests": slow_requests.slowest(limit, kind)}
+
+@router.delete("/slow-requests")
+async def clear_slow_requests():
+    """清空慢请求记录"""
+    slow_requests.clear()
+    return {"status": "success", "message": "Slow request log cleared"}
@@ -2,20 +2,24 @@
 """
 工作流相关 API 路由
 """
-import os
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
-from fastapi import APIRouter, HTTPException
-from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Response
+from fastapi.responses import StreamingResponse
 
 from app.workflow import (
     WorkflowDefinition,
     WorkflowExecutionRequest,
     WorkflowExecutionResult,
-    workflow_manager,
-    workflow_engine
+    BatchExecutionRequest,
+    WorkflowEngine,
+    workflow_manager
 )
+from app.workflow.batch import BatchStore, parse_jsonl_inputs, run_batch, claim_batch, release_batch
+from app.workflow.journal import execution_journal, ExecutionActiveError
+from app.core.config_presets import config_presets
+from app.core.request_timing import server_timing
 
 router = APIRouter(prefix="/api/workflows", tags=["workflows"])
 
@@ -46,16 +50,54 @@ async def create_workflow(
 
 
 @router.get("/list")
-async def list_workflows() -> Dict[str, List[Dict[str, Any]]]:
-    """列出所有工作流"""
+async def list_workflows(
+    q: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=500)
+) -> Dict[str, List[Dict[str, Any]]]:
+    """列出工作流（完整定义），可按名称/描述过滤并分页"""
     try:
-        workflows = workflow_manager.list_workflows()
+        workflows = workflow_manager.list_workflows(query=q, offset=offset, limit=limit)
         return {"workflows": [wf.dict() for wf in workflows.values()]}
     except Exception as e:
         logger.error(f"列出工作流失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/summaries")
+async def list_workflow_summaries(
+    q: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    sort: str = "updated_at",
+    order: str = "desc"
+) -> Dict[str, Any]:
+    """分页列出工作流摘要（ID、名称、描述、版本、时间），不包含节点内容"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order 只能为 asc 或 desc")
+    try:
+        summaries, total = workflow_manager.list_summaries(
+            query=q,
+            offset=offset,
+            limit=limit,
+            sort=sort,
+            descending=order == "desc"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"total": total, "offset": offset, "limit": limit, "workflows": summaries}
+
+
+@router.get("/configs")
+async def get_configs() -> Dict[str, List[Dict[str, Any]]]:
+    """获取所有配置预设"""
+    configs = [
+        {"name": preset["name"], "api_url": preset["base_url"], "api_key": preset["api_key"]}
+        for preset in config_presets.list()
+    ]
+    return {"configs": configs}
+
+
 @router.get("/{workflow_id}")
 async def get_workflow(workflow_id: str) -> Dict[str, Any]:
     """获取指定工作流的详细信息"""
@@ -118,20 +160,25 @@ async def delete_workflow(workflow_id: str) -> Dict[str, str]:
 @router.post("/{workflow_id}/execute")
 async def execute_workflow(
     workflow_id: str,
-    request: WorkflowExecutionRequest
+    request: WorkflowExecutionRequest,
+    response: Response
 ) -> Dict[str, Any]:
-    """执行工作流"""
+    """执行工作流，各节点耗时在结果的 node_timings 与 Server-Timing 响应头中返回"""
     try:
         workflow = workflow_manager.get_workflow(workflow_id)
         if workflow is None:
             raise HTTPException(status_code=404, detail="工作流不存在")
 
-        result = await workflow_engine.execute(
+        # 引擎实例保存单次执行状态，每个请求使用独立实例避免并发执行互相覆盖
+        result = await WorkflowEngine(journal=execution_journal).execute(
             workflow=workflow,
             inputs=request.inputs,
             stream=request.stream
         )
 
+        response.headers["Server-Timing"] = server_timing(
+            {**result.node_timings, "total": round((result.execution_time or 0.0) * 1000, 1)}
+        )
         return result.dict()
     except HTTPException:
         raise
@@ -140,6 +187,198 @@ async def execute_workflow(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _require_journal():
+    """获取执行日志，未启用时返回 400"""
+    if execution_journal is None:
+        raise HTTPException(status_code=400, detail="执行日志未启用 (WORKFLOW_JOURNAL_ENABLED)")
+    return execution_journal
+
+
+@router.get("/{workflow_id}/executions")
+async def list_executions(
+    workflow_id: str,
+    status: Optional[str] = None,
+    limit: int = 50
+) -> Dict[str, List[Dict[str, Any]]]:
+    """列出工作流的执行记录"""
+    journal = _require_journal()
+    return {"executions": journal.list_runs(workflow_id=workflow_id, status=status, limit=max(1, min(limit, 500)))}
+
+
+@router.get("/executions/{execution_id}")
+async def get_execution(execution_id: str) -> Dict[str, Any]:
+    """查询执行记录及已完成的节点结果"""
+    journal = _require_journal()
+    run = journal.get_run(execution_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="执行记录不存在")
+    run["node_results"] = journal.load_node_results(execution_id)
+    return run
+
+
+@router.post("/executions/{execution_id}/resume")
+async def resume_execution(execution_id: str) -> Dict[str, Any]:
+    """从断点继续执行失败或中断的工作流，已完成的节点直接复用结果"""
+    journal = _require_journal()
+    run = journal.get_run(execution_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="执行记录不存在")
+    if run["status"] == "completed":
+        raise HTTPException(status_code=400, detail="执行已完成，无需继续")
+    if journal.is_active(execution_id):
+        raise HTTPException(status_code=409, detail="执行正在进行中")
+
+    try:
+        workflow = workflow_manager.get_workflow(run["workflow_id"])
+        if workflow is None:
+            raise HTTPException(status_code=404, detail="工作流不存在")
+        if workflow.version != run["workflow_version"]:
+            logger.warning(
+                f"执行 {execution_id} 创建于工作流版本 {run['workflow_version']}，当前版本为 {workflow.version}"
+            )
+
+        result = await WorkflowEngine(journal=journal).execute(
+            workflow=workflow,
+            inputs=run["inputs"],
+            stream=run["stream"],
+            execution_id=execution_id,
+            completed_results=journal.load_node_results(execution_id)
+        )
+
+        return result.dict()
+    except HTTPException:
+        raise
+    except ExecutionActiveError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"继续执行工作流失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _create_batch(
+    workflow: WorkflowDefinition,
+    inputs: List[Dict[str, Any]],
+    concurrency: int,
+    rate_limit: Optional[float],
+    stream: bool,
+    batch_id: Optional[str]
+) -> StreamingResponse:
+    """创建批次并以 NDJSON 流返回执行结果"""
+    try:
+        store = BatchStore(batch_id or BatchStore.new_batch_id())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if store.exists():
+        raise HTTPException(status_code=409, detail="批次已存在，请使用 resume 接口继续执行")
+    if not inputs:
+        raise HTTPException(status_code=400, detail="输入列表不能为空")
+    if not claim_batch(store.batch_id):
+        raise HTTPException(status_code=409, detail="批次正在执行中")
+
+    try:
+        store.create(workflow, inputs, {
+            "concurrency": concurrency,
+            "rate_limit": rate_limit,
+            "stream": stream
+        })
+    except Exception:
+        release_batch(store.batch_id)
+        raise
+    # 批次在 run_batch 结束（含客户端断开）时释放
+    return StreamingResponse(
+        run_batch(workflow, store, concurrency, rate_limit, stream),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": store.batch_id}
+    )
+
+
+@router.post("/{workflow_id}/batch")
+async def execute_workflow_batch(workflow_id: str, request: BatchExecutionRequest) -> StreamingResponse:
+    """批量执行工作流，按完成顺序流式返回 NDJSON 结果"""
+    workflow = workflow_manager.get_workflow(workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流不存在")
+
+    return _create_batch(
+        workflow,
+        request.inputs,
+        request.concurrency,
+        request.rate_limit,
+        request.stream,
+        request.batch_id
+    )
+
+
+@router.post("/{workflow_id}/batch/upload")
+async def execute_workflow_batch_upload(
+    workflow_id: str,
+    file: UploadFile = File(...),
+    concurrency: int = Query(4, ge=1, le=64),
+    rate_limit: Optional[float] = Query(None, gt=0),
+    stream: bool = False,
+    batch_id: Optional[str] = None
+) -> StreamingResponse:
+    """上传 JSONL 输入文件批量执行工作流"""
+    workflow = workflow_manager.get_workflow(workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流不存在")
+
+    try:
+        inputs = parse_jsonl_inputs(await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _create_batch(workflow, inputs, concurrency, rate_limit, stream, batch_id)
+
+
+@router.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str) -> Dict[str, Any]:
+    """查询批次执行进度"""
+    try:
+        store = BatchStore(batch_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not store.exists():
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return store.summary()
+
+
+@router.post("/batches/{batch_id}/resume")
+async def resume_batch(
+    batch_id: str,
+    concurrency: Optional[int] = Query(None, ge=1, le=64),
+    rate_limit: Optional[float] = Query(None, gt=0)
+) -> StreamingResponse:
+    """继续执行批次中未完成或失败的输入"""
+    try:
+        store = BatchStore(batch_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not store.exists():
+        raise HTTPException(status_code=404, detail="批次不存在")
+
+    meta = store.load_meta()
+    workflow = workflow_manager.get_workflow(meta["workflow_id"])
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流不存在")
+    if workflow.version != meta.get("workflow_version"):
+        logger.warning(
+            f"批次 {batch_id} 创建于工作流版本 {meta.get('workflow_version')}，当前版本为 {workflow.version}"
+        )
+
+    concurrency = concurrency or meta.get("concurrency", 4)
+    rate_limit = rate_limit if rate_limit is not None else meta.get("rate_limit")
+    # 原批次的结果流仍在执行时，续跑会重复执行同一批输入
+    if not claim_batch(batch_id):
+        raise HTTPException(status_code=409, detail="批次正在执行中")
+
+    return StreamingResponse(
+        run_batch(workflow, store, concurrency, rate_limit, meta.get("stream", False)),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": store.batch_id}
+    )
+
+
 @router.get("/templates/{template_name}")
 async def get_workflow_template(template_name: str) -> Dict[str, Any]:
     """获取工作流模板"""
@@ -345,27 +584,3 @@ async def get_workflow_template(template_name: str) -> Dict[str, Any]:
         raise HTTPException(status_code=404, detail="模板不存在")
 
     return templates[template_name]
-
-
-@router.get("/configs")
-async def get_configs() -> Dict[str, List[Dict[str, Any]]]:
-    """获取所有配置预设"""
-    try:
-        load_dotenv(override=True)
-        configs = []
-        for key in os.environ:
-            if key.startswith("PROXY_BASE_URL_"):
-                config_name = key.replace("PROXY_BASE_URL_", "")
-                base_url = os.getenv(key)
-                api_key = os.getenv(f"PROXY_API_KEY_{config_name}", "")
-                
-                configs.append({
-                    "name": config_name,
-                    "api_url": base_url,
-                    "api_key": api_key
-                })
-        
-        return {"configs": sorted(configs, key=lambda x: x["name"])}
-    except Exception as e:
-        logger.error(f"获取配置列表失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
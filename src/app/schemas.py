@@ -3,7 +3,7 @@
 Pydantic 数据模型定义
 包含所有 API 请求/响应模型
 """
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Literal
 
 from pydantic import BaseModel
 
@@ -53,14 +53,25 @@ class MessageContent(BaseModel):
 
 class ChatRequest(BaseModel):
     """聊天请求"""
-    api_url: str
-    api_key: str
+    api_url: str = ""
+    api_key: str = ""
+    # 配置预设名称，指定时覆盖 api_url / api_key
+    config_id: Optional[str] = None
     model: str
     messages: List[Dict[str, Any]]
     session_file: Optional[str] = None
+    # 增量模式：messages 只包含本轮新增的消息，之前的历史从 session_file 读取
+    delta: bool = False
     kb_id: Optional[str] = None
     stream: bool = False
     drawing_workspace_mode: bool = False
+    temperature: Optional[float] = None
+    # 响应缓存模式: off / auto / force，为空时使用 LLM_CACHE_MODE
+    cache: Optional[Literal["off", "auto", "force"]] = None
+    # 上下文策略: off / trim / summarize，为空时使用 CONTEXT_MODE
+    context_mode: Optional[Literal["off", "trim", "summarize"]] = None
+    # 检索其他会话中相关的问答（需启用 SESSION_MEMORY_ENABLED）
+    memory: bool = True
 
 
 class ModelListRequest(BaseModel):
@@ -73,11 +84,22 @@ class ModelListRequest(BaseModel):
 # 知识库相关模型
 # =============================================================================
 
+class AgentTemplate(BaseModel):
+    """
+    知识库智能体的提示词模板
+    role 中可使用 {name} 与 {description} 占位符，留空时使用默认角色
+    """
+    role: Optional[str] = None
+    constraints: List[str] = []
+    output_format: Optional[str] = None
+
+
 class CreateKBRequest(BaseModel):
     """创建知识库请求"""
     name: str
     description: str
     files: List[str]
+    agent: Optional[AgentTemplate] = None
 
 
 class DeleteKBRequest(BaseModel):
@@ -90,4 +112,5 @@ class UpdateKBRequest(BaseModel):
     kb_id: str
     name: str
     description: str
-    files: Optional[List[str]] = None
\ No newline at end of file
+    files: Optional[List[str]] = None
+    agent: Optional[AgentTemplate] = None
\ No newline at end of file
@@ -6,6 +6,7 @@ from app.workflow.schemas import (
     WorkflowDefinition,
     WorkflowExecutionRequest,
     WorkflowExecutionResult,
+    BatchExecutionRequest,
     NodeType,
     NodeData,
     LLMNodeData,
@@ -17,13 +18,14 @@ from app.workflow.schemas import (
     TemplateNodeData,
     Edge
 )
-from app.workflow.engine import WorkflowEngine, workflow_engine
+from app.workflow.engine import WorkflowEngine, CompiledWorkflow, compile_workflow, workflow_engine
 from app.workflow.manager import WorkflowManager, workflow_manager
 
 __all__ = [
     "WorkflowDefinition",
     "WorkflowExecutionRequest",
     "WorkflowExecutionResult",
+    "BatchExecutionRequest",
     "NodeType",
     "NodeData",
     "LLMNodeData",
@@ -35,6 +37,8 @@ __all__ = [
     "TemplateNodeData",
     "Edge",
     "WorkflowEngine",
+    "CompiledWorkflow",
+    "compile_workflow",
     "workflow_engine",
     "WorkflowManager",
     "workflow_manager"
@@ -0,0 +1,268 @@
+# app/workflow/batch.py
+"""
+工作流批量执行
+同一工作流只加载、编译一次，以有限并发执行多组输入并按完成顺序输出 NDJSON。
+每条结果都会追加写入批次结果文件，中断后可跳过已完成的输入继续执行。
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import datetime
+import logging
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Set, AsyncIterator
+
+from app.workflow.schemas import WorkflowDefinition
+from app.workflow.engine import WorkflowEngine, compile_workflow
+from app.workflow.manager import WORKFLOW_DIR
+from app.core.upstream_governor import PRIORITY_BATCH
+from app.core.file_lock import FileLock, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = WORKFLOW_DIR / "batches"
+BATCH_DIR.mkdir(parents=True, exist_ok=True)
+
+_BATCH_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# 本进程中正在执行的批次及其持有的文件锁
+_running_batches: Dict[str, FileLock] = {}
+
+
+def claim_batch(batch_id: str) -> bool:
+    """
+    标记批次开始执行，已在本进程或其他工作进程中执行时返回 False
+    执行期间持有 {batch_id}.lock 的文件锁，进程退出（含崩溃）时由操作系统释放
+    """
+    # 文件锁在同一线程内可重入，本进程内的重复执行由 _running_batches 识别
+    if batch_id in _running_batches:
+        return False
+    lock = FileLock(BATCH_DIR / f"{batch_id}.lock")
+    if not lock.acquire(blocking=False):
+        return False
+    _running_batches[batch_id] = lock
+    return True
+
+
+def release_batch(batch_id: str) -> None:
+    """标记批次执行结束"""
+    lock = _running_batches.pop(batch_id, None)
+    if lock is not None:
+        lock.release()
+
+
+class UpstreamRateLimiter:
+    """
+    按上游主机划分的令牌桶限流器
+    每个主机独立计数，桶满时允许 burst 个请求瞬时通过
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        self.rate: float = rate
+        self.capacity: float = float(burst or max(1, int(rate)))
+        self._tokens: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def acquire(self, key: str) -> None:
+        """获取一个令牌，不足时等待"""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            while True:
+                now = time.monotonic()
+                tokens = self._tokens.get(key, self.capacity)
+                last = self._updated.get(key, now)
+                tokens = min(self.capacity, tokens + (now - last) * self.rate)
+                self._updated[key] = now
+                if tokens >= 1:
+                    self._tokens[key] = tokens - 1
+                    return
+                self._tokens[key] = tokens
+                await asyncio.sleep((1 - tokens) / self.rate)
+
+
+class BatchStore:
+    """
+    批次持久化
+    - {batch_id}.meta.json: 批次元数据
+    - {batch_id}.inputs.jsonl: 输入列表，每行一组输入
+    - {batch_id}.results.jsonl: 执行结果，按完成顺序追加
+    - {batch_id}.lock: 执行期间持有的文件锁，见 claim_batch()
+    """
+
+    def __init__(self, batch_id: str) -> None:
+        if not _BATCH_ID_PATTERN.match(batch_id):
+            raise ValueError(f"非法的批次ID: {batch_id}")
+        self.batch_id: str = batch_id
+        self.meta_path: Path = BATCH_DIR / f"{batch_id}.meta.json"
+        self.inputs_path: Path = BATCH_DIR / f"{batch_id}.inputs.jsonl"
+        self.results_path: Path = BATCH_DIR / f"{batch_id}.results.jsonl"
+
+    @staticmethod
+    def new_batch_id() -> str:
+        """生成新的批次ID"""
+        return datetime.datetime.now().strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:6]
+
+    def exists(self) -> bool:
+        """批次是否已存在"""
+        return self.meta_path.exists()
+
+    def create(self, workflow: WorkflowDefinition, inputs: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+        """创建批次并保存输入"""
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        meta = {
+            "batch_id": self.batch_id,
+            "workflow_id": workflow.workflow_id,
+            "workflow_version": workflow.version,
+            "total": len(inputs),
+            "created_at": now,
+            **options
+        }
+        with open(self.inputs_path, 'w', encoding='utf-8') as f:
+            for item in inputs:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self.results_path.touch()
+        self._save_meta(meta)
+        return meta
+
+    def load_meta(self) -> Dict[str, Any]:
+        """加载批次元数据"""
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_meta(self, meta: Dict[str, Any]) -> None:
+        """保存批次元数据（原子写入，其他进程查询批次状态时不会读到写了一半的文件）"""
+        atomic_write_json(self.meta_path, meta)
+
+    def load_inputs(self) -> List[Dict[str, Any]]:
+        """加载批次输入"""
+        with open(self.inputs_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def load_results(self) -> Dict[int, Dict[str, Any]]:
+        """加载每个输入的最新执行结果"""
+        latest: Dict[int, Dict[str, Any]] = {}
+        if not self.results_path.exists():
+            return latest
+        with open(self.results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断可能留下半行，忽略即可，对应输入会被重新执行
+                    continue
+                latest[record["index"]] = record
+        return latest
+
+    def completed_indices(self) -> Set[int]:
+        """已成功完成的输入序号"""
+        return {index for index, record in self.load_results().items() if record.get("status") == "completed"}
+
+    def summary(self) -> Dict[str, Any]:
+        """批次进度汇总"""
+        meta = self.load_meta()
+        results = self.load_results()
+        completed = sum(1 for r in results.values() if r.get("status") == "completed")
+        failed = sum(1 for r in results.values() if r.get("status") != "completed")
+        return {
+            **meta,
+            "completed": completed,
+            "failed": failed,
+            "pending": meta["total"] - completed - failed
+        }
+
+
+def parse_jsonl_inputs(content: bytes) -> List[Dict[str, Any]]:
+    """解析 JSONL 格式的输入文件，每行一个 JSON 对象"""
+    inputs: List[Dict[str, Any]] = []
+    for line_no, line in enumerate(content.decode("utf-8-sig").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {line_no} 行不是合法的 JSON: {e}")
+        if not isinstance(item, dict):
+            raise ValueError(f"第 {line_no} 行必须是 JSON 对象")
+        inputs.append(item)
+    return inputs
+
+
+async def run_batch(
+    workflow: WorkflowDefinition,
+    store: BatchStore,
+    concurrency: int,
+    rate_limit: Optional[float] = None,
+    stream: bool = False
+) -> AsyncIterator[str]:
+    """
+    执行批次中尚未完成的输入
+    调用方需先通过 claim_batch() 占用批次，结束（含客户端断开）时在这里释放
+
+    Args:
+        workflow: 工作流定义
+        store: 批次存储
+        concurrency: 最大并发执行数
+        rate_limit: 每个上游主机每秒最大请求数，为空则不限流
+        stream: LLM 节点是否流式调用
+
+    Yields:
+        NDJSON 行，每行一条执行结果，最后一行为批次汇总
+    """
+    try:
+        compiled = compile_workflow(workflow)
+        limiter = UpstreamRateLimiter(rate_limit) if rate_limit else None
+
+        inputs = store.load_inputs()
+        completed = store.completed_indices()
+        pending = [i for i in range(len(inputs)) if i not in completed]
+        logger.info(f"批次 {store.batch_id}: 共 {len(inputs)} 条，待执行 {len(pending)} 条，并发 {concurrency}")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in pending:
+            queue.put_nowait(index)
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def worker() -> None:
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    # 引擎实例保存单次执行状态，并发执行时每次使用新实例
+                    engine = WorkflowEngine(rate_limiter=limiter, priority=PRIORITY_BATCH)
+                    result = await engine.execute(workflow, inputs[index], stream=stream, compiled=compiled)
+                    record = {
+                        "batch_id": store.batch_id,
+                        "index": index,
+                        "execution_id": result.execution_id,
+                        "status": result.status,
+                        "outputs": result.outputs,
+                        "error": result.error,
+                        "execution_time": result.execution_time
+                    }
+                except Exception as e:
+                    logger.error(f"批次 {store.batch_id} 第 {index} 条执行异常: {e}", exc_info=True)
+                    record = {"batch_id": store.batch_id, "index": index, "status": "failed", "error": str(e)}
+
+                line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                with open(store.results_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                await finished.put(line)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+        try:
+            for _ in range(len(pending)):
+                yield await finished.get()
+            yield json.dumps({"done": True, **store.summary()}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消剩余执行，已完成的结果已落盘，可通过 resume 继续
+            for task in workers:
+                task.cancel()
+    finally:
+        release_batch(store.batch_id)
@@ -4,15 +4,14 @@
 负责解析和执行工作流定义
 """
 import json
-import os
 import uuid
 import time
 import asyncio
 import logging
+import sqlite3
 from typing import Dict, List, Any, Optional, Set
 from collections import defaultdict
-
-from openai import OpenAI
+from urllib.parse import urlsplit
 
 from app.workflow.schemas import (
     WorkflowDefinition,
@@ -20,28 +19,106 @@ from app.workflow.schemas import (
     NodeType,
     Edge
 )
-from app.core.rag_engine import query_rag_with_filter
+from app.workflow.expressions import (
+    CompiledExpression,
+    ExpressionError,
+    ExpressionScope,
+    compile_expression
+)
+from app.workflow.journal import ExecutionJournal, ExecutionActiveError
+from app.core.rag_engine import aquery_rag_with_filter
 from app.core.kb_manager import kb_manager
+from app.core import http_client
+from app.core.config_presets import config_presets
+from app.core.llm_gateway import llm_gateway
+from app.core.upstream_governor import PRIORITY_WORKFLOW
+from app.core.code_sandbox import code_sandbox_pool, normalize_timeout, CodeExecutionError
+from app.core.metrics import workflow_node_seconds, workflow_node_errors, workflow_execution_seconds
+from app.core.tracing import tracer
+from app.core.request_timing import slow_requests
 
 logger = logging.getLogger(__name__)
 
 
+class CompiledWorkflow:
+    """
+    预编译的工作流
+    一次性构建节点索引和邻接表，供同一版本的多次执行复用
+    """
+
+    def __init__(self, workflow: WorkflowDefinition) -> None:
+        self.workflow: WorkflowDefinition = workflow
+        self.nodes_by_id: Dict[str, Dict[str, Any]] = {
+            node.get("node_id"): node for node in workflow.nodes
+        }
+        self.adjacency: Dict[str, List[Dict[str, Any]]] = WorkflowEngine._build_adjacency_list(workflow.edges)
+        self.start_node: Optional[Dict[str, Any]] = WorkflowEngine._find_start_node(workflow.nodes)
+        self.expressions: Dict[str, CompiledExpression] = {}
+        self._compile_expressions()
+
+    def _compile_expressions(self) -> None:
+        """预编译边条件和条件节点中的表达式，语法错误留到求值时记录"""
+        sources = [edge.condition for edge in self.workflow.edges if edge.condition]
+        for node in self.workflow.nodes:
+            if node.get("node_type") == NodeType.CONDITION:
+                for condition in node.get("data", {}).get("conditions", []):
+                    if condition.get("condition"):
+                        sources.append(condition["condition"])
+        for source in sources:
+            try:
+                self.expressions[source] = compile_expression(source)
+            except ExpressionError:
+                continue
+
+    def expression(self, source: str) -> CompiledExpression:
+        """获取编译后的表达式"""
+        compiled = self.expressions.get(source)
+        if compiled is None:
+            compiled = compile_expression(source)
+        return compiled
+
+
+def compile_workflow(workflow: WorkflowDefinition) -> CompiledWorkflow:
+    """编译工作流定义"""
+    return CompiledWorkflow(workflow)
+
+
 class WorkflowEngine:
     """
     工作流执行引擎
     支持节点编排、变量传递、条件分支等功能
+
+    执行状态保存在实例上，并发执行时每次执行应使用独立的实例
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        rate_limiter: Optional[Any] = None,
+        journal: Optional[ExecutionJournal] = None,
+        priority: int = PRIORITY_WORKFLOW
+    ):
         self.execution_context: Dict[str, Any] = {}
         self.node_results: Dict[str, Any] = {}
         self.visited_nodes: Set[str] = set()
+        self.compiled: Optional[CompiledWorkflow] = None
+        # 可选的上游限流器，需提供 async acquire(key) 方法
+        self.rate_limiter = rate_limiter
+        # 上游排队优先级，批量执行时低于单次执行
+        self.priority: int = priority
+        # 可选的执行日志，记录节点结果以支持断点续跑
+        self.journal: Optional[ExecutionJournal] = journal
+        self.execution_id: Optional[str] = None
+        self.completed_results: Dict[str, Any] = {}
+        self.node_timings: Dict[str, float] = {}
 
     async def execute(
         self,
         workflow: WorkflowDefinition,
         inputs: Dict[str, Any],
-        stream: bool = False
+        stream: bool = False,
+        compiled: Optional[CompiledWorkflow] = None,
+        execution_id: Optional[str] = None,
+        completed_results: Optional[Dict[str, Any]] = None
     ) -> WorkflowExecutionResult:
         """
         执行工作流
@@ -50,15 +127,41 @@ class WorkflowEngine:
             workflow: 工作流定义
             inputs: 输入变量
             stream: 是否流式输出
+            compiled: 预编译的工作流，为空时现场编译
+            execution_id: 续跑时沿用的执行ID，为空时生成新ID
+            completed_results: 续跑时已完成节点的结果，这些节点不再重复执行
 
         Returns:
             执行结果
+
+        Raises:
+            ExecutionActiveError: 续跑的执行正在进行中
         """
-        execution_id = str(uuid.uuid4())
+        resuming = execution_id is not None
+        execution_id = execution_id or str(uuid.uuid4())
+        # 同一执行同时只能运行一次，避免未完成的节点（LLM / HTTP 调用）被并发重复执行
+        if self.journal is not None and not self.journal.claim(execution_id):
+            raise ExecutionActiveError(execution_id)
+        self.execution_id = execution_id
+        self.completed_results = completed_results or {}
         start_time = time.time()
 
+        if resuming:
+            self._journal_call("mark_running", execution_id)
+        else:
+            self._journal_call("start_run", execution_id, workflow.workflow_id, workflow.version, inputs, stream)
+
+        # 节点 span 作为执行 span 的子 span
+        span = tracer.span("workflow.execute", workflow_id=workflow.workflow_id, execution_id=execution_id, resuming=resuming)
+        token = tracer.activate(span)
         try:
-            logger.info(f"开始执行工作流: {workflow.name} (ID: {execution_id})")
+            if resuming:
+                logger.info(
+                    f"继续执行工作流: {workflow.name} (ID: {execution_id}), "
+                    f"复用 {len(self.completed_results)} 个已完成节点"
+                )
+            else:
+                logger.info(f"开始执行工作流: {workflow.name} (ID: {execution_id})")
 
             # 初始化执行上下文
             self.execution_context = {
@@ -67,13 +170,15 @@ class WorkflowEngine:
                 "outputs": {}
             }
             self.node_results = {}
+            self.node_timings = {}
             self.visited_nodes = set()
 
-            # 构建节点邻接表
-            adjacency = self._build_adjacency_list(workflow.edges)
+            # 编译工作流（节点索引与邻接表）
+            self.compiled = compiled or compile_workflow(workflow)
+            adjacency = self.compiled.adjacency
 
             # 找到起始节点
-            start_node = self._find_start_node(workflow.nodes)
+            start_node = self.compiled.start_node
             if not start_node:
                 raise ValueError("未找到起始节点")
 
@@ -90,25 +195,51 @@ class WorkflowEngine:
                 status="completed",
                 outputs=outputs,
                 execution_time=execution_time,
-                node_results=self.node_results
+                node_results=self.node_results,
+                node_timings=self.node_timings
             )
 
+            self._journal_call("finish_run", execution_id, "completed")
+            workflow_execution_seconds.observe(execution_time, "completed")
+            self._record_slow(workflow, execution_id, "completed", execution_time)
+            span.end()
             logger.info(f"工作流执行完成: {workflow.name}, 耗时: {execution_time:.2f}s")
             return result
 
         except Exception as e:
             logger.error(f"工作流执行失败: {e}", exc_info=True)
             execution_time = time.time() - start_time
+            self._journal_call("finish_run", execution_id, "failed", str(e))
+            workflow_execution_seconds.observe(execution_time, "failed")
+            self._record_slow(workflow, execution_id, "failed", execution_time)
+            span.end(e)
 
             return WorkflowExecutionResult(
                 execution_id=execution_id,
                 status="failed",
                 error=str(e),
                 execution_time=execution_time,
-                node_results=self.node_results
+                node_results=self.node_results,
+                node_timings=self.node_timings
             )
+        finally:
+            tracer.deactivate(token)
+            if self.journal is not None:
+                self.journal.release(execution_id)
+
+    def _record_slow(self, workflow: WorkflowDefinition, execution_id: str, status: str, execution_time: float) -> None:
+        """执行耗时超过阈值时写入慢请求记录（各节点耗时作为分解）"""
+        slow_requests.record(
+            "workflow",
+            dict(self.node_timings),
+            execution_time * 1000,
+            workflow_id=workflow.workflow_id,
+            execution_id=execution_id,
+            status=status
+        )
 
-    def _build_adjacency_list(self, edges: List[Edge]) -> Dict[str, List[Dict[str, Any]]]:
+    @staticmethod
+    def _build_adjacency_list(edges: List[Edge]) -> Dict[str, List[Dict[str, Any]]]:
         """构建节点邻接表"""
         adjacency = defaultdict(list)
         for edge in edges:
@@ -118,7 +249,8 @@ class WorkflowEngine:
             })
         return dict(adjacency)
 
-    def _find_start_node(self, nodes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _find_start_node(nodes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         """查找起始节点"""
         for node in nodes:
             if node.get("node_type") == NodeType.START:
@@ -178,59 +310,105 @@ class WorkflowEngine:
 
         logger.info(f"执行节点: {node_id} (类型: {node_type})")
 
-        # 执行节点
+        # 执行节点，续跑时直接复用日志中的结果
         result = None
-        if node_type == NodeType.START:
-            result = await self._execute_start_node(node)
-        elif node_type == NodeType.END:
-            result = await self._execute_end_node(node)
-        elif node_type == NodeType.LLM:
-            result = await self._execute_llm_node(node, stream)
-        elif node_type == NodeType.RAG:
-            result = await self._execute_rag_node(node)
-        elif node_type == NodeType.CODE:
-            result = await self._execute_code_node(node)
-        elif node_type == NodeType.CONDITION:
-            result = await self._execute_condition_node(node)
-        elif node_type == NodeType.HTTP_REQUEST:
-            result = await self._execute_http_node(node)
-        elif node_type == NodeType.VARIABLE:
-            result = await self._execute_variable_node(node)
-        elif node_type == NodeType.TEMPLATE:
-            result = await self._execute_template_node(node)
+        if node_id in self.completed_results:
+            result = self.completed_results[node_id]
+            logger.info(f"节点 {node_id} 已在之前的执行中完成，复用结果")
         else:
-            raise ValueError(f"未知的节点类型: {node_type}")
+            type_label = str(getattr(node_type, "value", node_type))
+            started = time.perf_counter()
+            try:
+                with workflow_node_seconds.time(type_label, span="workflow.node", node_id=node_id):
+                    result = await self._execute_node_by_type(node, node_type, stream)
+            except Exception:
+                workflow_node_errors.inc(type_label)
+                raise
+            finally:
+                self.node_timings[node_id] = round((time.perf_counter() - started) * 1000, 1)
 
         # 保存节点结果
         self.node_results[node_id] = result
+        if node_id not in self.completed_results:
+            self._journal_call("record_node", self.execution_id, node_id, result)
 
         # 执行后续节点
         if node_type != NodeType.END:
-            next_edges = adjacency.get(node_id, [])
-            for edge_info in next_edges:
-                next_node_id = edge_info["target"]
+            next_nodes = []
+            for edge_info in adjacency.get(node_id, []):
                 condition = edge_info.get("condition")
 
                 # 检查条件
-                if condition:
-                    if self._evaluate_condition(condition):
-                        next_node = self._find_node_by_id(workflow.nodes, next_node_id)
-                        if next_node:
-                            await self._execute_node(next_node, workflow, adjacency, stream)
-                else:
-                    next_node = self._find_node_by_id(workflow.nodes, next_node_id)
-                    if next_node:
-                        await self._execute_node(next_node, workflow, adjacency, stream)
+                if condition and not self._evaluate_condition(condition):
+                    continue
+                next_node = self._find_node_by_id(workflow.nodes, edge_info["target"])
+                if next_node:
+                    next_nodes.append(next_node)
+
+            if len(next_nodes) == 1:
+                await self._execute_node(next_nodes[0], workflow, adjacency, stream)
+            elif next_nodes:
+                # 分支之间互不依赖，并发执行
+                tasks = [
+                    asyncio.create_task(self._execute_node(next_node, workflow, adjacency, stream))
+                    for next_node in next_nodes
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    raise
 
         return result
 
+    async def _execute_node_by_type(self, node: Dict[str, Any], node_type: Any, stream: bool) -> Any:
+        """按节点类型执行节点"""
+        if node_type == NodeType.START:
+            return await self._execute_start_node(node)
+        elif node_type == NodeType.END:
+            return await self._execute_end_node(node)
+        elif node_type == NodeType.LLM:
+            return await self._execute_llm_node(node, stream)
+        elif node_type == NodeType.RAG:
+            return await self._execute_rag_node(node)
+        elif node_type == NodeType.CODE:
+            return await self._execute_code_node(node)
+        elif node_type == NodeType.CONDITION:
+            return await self._execute_condition_node(node)
+        elif node_type == NodeType.HTTP_REQUEST:
+            return await self._execute_http_node(node)
+        elif node_type == NodeType.VARIABLE:
+            return await self._execute_variable_node(node)
+        elif node_type == NodeType.TEMPLATE:
+            return await self._execute_template_node(node)
+        else:
+            raise ValueError(f"未知的节点类型: {node_type}")
+
+    def _journal_call(self, method: str, *args: Any) -> None:
+        """写入执行日志，日志失败只记录警告，不影响工作流执行"""
+        if self.journal is None:
+            return
+        try:
+            getattr(self.journal, method)(*args)
+        except sqlite3.Error as e:
+            logger.warning(f"写入执行日志失败 ({method}): {e}")
+
     def _find_node_by_id(self, nodes: List[Dict[str, Any]], node_id: str) -> Optional[Dict[str, Any]]:
         """根据ID查找节点"""
+        if self.compiled is not None:
+            return self.compiled.nodes_by_id.get(node_id)
         for node in nodes:
             if node.get("node_id") == node_id:
                 return node
         return None
 
+    async def _acquire_upstream(self, url: str) -> None:
+        """在访问上游服务前按主机限流"""
+        if self.rate_limiter is None:
+            return
+        await self.rate_limiter.acquire(urlsplit(url).netloc or url)
+
     async def _execute_start_node(self, node: Dict[str, Any]) -> Dict[str, Any]:
         """执行起始节点"""
         return {"status": "started"}
@@ -244,23 +422,17 @@ class WorkflowEngine:
         data = node.get("data", {})
         config_id = data.get("config_id", "")
         
-        # 从配置预设加载配置
-        if config_id:
-            from dotenv import load_dotenv
-            load_dotenv(override=True)
-            
-            base_url = os.getenv(f"PROXY_BASE_URL_{config_id}")
-            api_key = os.getenv(f"PROXY_API_KEY_{config_id}", "")
-            
-            if base_url:
-                model = data.get("model", "gpt-3.5-turbo")
-                api_url = base_url
-            else:
-                model = data.get("model", "gpt-3.5-turbo")
-                api_url = data.get("api_url", "https://api.openai.com/v1")
-                api_key = data.get("api_key", "")
+        # 从配置预设或上游组加载配置，都不存在时使用节点自身的配置
+        model = data.get("model", "gpt-3.5-turbo")
+        preset = config_presets.get(config_id) if config_id else None
+        group = None
+        if preset:
+            api_url = preset["base_url"]
+            api_key = preset["api_key"]
+        elif config_id and config_presets.group(config_id) is not None:
+            group = config_id
+            api_url, api_key = "", ""
         else:
-            model = data.get("model", "gpt-3.5-turbo")
             api_url = data.get("api_url", "https://api.openai.com/v1")
             api_key = data.get("api_key", "")
         
@@ -284,14 +456,8 @@ class WorkflowEngine:
         if user_message:
             messages.append({"role": "user", "content": user_message})
 
-        client = OpenAI(base_url=api_url, api_key=api_key)
-
         # 构建请求参数
-        request_params = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature
-        }
+        request_params = {"temperature": temperature}
         
         if max_tokens:
             request_params["max_tokens"] = max_tokens
@@ -311,21 +477,26 @@ class WorkflowEngine:
             except json.JSONDecodeError as e:
                 logger.warning(f"结构化输出 Schema 解析失败: {e}")
 
+        await self._acquire_upstream(api_url or f"group:{group}")
+
+        upstream = {
+            "base_url": api_url,
+            "api_key": api_key,
+            "model": model,
+            "messages": messages,
+            "params": request_params,
+            "cache": data.get("cache"),
+            "priority": self.priority,
+            "group": group
+        }
         if stream:
             # 流式输出
             full_content = ""
-            stream_response = client.chat.completions.create(
-                **request_params,
-                stream=True
-            )
-            for chunk in stream_response:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    full_content += content
+            async for content in llm_gateway.stream(**upstream):
+                full_content += content
             return full_content
         else:
-            response = client.chat.completions.create(**request_params)
-            return response.choices[0].message.content
+            return await llm_gateway.complete(**upstream)
 
     async def _execute_rag_node(self, node: Dict[str, Any]) -> str:
         """执行 RAG 节点"""
@@ -346,30 +517,26 @@ class WorkflowEngine:
 
         # 执行 RAG 查询
         if all_files:
-            context = query_rag_with_filter(query, all_files, n_results=top_k)
+            context = await aquery_rag_with_filter(query, all_files, n_results=top_k)
             return context
         else:
             return ""
 
     async def _execute_code_node(self, node: Dict[str, Any]) -> Any:
-        """执行代码节点"""
+        """执行代码节点（在沙箱 worker 进程中运行）"""
         data = node.get("data", {})
         code = data.get("code", "")
-        timeout = data.get("timeout", 30)
-
-        # 准备执行环境
-        exec_globals = {
-            "__builtins__": {},
-            "context": self.execution_context,
-            "results": self.node_results,
-            "inputs": self.execution_context.get("inputs", {})
-        }
+        timeout = normalize_timeout(data.get("timeout"))
 
         try:
-            # 执行代码
-            exec(code, exec_globals)
-            return exec_globals.get("output")
-        except Exception as e:
+            return await code_sandbox_pool.run(
+                code,
+                context=self.execution_context,
+                results=self.node_results,
+                inputs=self.execution_context.get("inputs", {}),
+                timeout=timeout
+            )
+        except CodeExecutionError as e:
             logger.error(f"代码节点执行失败: {e}")
             raise
 
@@ -391,47 +558,47 @@ class WorkflowEngine:
     def _evaluate_condition(self, condition: str) -> bool:
         """评估条件表达式"""
         try:
-            # 解析变量
-            resolved_condition = self._resolve_variables(condition)
-
-            # 简单的条件评估
-            # 注意：生产环境应该使用更安全的表达式评估器
-            return bool(eval(resolved_condition, {"__builtins__": {}}))
-        except Exception as e:
+            if self.compiled is not None:
+                expression = self.compiled.expression(condition)
+            else:
+                expression = compile_expression(condition)
+            scope = ExpressionScope(
+                self.node_results,
+                self.execution_context.get("inputs", {}),
+                self.execution_context.get("variables", {})
+            )
+            return expression.test(scope)
+        except (ExpressionError, TypeError, ValueError) as e:
+            # 变量缺失或类型不符时走默认分支，而不是中断整个执行
             logger.error(f"条件评估失败: {e}")
             return False
 
     async def _execute_http_node(self, node: Dict[str, Any]) -> Dict[str, Any]:
         """执行 HTTP 请求节点"""
-        import requests
-
         data = node.get("data", {})
         url = self._resolve_variables(data.get("url", ""))
         method = data.get("method", "GET").upper()
         headers = data.get("headers", {})
         body = data.get("body")
-        timeout = data.get("timeout", 30)
+        timeout = normalize_timeout(data.get("timeout"))
+        retries = data.get("retries", 2)
 
         # 解析变量
         headers = {k: self._resolve_variables(v) for k, v in headers.items()}
         if body:
             body = json.loads(self._resolve_variables(json.dumps(body)))
 
-        # 发送请求
-        response = requests.request(
+        # 发送请求（共享连接池，不阻塞事件循环）
+        await self._acquire_upstream(url)
+        return await http_client.request(
             method=method,
             url=url,
             headers=headers,
-            json=body,
-            timeout=timeout
+            json_body=body,
+            timeout=timeout,
+            retries=retries
         )
 
-        return {
-            "status_code": response.status_code,
-            "headers": dict(response.headers),
-            "body": response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text
-        }
-
     async def _execute_variable_node(self, node: Dict[str, Any]) -> Any:
         """执行变量节点"""
         data = node.get("data", {})
@@ -0,0 +1,378 @@
+# app/workflow/expressions.py
+"""
+条件表达式语言
+将条件字符串解析一次并编译为闭包，求值时直接读取变量绑定，不再做文本替换和 eval()
+
+支持的语法：
+- 字面量: 数字、'字符串' / "字符串"、true / false / null（兼容 True / False / None）、[列表]
+- 变量: {{name}}、{{node.field}} 或裸标识符 name
+- 字段访问: a.b、a["b"]、a[0]，字符串形式的 JSON 会按需解析
+- 比较: == != < <= > >=，成员判断: in / not in
+- 逻辑: and / or / not（兼容 && / || / !），括号分组
+- 字符串中的 {{name}} 会被插值，兼容旧写法 '{{user_type}}' == 'admin'
+"""
+import re
+import json
+import operator
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+Evaluator = Callable[["ExpressionScope"], Any]
+
+
+class ExpressionError(ValueError):
+    """表达式语法或求值错误"""
+
+
+class ExpressionScope:
+    """
+    表达式求值时的变量绑定
+    查找顺序与模板变量解析一致：节点结果 > 输入 > 全局变量
+    """
+
+    __slots__ = ("layers",)
+
+    def __init__(self, *layers: Dict[str, Any]) -> None:
+        self.layers: Tuple[Dict[str, Any], ...] = layers
+
+    def lookup(self, name: str) -> Any:
+        """按名称查找变量，支持 a.b.c 形式的路径"""
+        for layer in self.layers:
+            if name in layer:
+                return layer[name]
+        if "." in name:
+            head, *path = name.split(".")
+            value = self.lookup(head)
+            for key in path:
+                value = get_field(value, key)
+            return value
+        return None
+
+
+def get_field(value: Any, key: Any) -> Any:
+    """读取字段或下标，只允许访问 dict / list / JSON 字符串"""
+    if isinstance(value, str) and value[:1] in ("{", "["):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    try:
+        if isinstance(value, dict):
+            return value.get(key)
+        if isinstance(value, (list, tuple)):
+            return value[int(key)]
+    except (TypeError, ValueError, IndexError):
+        # 不可哈希的键、非整数下标、越界
+        return None
+    return None
+
+
+# =============================================================================
+# 词法分析
+# =============================================================================
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<var>\{\{\s*(?P<var_name>[^{}]+?)\s*\}\})
+  | (?P<number>\d+\.\d*|\.\d+|\d+)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<op>==|!=|<=|>=|&&|\|\||[<>!()\[\].,-])
+  | (?P<name>[^\W\d]\w*)
+""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "in", "true", "false", "null", "True", "False", "None"}
+_TEMPLATE_PATTERN = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    """将表达式拆分为 (类型, 值) 列表"""
+    tokens: List[Tuple[str, Any]] = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise ExpressionError(f"无法识别的字符 '{text[pos]}' (位置 {pos})")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == "ws":
+            continue
+        if kind == "var":
+            tokens.append(("var", match.group("var_name")))
+        elif kind == "number":
+            raw = match.group("number")
+            tokens.append(("literal", float(raw) if "." in raw else int(raw)))
+        elif kind == "string":
+            raw = match.group("string")
+            tokens.append(("string", _unescape(raw[1:-1])))
+        elif kind == "name":
+            word = match.group("name")
+            tokens.append(("kw", word) if word in _KEYWORDS else ("name", word))
+        else:
+            tokens.append(("op", match.group("op")))
+    tokens.append(("end", None))
+    return tokens
+
+
+def _unescape(text: str) -> str:
+    """处理字符串中的反斜杠转义"""
+    return re.sub(r"\\(.)", lambda m: {"n": "\n", "t": "\t"}.get(m.group(1), m.group(1)), text)
+
+
+# =============================================================================
+# 语法分析 + 编译
+# =============================================================================
+
+def _coerce_pair(left: Any, right: Any) -> Tuple[Any, Any]:
+    """数字与数字字符串比较时，将字符串转换为数字（兼容旧的文本替换语义）"""
+    def is_number(v: Any) -> bool:
+        return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+    if is_number(left) and isinstance(right, str):
+        try:
+            return left, float(right)
+        except ValueError:
+            return left, right
+    if is_number(right) and isinstance(left, str):
+        try:
+            return float(left), right
+        except ValueError:
+            return left, right
+    return left, right
+
+
+def _compare(op: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    """包装比较运算，先做类型协调；无法比较时视为不成立"""
+    def compare(left: Any, right: Any) -> bool:
+        left, right = _coerce_pair(left, right)
+        try:
+            return op(left, right)
+        except TypeError:
+            return False
+    return compare
+
+
+def _negate(value: Any) -> Any:
+    """一元负号，数字字符串按数字处理（兼容旧的文本替换语义）"""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    try:
+        return -value
+    except TypeError:
+        raise ExpressionError(f"无法对 {type(value).__name__} 取负") from None
+
+
+def _contains(item: Any, container: Any) -> bool:
+    """in 运算，容器为空或不可迭代时返回 False"""
+    if container is None:
+        return False
+    if isinstance(container, str) and not isinstance(item, str):
+        item = str(item)
+    try:
+        return item in container
+    except TypeError:
+        return False
+
+
+_COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": _compare(operator.eq),
+    "!=": _compare(operator.ne),
+    "<": _compare(operator.lt),
+    "<=": _compare(operator.le),
+    ">": _compare(operator.gt),
+    ">=": _compare(operator.ge),
+    "in": _contains,
+    "not in": lambda item, container: not _contains(item, container),
+}
+
+
+class _Parser:
+    """递归下降解析器，直接生成求值闭包"""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def _peek(self) -> Tuple[str, Any]:
+        return self.tokens[self.pos]
+
+    def _next(self) -> Tuple[str, Any]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _accept(self, kind: str, value: Any = None) -> bool:
+        token = self._peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value: Any) -> None:
+        if not self._accept(kind, value):
+            raise ExpressionError(f"表达式 '{self.text}' 缺少 '{value}'")
+
+    def parse(self) -> Evaluator:
+        evaluator = self._or()
+        if self._peek()[0] != "end":
+            raise ExpressionError(f"表达式 '{self.text}' 存在多余内容: {self._peek()[1]}")
+        return evaluator
+
+    def _or(self) -> Evaluator:
+        left = self._and()
+        while self._accept("kw", "or") or self._accept("op", "||"):
+            right = self._and()
+            left = (lambda a, b: lambda s: bool(a(s)) or bool(b(s)))(left, right)
+        return left
+
+    def _and(self) -> Evaluator:
+        left = self._not()
+        while self._accept("kw", "and") or self._accept("op", "&&"):
+            right = self._not()
+            left = (lambda a, b: lambda s: bool(a(s)) and bool(b(s)))(left, right)
+        return left
+
+    def _not(self) -> Evaluator:
+        if self._accept("kw", "not") or self._accept("op", "!"):
+            operand = self._not()
+            return lambda s: not operand(s)
+        return self._comparison()
+
+    def _comparison_operator(self) -> Optional[str]:
+        kind, value = self._peek()
+        if kind == "op" and value in ("==", "!=", "<", "<=", ">", ">="):
+            self.pos += 1
+            return value
+        if kind == "kw" and value == "in":
+            self.pos += 1
+            return "in"
+        if kind == "kw" and value == "not" and self.tokens[self.pos + 1] == ("kw", "in"):
+            self.pos += 2
+            return "not in"
+        return None
+
+    def _comparison(self) -> Evaluator:
+        left = self._postfix()
+        # 与 Python 一致支持链式比较：a < b < c
+        steps: List[Tuple[Callable[[Any, Any], bool], Evaluator]] = []
+        while True:
+            op = self._comparison_operator()
+            if op is None:
+                break
+            steps.append((_COMPARISONS[op], self._postfix()))
+        if not steps:
+            return left
+
+        def evaluate(scope: "ExpressionScope") -> bool:
+            current = left(scope)
+            for compare, operand in steps:
+                value = operand(scope)
+                if not compare(current, value):
+                    return False
+                current = value
+            return True
+
+        return evaluate
+
+    def _postfix(self) -> Evaluator:
+        value = self._primary()
+        while True:
+            if self._accept("op", "."):
+                kind, name = self._next()
+                if kind not in ("name", "kw"):
+                    raise ExpressionError(f"表达式 '{self.text}' 中 '.' 后应为字段名")
+                value = (lambda v, k: lambda s: get_field(v(s), k))(value, name)
+            elif self._accept("op", "["):
+                key = self._or()
+                self._expect("op", "]")
+                value = (lambda v, k: lambda s: get_field(v(s), k(s)))(value, key)
+            else:
+                return value
+
+    def _primary(self) -> Evaluator:
+        kind, value = self._next()
+        if kind == "literal":
+            return lambda s: value
+        if kind == "string":
+            return _compile_string(value)
+        if kind == "var" or kind == "name":
+            name = value.strip()
+            return lambda s: s.lookup(name)
+        if kind == "kw":
+            if value in ("true", "True"):
+                return lambda s: True
+            if value in ("false", "False"):
+                return lambda s: False
+            if value in ("null", "None"):
+                return lambda s: None
+        if kind == "op" and value == "(":
+            inner = self._or()
+            self._expect("op", ")")
+            return inner
+        if kind == "op" and value == "[":
+            items: List[Evaluator] = []
+            if not self._accept("op", "]"):
+                while True:
+                    items.append(self._or())
+                    if self._accept("op", "]"):
+                        break
+                    self._expect("op", ",")
+            return lambda s: [item(s) for item in items]
+        if kind == "op" and value == "-":
+            operand = self._primary()
+            return lambda s: _negate(operand(s))
+        if kind == "end":
+            raise ExpressionError(f"表达式 '{self.text}' 意外结束")
+        raise ExpressionError(f"表达式 '{self.text}' 在 '{value}' 处语法错误")
+
+
+def _compile_string(text: str) -> Evaluator:
+    """字符串字面量，包含 {{name}} 时编译为插值模板"""
+    parts = _TEMPLATE_PATTERN.split(text)
+    if len(parts) == 1:
+        return lambda s: text
+    # split 结果中奇数位为变量名
+    names = parts[1::2]
+    literals = parts[0::2]
+
+    def render(scope: ExpressionScope) -> str:
+        out = [literals[0]]
+        for name, literal in zip(names, literals[1:]):
+            value = scope.lookup(name)
+            out.append("" if value is None else str(value))
+            out.append(literal)
+        return "".join(out)
+
+    return render
+
+
+class CompiledExpression:
+    """编译后的条件表达式"""
+
+    __slots__ = ("source", "_evaluator")
+
+    def __init__(self, source: str, evaluator: Evaluator) -> None:
+        self.source: str = source
+        self._evaluator: Evaluator = evaluator
+
+    def evaluate(self, scope: ExpressionScope) -> Any:
+        """求值，返回原始结果"""
+        return self._evaluator(scope)
+
+    def test(self, scope: ExpressionScope) -> bool:
+        """求值并转换为布尔值"""
+        return bool(self._evaluator(scope))
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(source: str) -> CompiledExpression:
+    """
+    编译条件表达式（结果按源码缓存）
+
+    Raises:
+        ExpressionError: 语法错误
+    """
+    return CompiledExpression(source, _Parser(source).parse())
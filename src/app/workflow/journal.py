@@ -0,0 +1,270 @@
+# app/workflow/journal.py
+"""
+工作流执行日志
+每个节点完成时将结果写入 SQLite，执行失败或进程中断后可以从断点继续，
+已完成的节点（如昂贵的 LLM 调用）直接复用日志中的结果。
+按保留天数和最大条数清理旧记录，保证日志大小有界。
+"""
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from app.config import (
+    WORKFLOW_JOURNAL_ENABLED,
+    WORKFLOW_JOURNAL_MAX_AGE_DAYS,
+    WORKFLOW_JOURNAL_MAX_RUNS
+)
+from app.workflow.manager import WORKFLOW_DIR
+from app.core.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH: Path = WORKFLOW_DIR / "journal.db"
+
+# 每新建多少次执行触发一次保留策略清理
+_PRUNE_INTERVAL = 100
+
+_SAFE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    execution_id TEXT PRIMARY KEY,
+    workflow_id TEXT NOT NULL,
+    workflow_version INTEGER,
+    inputs TEXT NOT NULL,
+    stream INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_updated ON runs(updated_at);
+CREATE INDEX IF NOT EXISTS idx_runs_workflow ON runs(workflow_id, updated_at);
+CREATE TABLE IF NOT EXISTS node_results (
+    execution_id TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    result TEXT,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (execution_id, node_id)
+);
+"""
+
+
+class ExecutionActiveError(Exception):
+    """执行正在进行中，不能同时再继续一次"""
+
+    def __init__(self, execution_id: str) -> None:
+        super().__init__(f"执行 {execution_id} 正在进行中")
+        self.execution_id: str = execution_id
+
+
+class ExecutionJournal:
+    """
+    基于 SQLite 的执行日志
+    runs 表记录每次执行的输入和状态，node_results 表记录已完成节点的结果
+    执行期间持有 <db>.locks/<execution_id>.lock 的文件锁，多个工作进程共享同一个日志时
+    也不会同时执行同一个 execution_id；进程退出（含崩溃）时锁由操作系统释放
+    """
+
+    def __init__(self, db_path: Path, max_age_days: int, max_runs: int) -> None:
+        self.db_path: Path = db_path
+        self.max_age_days: int = max_age_days
+        self.max_runs: int = max_runs
+        self._lock = threading.Lock()
+        self._runs_since_prune: int = 0
+        self.lock_dir: Path = db_path.with_suffix(".locks")
+        # 本进程中正在执行的 execution_id 及其持有的文件锁
+        self._active: Dict[str, FileLock] = {}
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.recover_interrupted()
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _lock_path(self, execution_id: str) -> Path:
+        name = execution_id if _SAFE_ID_PATTERN.match(execution_id) else hashlib.sha256(execution_id.encode("utf-8")).hexdigest()
+        return self.lock_dir / f"{name}.lock"
+
+    def claim(self, execution_id: str) -> bool:
+        """标记执行开始，已在本进程或其他工作进程中进行时返回 False"""
+        with self._lock:
+            # 文件锁在同一线程内可重入，本进程内的重复执行由 _active 识别
+            if execution_id in self._active:
+                return False
+            lock = FileLock(self._lock_path(execution_id))
+            if not lock.acquire(blocking=False):
+                return False
+            self._active[execution_id] = lock
+            return True
+
+    def release(self, execution_id: str) -> None:
+        """标记执行结束"""
+        with self._lock:
+            lock = self._active.pop(execution_id, None)
+        if lock is not None:
+            lock.release()
+
+    def is_active(self, execution_id: str) -> bool:
+        """执行是否正在进行（本进程或其他工作进程）"""
+        if execution_id in self._active:
+            return True
+        lock = FileLock(self._lock_path(execution_id))
+        if lock.acquire(blocking=False):
+            lock.release()
+            return False
+        return True
+
+    def start_run(self, execution_id: str, workflow_id: str, workflow_version: int, inputs: Dict[str, Any], stream: bool) -> None:
+        """记录一次新的执行"""
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, 'running', NULL, ?, ?)",
+            (execution_id, workflow_id, workflow_version, json.dumps(inputs, ensure_ascii=False, default=str), int(stream), now, now)
+        )
+        self._runs_since_prune += 1
+        if self._runs_since_prune >= _PRUNE_INTERVAL:
+            self.prune()
+
+    def mark_running(self, execution_id: str) -> None:
+        """标记执行重新开始（断点续跑）"""
+        self._execute(
+            "UPDATE runs SET status = 'running', error = NULL, updated_at = ? WHERE execution_id = ?",
+            (time.time(), execution_id)
+        )
+
+    def record_node(self, execution_id: str, node_id: str, result: Any) -> None:
+        """记录节点结果"""
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO node_results VALUES (?, ?, ?, ?)",
+            (execution_id, node_id, json.dumps(result, ensure_ascii=False, default=str), now)
+        )
+
+    def finish_run(self, execution_id: str, status: str, error: Optional[str] = None) -> None:
+        """记录执行结束状态"""
+        self._execute(
+            "UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE execution_id = ?",
+            (status, error, time.time(), execution_id)
+        )
+
+    def get_run(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """获取执行记录"""
+        row = self._execute(
+            "SELECT execution_id, workflow_id, workflow_version, inputs, stream, status, error, created_at, updated_at "
+            "FROM runs WHERE execution_id = ?",
+            (execution_id,)
+        ).fetchone()
+        return self._row_to_run(row) if row else None
+
+    def list_runs(self, workflow_id: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """按更新时间倒序列出执行记录"""
+        sql = (
+            "SELECT execution_id, workflow_id, workflow_version, inputs, stream, status, error, created_at, updated_at "
+            "FROM runs WHERE 1 = 1"
+        )
+        params: List[Any] = []
+        if workflow_id:
+            sql += " AND workflow_id = ?"
+            params.append(workflow_id)
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._row_to_run(row) for row in self._execute(sql, tuple(params)).fetchall()]
+
+    def load_node_results(self, execution_id: str) -> Dict[str, Any]:
+        """加载已完成节点的结果"""
+        rows = self._execute(
+            "SELECT node_id, result FROM node_results WHERE execution_id = ? ORDER BY completed_at",
+            (execution_id,)
+        ).fetchall()
+        return {node_id: json.loads(result) for node_id, result in rows}
+
+    def recover_interrupted(self) -> int:
+        """
+        将已无进程执行的 'running' 记录标记为 'interrupted'，返回标记的执行数
+        进程崩溃或重启时中断的执行否则会一直停留在 'running'，既不会被清理，也无法与进行中的执行区分
+        """
+        rows = self._execute("SELECT execution_id FROM runs WHERE status = 'running'").fetchall()
+        recovered = 0
+        for (execution_id,) in rows:
+            # 占用成功说明没有任何进程在执行它；占用期间更新，避免与同时开始的续跑交错
+            if not self.claim(execution_id):
+                continue
+            try:
+                cursor = self._execute(
+                    "UPDATE runs SET status = 'interrupted', error = ?, updated_at = ? "
+                    "WHERE execution_id = ? AND status = 'running'",
+                    ("执行被中断（进程退出）", time.time(), execution_id)
+                )
+                recovered += cursor.rowcount
+            finally:
+                self.release(execution_id)
+        if recovered:
+            logger.info(f"执行日志: {recovered} 条中断的执行已标记为 interrupted")
+        return recovered
+
+    def prune(self) -> int:
+        """按保留策略删除旧的执行记录，返回删除的执行数"""
+        self._runs_since_prune = 0
+        self.recover_interrupted()
+        expire_before = time.time() - self.max_age_days * 86400
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN")
+            try:
+                # 超过保留天数的已结束执行，以及超出最大条数的最旧已结束执行（进行中的执行不删除）
+                cursor.execute(
+                    "SELECT execution_id FROM runs WHERE status != 'running' AND updated_at < ?",
+                    (expire_before,)
+                )
+                expired = {row[0] for row in cursor.fetchall()}
+                cursor.execute(
+                    "SELECT execution_id FROM runs WHERE status != 'running' ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                    (self.max_runs,)
+                )
+                expired.update(row[0] for row in cursor.fetchall())
+                for execution_id in expired:
+                    cursor.execute("DELETE FROM node_results WHERE execution_id = ?", (execution_id,))
+                    cursor.execute("DELETE FROM runs WHERE execution_id = ?", (execution_id,))
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        for execution_id in expired:
+            self._lock_path(execution_id).unlink(missing_ok=True)
+        if expired:
+            logger.info(f"执行日志清理: 删除 {len(expired)} 条过期记录")
+        return len(expired)
+
+    @staticmethod
+    def _row_to_run(row: tuple) -> Dict[str, Any]:
+        return {
+            "execution_id": row[0],
+            "workflow_id": row[1],
+            "workflow_version": row[2],
+            "inputs": json.loads(row[3]),
+            "stream": bool(row[4]),
+            "status": row[5],
+            "error": row[6],
+            "created_at": row[7],
+            "updated_at": row[8]
+        }
+
+
+# 模块级单例，关闭日志时为 None
+execution_journal: Optional[ExecutionJournal] = (
+    ExecutionJournal(JOURNAL_PATH, WORKFLOW_JOURNAL_MAX_AGE_DAYS, WORKFLOW_JOURNAL_MAX_RUNS)
+    if WORKFLOW_JOURNAL_ENABLED else None
+)
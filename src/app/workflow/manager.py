@@ -2,18 +2,39 @@
 """
 工作流管理器
 负责工作流的创建、查询、删除和持久化
+
+解析后的工作流定义按文件修改时间缓存；列表查询使用持久化的摘要索引
+（workflows/.index.json），只有变化的文件才会被重新读取
 """
+import os
 import json
 import uuid
+import logging
 import datetime
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.core.file_lock import file_lock, atomic_write_json
+from app.workflow.schemas import WorkflowDefinition, Edge
 
-from app.workflow.schemas import WorkflowDefinition
+logger = logging.getLogger(__name__)
 
 WORKFLOW_DIR = Path("workflows")
 WORKFLOW_DIR.mkdir(parents=True, exist_ok=True)
 
+INDEX_FILE = WORKFLOW_DIR / ".index.json"
+INDEX_VERSION = 1
+
+# 内存中最多缓存的工作流定义数量
+DEFINITION_CACHE_SIZE = 512
+
+SUMMARY_FIELDS = ("workflow_id", "name", "description", "version", "created_at", "updated_at")
+SORT_FIELDS = ("updated_at", "created_at", "name", "version")
+
+# 文件版本标识：(mtime_ns, size)
+FileStamp = Tuple[int, int]
+
 
 class WorkflowManager:
     """
@@ -23,6 +44,11 @@ class WorkflowManager:
 
     def __init__(self) -> None:
         self.workflow_dir: Path = WORKFLOW_DIR
+        self.index_file: Path = INDEX_FILE
+        self._definitions: "OrderedDict[str, Tuple[FileStamp, WorkflowDefinition]]" = OrderedDict()
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        # 写入工作流文件与索引时持有（多进程部署时各进程共享同一目录）
+        self._lock = file_lock(self.index_file)
 
     def _get_workflow_path(self, workflow_id: str) -> Path:
         """获取工作流文件路径"""
@@ -78,30 +104,94 @@ class WorkflowManager:
             工作流定义，不存在则返回 None
         """
         file_path = self._get_workflow_path(workflow_id)
-        if not file_path.exists():
+        stamp = self._file_stamp(file_path)
+        if stamp is None:
+            self._definitions.pop(workflow_id, None)
             return None
 
+        cached = self._definitions.get(workflow_id)
+        if cached is not None and cached[0] == stamp:
+            self._definitions.move_to_end(workflow_id)
+            return cached[1]
+
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
 
-        return WorkflowDefinition(**data)
+        workflow = WorkflowDefinition(**data)
+        self._cache_definition(workflow_id, stamp, workflow)
+        return workflow
 
-    def list_workflows(self) -> Dict[str, WorkflowDefinition]:
+    def list_workflows(
+        self,
+        query: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Dict[str, WorkflowDefinition]:
         """
-        列出所有工作流
+        列出工作流
+
+        Args:
+            query: 按名称或描述过滤（不区分大小写）
+            offset: 分页偏移
+            limit: 每页数量，为空时返回全部
 
         Returns:
             工作流ID到工作流定义的映射
         """
+        summaries, _ = self.list_summaries(query=query, offset=offset, limit=limit)
         workflows = {}
-        for file_path in self.workflow_dir.glob("*.json"):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                workflow = WorkflowDefinition(**data)
+        for summary in summaries:
+            workflow = self.get_workflow(summary["workflow_id"])
+            if workflow is not None:
                 workflows[workflow.workflow_id] = workflow
 
         return workflows
 
+    def list_summaries(
+        self,
+        query: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: str = "updated_at",
+        descending: bool = True
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        基于摘要索引列出工作流，不解析节点内容
+
+        Args:
+            query: 按名称或描述过滤（不区分大小写）
+            offset: 分页偏移
+            limit: 每页数量，为空时返回全部
+            sort: 排序字段，见 SORT_FIELDS
+            descending: 是否倒序
+
+        Returns:
+            (当前页摘要列表, 过滤后的总数)
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"不支持的排序字段: {sort}")
+
+        summaries = [
+            {field: entry.get(field) for field in SUMMARY_FIELDS}
+            for entry in self._sync_index().values()
+        ]
+        if query:
+            needle = query.lower()
+            summaries = [
+                s for s in summaries
+                if needle in (s.get("name") or "").lower() or needle in (s.get("description") or "").lower()
+            ]
+
+        # 缺失的字段排在最后
+        present = [s for s in summaries if s.get(sort) is not None]
+        missing = [s for s in summaries if s.get(sort) is None]
+        present.sort(key=lambda s: s[sort], reverse=descending)
+        summaries = present + missing
+
+        total = len(summaries)
+        end = None if limit is None else offset + limit
+        return summaries[offset:end], total
+
     def update_workflow(
         self,
         workflow_id: str,
@@ -125,26 +215,31 @@ class WorkflowManager:
         Returns:
             更新后的工作流定义，不存在则返回 None
         """
-        workflow = self.get_workflow(workflow_id)
-        if workflow is None:
-            return None
-
-        if name is not None:
-            workflow.name = name
-        if description is not None:
-            workflow.description = description
-        if nodes is not None:
-            workflow.nodes = nodes
-        if edges is not None:
-            workflow.edges = edges
-        if variables is not None:
-            workflow.variables = variables
-
-        workflow.version += 1
-        workflow.updated_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-
-        self._save_workflow(workflow)
-        return workflow
+        with self._lock:
+            # 读-改-写：丢弃缓存重新读取，其他进程可能在同一时间戳粒度内写入了大小相同的内容
+            self._definitions.pop(workflow_id, None)
+            workflow = self.get_workflow(workflow_id)
+            if workflow is None:
+                return None
+
+            # 在副本上修改，避免保存失败时污染缓存
+            workflow = workflow.model_copy(deep=True)
+            if name is not None:
+                workflow.name = name
+            if description is not None:
+                workflow.description = description
+            if nodes is not None:
+                workflow.nodes = nodes
+            if edges is not None:
+                workflow.edges = [Edge(**edge) if isinstance(edge, dict) else edge for edge in edges]
+            if variables is not None:
+                workflow.variables = variables
+
+            workflow.version += 1
+            workflow.updated_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+
+            self._save_workflow(workflow)
+            return workflow
 
     def delete_workflow(self, workflow_id: str) -> bool:
         """
@@ -156,18 +251,119 @@ class WorkflowManager:
         Returns:
             是否删除成功
         """
-        file_path = self._get_workflow_path(workflow_id)
-        if not file_path.exists():
-            return False
+        with self._lock:
+            file_path = self._get_workflow_path(workflow_id)
+            if not file_path.exists():
+                return False
 
-        file_path.unlink()
-        return True
+            file_path.unlink()
+            self._definitions.pop(workflow_id, None)
+            # 同步时会移除已删除文件的索引条目
+            self._sync_index()
+            return True
 
     def _save_workflow(self, workflow: WorkflowDefinition) -> None:
-        """保存工作流到文件"""
-        file_path = self._get_workflow_path(workflow.workflow_id)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(workflow.dict(), f, ensure_ascii=False, indent=2)
+        """保存工作流到文件，同时更新缓存和索引"""
+        with self._lock:
+            file_path = self._get_workflow_path(workflow.workflow_id)
+            data = workflow.dict()
+            atomic_write_json(file_path, data)
+
+            stamp = self._file_stamp(file_path)
+            if stamp is None:
+                return
+            self._cache_definition(workflow.workflow_id, stamp, workflow)
+            index = self._sync_index()
+            index[workflow.workflow_id] = self._summary_entry(data, stamp)
+            self._save_index(index)
+
+    # =========================================================================
+    # 缓存与索引
+    # =========================================================================
+
+    @staticmethod
+    def _file_stamp(file_path: Path) -> Optional[FileStamp]:
+        """文件版本标识，文件不存在时返回 None"""
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _cache_definition(self, workflow_id: str, stamp: FileStamp, workflow: WorkflowDefinition) -> None:
+        """缓存解析后的定义，超出容量时淘汰最久未使用的"""
+        self._definitions[workflow_id] = (stamp, workflow)
+        self._definitions.move_to_end(workflow_id)
+        while len(self._definitions) > DEFINITION_CACHE_SIZE:
+            self._definitions.popitem(last=False)
+
+    @staticmethod
+    def _summary_entry(data: Dict[str, Any], stamp: FileStamp) -> Dict[str, Any]:
+        """由工作流数据构建索引条目"""
+        entry = {field: data.get(field) for field in SUMMARY_FIELDS}
+        entry["mtime_ns"], entry["size"] = stamp
+        return entry
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        """读取持久化的索引，格式不符时丢弃"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return {}
+        return data.get("workflows", {})
+
+    def _save_index(self, index: Dict[str, Dict[str, Any]]) -> None:
+        """原子写入索引文件"""
+        try:
+            atomic_write_json(self.index_file, {"version": INDEX_VERSION, "workflows": index}, indent=None)
+        except OSError as e:
+            logger.warning(f"保存工作流索引失败: {e}")
+
+    def _sync_index(self) -> Dict[str, Dict[str, Any]]:
+        """
+        将索引与目录同步
+        只 stat 每个文件，修改时间或大小变化的文件才重新读取
+        """
+        if self._index is None:
+            self._index = self._load_index()
+        index = self._index
+
+        changed = False
+        seen = set()
+        with os.scandir(self.workflow_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json") or entry.name.startswith(".") or not entry.is_file():
+                    continue
+                workflow_id = entry.name[:-len(".json")]
+                seen.add(workflow_id)
+                stat = entry.stat()
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                cached = index.get(workflow_id)
+                if cached is not None and (cached.get("mtime_ns"), cached.get("size")) == stamp:
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"跳过无法解析的工作流文件 {entry.name}: {e}")
+                    # 文件损坏前的旧条目也要从持久化索引中删除
+                    if index.pop(workflow_id, None) is not None:
+                        changed = True
+                    continue
+                index[workflow_id] = self._summary_entry(data, stamp)
+                changed = True
+
+        for workflow_id in list(index):
+            if workflow_id not in seen:
+                del index[workflow_id]
+                changed = True
+
+        if changed:
+            self._save_index(index)
+        return index
 
 
 # 模块级单例
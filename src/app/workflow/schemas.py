@@ -38,6 +38,7 @@ class LLMNodeData(NodeData):
     temperature: float = Field(default=0.7, description="温度参数")
     max_tokens: Optional[int] = Field(None, description="最大token数")
     stream: bool = Field(default=False, description="是否流式输出")
+    cache: Optional[str] = Field(None, description="响应缓存模式: off / auto / force，为空时使用 LLM_CACHE_MODE")
 
 
 class RAGNodeData(NodeData):
@@ -116,6 +117,15 @@ class WorkflowExecutionRequest(BaseModel):
     stream: bool = Field(default=False, description="是否流式输出")
 
 
+class BatchExecutionRequest(BaseModel):
+    """批量执行请求"""
+    inputs: List[Dict[str, Any]] = Field(default_factory=list, description="输入变量列表，每项对应一次执行")
+    concurrency: int = Field(default=4, ge=1, le=64, description="最大并发执行数")
+    rate_limit: Optional[float] = Field(None, gt=0, description="每个上游主机每秒最大请求数")
+    stream: bool = Field(default=False, description="LLM 节点是否流式调用")
+    batch_id: Optional[str] = Field(None, description="批次ID，为空时自动生成")
+
+
 class WorkflowExecutionResult(BaseModel):
     """工作流执行结果"""
     execution_id: str = Field(..., description="执行ID")
@@ -124,3 +134,4 @@ class WorkflowExecutionResult(BaseModel):
     error: Optional[str] = Field(None, description="错误信息")
     execution_time: Optional[float] = Field(None, description="执行时间（秒）")
     node_results: Dict[str, Any] = Field(default_factory=dict, description="各节点执行结果")
+    node_timings: Dict[str, float] = Field(default_factory=dict, description="各节点执行耗时（毫秒），续跑时复用结果的节点不计入")
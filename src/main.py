@@ -1,6 +1,9 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, JSONResponse
 import logging
 import os
 
@@ -16,13 +19,76 @@ logging.basicConfig(
 )
 
 # 导入拆分后的路由
-from app.routers import chat, files, kb, history, prompts, settings, workflows
+from app.routers import chat, files, kb, history, prompts, settings, workflows, metrics, health
+from app.config import METRICS_ENABLED
+from app.core.http_client import close_http_client
+from app.core.llm_gateway import llm_gateway
+from app.core.upstream_pool import upstream_pool
+from app.core.code_sandbox import code_sandbox_pool
+from app.core.history_search import history_search
+from app.core.session_memory import session_memory
+from app.core.archive_job import archive_job
+from app.core.image_archive import image_archive
+from app.core.tracing import tracer
+from app.core.startup import preloader
+from app.core.rag_engine import embedding_warmup, EmbeddingWarmingError
+from app.workflow.journal import execution_journal
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热代码沙箱、清理执行日志、开始上游组健康检查并在后台预热向量化模型、预加载较慢的模块，退出时释放共享资源"""
+    code_sandbox_pool.start()
+    if execution_journal is not None:
+        execution_journal.prune()
+    upstream_pool.start()
+    archive_job.start()
+    # 后台线程执行，不阻塞开始监听；预热完成前 GET /ready 返回 503
+    if embedding_warmup is not None:
+        embedding_warmup.start()
+    if preloader is not None:
+        preloader.start()
+    yield
+    await archive_job.stop()
+    await upstream_pool.stop()
+    await close_http_client()
+    await llm_gateway.close()
+    if history_search is not None:
+        # 写入排队中的检索索引更新
+        history_search.close()
+    if session_memory is not None:
+        session_memory.close()
+    code_sandbox_pool.shutdown()
+    # 写入排队中的 span
+    tracer.close()
+
 
-app = FastAPI(title="Nexus AI Local")
+app = FastAPI(title="Nexus AI Local", lifespan=lifespan)
+
+
+@app.exception_handler(EmbeddingWarmingError)
+async def embedding_warming_handler(request, exc: EmbeddingWarmingError) -> JSONResponse:
+    """向量化模型预热超时：返回 503，客户端按 Retry-After 重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "status": "warming"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # 1. 挂载静态文件
 import os
 static_dir = os.path.join(os.path.dirname(__file__), "static")
+
+
+# 已转码的生成图片：旧链接指向转码后的文件（需在挂载静态目录之前注册）
+@app.get("/static/generated_images/{name}", include_in_schema=False)
+async def generated_image(name: str):
+    path = image_archive.resolve_path(name)
+    if os.path.basename(name) != name or not path.is_file():
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path)
+
+
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 # 2. 注册路由
@@ -33,6 +99,9 @@ app.include_router(history.router)
 app.include_router(prompts.router)
 app.include_router(settings.router)
 app.include_router(workflows.router)
+app.include_router(health.router)
+if METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 # 3. 根路径
 @app.get("/")
@@ -40,11 +109,46 @@ async def read_index():
     return FileResponse(os.path.join(os.path.dirname(__file__), "static", "index.html"))
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
     from app.config import STATIC_DIR
-    
+
+    parser = argparse.ArgumentParser(description="Nexus AI Local")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="生产模式：启动 N 个工作进程，不自动重载；N > 1 时同时启动共享的向量服务。不指定时为开发模式（单进程，自动重载）"
+    )
+    parser.add_argument("--profile-startup", action="store_true", help="输出导入耗时分解后退出")
+    parser.add_argument("--top", type=int, default=20, help="--profile-startup 每个列表的条目数")
+    args = parser.parse_args()
+    if args.profile_startup:
+        from app.core.startup import profile_imports, format_profile
+        print(format_profile(profile_imports("main", args.top)))
+        raise SystemExit(0)
+
     # 确保生成的图片目录存在
     (STATIC_DIR / "generated_images").mkdir(parents=True, exist_ok=True)
     
     logger.info("🚀 Nexus AI Modularized Server Starting...")
-    uvicorn.run("main:app", host="127.0.0.1", port=9000, reload=True)
\ No newline at end of file
+    if args.workers is None:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
+        raise SystemExit(0)
+
+    # 生产模式：多个工作进程共用一个向量服务（一份向量化模型、一个 Chroma 客户端），
+    # JSON 元数据文件的写入由文件锁串行化（见 app/core/file_lock.py）
+    from app.config import VECTOR_SERVICE_URL, VECTOR_SERVICE_PORT
+    vector_service = None
+    if args.workers > 1 and not VECTOR_SERVICE_URL:
+        from app.core.vector_service import spawn
+        vector_service = spawn(VECTOR_SERVICE_PORT)
+        # 工作进程重新导入 app.config 时读取
+        os.environ["VECTOR_SERVICE_URL"] = f"http://127.0.0.1:{VECTOR_SERVICE_PORT}"
+        logger.info(f"向量服务已启动 (PID {vector_service.pid}, 端口 {VECTOR_SERVICE_PORT})")
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if vector_service is not None:
+            vector_service.terminate()
+            vector_service.wait(timeout=10)
\ No newline at end of file
@@ -129,6 +129,8 @@ export async function sendMessage() {
     clearMediaSelection();
 
     const userMsg = { role: 'user', content: messageContent };
+    // 会话已有历史时只发送本轮的新消息（增量模式），服务器从会话文件读取之前的历史
+    const useDelta = !state.drawingWorkspaceEnabled && !!state.currentSessionFile && state.conversationHistory.length > 0;
     
     if (state.drawingWorkspaceEnabled) {
         pushToHistory(userMsg);
@@ -148,8 +150,9 @@ export async function sendMessage() {
         api_url: state.config.apiUrl,
         api_key: state.config.apiKey,
         model: state.config.model,
-        messages: state.drawingWorkspaceEnabled ? [userMsg] : state.conversationHistory,
+        messages: (state.drawingWorkspaceEnabled || useDelta) ? [userMsg] : state.conversationHistory,
         session_file: state.drawingWorkspaceEnabled ? null : state.currentSessionFile,
+        delta: useDelta,
         kb_id: state.currentKB ? state.currentKB.id : null,
         stream: state.streamEnabled,
         drawing_workspace_mode: state.drawingWorkspaceEnabled
@@ -162,6 +165,20 @@ export async function sendMessage() {
     }
 }
 
+// 增量模式下服务器找不到已保存的会话时返回 409，改为发送完整历史重试
+async function postChat(payload) {
+    const send = body => fetch('/api/chat', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    const response = await send(payload);
+    if (response.status === 409 && payload.delta) {
+        return send({ ...payload, messages: state.conversationHistory, delta: false });
+    }
+    return response;
+}
+
 async function sendStreamMessage(payload) {
     const loadingDiv = appendMessage('assistant', 'Thinking...', true);
     const contentDiv = document.createElement('div');
@@ -171,11 +188,7 @@ async function sendStreamMessage(payload) {
     let fullContent = '';
 
     try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(payload)
-        });
+        const response = await postChat(payload);
 
         if (!response.ok) {
             const errorData = await response.json();
@@ -252,11 +265,7 @@ async function sendNonStreamMessage(payload) {
     const loadingDiv = appendMessage('assistant', 'Thinking...', true);
 
     try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(payload)
-        });
+        const response = await postChat(payload);
 
         const data = await response.json();
         loadingDiv.remove();
@@ -7,36 +7,57 @@ export function toggleHistory() {
     loadHistoryList();
 }
 
-export async function loadHistoryList() {
+// 历史列表每页条数
+const HISTORY_PAGE_SIZE = 100;
+
+export async function loadHistoryList(offset = 0) {
     const container = document.getElementById('historyListContent');
     try {
-        const res = await fetch('/api/history/list');
+        const res = await fetch(`/api/history/sessions?offset=${offset}&limit=${HISTORY_PAGE_SIZE}`);
         const data = await res.json();
-        container.innerHTML = '';
-        for (const [date, files] of Object.entries(data)) {
-            const dateHeader = document.createElement('div');
-            dateHeader.className = 'history-date-header';
-            dateHeader.innerText = date;
-            container.appendChild(dateHeader);
-
-            files.forEach(file => {
-                const fullPath = `${date}/${file}`;
-                const displayName = file.replace('.json', '');
-
-                const item = document.createElement('div');
-                item.className = 'history-item-row';
-                item.innerHTML = `
-                    <div class="h-name" onclick="window.loadSession('${fullPath}')">
-                        <span class="material-symbols-outlined">chat_bubble_outline</span>
-                        <span>${displayName}</span>
-                    </div>
-                    <div class="h-actions">
-                        <button onclick="window.renameHistory('${fullPath}', '${displayName}')"><span class="material-symbols-outlined">edit</span></button>
-                        <button onclick="window.deleteHistory('${fullPath}')" style="color:#ef4444;"><span class="material-symbols-outlined">delete</span></button>
-                    </div>
-                `;
-                container.appendChild(item);
-            });
+        if (offset === 0) {
+            container.innerHTML = '';
+        } else {
+            container.querySelector('.history-load-more')?.remove();
+        }
+
+        let lastDate = offset === 0 ? '' : (container.dataset.lastDate || '');
+        data.items.forEach(session => {
+            if (session.date !== lastDate) {
+                const dateHeader = document.createElement('div');
+                dateHeader.className = 'history-date-header';
+                dateHeader.innerText = session.date;
+                container.appendChild(dateHeader);
+                lastDate = session.date;
+            }
+
+            const fullPath = session.path;
+            const displayName = session.name.replace('.json', '');
+
+            const item = document.createElement('div');
+            item.className = 'history-item-row';
+            item.title = session.title || '';
+            item.innerHTML = `
+                <div class="h-name" onclick="window.loadSession('${fullPath}')">
+                    <span class="material-symbols-outlined">chat_bubble_outline</span>
+                    <span>${displayName}</span>
+                </div>
+                <div class="h-actions">
+                    <button onclick="window.renameHistory('${fullPath}', '${displayName}')"><span class="material-symbols-outlined">edit</span></button>
+                    <button onclick="window.deleteHistory('${fullPath}')" style="color:#ef4444;"><span class="material-symbols-outlined">delete</span></button>
+                </div>
+            `;
+            container.appendChild(item);
+        });
+        container.dataset.lastDate = lastDate;
+
+        const loaded = offset + data.items.length;
+        if (loaded < data.total) {
+            const more = document.createElement('button');
+            more.className = 'history-load-more';
+            more.innerText = `加载更多 (${loaded}/${data.total})`;
+            more.onclick = () => loadHistoryList(loaded);
+            container.appendChild(more);
         }
     } catch (e) { console.error(e); }
 }
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 测试直接导入 src 下的 app 包；不探测本机代理
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+os.environ.setdefault("NETWORK_PROBE", "false")
+# 导入 app 时会在当前目录创建数据目录与元数据文件，在临时目录中运行，避免写入仓库
+os.chdir(tempfile.mkdtemp(prefix="nexus_tests_"))
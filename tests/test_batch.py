@@ -0,0 +1,33 @@
+"""批量执行：同一批次不会并发执行"""
+import asyncio
+
+from app.workflow.batch import BatchStore, claim_batch, release_batch, run_batch
+from app.workflow.schemas import WorkflowDefinition
+
+
+def test_batch_is_released_after_run():
+    store = BatchStore(BatchStore.new_batch_id())
+    workflow = WorkflowDefinition(workflow_id="wf", name="wf", nodes=[], edges=[])
+    store.create(workflow, [{"text": "a"}, {"text": "b"}], {"concurrency": 2})
+    assert claim_batch(store.batch_id)
+    assert not claim_batch(store.batch_id)
+
+    async def consume():
+        return [line async for line in run_batch(workflow, store, 2)]
+
+    lines = asyncio.run(consume())
+    assert len(lines) == 3
+    assert claim_batch(store.batch_id)
+    release_batch(store.batch_id)
+
+
+def test_running_batch_cannot_be_claimed_by_other_process():
+    import multiprocessing
+
+    batch_id = BatchStore.new_batch_id()
+    assert claim_batch(batch_id)
+    try:
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            assert pool.apply(claim_batch, (batch_id,)) is False
+    finally:
+        release_batch(batch_id)
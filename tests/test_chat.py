@@ -0,0 +1,22 @@
+"""聊天接口：增量模式"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import chat
+
+
+def test_delta_with_unknown_session_is_rejected():
+    app = FastAPI()
+    app.include_router(chat.router)
+    client = TestClient(app)
+
+    response = client.post("/api/chat", json={
+        "api_url": "http://127.0.0.1:9/v1",
+        "model": "gpt",
+        "messages": [{"role": "user", "content": "继续"}],
+        "session_file": "2026-01-01/chat_missing.json",
+        "delta": True,
+        "memory": False
+    })
+
+    assert response.status_code == 409
@@ -0,0 +1,76 @@
+"""代码节点沙箱"""
+import asyncio
+
+import pytest
+
+from app.core.code_sandbox import CodeExecutionError, CodeSandboxPool, DEFAULT_TIMEOUT, normalize_timeout
+
+
+@pytest.fixture
+def pool():
+    pool = CodeSandboxPool(1, 0)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("value", [None, "abc", 0, -5, float("nan")])
+def test_invalid_timeout_uses_default(value):
+    assert normalize_timeout(value) == DEFAULT_TIMEOUT
+
+
+def test_none_timeout_runs(pool):
+    assert asyncio.run(pool.run("output = 1 + 1", {}, {}, {}, timeout=None)) == 2
+
+
+def test_cancelled_run_replaces_busy_worker(pool):
+    async def scenario():
+        task = asyncio.create_task(pool.run("while True:\n    pass", {}, {}, {}, timeout=30))
+        await asyncio.sleep(0.5)
+        busy = pool._idle == []
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return busy
+
+    assert asyncio.run(scenario())
+    assert len(pool._idle) == 1 and pool._idle[0].alive()
+    assert asyncio.run(pool.run("output = 'ok'", {}, {}, {})) == "ok"
+
+
+def test_timeout_replaces_worker(pool):
+    with pytest.raises(CodeExecutionError, match="超时"):
+        asyncio.run(pool.run("while True:\n    pass", {}, {}, {}, timeout=0.5))
+
+    assert len(pool._idle) == 1 and pool._idle[0].alive()
+    assert asyncio.run(pool.run("output = inputs['x'] * 2", {}, {}, {"x": 21})) == 42
+
+
+def test_crashed_worker_is_replaced(pool):
+    pool.start()
+    worker = pool._idle[0]
+
+    async def scenario():
+        task = asyncio.create_task(pool.run("while True:\n    pass", {}, {}, {}, timeout=30))
+        await asyncio.sleep(0.5)
+        # worker 在执行过程中异常退出
+        worker.process.kill()
+        with pytest.raises(CodeExecutionError, match="强制终止"):
+            await task
+
+    asyncio.run(scenario())
+    assert pool._idle[0] is not worker and pool._idle[0].alive()
+    assert asyncio.run(pool.run("output = 'ok'", {}, {}, {})) == "ok"
+
+
+def test_dead_idle_worker_is_skipped(pool):
+    pool.start()
+    pool._idle[0].process.kill()
+    pool._idle[0].process.wait()
+
+    assert asyncio.run(pool.run("output = 1", {}, {}, {})) == 1
+
+
+def test_user_code_error(pool):
+    with pytest.raises(CodeExecutionError, match="ZeroDivisionError"):
+        asyncio.run(pool.run("output = 1 / 0", {}, {}, {}))
+    assert asyncio.run(pool.run("output = 2", {}, {}, {})) == 2
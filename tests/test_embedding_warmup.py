@@ -0,0 +1,49 @@
+"""向量化预热：失败后重试与首次使用时恢复就绪"""
+import time
+
+from app.core import rag_engine
+from app.core.rag_engine import EmbeddingWarmup
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_failed_warmup_is_retried(monkeypatch):
+    calls = []
+
+    def flaky_embedding_function():
+        calls.append(1)
+        if len(calls) <= 2:
+            raise TimeoutError("向量服务超时")
+        return lambda texts: [[0.0] for _ in texts]
+
+    monkeypatch.setattr(rag_engine, "_get_embedding_function", flaky_embedding_function)
+    monkeypatch.setattr(rag_engine, "_get_collection", lambda: None)
+    warmup = EmbeddingWarmup(0, retry_max=0.05, retry_base=0.01)
+
+    warmup.start()
+
+    assert _wait_for(lambda: warmup.ready)
+    assert warmup.attempts == 3
+    assert warmup.error is None
+
+
+def test_lazy_load_marks_failed_warmup_ready(monkeypatch):
+    def failing():
+        raise TimeoutError("向量服务超时")
+
+    monkeypatch.setattr(rag_engine, "_get_embedding_function", failing)
+    warmup = EmbeddingWarmup(0, retry_max=60, retry_base=60)
+    warmup.start()
+    assert _wait_for(lambda: warmup.state == "failed")
+
+    warmup.mark_ready()
+
+    assert warmup.ready
+    assert warmup.stats()["state"] == "ready"
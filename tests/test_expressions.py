@@ -0,0 +1,43 @@
+"""条件表达式（替代 eval()）的回归测试"""
+import pytest
+
+from app.workflow.expressions import ExpressionError, ExpressionScope, compile_expression
+from app.workflow.engine import WorkflowEngine
+
+
+def scope(**values):
+    return ExpressionScope(values)
+
+
+@pytest.mark.parametrize("source, values, expected", [
+    ("{{user_type}} == 'admin'", {"user_type": "admin"}, True),
+    ("'{{user_type}}' == 'admin'", {"user_type": "guest"}, False),
+    ("{{score}} >= 0.5 && {{count}} < 10", {"score": "0.7", "count": 3}, True),
+    ("{{llm.category}} in ['billing', 'refund']", {"llm": '{"category": "refund"}'}, True),
+    ("-x < 0", {"x": 3}, True),
+    ("-x < 0", {"x": "3"}, True),
+    ("missing == null", {}, True),
+    ("items[null] == null", {"items": [1, 2]}, True),
+    ("data[[1]] == null", {"data": {"a": 1}}, True),
+    ("{{flag}} == True", {"flag": "True"}, False),
+])
+def test_evaluate(source, values, expected):
+    assert compile_expression(source).test(scope(**values)) is expected
+
+
+@pytest.mark.parametrize("value", [None, "abc", [1], {"a": 1}])
+def test_unary_minus_on_non_number_raises_expression_error(value):
+    with pytest.raises(ExpressionError):
+        compile_expression("-x < 0").test(scope(x=value))
+
+
+def test_arithmetic_is_syntax_error():
+    with pytest.raises(ExpressionError):
+        compile_expression("x + 1 > 2")
+
+
+@pytest.mark.parametrize("condition", ["-x < 0", "x + 1 > 2", "x > 0 and -y < 0"])
+def test_condition_with_missing_variable_takes_default_branch(condition):
+    engine = WorkflowEngine()
+    engine.execution_context = {"inputs": {"x": None}, "variables": {}}
+    assert engine._evaluate_condition(condition) is False
@@ -0,0 +1,54 @@
+"""跨进程文件锁"""
+import json
+import multiprocessing
+
+from app.core.file_lock import atomic_write_json, file_lock
+
+
+def _hold_lock(path, locked, release):
+    with file_lock(path):
+        locked.set()
+        release.wait(10)
+
+
+def _increment(path, times):
+    for _ in range(times):
+        with file_lock(path):
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)["value"]
+            atomic_write_json(path, {"value": value + 1})
+
+
+def test_lock_held_by_other_process(tmp_path):
+    path = tmp_path / "data.json"
+    ctx = multiprocessing.get_context("spawn")
+    locked, release = ctx.Event(), ctx.Event()
+    process = ctx.Process(target=_hold_lock, args=(str(path), locked, release))
+    process.start()
+    try:
+        assert locked.wait(30)
+        lock = file_lock(path)
+        assert not lock.acquire(blocking=False)
+        release.set()
+        process.join(30)
+        assert lock.acquire(blocking=False)
+        lock.release()
+    finally:
+        release.set()
+        process.join(30)
+
+
+def test_concurrent_read_modify_write_keeps_all_updates(tmp_path):
+    path = tmp_path / "counter.json"
+    atomic_write_json(path, {"value": 0})
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_increment, args=(str(path), 50)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    _increment(path, 50)
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["value"] == 200
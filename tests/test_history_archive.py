@@ -0,0 +1,51 @@
+"""历史归档：压缩读回与归档后再次保存"""
+import json
+import os
+
+from app.config import HISTORY_DIR
+from app.core.history_archive import HistoryArchive, history_archive
+from app.core.session_store import SessionStore
+
+
+def _write_old_session(session, messages, kb_id=None):
+    path = HISTORY_DIR / session
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"messages": messages, "kb_id": kb_id}, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, (0, 0))
+    return path
+
+
+def _messages(text, count=3):
+    return [{"id": f"m{i}", "role": "user" if i % 2 == 0 else "assistant", "content": f"{text} {i}"} for i in range(count)]
+
+
+def test_archive_round_trip(tmp_path):
+    archive = HistoryArchive(tmp_path / "archive", HISTORY_DIR, block_size=256, segment_size=1024)
+    sessions = {f"2020-01-01/chat_{i}.json": _messages(f"归档会话 {i}", count=5) for i in range(6)}
+    for session, messages in sessions.items():
+        _write_old_session(session, messages, kb_id="kb1")
+
+    result = archive.archive(older_than_days=30)
+
+    assert result["archived_sessions"] == len(sessions)
+    assert result["archived_bytes"] > 0
+    for session, messages in sessions.items():
+        assert not (HISTORY_DIR / session).exists()
+        assert archive.contains(session)
+        assert archive.read_session(session) == {"messages": messages, "kb_id": "kb1"}
+    assert archive.load("2020-01-01/chat_missing.json") is None
+
+
+def test_resave_after_archive_writes_new_file():
+    session = "2020-01-02/chat_resave.json"
+    path = _write_old_session(session, _messages("旧内容"))
+    assert history_archive.archive(older_than_days=30)["archived_sessions"] >= 1
+    assert not path.exists()
+
+    store = SessionStore()
+    # 已归档的会话按 ID 编辑后写入新的会话文件，之后以文件为准
+    assert store.update_message(session, "m0", "user", lambda m: m.update(content="归档后修改")) is not None
+
+    assert path.exists()
+    assert history_archive.read_session(session)["messages"][0]["content"] == "归档后修改"
+    assert history_archive.load(session)["messages"][0]["content"] == "旧内容 0"
@@ -0,0 +1,73 @@
+"""历史目录索引：应用之外的文件变化"""
+import json
+import os
+import time
+
+import pytest
+
+from app.core.history_catalog import HistoryCatalog
+
+
+def _write(path, title, count=1):
+    messages = [{"id": f"m{i}", "role": "user", "content": title} for i in range(count)]
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"messages": messages, "kb_id": None}, ensure_ascii=False), encoding="utf-8")
+    # 与 atomic_write_json 一样替换文件，目录修改时间随之变化
+    os.replace(tmp, path)
+
+
+def _tick():
+    # 目录修改时间的精度取决于内核时钟，相邻两次变化之间留出间隔
+    time.sleep(0.05)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    (tmp_path / "history").mkdir()
+    return HistoryCatalog(tmp_path / "catalog.db", tmp_path / "history")
+
+
+def test_resync_after_external_changes(catalog):
+    date_dir = catalog.history_dir / "2026-01-01"
+    date_dir.mkdir()
+    _write(date_dir / "chat_1.json", "第一个会话")
+    _write(date_dir / "chat_2.json", "第二个会话")
+    assert sorted(catalog.grouped()["2026-01-01"]) == ["chat_1.json", "chat_2.json"]
+
+    _tick()
+    _write(date_dir / "chat_1.json", "改过的标题", count=3)
+    (date_dir / "chat_2.json").unlink()
+    other = catalog.history_dir / "2026-01-02"
+    other.mkdir()
+    _write(other / "chat_3.json", "新日期目录")
+
+    items = {item["path"]: item for item in catalog.page()["items"]}
+    assert set(items) == {"2026-01-01/chat_1.json", "2026-01-02/chat_3.json"}
+    assert items["2026-01-01/chat_1.json"]["title"] == "改过的标题"
+    assert items["2026-01-01/chat_1.json"]["message_count"] == 3
+
+
+def test_removed_date_dir_is_dropped(catalog):
+    date_dir = catalog.history_dir / "2026-01-03"
+    date_dir.mkdir()
+    _write(date_dir / "chat_1.json", "会话")
+    assert catalog.paths() == ["2026-01-03/chat_1.json"]
+
+    (date_dir / "chat_1.json").unlink()
+    date_dir.rmdir()
+
+    assert catalog.paths() == []
+
+
+def test_full_sync_finds_in_place_edits(catalog):
+    date_dir = catalog.history_dir / "2026-01-04"
+    date_dir.mkdir()
+    path = date_dir / "chat_1.json"
+    _write(path, "原标题")
+    assert catalog.page()["items"][0]["title"] == "原标题"
+
+    # 就地改写不改变目录的修改时间，只有完整同步能发现
+    path.write_text(json.dumps({"messages": [{"role": "user", "content": "就地修改的标题"}]}, ensure_ascii=False), encoding="utf-8")
+    catalog.sync(full=True)
+
+    assert catalog.page()["items"][0]["title"] == "就地修改的标题"
@@ -0,0 +1,55 @@
+"""历史全文检索：中日韩单字、短语与引号"""
+import pytest
+
+from app.core.history_search import HistorySearchIndex, build_match
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "history").mkdir()
+    index = HistorySearchIndex(tmp_path / "search.db", tmp_path / "history", flush_interval=0, batch_size=100)
+    messages = [
+        {"id": "u1", "role": "user", "content": "如何配置向量数据库？"},
+        {"id": "a1", "role": "assistant", "content": "Use the Chroma client, then 配置 embedding 模型"},
+        {"id": "u2", "role": "user", "content": "他说\"你好世界\"然后离开了"}
+    ]
+    index.submit(tmp_path / "history" / "2026-01-01" / "chat_1.json", messages, None)
+    index.flush()
+    return index
+
+
+def _ids(index, query):
+    return {item["message_id"] for item in index.search(query)["results"]}
+
+
+def test_single_cjk_character(index):
+    # 单字既是二元组的首字（"向量"），也可能是段末的单字（"库"）
+    assert _ids(index, "向") == {"u1"}
+    assert _ids(index, "库") == {"u1"}
+    assert _ids(index, "配") == {"u1", "a1"}
+
+
+def test_phrase_is_substring_match(index):
+    assert _ids(index, "向量数据库") == {"u1"}
+    assert _ids(index, "数据向量") == set()
+    # 空格分隔的词需要同时命中
+    assert _ids(index, "配置 chroma") == {"a1"}
+    assert _ids(index, "client 模型") == {"a1"}
+
+
+def test_quotes_in_query(index):
+    assert _ids(index, '"你好世界"') == {"u2"}
+    assert _ids(index, '说"你好') == {"u2"}
+    assert _ids(index, 'the "chroma') == {"a1"}
+    # 只有标点的查询不会生成非法的 MATCH 表达式
+    assert build_match('" "" ***') is None
+    assert index.search('"')["total"] == 0
+
+
+def test_reindex_replaces_edited_message(index, tmp_path):
+    path = tmp_path / "history" / "2026-01-01" / "chat_1.json"
+    index.submit(path, [{"id": "u1", "role": "user", "content": "换成别的内容"}], None)
+    index.flush()
+
+    assert _ids(index, "向量") == set()
+    assert _ids(index, "别的") == {"u1"}
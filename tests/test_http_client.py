@@ -0,0 +1,22 @@
+"""HTTP 客户端重试等待时间"""
+import httpx
+import pytest
+
+from app.core.http_client import _retry_delay
+
+
+def _response(retry_after):
+    return httpx.Response(429, headers={"Retry-After": retry_after})
+
+
+def test_retry_after_is_capped():
+    assert _retry_delay(0, 0.5, 30, _response("86400")) == 30
+
+
+def test_retry_after_within_cap_is_used():
+    assert _retry_delay(0, 0.5, 30, _response("3")) == 3
+
+
+@pytest.mark.parametrize("value", ["-5", "soon"])
+def test_invalid_retry_after_falls_back_to_backoff(value):
+    assert 0.5 <= _retry_delay(0, 0.5, 30, _response(value)) <= 1.0
@@ -0,0 +1,79 @@
+"""执行日志：清理策略与重复续跑"""
+import asyncio
+
+import pytest
+
+from app.workflow.engine import WorkflowEngine
+from app.workflow.journal import ExecutionActiveError, ExecutionJournal
+from app.workflow.schemas import WorkflowDefinition
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return ExecutionJournal(tmp_path / "journal.db", max_age_days=30, max_runs=1)
+
+
+def test_prune_keeps_running_executions(journal):
+    for execution_id in ("a", "b", "c"):
+        journal.start_run(execution_id, "wf", 1, {}, False)
+    journal.finish_run("a", "completed")
+    journal.finish_run("b", "failed", "boom")
+    # c 仍在执行：超出 max_runs 时只删除已结束的执行
+    journal._execute("UPDATE runs SET updated_at = 0 WHERE execution_id = 'c'")
+    assert journal.claim("c")
+    try:
+        journal.prune()
+    finally:
+        journal.release("c")
+
+    assert journal.get_run("c")["status"] == "running"
+    remaining = {run["execution_id"] for run in journal.list_runs()}
+    assert remaining == {"c", "b"} or remaining == {"c", "a"}
+
+
+def test_abandoned_running_executions_are_marked_interrupted(tmp_path):
+    journal = ExecutionJournal(tmp_path / "journal.db", max_age_days=30, max_runs=10)
+    journal.start_run("crashed", "wf", 1, {}, False)
+    journal.start_run("live", "wf", 1, {}, False)
+    assert journal.claim("live")
+
+    # 重启后打开同一个日志：没有进程持有的执行标记为 interrupted，可以被清理和续跑
+    reopened = ExecutionJournal(tmp_path / "journal.db", max_age_days=30, max_runs=10)
+
+    assert reopened.get_run("crashed")["status"] == "interrupted"
+    assert reopened.get_run("live")["status"] == "running"
+    journal.release("live")
+
+
+def test_resume_rejected_while_execution_active(journal):
+    workflow = WorkflowDefinition(workflow_id="wf", name="wf", nodes=[], edges=[])
+    journal.start_run("run-1", "wf", 1, {}, False)
+    assert journal.claim("run-1")
+    try:
+        with pytest.raises(ExecutionActiveError):
+            asyncio.run(WorkflowEngine(journal=journal).execute(workflow, {}, execution_id="run-1"))
+    finally:
+        journal.release("run-1")
+    assert not journal.is_active("run-1")
+
+
+def test_claim_is_visible_to_other_processes(journal):
+    import multiprocessing
+
+    assert journal.claim("run-2")
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1) as pool:
+            # 另一个进程打开同一个日志：执行被占用时既不能再占用，也能识别为进行中
+            claimed, active = pool.apply(_claim_in_other_process, (str(journal.db_path), "run-2"))
+        assert (claimed, active) == (False, True)
+    finally:
+        journal.release("run-2")
+    assert not journal.is_active("run-2")
+
+
+def _claim_in_other_process(db_path, execution_id):
+    from pathlib import Path
+
+    other = ExecutionJournal(Path(db_path), max_age_days=30, max_runs=10)
+    return other.claim(execution_id), other.is_active(execution_id)
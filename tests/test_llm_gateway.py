@@ -0,0 +1,20 @@
+"""LLM 网关请求键"""
+from app.core.llm_gateway import request_key
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def test_direct_calls_with_different_keys_do_not_share():
+    a = request_key("https://api.example.com/v1", "gpt", MESSAGES, {}, api_key="sk-a")
+    b = request_key("https://api.example.com/v1", "gpt", MESSAGES, {}, api_key="sk-b")
+    assert a != b
+
+
+def test_same_key_and_request_share():
+    a = request_key("https://api.example.com/v1/", "gpt", MESSAGES, {}, api_key="sk-a")
+    b = request_key("https://api.example.com/v1", "gpt", MESSAGES, {}, api_key="sk-a")
+    assert a == b
+
+
+def test_group_scope_ignores_key():
+    assert request_key("group:main", "gpt", MESSAGES, {}) == request_key("group:main", "gpt", MESSAGES, {})
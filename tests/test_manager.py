@@ -0,0 +1,17 @@
+"""工作流索引同步"""
+import json
+
+from app.workflow.manager import WorkflowManager
+
+
+def test_corrupted_file_is_removed_from_saved_index():
+    manager = WorkflowManager()
+    workflow = manager.create_workflow(name="wf")
+    manager._sync_index()
+    path = manager._get_workflow_path(workflow.workflow_id)
+    path.write_text("{broken", encoding="utf-8")
+
+    manager._sync_index()
+
+    saved = json.loads(manager.index_file.read_text(encoding="utf-8"))
+    assert workflow.workflow_id not in saved["workflows"]
@@ -0,0 +1,63 @@
+"""会话存储：按消息 ID 编辑与删除"""
+import json
+
+import pytest
+
+from app.core.history import history_path
+from app.core.session_store import SessionStore
+
+
+@pytest.fixture
+def store():
+    return SessionStore(capacity=4)
+
+
+def _messages():
+    return [
+        {"id": "u1", "role": "user", "content": "第一个问题"},
+        {"id": "a1", "role": "assistant", "content": "第一个回答"},
+        {"id": "u2", "role": "user", "content": "第二个问题"},
+        {"id": "a2", "role": "assistant", "content": "第二个回答"}
+    ]
+
+
+def test_update_message_by_id(store):
+    store.save("2026-01-01/chat_edit.json", _messages())
+
+    updated = store.update_message("2026-01-01/chat_edit.json", "u2", "user", lambda m: m.update(content="改过的问题"))
+
+    assert updated["content"] == "改过的问题"
+    with open(history_path("2026-01-01/chat_edit.json"), encoding="utf-8") as f:
+        assert json.load(f)["messages"][2]["content"] == "改过的问题"
+    # 角色与 ID 不一致时不修改
+    assert store.update_message("2026-01-01/chat_edit.json", "u2", "assistant", lambda m: m.clear()) is None
+
+
+def test_delete_message_shifts_index(store):
+    store.save("2026-01-01/chat_delete.json", _messages())
+
+    deleted = store.delete_message("2026-01-01/chat_delete.json", "a1", "assistant")
+
+    assert deleted["content"] == "第一个回答"
+    assert store.delete_message("2026-01-01/chat_delete.json", "a1", "assistant") is None
+    # 删除后其后的消息仍能按 ID 定位到正确位置
+    updated = store.update_message("2026-01-01/chat_delete.json", "a2", "assistant", lambda m: m.update(content="新的回答"))
+    assert updated["id"] == "a2"
+    assert [m["id"] for m in store.load("2026-01-01/chat_delete.json")["messages"]] == ["u1", "u2", "a2"]
+    assert store.load("2026-01-01/chat_delete.json")["messages"][2]["content"] == "新的回答"
+
+
+def test_external_change_is_reloaded(store):
+    store.save("2026-01-01/chat_external.json", _messages())
+    assert store.load("2026-01-01/chat_external.json") is not None
+
+    path = history_path("2026-01-01/chat_external.json")
+    messages = _messages() + [{"id": "u3", "role": "user", "content": "在其他进程中追加的问题"}]
+    path.write_text(json.dumps({"messages": messages, "kb_id": None}, ensure_ascii=False), encoding="utf-8")
+
+    assert store.update_message("2026-01-01/chat_external.json", "u3", "user", lambda m: m.update(content="x")) is not None
+
+
+def test_missing_session(store):
+    assert store.load("2026-01-01/chat_missing.json") is None
+    assert store.delete_message("2026-01-01/chat_missing.json", "u1", "user") is None
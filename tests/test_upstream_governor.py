@@ -0,0 +1,27 @@
+"""上游排队：超时与取消时不泄漏并发名额"""
+import asyncio
+
+import pytest
+
+from app.core import upstream_governor
+from app.core.upstream_governor import UpstreamBusyError, UpstreamLimiter
+
+
+def test_permit_granted_at_timeout_is_returned(monkeypatch):
+    limiter = UpstreamLimiter("test", rate=0, burst=1, initial_concurrency=1, max_concurrency=1)
+
+    async def scenario():
+        held = await limiter.acquire()
+
+        async def wait_for_then_time_out(future, timeout):
+            # 模拟超时触发的同时 _dispatch 刚好分配了许可
+            held.release()
+            assert future.done()
+            raise asyncio.TimeoutError()
+
+        monkeypatch.setattr(upstream_governor.asyncio, "wait_for", wait_for_then_time_out)
+        with pytest.raises(UpstreamBusyError):
+            await limiter.acquire(timeout=1)
+
+    asyncio.run(scenario())
+    assert limiter.inflight == 0